@@ -0,0 +1,138 @@
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import zstandard
+except ImportError:  # zstandard é opcional; sem ele apenas gzip é oferecido
+    zstandard = None
+
+# Compressão das respostas da API (gzip ou zstd, conforme o Accept-Encoding do cliente).
+# Respostas menores que o limite vão sem compressão: o ganho não paga a CPU. Respostas
+# transmitidas (ex: NDJSON) são comprimidas pedaço a pedaço, sem acumular o corpo.
+
+_COMPRESSIBLE_TYPES = ("text/", "application/json", "application/x-ndjson")
+
+def available_encodings() -> tuple:
+    # Em ordem de preferência do servidor: zstd comprime melhor e mais rápido que gzip
+    return ("zstd", "gzip") if zstandard is not None else ("gzip",)
+
+def select_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Escolhe a codificação da resposta a partir do cabeçalho Accept-Encoding (None = sem compressão).
+    """
+    accepted = {}
+    for item in accept_encoding.lower().split(","):
+        name, _, params = item.strip().partition(";")
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[name.strip()] = quality
+    for encoding in available_encodings():
+        if accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+            return encoding
+    return None
+
+class _GzipEncoder:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+class _ZstdEncoder:
+    def __init__(self, level: int):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        flush = zstandard.COMPRESSOBJ_FLUSH_FINISH if final else zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        return self._compressor.compress(data) + self._compressor.flush(flush)
+
+class CompressionMiddleware:
+    """
+    Middleware ASGI que comprime respostas de texto/JSON com zstd ou gzip.
+
+    Args:
+        app: Aplicação ASGI.
+        minimum_size: Tamanho mínimo (bytes) do corpo para comprimir.
+        gzip_level: Nível de compressão gzip.
+        zstd_level: Nível de compressão zstd.
+    """
+    def __init__(self, app: ASGIApp, minimum_size: int = 1024, gzip_level: int = 6, zstd_level: int = 3):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.levels = {"gzip": gzip_level, "zstd": zstd_level}
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encoding = select_encoding(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, _CompressingSender(send, encoding, self.levels[encoding], self.minimum_size))
+
+class _CompressingSender:
+    def __init__(self, send: Send, encoding: str, level: int, minimum_size: int):
+        self.send = send
+        self.encoding = encoding
+        self.level = level
+        self.minimum_size = minimum_size
+        self.start: Optional[Message] = None
+        self.encoder = None
+        self.passthrough = False
+
+    async def __call__(self, message: Message):
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            content_type = headers.get("content-type", "")
+            self.passthrough = (
+                message["status"] in (204, 304)
+                or "content-encoding" in headers
+                or not content_type.startswith(_COMPRESSIBLE_TYPES)
+            )
+            if self.passthrough:
+                await self.send(message)
+            else:
+                # Início retido até o primeiro pedaço do corpo: só então se sabe o tamanho
+                MutableHeaders(raw=message["headers"]).add_vary_header("Accept-Encoding")
+                self.start = message
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self.send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self.start is not None:
+            start, self.start = self.start, None
+            if not more_body and len(body) < self.minimum_size:
+                self.passthrough = True
+                await self.send(start)
+                await self.send(message)
+                return
+            self.encoder = _ZstdEncoder(self.level) if self.encoding == "zstd" else _GzipEncoder(self.level)
+            headers = MutableHeaders(raw=start["headers"])
+            headers["Content-Encoding"] = self.encoding
+            del headers["Content-Length"]
+            if not more_body:
+                body = self.encoder.compress(body, final=True)
+                headers["Content-Length"] = str(len(body))
+                await self.send(start)
+                await self.send({"type": "http.response.body", "body": body})
+                return
+            await self.send(start)
+
+        await self.send({
+            "type": "http.response.body",
+            "body": self.encoder.compress(body, final=not more_body),
+            "more_body": more_body,
+        })
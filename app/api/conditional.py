@@ -0,0 +1,57 @@
+import datetime
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Optional
+
+from fastapi import Request, Response
+
+# Requisições condicionais (RFC 9110): o cliente reenvia o ETag (If-None-Match) ou a
+# data (If-Modified-Since) da resposta que já tem; se nada mudou, a API responde
+# 304 sem corpo. As ETags são fracas (W/): a mesma versão pode ir comprimida ou não.
+
+def make_etag(version: str) -> str:
+    return f'W/"{version}"'
+
+def _opaque(tag: str) -> str:
+    tag = tag.strip()
+    return tag[2:] if tag.startswith("W/") else tag
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Compara o cabeçalho If-None-Match com a ETag atual (comparação fraca).
+    """
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or _opaque(etag) in {_opaque(tag) for tag in tags}
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime.datetime] = None) -> bool:
+    """
+    Indica se a cópia do cliente ainda é válida. If-None-Match tem precedência sobre If-Modified-Since.
+    """
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=datetime.UTC)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+def cache_headers(
+    etag: str, last_modified: Optional[datetime.datetime] = None, cache_control: str = "no-cache"
+) -> Dict[str, str]:
+    """
+    Cabeçalhos de validação e cache de uma resposta. A resposta depende do tenant
+    (cabeçalho X-Tenant-ID) e da credencial do cliente, que entram no Vary para que
+    caches intermediários não a entreguem a outra empresa.
+    """
+    headers = {"ETag": etag, "Cache-Control": cache_control, "Vary": "X-Tenant-ID, Authorization"}
+    if last_modified is not None:
+        headers["Last-Modified"] = format_datetime(last_modified.astimezone(datetime.UTC), usegmt=True)
+    return headers
+
+def not_modified(headers: Dict[str, str]) -> Response:
+    return Response(status_code=304, headers=headers)
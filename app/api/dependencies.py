@@ -1,4 +1,6 @@
-from fastapi import BackgroundTasks, Depends
+from typing import Optional
+from fastapi import BackgroundTasks, Depends, Header, HTTPException
+from app.core.datalake import validate_tenant
 
 class TaskRunner:
     """
@@ -12,4 +14,14 @@ class TaskRunner:
         self.background_tasks.add_task(func, *args, **kwargs)
 
 def get_task_runner(background_tasks: BackgroundTasks):
-    return TaskRunner(background_tasks)
\ No newline at end of file
+    return TaskRunner(background_tasks)
+
+def get_tenant(x_tenant_id: Optional[str] = Header(None, description="Empresa dona dos dados")) -> str:
+    """
+    Dependency que identifica a empresa (tenant) da requisição pelo cabeçalho X-Tenant-ID.
+    Sem o cabeçalho, usa settings.DEFAULT_TENANT.
+    """
+    try:
+        return validate_tenant(x_tenant_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
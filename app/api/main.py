@@ -1,16 +1,25 @@
 from fastapi import FastAPI
 from contextlib import asynccontextmanager
-from app.api.routes import health, upload, predictions
+from app.api.routes import health, upload, upload_sessions, products, predictions, inventory, metrics
+from app.api.compression import CompressionMiddleware
+from app.core.config import settings
 from app.core.database import create_tables
+from app.ml.prophet_model import warm_up
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # On startup
     print("Iniciando aplicação...")
     create_tables()
+    # O pipeline de ML roda neste processo: o modelo Stan é carregado uma vez, antes do primeiro upload
+    if settings.PROPHET_WARM_UP:
+        warm_up()
     yield
     # On shutdown
     print("Encerrando aplicação...")
+    # Pipelines em andamento terminam antes do processo sair
+    if not upload.wait_for_pipeline_jobs(timeout=settings.PIPELINE_SHUTDOWN_TIMEOUT_SECONDS):
+        print(f"{upload.pending_pipeline_jobs()} pipelines de ML não terminaram antes do encerramento.")
 
 app = FastAPI(
     title="Smart Stock API",
@@ -19,6 +28,9 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Compressão gzip/zstd das respostas (negociada pelo Accept-Encoding)
+app.add_middleware(CompressionMiddleware, minimum_size=settings.RESPONSE_COMPRESSION_MIN_SIZE)
+
 @app.get("/", tags=["Root"])
 def read_root():
     return {"message": "Bem-vindo à API Smart Stock!"}
@@ -26,4 +38,8 @@ def read_root():
 # Routers
 app.include_router(health.router, prefix="/health", tags=["Health"])
 app.include_router(upload.router, prefix="/upload", tags=["Upload"])
+app.include_router(upload_sessions.router, prefix="/upload/sessions", tags=["Upload"])
+app.include_router(products.router, prefix="/products", tags=["Products"])
 app.include_router(predictions.router, prefix="/predictions", tags=["Predictions"])
+app.include_router(inventory.router, prefix="/inventory", tags=["Inventory"])
+app.include_router(metrics.router, prefix="/metrics", tags=["Metrics"])
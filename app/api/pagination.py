@@ -0,0 +1,69 @@
+import base64
+import json
+from typing import Callable, Iterator, List, Optional, Type
+
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+
+from app.core.database import get_read_router
+
+# Paginação por chave (keyset): o cursor guarda os valores da chave de ordenação do
+# último item devolvido, e a próxima página começa logo depois dele. Diferente de
+# OFFSET, o custo de cada página não cresce com a posição no resultado.
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+def encode_cursor(*values) -> str:
+    """
+    Codifica os valores da chave do último item da página em um cursor opaco.
+    """
+    raw = json.dumps(list(values), default=str, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: Optional[str], size: int) -> Optional[list]:
+    """
+    Decodifica um cursor recebido do cliente. Cursores malformados geram HTTP 400.
+    """
+    if not cursor:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Cursor de paginação inválido.")
+    return values
+
+def stream_ndjson(
+    fetch_page: Callable, next_key: Callable, schema: Type[BaseModel], after=None, page_size: int = 1000
+) -> StreamingResponse:
+    """
+    Transmite todos os itens a partir de `after` como NDJSON (um objeto JSON por linha),
+    buscando uma página de cada vez.
+
+    Args:
+        fetch_page: Função (db, after, limit) -> itens da página.
+        next_key: Função (último item) -> chave `after` da próxima página.
+        schema: Modelo pydantic de cada linha.
+        after: Chave a partir da qual a transmissão começa (cursor decodificado).
+        page_size: Itens buscados por consulta.
+    """
+    def lines() -> Iterator[bytes]:
+        # Sessão própria (de leitura): a transmissão continua depois que a rota retorna
+        db = get_read_router().session()
+        key = after
+        try:
+            while True:
+                page: List = fetch_page(db, key, page_size)
+                if page:
+                    yield "".join(schema.model_validate(item).model_dump_json() + "\n" for item in page).encode("utf-8")
+                if len(page) < page_size:
+                    return
+                key = next_key(page[-1])
+                # Libera os objetos já enviados: a memória fica limitada a uma página
+                db.expunge_all()
+        finally:
+            db.close()
+
+    return StreamingResponse(lines(), media_type=NDJSON_MEDIA_TYPE)
@@ -0,0 +1,23 @@
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy.orm import Session
+
+from app.core.database import get_read_db
+from app.core.crud import get_stock_at_risk
+from app.api.schemas import StockRisk as StockRiskSchema
+from app.api.dependencies import get_tenant
+
+router = APIRouter()
+
+@router.get("/at-risk", response_model=List[StockRiskSchema])
+def get_products_at_risk(
+    limit: int = Query(20, ge=1, le=500),
+    max_days_of_cover: Optional[float] = Query(None, ge=0),
+    tenant: str = Depends(get_tenant),
+    db: Session = Depends(get_read_db),
+):
+    """
+    Retorna os produtos da empresa com maior risco de ruptura (menos dias de cobertura).
+    O risco é pré-calculado a cada execução do pipeline de ML.
+    """
+    return get_stock_at_risk(db, tenant, limit=limit, max_days_of_cover=max_days_of_cover)
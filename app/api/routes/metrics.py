@@ -0,0 +1,13 @@
+from fastapi import APIRouter
+
+from app.utils.tracing import aggregator
+
+router = APIRouter()
+
+@router.get("")
+def get_metrics():
+    """
+    Retorna as medições agregadas por etapa do pipeline (tempo, CPU, memória e linhas)
+    desde o início do processo.
+    """
+    return {"stages": aggregator.snapshot()}
@@ -1,18 +1,90 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException
+import hashlib
+from datetime import datetime
+from typing import List, Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from pydantic import TypeAdapter
 from sqlalchemy.orm import Session
 
-from app.core.database import get_db, Prediction as PredictionModel
-from app.api.schemas import Prediction as PredictionSchema
+from app.core.database import get_read_db, Prediction as PredictionModel
+from app.core.crud import list_predictions
+from app.api.schemas import Prediction as PredictionSchema, PredictionPage
+from app.api.dependencies import get_tenant
+from app.api.pagination import encode_cursor, decode_cursor, stream_ndjson
+from app.api.conditional import make_etag, is_not_modified, cache_headers, not_modified
+from app.core.forecast_snapshot import get_snapshot_store
+from app.core.config import settings
 
 router = APIRouter()
 
+_predictions_adapter = TypeAdapter(List[PredictionSchema])
+
+@router.get("", response_model=PredictionPage)
+def get_predictions(
+    limit: int = Query(1000, ge=1, le=10000),
+    cursor: Optional[str] = Query(None, description="Cursor devolvido pela página anterior"),
+    product_id: Optional[int] = Query(None),
+    start: Optional[datetime] = Query(None, description="Primeira data prevista (inclusiva)"),
+    end: Optional[datetime] = Query(None, description="Última data prevista (exclusiva)"),
+    format: Literal["json", "ndjson"] = Query("json", description="ndjson transmite todas as páginas"),
+    tenant: str = Depends(get_tenant),
+    db: Session = Depends(get_read_db),
+):
+    """
+    Lista as previsões atuais da empresa em ordem de (produto, data), com paginação por cursor.
+
+    Com format=ndjson, todas as previsões a partir do cursor são transmitidas (uma por
+    linha), buscadas em páginas de `limit` itens.
+    """
+    after = decode_cursor(cursor, 2)
+    if after:
+        try:
+            after = (int(after[0]), datetime.fromisoformat(after[1]))
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail="Cursor de paginação inválido.")
+
+    def fetch_page(session, key, size):
+        return list_predictions(session, tenant, size, key, product_id=product_id, start=start, end=end)
+
+    def next_key(prediction):
+        return prediction.product_id, prediction.ds
+
+    if format == "ndjson":
+        return stream_ndjson(fetch_page, next_key, PredictionSchema, after=after, page_size=limit)
+
+    items = fetch_page(db, after, limit)
+    next_cursor = encode_cursor(*next_key(items[-1])) if len(items) == limit else None
+    return {"items": items, "next_cursor": next_cursor}
+
 @router.get("/{product_id}", response_model=List[PredictionSchema])
-def get_prediction_for_product(product_id: int, db: Session = Depends(get_db)):
+def get_prediction_for_product(
+    product_id: int, request: Request, tenant: str = Depends(get_tenant), db: Session = Depends(get_read_db)
+):
     """
-    Retorna a previsão de demanda para um produto específico a partir do banco de dados.
+    Retorna a previsão de demanda para um produto específico da empresa.
+
+    As previsões vêm do snapshot mapeado em memória da última execução do pipeline;
+    o banco de dados só é consultado se a empresa ainda não tiver um snapshot publicado
+    ou se o produto não estiver nele. A ETag é a versão do snapshot: com If-None-Match
+    (ou If-Modified-Since) da versão atual, a resposta é 304 sem corpo e sem ler as previsões.
     """
-    predictions = db.query(PredictionModel).filter(PredictionModel.product_id == product_id).all()
+    snapshot = get_snapshot_store().get(tenant)
+    rows = snapshot.lookup(product_id) if snapshot is not None else None
+    if rows is not None:
+        headers = cache_headers(
+            make_etag(f"{tenant}-{snapshot.name}-{product_id}"),
+            snapshot.created_at,
+            # Dados de uma empresa: só o cache do próprio cliente pode reutilizá-los
+            f"private, max-age={settings.PREDICTIONS_CACHE_MAX_AGE}",
+        )
+        if is_not_modified(request, headers["ETag"], snapshot.created_at):
+            return not_modified(headers)
+        predictions = rows.to_pylist()
+    else:
+        # Sem snapshot, ou produto fora dele (ex: cadastrado depois da última execução)
+        headers = None
+        predictions = db.query(PredictionModel).filter(
+            PredictionModel.tenant_id == tenant, PredictionModel.product_id == product_id
+        ).all()
 
     if not predictions:
         raise HTTPException(
@@ -20,4 +92,10 @@ def get_prediction_for_product(product_id: int, db: Session = Depends(get_db)):
             detail="Previsão não encontrada para o produto especificado."
         )
 
-    return predictions
+    body = _predictions_adapter.dump_json(_predictions_adapter.validate_python(predictions, from_attributes=True))
+    if headers is None:
+        # Fora do snapshot não há versão da execução: a ETag é o hash do conteúdo
+        headers = cache_headers(make_etag(f"{tenant}-{hashlib.sha256(body).hexdigest()[:32]}"))
+        if is_not_modified(request, headers["ETag"]):
+            return not_modified(headers)
+    return Response(content=body, media_type="application/json", headers=headers)
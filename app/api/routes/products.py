@@ -0,0 +1,43 @@
+from typing import Literal, Optional
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+
+from app.core.database import get_read_db
+from app.core.crud import list_products
+from app.api.schemas import Product as ProductSchema, ProductPage
+from app.api.dependencies import get_tenant
+from app.api.pagination import encode_cursor, decode_cursor, stream_ndjson
+
+router = APIRouter()
+
+@router.get("", response_model=ProductPage)
+def get_products(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = Query(None, description="Cursor devolvido pela página anterior"),
+    code_prefix: Optional[str] = Query(None, description="Prefixo do código do produto"),
+    name_prefix: Optional[str] = Query(None, description="Prefixo do nome do produto"),
+    format: Literal["json", "ndjson"] = Query("json", description="ndjson transmite todas as páginas"),
+    tenant: str = Depends(get_tenant),
+    db: Session = Depends(get_read_db),
+):
+    """
+    Lista os produtos da empresa em ordem de ID, com paginação por cursor.
+
+    Com format=ndjson, todos os produtos a partir do cursor são transmitidos (um por
+    linha), buscados em páginas de `limit` itens.
+    """
+    after = decode_cursor(cursor, 1)
+    try:
+        after_id = int(after[0]) if after else None
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Cursor de paginação inválido.")
+
+    def fetch_page(session, key, size):
+        return list_products(session, tenant, size, key, code_prefix=code_prefix, name_prefix=name_prefix)
+
+    if format == "ndjson":
+        return stream_ndjson(fetch_page, lambda product: product.id, ProductSchema, after=after_id, page_size=limit)
+
+    items = fetch_page(db, after_id, limit)
+    next_cursor = encode_cursor(items[-1].id) if len(items) == limit else None
+    return {"items": items, "next_cursor": next_cursor}
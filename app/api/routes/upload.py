@@ -1,5 +1,7 @@
-import io
 import datetime
+import threading
+from concurrent.futures import Future, wait
+from typing import Dict, Optional, Tuple
 import pandas as pd
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, BackgroundTasks
 
@@ -7,95 +9,289 @@ from app.processing.validator import validate_csv, PRODUCT_COLUMNS, SALES_COLUMN
 from app.processing.cleaner import clean_products_data, clean_sales_data
 from app.processing.feature_engineering import create_prophet_features
 from app.ml.trainer import train_models_for_products
-from app.ml.predictor import generate_predictions
+from app.ml.predictor import generate_predictions, stack_predictions
+from app.ml.inventory import assess_stock_risk
+from app.ml.scheduler import get_pipeline_scheduler
 from app.core.s3 import upload_fileobj_to_s3
+from app.core.datalake import write_partitioned_dataset, write_dataset_alias, raw_key, dataset_exists, training_start
+from app.core.manifest import write_batch_manifest, batch_run_id
+from app.core.parquet import to_arrow_table
+from app.core.forecast_snapshot import publish_forecast_snapshot, get_snapshot_store
+from app.core.sales_history import load_sales_history, sales_history_loaded, get_daily_sales
 from app.core.config import settings
 from app.core.database import SessionLocal
-from app.core.crud import save_products_to_db, save_predictions_to_db
+from app.core.crud import (
+    save_products_to_db, save_predictions_to_db, save_stock_risk, get_processed_key, record_processed_file,
+    forget_processed_file, complete_pipeline_run, pipeline_run_completed, claim_pipeline_run, release_pipeline_run,
+)
+from app.utils.file_utils import IngestBuffer
+from app.api.dependencies import get_tenant
+from app.utils.tracing import span
+from app.utils.logger import get_logger, bind_context
+
+logger = get_logger("api.upload")
 
 router = APIRouter()
 
-def run_ml_pipeline_task(products_df: pd.DataFrame, sales_df: pd.DataFrame):
+# Pipelines enfileirados por este processo e ainda não concluídos: Future -> (tenant, lote)
+_pipeline_jobs: Dict[Future, Tuple[str, Optional[str]]] = {}
+_pipeline_jobs_lock = threading.Lock()
+
+def schedule_ml_pipeline(
+    tenant: str,
+    products_df: pd.DataFrame,
+    sales_df: pd.DataFrame,
+    sales_root: Optional[str] = None,
+    run_id: Optional[str] = None,
+) -> Future:
+    """
+    Enfileira o pipeline de ML no scheduler compartilhado e retorna sem esperar a execução.
+    A fila é por tenant: o upload de uma empresa pequena não espera o retreino de uma grande.
+    O job fica registrado em `_pipeline_jobs` até terminar (ver wait_for_pipeline_jobs).
+    """
+    future = get_pipeline_scheduler().submit(tenant, run_ml_pipeline_task, products_df, sales_df, tenant, sales_root, run_id)
+    with _pipeline_jobs_lock:
+        _pipeline_jobs[future] = (tenant, run_id)
+    future.add_done_callback(_pipeline_job_done)
+    return future
+
+def _pipeline_job_done(future: Future):
+    with _pipeline_jobs_lock:
+        tenant, run_id = _pipeline_jobs.pop(future, (None, None))
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Pipeline de ML do tenant %s (lote %s) falhou: %s", tenant, run_id, future.exception())
+
+def pending_pipeline_jobs() -> int:
+    with _pipeline_jobs_lock:
+        return len(_pipeline_jobs)
+
+def wait_for_pipeline_jobs(timeout: Optional[float] = None) -> bool:
+    """
+    Espera os pipelines enfileirados por este processo (ex: no encerramento da API).
+
+    Returns:
+        True se todos terminaram dentro de `timeout`.
+    """
+    with _pipeline_jobs_lock:
+        futures = list(_pipeline_jobs)
+    return not wait(futures, timeout=timeout).not_done
+
+def run_ml_pipeline_task(
+    products_df: pd.DataFrame,
+    sales_df: pd.DataFrame,
+    tenant: Optional[str] = None,
+    sales_root: Optional[str] = None,
+    run_id: Optional[str] = None,
+):
     """
     Executa o pipeline de ML completo e salva os resultados no banco de dados.
+    `sales_root` é o dataset processado das vendas, registrado na carga do histórico;
+    `run_id` identifica o lote (ver batch_run_id) e é marcado como concluído ao final.
+    """
+    job_id = datetime.datetime.now(datetime.UTC).strftime("%Y%m%d%H%M%S%f")
+    tenant = tenant or settings.DEFAULT_TENANT
+    with bind_context(job_id=job_id, tenant=tenant):
+        _run_ml_pipeline(products_df, sales_df, tenant, job_id, sales_root, run_id)
+
+def _publish_snapshot(forecast_df: pd.DataFrame, tenant: str, timestamp: str):
     """
-    print("Iniciando pipeline de ML...", flush=True)
+    Publica o snapshot das previsões servido pela API. Falhas não interrompem o
+    pipeline: sem snapshot, as consultas continuam sendo respondidas pelo banco.
+    """
+    if forecast_df.empty:
+        return
+    try:
+        with span("publish_forecast_snapshot"):
+            publish_forecast_snapshot(to_arrow_table(forecast_df, "forecast"), tenant, timestamp)
+        get_snapshot_store().invalidate(tenant)
+    except Exception as e:
+        logger.warning("Não foi possível publicar o snapshot de previsões: %s", e)
+
+def _run_ml_pipeline(
+    products_df: pd.DataFrame,
+    sales_df: pd.DataFrame,
+    tenant: str,
+    timestamp: str,
+    sales_root: Optional[str] = None,
+    run_id: Optional[str] = None,
+):
+    # O _SUCCESS dos datasets também aciona a Lambda de previsão: o lote é reivindicado
+    # como lá (mesmo run_id), e só uma das execuções treina
+    if run_id:
+        db = SessionLocal()
+        try:
+            claimed = claim_pipeline_run(db, tenant, run_id)
+        finally:
+            db.close()
+        if not claimed:
+            logger.info("Lote %s/%s já foi executado ou está em execução. Ignorando.", tenant, run_id)
+            return
+
+    logger.info("Iniciando pipeline de ML...")
     try:
         db = SessionLocal()
         try:
-            save_products_to_db(db, products_df)
-
-            # Filtrar vendas para incluir apenas produtos que existem no CSV de produtos
-            valid_product_ids = set(products_df['produto_id'].unique())
-            initial_sales_count = len(sales_df)
-            sales_df = sales_df[sales_df['produto_id'].isin(valid_product_ids)]
-            filtered_sales_count = len(sales_df)
-            
-            if initial_sales_count != filtered_sales_count:
-                print(f"Filtrando vendas: {initial_sales_count - filtered_sales_count} registros removidos pois os produtos não foram encontrados.", flush=True)
-
-            feature_dfs = create_prophet_features(sales_df)
-            trained_models = train_models_for_products(feature_dfs)
-            predictions = generate_predictions(trained_models, days_to_predict=90)
-            for product_id, forecast_df in predictions.items():
-                save_predictions_to_db(db, int(product_id), forecast_df)
-            print("Pipeline de ML concluído.", flush=True)
+            with span("ml_pipeline") as pipeline_span:
+                pipeline_span.rows_in = len(sales_df)
+                save_products_to_db(db, products_df, tenant=tenant)
+                # Histórico de vendas no banco: com o dataset carregado, o treino usa o
+                # histórico acumulado, como os workers da Lambda (feature_source="database")
+                from_history = False
+                if settings.SALES_HISTORY_ENABLED:
+                    load_sales_history(db, sales_df, tenant=tenant, source=sales_root)
+                    from_history = sales_root is not None and sales_history_loaded(db, tenant, sales_root)
+
+                # Filtrar vendas para incluir apenas produtos que existem no CSV de produtos
+                valid_product_ids = set(products_df['produto_id'].unique())
+                initial_sales_count = len(sales_df)
+                sales_df = sales_df[sales_df['produto_id'].isin(valid_product_ids)]
+                filtered_sales_count = len(sales_df)
+
+                if initial_sales_count != filtered_sales_count:
+                    logger.info("Filtrando vendas: %d registros removidos pois os produtos não foram encontrados.", initial_sales_count - filtered_sales_count)
+
+                # Mesma janela de treino dos workers da Lambda (ver training_start)
+                start = training_start()
+                if from_history:
+                    feature_dfs = get_daily_sales(db, tenant, valid_product_ids, start=start)
+                else:
+                    if start is not None:
+                        sales_df = sales_df[sales_df['data_pedido'] >= pd.Timestamp(start)]
+                    feature_dfs = create_prophet_features(sales_df)
+                trained_models = train_models_for_products(feature_dfs)
+                samples = {} if settings.FORECAST_KEEP_SAMPLES else None
+                predictions = generate_predictions(trained_models, days_to_predict=settings.FORECAST_DAYS, samples=samples)
+                for product_id, forecast_df in predictions.items():
+                    save_predictions_to_db(db, int(product_id), forecast_df, tenant=tenant)
+
+                all_forecasts = stack_predictions(predictions)
+                stock = products_df.set_index('produto_id')['produto_estoque_atual']
+                save_stock_risk(db, assess_stock_risk(all_forecasts, stock, samples, horizon_days=settings.FORECAST_DAYS), tenant=tenant)
+                _publish_snapshot(all_forecasts, tenant, timestamp)
+                pipeline_span.rows_out = len(predictions)
+            if run_id:
+                # Só um lote concluído dispensa o retreino de um reenvio idêntico
+                complete_pipeline_run(db, tenant, run_id)
+            logger.info("Pipeline de ML concluído.")
         finally:
             db.close()
     except Exception as e:
-        print(f"Erro fatal no pipeline de ML: {e}", flush=True)
-        import traceback
-        traceback.print_exc()
+        logger.exception("Erro fatal no pipeline de ML: %s", e)
+        if run_id:
+            # Libera o lote: um reenvio (ou a Lambda) pode executá-lo de novo
+            db = SessionLocal()
+            try:
+                release_pipeline_run(db, tenant, run_id)
+            finally:
+                db.close()
 
 
+def _write_processed_dataset(
+    df: Optional[pd.DataFrame], dataset: str, timestamp: str, tenant: str, existing_key: Optional[str] = None
+) -> str:
+    """
+    Grava o DataFrame limpo no data lake (Parquet particionado) e retorna a chave raiz.
+    Se o mesmo conteúdo já foi processado (`existing_key`), apenas publica o dataset existente.
+    """
+    nome = "produtos" if dataset == "products" else "vendas"
+    with span(f"upload_processed_{dataset}") as s:
+        s.rows_in = len(df) if df is not None else 0
+        try:
+            if existing_key:
+                return write_dataset_alias(existing_key, dataset, timestamp, tenant=tenant)
+            return write_partitioned_dataset(df, dataset, timestamp, tenant=tenant)
+        except Exception as e:
+            logger.error("Erro ao gravar o dataset processado de %s: %s", nome, e)
+            raise HTTPException(status_code=500, detail=f"Upload do arquivo processado de {nome} falhou.")
+
 @router.post("")
 async def upload_csv_files(
     background_tasks: BackgroundTasks,
     products_file: UploadFile = File(..., description="CSV de produtos"),
     sales_file: UploadFile = File(..., description="CSV de vendas"),
+    tenant: str = Depends(get_tenant),
 ):
+    # Um buffer por arquivo, compartilhado por validação, upload, hash e limpeza
+    with IngestBuffer.from_file(products_file.file) as products, IngestBuffer.from_file(sales_file.file) as sales:
+        return _ingest_upload(background_tasks, tenant, products, sales)
+
+def _ingest_upload(background_tasks: BackgroundTasks, tenant: str, products: IngestBuffer, sales: IngestBuffer) -> dict:
     # (Validação e upload para S3)
-    is_valid, message = validate_csv(products_file.file, PRODUCT_COLUMNS)
+    is_valid, message = validate_csv(products, PRODUCT_COLUMNS)
     if not is_valid:
         raise HTTPException(status_code=400, detail=f"Arquivo de produtos inválido: {message}")
-    is_valid, message = validate_csv(sales_file.file, SALES_COLUMNS)
+    is_valid, message = validate_csv(sales, SALES_COLUMNS)
     if not is_valid:
         raise HTTPException(status_code=400, detail=f"Arquivo de vendas inválido: {message}")
 
     timestamp = datetime.datetime.now(datetime.UTC).strftime("%Y%m%d%H%M%S")
-    raw_products_path = f"raw/products_{timestamp}.csv"
-    raw_sales_path = f"raw/sales_{timestamp}.csv"
-    if not upload_fileobj_to_s3(products_file.file, settings.S3_BUCKET_NAME, raw_products_path):
-        raise HTTPException(status_code=500, detail="Upload do arquivo bruto de produtos falhou.")
-    if not upload_fileobj_to_s3(sales_file.file, settings.S3_BUCKET_NAME, raw_sales_path):
-        raise HTTPException(status_code=500, detail="Upload do arquivo bruto de vendas falhou.")
-
-    # Resetar ponteiros após upload
-    products_file.file.seek(0)
-    sales_file.file.seek(0)
-
-    products_df = clean_products_data(products_file.file)
-    sales_df = clean_sales_data(sales_file.file)
-
-    with io.BytesIO() as buffer:
-        products_df.to_parquet(buffer, index=False)
-        buffer.seek(0)
-        processed_products_path = f"processed/products_{timestamp}.parquet"
-        if not upload_fileobj_to_s3(buffer, settings.S3_BUCKET_NAME, processed_products_path):
-            raise HTTPException(status_code=500, detail="Upload do arquivo processado de produtos falhou.")
-
-    with io.BytesIO() as buffer:
-        sales_df.to_parquet(buffer, index=False)
-        buffer.seek(0)
-        processed_sales_path = f"processed/sales_{timestamp}.parquet"
-        if not upload_fileobj_to_s3(buffer, settings.S3_BUCKET_NAME, processed_sales_path):
-            raise HTTPException(status_code=500, detail="Upload do arquivo processado de vendas falhou.")
-
-    # Agendar o pipeline de ML
-    background_tasks.add_task(run_ml_pipeline_task, products_df, sales_df)
+    # Arquivos comprimidos (gzip, zstd, zip) são guardados como recebidos
+    raw_products_path = raw_key("products", timestamp, tenant, compression=products.compression)
+    raw_sales_path = raw_key("sales", timestamp, tenant, compression=sales.compression)
+    with span("upload_raw_files"):
+        if not upload_fileobj_to_s3(products.cursor(), settings.S3_BUCKET_NAME, raw_products_path):
+            raise HTTPException(status_code=500, detail="Upload do arquivo bruto de produtos falhou.")
+        if not upload_fileobj_to_s3(sales.cursor(), settings.S3_BUCKET_NAME, raw_sales_path):
+            raise HTTPException(status_code=500, detail="Upload do arquivo bruto de vendas falhou.")
+
+    # Arquivos com conteúdo já processado reaproveitam o dataset existente
+    content_hashes = {
+        "products": products.sha256(),
+        "sales": sales.sha256(),
+    }
+    db = SessionLocal()
+    try:
+        existing_keys = {dataset: get_processed_key(db, h, dataset, tenant=tenant) for dataset, h in content_hashes.items()}
+        for dataset, existing_key in existing_keys.items():
+            # Dataset removido do data lake desde o registro: o conteúdo é processado de novo
+            if existing_key and not dataset_exists(existing_key):
+                forget_processed_file(db, content_hashes[dataset], dataset, tenant=tenant)
+                existing_keys[dataset] = None
+        already_trained = all(existing_keys.values()) and pipeline_run_completed(db, tenant, batch_run_id(existing_keys))
+    finally:
+        db.close()
+
+    # O manifesto lista os datasets do upload; o pipeline só roda quando todos estiverem completos
+    try:
+        manifest_path = write_batch_manifest(timestamp, tenant=tenant)
+    except Exception as e:
+        logger.error("Erro ao gravar o manifesto do upload: %s", e)
+        raise HTTPException(status_code=500, detail="Gravação do manifesto do upload falhou.")
+
+    if already_trained:
+        # Nada mudou e o pipeline desses dados já foi concluído: não há o que processar nem retreinar.
+        # Se o treino anterior falhou, o reenvio segue adiante e treina de novo
+        return {
+            "message": "Arquivos já processados anteriormente. Nenhum novo processamento necessário.",
+            "raw_files": [raw_products_path, raw_sales_path],
+            "processed_files": [
+                _write_processed_dataset(None, dataset, timestamp, tenant, existing_keys[dataset])
+                for dataset in ("products", "sales")
+            ],
+            "manifest": manifest_path,
+        }
+
+    products_df = clean_products_data(products)
+    sales_df = clean_sales_data(sales)
+
+    processed_paths = {}
+    db = SessionLocal()
+    try:
+        for dataset, df, raw_path in (("products", products_df, raw_products_path), ("sales", sales_df, raw_sales_path)):
+            processed_paths[dataset] = _write_processed_dataset(df, dataset, timestamp, tenant, existing_keys[dataset])
+            if not existing_keys[dataset]:
+                record_processed_file(db, content_hashes[dataset], dataset, processed_paths[dataset], raw_key=raw_path, tenant=tenant)
+    finally:
+        db.close()
+
+    # Agendar o pipeline de ML (fila justa entre tenants)
+    # O lote é identificado pelos datasets que realmente usa, como na Lambda de previsão
+    run_id = batch_run_id({dataset: existing_keys[dataset] or processed_paths[dataset] for dataset in processed_paths})
+    background_tasks.add_task(schedule_ml_pipeline, tenant, products_df, sales_df, processed_paths["sales"], run_id)
 
     return {
         "message": "Arquivos recebidos. O processamento foi iniciado.",
         "raw_files": [raw_products_path, raw_sales_path],
-        "processed_files": [processed_products_path, processed_sales_path],
+        "processed_files": [processed_paths["products"], processed_paths["sales"]],
+        "manifest": manifest_path,
     }
@@ -0,0 +1,158 @@
+import re
+import tempfile
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Request
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from app.api.dependencies import get_tenant
+from app.api.schemas import UploadSessionCreate, UploadSessionComplete
+from app.core.config import settings
+from app.core.crud import get_upload_session
+from app.core.database import get_db, SessionLocal
+from app.core.s3 import get_s3_client, get_presign_client
+from app.core.upload_sessions import start_upload_session, finish_upload_session, upload_chunk, upload_session_status
+from app.utils.logger import get_logger
+
+logger = get_logger("api.upload_sessions")
+
+router = APIRouter()
+
+_CONTENT_RANGE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+# Partes até este tamanho ficam em memória; acima disso, em arquivo temporário
+_CHUNK_SPOOL_MAX_MEMORY = 1024 * 1024
+
+def _s3_client():
+    s3_client = get_s3_client()
+    if s3_client is None:
+        raise HTTPException(status_code=500, detail="S3 indisponível.")
+    return s3_client
+
+@router.post("")
+def create_upload_session(
+    request: UploadSessionCreate,
+    tenant: str = Depends(get_tenant),
+    db: Session = Depends(get_db),
+):
+    """
+    Abre uma sessão de upload direto ao S3 e retorna as URLs pré-assinadas dos dois CSVs.
+    Arquivos maiores que UPLOAD_PART_SIZE recebem uma URL por parte (multipart upload).
+    """
+    sizes = {"products": request.products_size, "sales": request.sales_size}
+    try:
+        s3_client = _s3_client()
+        return start_upload_session(db, tenant, sizes, s3_client, presign_client=get_presign_client(s3_client))
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Erro ao abrir a sessão de upload: %s", e)
+        raise HTTPException(status_code=500, detail="Não foi possível abrir a sessão de upload.")
+
+@router.post("/resumable")
+def create_resumable_upload_session(
+    request: UploadSessionCreate,
+    tenant: str = Depends(get_tenant),
+    db: Session = Depends(get_db),
+):
+    """
+    Abre uma sessão de upload retomável: os dois CSVs são enviados à API em partes de
+    UPLOAD_CHUNK_SIZE (PUT /upload/sessions/{id}/files/{dataset}) e guardados no S3 em
+    multipart uploads.
+    """
+    sizes = {"products": request.products_size, "sales": request.sales_size}
+    try:
+        return start_upload_session(db, tenant, sizes, _s3_client(), resumable=True)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error("Erro ao abrir a sessão de upload retomável: %s", e)
+        raise HTTPException(status_code=500, detail="Não foi possível abrir a sessão de upload.")
+
+@router.get("/{session_id}")
+def get_upload_session_status(
+    session_id: str,
+    tenant: str = Depends(get_tenant),
+    db: Session = Depends(get_db),
+):
+    """
+    Estado da sessão. Para retomar um upload em partes, o cliente continua a partir do
+    `offset` de cada arquivo (ou reenvia as partes em `missing_parts`).
+    """
+    session = get_upload_session(db, session_id, tenant)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Sessão de upload não encontrada.")
+    return upload_session_status(db, session)
+
+def _store_chunk(session_id: str, tenant: str, dataset: str, content_range: tuple, body, checksum: str) -> dict:
+    # Executada no threadpool (boto3 e o banco bloqueiam), com uma sessão do banco própria
+    db = SessionLocal()
+    try:
+        session = get_upload_session(db, session_id, tenant)
+        if session is None:
+            raise HTTPException(status_code=404, detail="Sessão de upload não encontrada.")
+        try:
+            return upload_chunk(db, session, dataset, *content_range, body, checksum, _s3_client())
+        except LookupError as e:
+            raise HTTPException(status_code=404, detail=str(e))
+        except ValueError as e:
+            raise HTTPException(status_code=409 if session.status == "completed" else 400, detail=str(e))
+    finally:
+        db.close()
+
+@router.put("/{session_id}/files/{dataset}")
+async def put_upload_chunk(
+    session_id: str,
+    dataset: str,
+    request: Request,
+    content_range: str = Header(..., description="Intervalo da parte: bytes {início}-{fim}/{total}"),
+    checksum: str = Header(..., alias="X-Checksum-SHA256", description="SHA-256 (hexadecimal) da parte"),
+    tenant: str = Depends(get_tenant),
+):
+    """
+    Recebe uma parte de um arquivo da sessão retomável. Reenviar uma parte é seguro:
+    o conteúdo é conferido pelo checksum e a parte registrada é substituída.
+    """
+    match = _CONTENT_RANGE.match(content_range.strip())
+    if match is None or int(match.group(2)) < int(match.group(1)):
+        raise HTTPException(status_code=400, detail="Content-Range inválido.")
+    start, end, total = (int(value) for value in match.groups())
+
+    with tempfile.SpooledTemporaryFile(max_size=_CHUNK_SPOOL_MAX_MEMORY) as body:
+        expected, received = end + 1 - start, 0
+        async for block in request.stream():
+            received += len(block)
+            if received > expected:
+                raise HTTPException(status_code=400, detail="A parte é maior que o intervalo informado.")
+            body.write(block)
+        body.seek(0)
+        return await run_in_threadpool(_store_chunk, session_id, tenant, dataset, (start, end, total), body, checksum)
+
+@router.post("/{session_id}/complete")
+def complete_upload_session(
+    session_id: str,
+    request: UploadSessionComplete,
+    tenant: str = Depends(get_tenant),
+    db: Session = Depends(get_db),
+):
+    """
+    Conclui a sessão depois que o cliente enviou os arquivos. O processamento começa
+    pela notificação do S3 de cada arquivo em raw/, como nos uploads pela API.
+    Nas sessões retomáveis, `parts` pode ser omitido: as partes vêm do ledger.
+    """
+    session = get_upload_session(db, session_id, tenant)
+    if session is None:
+        raise HTTPException(status_code=404, detail="Sessão de upload não encontrada.")
+
+    parts = {dataset: [part.model_dump() for part in items] for dataset, items in request.parts.items()}
+    try:
+        raw_files = finish_upload_session(db, session, parts, _s3_client())
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    return {
+        "message": "Arquivos recebidos. O processamento foi iniciado.",
+        "session_id": session.id,
+        "status": session.status,
+        "raw_files": raw_files,
+        "bucket": settings.S3_BUCKET_NAME,
+    }
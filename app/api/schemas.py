@@ -1,4 +1,5 @@
-from pydantic import BaseModel, ConfigDict
+from typing import Dict, List, Optional
+from pydantic import BaseModel, ConfigDict, Field
 from datetime import datetime
 
 class PredictionBase(BaseModel):
@@ -8,7 +9,58 @@ class PredictionBase(BaseModel):
     yhat_upper: float
 
 class Prediction(PredictionBase):
+    # Previsões servidas pelo snapshot não têm ID do banco
+    id: Optional[int] = None
+    product_id: int
+
+    model_config = ConfigDict(from_attributes=True)
+
+class PredictionPage(BaseModel):
+    items: List[Prediction]
+    # Cursor da próxima página (None na última)
+    next_cursor: Optional[str] = None
+
+class Product(BaseModel):
     id: int
+    name: Optional[str] = None
+    code: Optional[str] = None
+    price: Optional[float] = None
+    stock: Optional[float] = None
+
+    model_config = ConfigDict(from_attributes=True)
+
+class ProductPage(BaseModel):
+    items: List[Product]
+    next_cursor: Optional[str] = None
+
+class StockRisk(BaseModel):
     product_id: int
+    stock: Optional[float] = None
+    days_of_cover: float
+    # Vazio quando o estoque cobre todo o horizonte da previsão
+    stockout_date: Optional[datetime] = None
+    lead_time_days: int
+    service_level: float
+    lead_time_demand: float
+    safety_stock: float
+    reorder_point: float
+    reorder_quantity: float
+    stockout_probability: Optional[float] = None
+    lead_time_stockout_probability: Optional[float] = None
+    expected_lost_sales: Optional[float] = None
+    computed_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
+
+class UploadSessionCreate(BaseModel):
+    # Tamanho em bytes de cada CSV: define upload simples ou em partes
+    products_size: int = Field(gt=0)
+    sales_size: int = Field(gt=0)
+
+class UploadedPart(BaseModel):
+    part_number: int = Field(ge=1)
+    etag: str
+
+class UploadSessionComplete(BaseModel):
+    # Partes enviadas de cada arquivo multipart, por dataset ("products" ou "sales")
+    parts: Dict[str, List[UploadedPart]] = {}
@@ -1,3 +1,4 @@
+from typing import Dict
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 class Settings(BaseSettings):
@@ -14,8 +15,125 @@ class Settings(BaseSettings):
     AWS_SESSION_TOKEN: str = "" # Optional: for temporary credentials
     AWS_REGION: str = "us-east-1"
     S3_BUCKET_NAME: str = "smart-stock-data-bucket"
+    # Endpoint S3 alternativo (ex: MinIO ou LocalStack em desenvolvimento); vazio usa a AWS
+    S3_ENDPOINT_URL: str = ""
+    # Endpoint usado nas URLs pré-assinadas entregues aos clientes, quando difere do acessado
+    # pela API (ex: a API usa http://minio:9000 na rede do Docker e o host, http://localhost:9000)
+    S3_PUBLIC_ENDPOINT_URL: str = ""
+
+    # Data Lake Settings
+    # Identificador da empresa (tenant) usado quando o upload não informa o cabeçalho X-Tenant-ID
+    DEFAULT_TENANT: str = "default"
+    # Número de buckets de produto (produto_id % N) usados como partição
+    DATALAKE_PRODUCT_BUCKETS: int = 16
+    # Tamanho máximo (em linhas) de cada row group dos arquivos Parquet
+    PARQUET_ROW_GROUP_SIZE: int = 128_000
+    # Compressão dos arquivos Parquet (zstd comprime bem mais que o snappy padrão
+    # e descomprime quase tão rápido)
+    PARQUET_COMPRESSION: str = "zstd"
+    PARQUET_COMPRESSION_LEVEL: int = 3
+
+    # Processing Settings
+    # Engine do pandas.read_csv usado na limpeza: "pyarrow" (multithread, bem mais
+    # rápido em arquivos grandes) ou "c"
+    CSV_ENGINE: str = "pyarrow"
+    # Backend da limpeza de vendas e da agregação diária: "pandas" (em memória) ou
+    # "duckdb" (SQL no DuckDB embarcado, com spill em disco; requer o pacote duckdb)
+    PROCESSING_BACKEND: str = "pandas"
+    # Threads do DuckDB (0 = todos os núcleos)
+    DUCKDB_THREADS: int = 0
+    # Limite de memória do DuckDB (ex: "2GB"); vazio usa o padrão do DuckDB (80% da RAM)
+    DUCKDB_MEMORY_LIMIT: str = ""
+    # Diretório onde o DuckDB grava os dados que não cabem na memória
+    DUCKDB_TEMP_DIR: str = "/tmp/smart-stock/duckdb"
+
+    # Sales History Settings
+    # Carrega as vendas processadas no banco (sales_daily) e mantém as vendas diárias por
+    # produto; os workers leem a série de treino do banco em vez do data lake
+    SALES_HISTORY_ENABLED: bool = True
+    # Janela do histórico usado no treino, em dias até hoje (0 = todo o histórico). Com o data
+    # lake, as partições de meses anteriores à janela nem são baixadas
+    TRAINING_HISTORY_DAYS: int = 0
+
+    # Upload Session Settings
+    # Validade das URLs pré-assinadas de upload direto ao S3
+    UPLOAD_URL_EXPIRES_SECONDS: int = 3600
+    # Arquivos maiores que isto são enviados em partes (multipart upload); também é o tamanho de cada parte
+    UPLOAD_PART_SIZE: int = 64 * 1024 * 1024
+    # Tamanho de cada parte no upload retomável pela API (mínimo de 5 MiB do S3): uma falha de
+    # rede perde no máximo uma parte
+    UPLOAD_CHUNK_SIZE: int = 8 * 1024 * 1024
+
+    # Forecast Settings
+    # Horizonte das previsões, em dias (API e workers de previsão)
+    FORECAST_DAYS: int = 90
+
+    # Inventory Settings
+    # Dias entre o pedido de reposição e a chegada do estoque
+    INVENTORY_LEAD_TIME_DAYS: int = 7
+    # Probabilidade desejada de não faltar estoque durante o lead time
+    INVENTORY_SERVICE_LEVEL: float = 0.95
+
+    # Simulation Settings
+    # Guarda amostras da distribuição preditiva e simula a ruptura de estoque (Monte Carlo)
+    FORECAST_KEEP_SAMPLES: bool = False
+    # Caminhos (amostras) mantidos por produto, em float32
+    SIMULATION_PATHS: int = 200
+    # Produtos simulados por lote: limita a memória da simulação
+    SIMULATION_CHUNK_PRODUCTS: int = 256
+
+    # Forecast Snapshot Settings
+    # Diretório local onde a API guarda os snapshots de previsões mapeados em memória
+    FORECAST_SNAPSHOT_DIR: str = "/tmp/smart-stock/snapshots"
+    # Intervalo mínimo entre consultas ao ponteiro do snapshot atual de cada tenant
+    FORECAST_SNAPSHOT_REFRESH_SECONDS: float = 30.0
+
+    # HTTP Caching and Compression Settings
+    # Tempo (segundos) que o cliente pode reutilizar a previsão de um produto sem revalidar
+    PREDICTIONS_CACHE_MAX_AGE: int = 60
+    # Respostas menores que isto (bytes) não são comprimidas
+    RESPONSE_COMPRESSION_MIN_SIZE: int = 1024
 
     # Database Settings (placeholders for local docker)
     DATABASE_URL: str = "postgresql://user:password@db:5432/smart-stock"
+    # Réplica de leitura usada pelas consultas da API (vazio = todas as leituras no primário)
+    DATABASE_REPLICA_URL: str = ""
+    # Atraso máximo (segundos) aceito na réplica; acima dele as leituras vão para o primário
+    DATABASE_REPLICA_MAX_LAG_SECONDS: float = 30.0
+    # Intervalo mínimo entre medições do atraso da réplica
+    DATABASE_REPLICA_CHECK_SECONDS: float = 5.0
+
+    # Logging Settings
+    # Fração das mensagens por produto (treino/previsão/gravação) que são mantidas
+    LOG_PRODUCT_SAMPLE_RATE: float = 0.1
+
+    # Metrics Settings
+    METRICS_FLUSH_INTERVAL_SECONDS: float = 10.0
+    METRICS_MAX_BUFFERED: int = 1000
+
+    # Predict Sharding Settings
+    # "local" executa os shards no próprio processo; "lambda" invoca um worker por shard
+    PREDICT_EXECUTOR: str = "local"
+    # Custo estimado máximo (segundos aproximados) de cada shard
+    PREDICT_SHARD_MAX_COST: float = 600.0
+    # Função Lambda dos workers (padrão: a própria função coordenadora)
+    PREDICT_WORKER_FUNCTION_NAME: str = ""
+    # Workers Lambda simultâneos por tenant: os demais shards esperam o término de um anterior
+    PREDICT_WORKERS_PER_TENANT: int = 10
+    # Carrega o Prophet e o modelo Stan na inicialização da API e da Lambda de previsão,
+    # em vez de no primeiro treino
+    PROPHET_WARM_UP: bool = True
+
+    # Pipeline Scheduling Settings
+    # Execuções de pipeline/shards simultâneas no processo (API e executor local)
+    PIPELINE_MAX_WORKERS: int = 2
+    # Execuções simultâneas de um mesmo tenant, para que um tenant grande não ocupe todos os workers
+    PIPELINE_TENANT_CONCURRENCY: int = 1
+    # Cotas específicas por tenant (JSON, ex: {"loja-grande": 2})
+    PIPELINE_TENANT_QUOTAS: Dict[str, int] = {}
+    # Execução de pipeline não concluída neste tempo é considerada abandonada e pode ser retomada
+    PIPELINE_RUN_TIMEOUT_SECONDS: int = 2 * 3600
+    # Tempo que a API espera os pipelines em andamento ao encerrar
+    PIPELINE_SHUTDOWN_TIMEOUT_SECONDS: float = 300.0
 
 settings = Settings()
@@ -1,45 +1,339 @@
+import datetime
+from typing import List, Optional, Tuple
 import pandas as pd
+from sqlalchemy import insert, tuple_
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from app.core.database import Product, Prediction
+from app.core.database import Product, Prediction, PipelineRun, ProcessedFile, UploadSession, UploadPart, StockRisk
+from app.utils.tracing import span
+from app.utils.logger import get_logger
+from app.core.config import settings
 
-def save_products_to_db(db: Session, products_df: pd.DataFrame):
+logger = get_logger("core.crud")
+# Mensagens por produto são amostradas para não pesar no loop de gravação
+product_logger = get_logger("core.crud.product", sample_rate=settings.LOG_PRODUCT_SAMPLE_RATE)
+
+def save_products_to_db(db: Session, products_df: pd.DataFrame, tenant: Optional[str] = None):
     """
     Salva ou atualiza produtos no banco de dados a partir de um DataFrame.
+    Os produtos pertencem ao tenant informado (padrão: settings.DEFAULT_TENANT).
+    """
+    tenant = tenant or settings.DEFAULT_TENANT
+    logger.info("Salvando produtos no banco de dados...")
+    with span("save_products_to_db") as s:
+        s.rows_in = len(products_df)
+        for _, row in products_df.iterrows():
+            product_id = int(row['produto_id'])
+            # Verifica se o produto já existe
+            db_product = db.get(Product, (tenant, product_id))
+            if not db_product:
+                # Cria um novo produto se não existir
+                db_product = Product(
+                    tenant_id=tenant,
+                    id=product_id,
+                    name=row['produto_nome'],
+                    code=row['produto_codigo'],
+                    price=row['produto_preco'],
+                    stock=row['produto_estoque_atual']
+                )
+                db.add(db_product)
+            else:
+                # O estoque atual é o do upload mais recente
+                db_product.stock = row['produto_estoque_atual']
+        db.commit()
+    logger.info("%d produtos salvos/atualizados.", len(products_df))
+
+def save_predictions_to_db(db: Session, product_id: int, forecast_df: pd.DataFrame, tenant: Optional[str] = None):
+    """
+    Salva as previsões de um produto do tenant no banco de dados, limpando as antigas.
     """
-    print("Salvando produtos no banco de dados...")
-    for _, row in products_df.iterrows():
-        product_id = int(row['produto_id'])
-        # Verifica se o produto já existe
-        db_product = db.query(Product).filter(Product.id == product_id).first()
-        if not db_product:
-            # Cria um novo produto se não existir
-            db_product = Product(
-                id=product_id,
-                name=row['produto_nome'],
-                code=row['produto_codigo'],
-                price=row['produto_preco'],
-                stock=row['produto_estoque_atual']
+    tenant = tenant or settings.DEFAULT_TENANT
+    with span("save_predictions_to_db", product_id=str(product_id)) as s:
+        s.rows_in = len(forecast_df)
+        # Deleta previsões antigas para este produto
+        db.query(Prediction).filter(Prediction.tenant_id == tenant, Prediction.product_id == product_id).delete()
+
+        # Adiciona as novas previsões
+        for _, row in forecast_df.iterrows():
+            db_prediction = Prediction(
+                tenant_id=tenant,
+                product_id=product_id,
+                ds=row['ds'],
+                yhat=row['yhat'],
+                yhat_lower=row['yhat_lower'],
+                yhat_upper=row['yhat_upper']
             )
-            db.add(db_product)
+            db.add(db_prediction)
+        db.commit()
+    product_logger.info("Previsões para o produto %s salvas no banco de dados.", product_id)
+
+def list_products(
+    db: Session,
+    tenant: Optional[str] = None,
+    limit: int = 100,
+    after_id: Optional[int] = None,
+    code_prefix: Optional[str] = None,
+    name_prefix: Optional[str] = None,
+) -> List[Product]:
+    """
+    Lista os produtos do tenant em ordem de ID, a partir do produto seguinte a `after_id`.
+
+    A paginação é por chave (keyset) sobre a chave primária (tenant_id, id): cada página
+    custa o mesmo, qualquer que seja a sua posição no catálogo.
+    """
+    query = db.query(Product).filter(Product.tenant_id == (tenant or settings.DEFAULT_TENANT))
+    if code_prefix:
+        query = query.filter(Product.code.startswith(code_prefix, autoescape=True))
+    if name_prefix:
+        query = query.filter(Product.name.startswith(name_prefix, autoescape=True))
+    if after_id is not None:
+        query = query.filter(Product.id > after_id)
+    return query.order_by(Product.id).limit(limit).all()
+
+def list_predictions(
+    db: Session,
+    tenant: Optional[str] = None,
+    limit: int = 1000,
+    after: Optional[Tuple[int, datetime.datetime]] = None,
+    product_id: Optional[int] = None,
+    start: Optional[datetime.datetime] = None,
+    end: Optional[datetime.datetime] = None,
+) -> List[Prediction]:
+    """
+    Lista as previsões do tenant em ordem de (produto, data), a partir da posição seguinte a `after`.
+
+    A paginação é por chave sobre o índice (tenant_id, product_id, ds); `start` e `end`
+    limitam as datas previstas (intervalo [start, end)).
+    """
+    query = db.query(Prediction).filter(Prediction.tenant_id == (tenant or settings.DEFAULT_TENANT))
+    if product_id is not None:
+        query = query.filter(Prediction.product_id == product_id)
+    if start is not None:
+        query = query.filter(Prediction.ds >= start)
+    if end is not None:
+        query = query.filter(Prediction.ds < end)
+    if after is not None:
+        query = query.filter(tuple_(Prediction.product_id, Prediction.ds) > tuple_(*after))
+    return query.order_by(Prediction.product_id, Prediction.ds).limit(limit).all()
+
+def get_product_stock(db: Session, product_ids: List[int], tenant: Optional[str] = None) -> pd.Series:
+    """
+    Retorna o estoque atual dos produtos do tenant, indexado pelo ID do produto.
+    """
+    rows = db.query(Product.id, Product.stock).filter(
+        Product.tenant_id == (tenant or settings.DEFAULT_TENANT), Product.id.in_([int(pid) for pid in product_ids])
+    ).all()
+    return pd.Series({pid: stock for pid, stock in rows}, dtype="float64")
+
+def save_stock_risk(
+    db: Session,
+    risk_df: pd.DataFrame,
+    tenant: Optional[str] = None,
+    lead_time_days: Optional[int] = None,
+    service_level: Optional[float] = None,
+):
+    """
+    Substitui o risco de ruptura dos produtos do DataFrame (saída de compute_stock_risk).
+    """
+    tenant = tenant or settings.DEFAULT_TENANT
+    with span("save_stock_risk") as s:
+        s.rows_in = len(risk_df)
+        product_ids = [int(pid) for pid in risk_df["product_id"]]
+        db.query(StockRisk).filter(StockRisk.tenant_id == tenant, StockRisk.product_id.in_(product_ids)).delete()
+        if product_ids:
+            computed_at = datetime.datetime.now(datetime.UTC)
+            records = risk_df.astype(object).where(risk_df.notna(), None).to_dict("records")
+            db.execute(insert(StockRisk), [
+                dict(
+                    record,
+                    product_id=int(record["product_id"]),
+                    tenant_id=tenant,
+                    lead_time_days=lead_time_days if lead_time_days is not None else settings.INVENTORY_LEAD_TIME_DAYS,
+                    service_level=service_level or settings.INVENTORY_SERVICE_LEVEL,
+                    computed_at=computed_at,
+                )
+                for record in records
+            ])
+        db.commit()
+
+def get_stock_at_risk(db: Session, tenant: Optional[str] = None, limit: int = 20, max_days_of_cover: Optional[float] = None) -> List[StockRisk]:
+    """
+    Retorna os produtos do tenant com menos dias de cobertura de estoque.
+    """
+    query = db.query(StockRisk).filter(StockRisk.tenant_id == (tenant or settings.DEFAULT_TENANT))
+    if max_days_of_cover is not None:
+        query = query.filter(StockRisk.days_of_cover <= max_days_of_cover)
+    return query.order_by(StockRisk.days_of_cover, StockRisk.product_id).limit(limit).all()
+
+def claim_pipeline_run(db: Session, tenant: str, batch_timestamp: str) -> bool:
+    """
+    Registra o início do pipeline de ML para um lote.
+
+    Uma execução registrada que não terminou em PIPELINE_RUN_TIMEOUT_SECONDS (ex: um
+    worker que falhou sem liberar o lote) pode ser reivindicada de novo.
+
+    Returns:
+        True se a execução foi registrada agora; False se o lote já foi concluído
+        ou está em execução por outra invocação.
+    """
+    now = datetime.datetime.now(datetime.UTC)
+    db.add(PipelineRun(
+        tenant=tenant,
+        batch_timestamp=batch_timestamp,
+        started_at=now,
+    ))
+    try:
+        db.commit()
+        return True
+    except IntegrityError:
+        db.rollback()
+
+    # Retomada de uma execução abandonada: apenas uma invocação vence a atualização condicional
+    stale_before = now - datetime.timedelta(seconds=settings.PIPELINE_RUN_TIMEOUT_SECONDS)
+    claimed = db.query(PipelineRun).filter(
+        PipelineRun.tenant == tenant,
+        PipelineRun.batch_timestamp == batch_timestamp,
+        PipelineRun.completed_at.is_(None),
+        PipelineRun.started_at < stale_before,
+    ).update({PipelineRun.started_at: now}, synchronize_session=False)
     db.commit()
-    print(f"{len(products_df)} produtos salvos/atualizados.")
+    return claimed == 1
+
+def complete_pipeline_run(db: Session, tenant: str, batch_timestamp: str):
+    """
+    Marca o pipeline de ML do lote como concluído (registrando a execução, se necessário).
+    """
+    now = datetime.datetime.now(datetime.UTC)
+    run = db.get(PipelineRun, (tenant, batch_timestamp))
+    if run is None:
+        db.add(PipelineRun(tenant=tenant, batch_timestamp=batch_timestamp, started_at=now, completed_at=now))
+    else:
+        run.completed_at = now
+    try:
+        db.commit()
+    except IntegrityError:
+        # Registrado por outra invocação entre a leitura e a gravação
+        db.rollback()
+        db.query(PipelineRun).filter(
+            PipelineRun.tenant == tenant, PipelineRun.batch_timestamp == batch_timestamp
+        ).update({PipelineRun.completed_at: now}, synchronize_session=False)
+        db.commit()
 
-def save_predictions_to_db(db: Session, product_id: int, forecast_df: pd.DataFrame):
+def pipeline_run_completed(db: Session, tenant: str, batch_timestamp: str) -> bool:
     """
-    Salva as previsões de um produto no banco de dados, limpando as antigas.
+    Indica se o pipeline de ML do lote já foi concluído com sucesso.
     """
-    # Deleta previsões antigas para este produto
-    db.query(Prediction).filter(Prediction.product_id == product_id).delete()
+    run = db.get(PipelineRun, (tenant, batch_timestamp))
+    return run is not None and run.completed_at is not None
 
-    # Adiciona as novas previsões
-    for _, row in forecast_df.iterrows():
-        db_prediction = Prediction(
-            product_id=product_id,
-            ds=row['ds'],
-            yhat=row['yhat'],
-            yhat_lower=row['yhat_lower'],
-            yhat_upper=row['yhat_upper']
-        )
-        db.add(db_prediction)
+def release_pipeline_run(db: Session, tenant: str, batch_timestamp: str):
+    """
+    Remove o registro de execução de um lote (ex: após uma falha), permitindo nova tentativa.
+    """
+    db.query(PipelineRun).filter(
+        PipelineRun.tenant == tenant, PipelineRun.batch_timestamp == batch_timestamp
+    ).delete()
+    db.commit()
+
+def get_processed_key(db: Session, content_hash: str, dataset: str, tenant: Optional[str] = None) -> Optional[str]:
+    """
+    Retorna o dataset processado já gerado para um arquivo bruto do tenant com o mesmo conteúdo, se houver.
+    """
+    entry = db.get(ProcessedFile, (tenant or settings.DEFAULT_TENANT, content_hash, dataset))
+    return entry.processed_key if entry else None
+
+def forget_processed_file(db: Session, content_hash: str, dataset: str, tenant: Optional[str] = None):
+    """
+    Remove do ledger um conteúdo cujo dataset processado não existe mais no data lake.
+    """
+    db.query(ProcessedFile).filter(
+        ProcessedFile.tenant == (tenant or settings.DEFAULT_TENANT),
+        ProcessedFile.content_hash == content_hash,
+        ProcessedFile.dataset == dataset,
+    ).delete()
+    db.commit()
+
+def record_processed_file(
+    db: Session,
+    content_hash: str,
+    dataset: str,
+    processed_key: str,
+    raw_key: Optional[str] = None,
+    tenant: Optional[str] = None,
+):
+    """
+    Registra o dataset processado gerado a partir de um arquivo bruto do tenant.
+    Se outro processo registrou o mesmo conteúdo antes, o registro existente é mantido.
+    """
+    db.add(ProcessedFile(
+        tenant=tenant or settings.DEFAULT_TENANT,
+        content_hash=content_hash,
+        dataset=dataset,
+        processed_key=processed_key,
+        raw_key=raw_key,
+        created_at=datetime.datetime.now(datetime.UTC),
+    ))
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+
+def create_upload_session(db: Session, session_id: str, tenant: str, batch_timestamp: str, files: dict) -> UploadSession:
+    """
+    Registra uma sessão de upload direto ao S3.
+    """
+    session = UploadSession(
+        id=session_id,
+        tenant=tenant,
+        batch_timestamp=batch_timestamp,
+        status="pending",
+        files=files,
+        created_at=datetime.datetime.now(datetime.UTC),
+    )
+    db.add(session)
+    db.commit()
+    return session
+
+def get_upload_session(db: Session, session_id: str, tenant: str) -> Optional[UploadSession]:
+    """
+    Retorna a sessão de upload do tenant, se existir.
+    """
+    session = db.get(UploadSession, session_id)
+    return session if session is not None and session.tenant == tenant else None
+
+def mark_upload_session_completed(db: Session, session: UploadSession):
+    """
+    Marca a sessão de upload como concluída.
+    """
+    session.status = "completed"
+    session.completed_at = datetime.datetime.now(datetime.UTC)
     db.commit()
-    print(f"Previsões para o produto {product_id} salvas no banco de dados.")
+
+def record_upload_part(
+    db: Session, session_id: str, dataset: str, part_number: int, size: int, etag: str, checksum: str
+) -> UploadPart:
+    """
+    Registra (ou substitui, no reenvio) uma parte recebida no ledger do upload retomável.
+    """
+    part = db.merge(UploadPart(
+        session_id=session_id,
+        dataset=dataset,
+        part_number=part_number,
+        size=size,
+        etag=etag,
+        checksum=checksum,
+        uploaded_at=datetime.datetime.now(datetime.UTC),
+    ))
+    db.commit()
+    return part
+
+def get_upload_parts(db: Session, session_id: str) -> List[UploadPart]:
+    """
+    Retorna as partes registradas da sessão de upload, em ordem de dataset e número.
+    """
+    return (
+        db.query(UploadPart)
+        .filter(UploadPart.session_id == session_id)
+        .order_by(UploadPart.dataset, UploadPart.part_number)
+        .all()
+    )
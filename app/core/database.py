@@ -1,15 +1,165 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, ForeignKey
-from sqlalchemy.orm import sessionmaker, relationship, declarative_base
+import threading
+import time
+from typing import Optional
+from sqlalchemy import text, create_engine, Table, Column, Integer, String, Float, Date, DateTime, ForeignKeyConstraint, Index, JSON
+from sqlalchemy.orm import Session, sessionmaker, relationship, declarative_base
 from app.core.config import settings
+from app.utils.logger import get_logger
+
+logger = get_logger("core.database")
 
 # SQLAlchemy Engine
-engine = create_engine(
-    settings.DATABASE_URL,
-    # connect_args={"check_same_thread": False} # Needed for SQLite, not for PostgreSQL
-)
+# O engine (e o driver do banco) é criado no primeiro uso, e não na importação:
+# módulos que só precisam dos modelos (ex: Lambdas) não pagam esse custo na inicialização.
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_engine():
+    """
+    Retorna o engine do banco, criando-o no primeiro uso.
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = create_engine(
+                    settings.DATABASE_URL,
+                    # connect_args={"check_same_thread": False} # Needed for SQLite, not for PostgreSQL
+                )
+    return _engine
+
+def __getattr__(name):
+    # Compatibilidade: `from app.core.database import engine`
+    if name == "engine":
+        return get_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+class _LazySessionLocal:
+    """
+    Fábrica de sessões que vincula o engine apenas na primeira sessão criada.
+    """
+    def __init__(self):
+        self._factory = None
+
+    def __call__(self, **kwargs):
+        if self._factory is None:
+            self._factory = sessionmaker(autocommit=False, autoflush=False, bind=get_engine())
+        return self._factory(**kwargs)
 
 # Session Maker
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SessionLocal = _LazySessionLocal()
+
+# --- Réplica de leitura ---
+# Atraso de replicação de uma réplica PostgreSQL (0 se ela já aplicou tudo o que recebeu,
+# ou se o banco não é uma réplica). Sem o WAL receiver transmitindo, a réplica não recebe
+# nada do primário e o "recebido = aplicado" não diz nada: o atraso é desconhecido (NULL).
+# Sem pg_read_all_stats o status vem NULL, e basta o receiver existir.
+_REPLICA_LAG_SQL = text("""
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN NOT EXISTS (
+        SELECT 1 FROM pg_stat_wal_receiver WHERE COALESCE(status, 'streaming') = 'streaming'
+    ) THEN NULL
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+""")
+
+def replica_lag_seconds(connection) -> float:
+    """
+    Mede o atraso (segundos) da réplica. Bancos sem replicação nativa (ex: dois
+    arquivos SQLite em desenvolvimento) não têm atraso mensurável e retornam 0.
+    Uma réplica desconectada do primário tem atraso infinito.
+    """
+    if connection.dialect.name != "postgresql":
+        return 0.0
+    lag = connection.execute(_REPLICA_LAG_SQL).scalar()
+    return float("inf") if lag is None else float(lag)
+
+class ReadRouter:
+    """
+    Encaminha as sessões de leitura (consultas da API) para a réplica de leitura
+    enquanto o atraso de replicação estiver dentro da tolerância; fora dela, ou
+    se a réplica não responder, as leituras vão para o primário. As gravações
+    (pipeline, CRUD) continuam usando SessionLocal, sempre no primário.
+
+    O atraso é medido no máximo a cada `check_interval_seconds`.
+    """
+    def __init__(
+        self,
+        replica_url: Optional[str] = None,
+        max_lag_seconds: Optional[float] = None,
+        check_interval_seconds: Optional[float] = None,
+        primary_factory=None,
+    ):
+        self.replica_url = settings.DATABASE_REPLICA_URL if replica_url is None else replica_url
+        self.max_lag_seconds = settings.DATABASE_REPLICA_MAX_LAG_SECONDS if max_lag_seconds is None else max_lag_seconds
+        self.check_interval_seconds = (
+            settings.DATABASE_REPLICA_CHECK_SECONDS if check_interval_seconds is None else check_interval_seconds
+        )
+        self._primary_factory = primary_factory or SessionLocal
+        self._replica_engine = None
+        self._replica_factory = None
+        self._lock = threading.RLock()
+        self._checked_at = float("-inf")
+        self._replica_fresh = False
+
+    @property
+    def replica_engine(self):
+        if self._replica_engine is None:
+            with self._lock:
+                if self._replica_engine is None:
+                    self._replica_engine = create_engine(self.replica_url)
+                    self._replica_factory = sessionmaker(autocommit=False, autoflush=False, bind=self._replica_engine)
+        return self._replica_engine
+
+    def replica_available(self) -> bool:
+        """
+        Indica se as leituras podem ir para a réplica (configurada e dentro da tolerância de atraso).
+        """
+        if not self.replica_url:
+            return False
+        now = time.monotonic()
+        if now - self._checked_at >= self.check_interval_seconds:
+            with self._lock:
+                if now - self._checked_at >= self.check_interval_seconds:
+                    self._replica_fresh = self._check_replica()
+                    self._checked_at = time.monotonic()
+        return self._replica_fresh
+
+    def _check_replica(self) -> bool:
+        try:
+            with self.replica_engine.connect() as connection:
+                lag = replica_lag_seconds(connection)
+        except Exception as e:
+            logger.warning("Réplica de leitura indisponível, usando o primário: %s", e)
+            return False
+        if lag > self.max_lag_seconds:
+            logger.warning("Réplica de leitura %.1fs atrasada (tolerância %.1fs), usando o primário.", lag, self.max_lag_seconds)
+            return False
+        return True
+
+    def session(self, **kwargs) -> Session:
+        """
+        Abre uma sessão de leitura na réplica ou, se ela não estiver disponível, no primário.
+        """
+        if self.replica_available():
+            return self._replica_factory(**kwargs)
+        return self._primary_factory(**kwargs)
+
+_read_router: Optional[ReadRouter] = None
+_read_router_lock = threading.Lock()
+
+def get_read_router() -> ReadRouter:
+    """
+    Retorna o roteador de leituras do processo, criando-o no primeiro uso.
+    """
+    global _read_router
+    if _read_router is None:
+        with _read_router_lock:
+            if _read_router is None:
+                _read_router = ReadRouter()
+    return _read_router
 
 # Declarative Base
 Base = declarative_base()
@@ -17,9 +167,13 @@ Base = declarative_base()
 # --- Database Models ---
 
 class Product(Base):
+    """
+    Produto de uma empresa (tenant). O ID vem do CSV da empresa e só é único dentro dela.
+    """
     __tablename__ = "products"
 
-    id = Column(Integer, primary_key=True, index=True)
+    tenant_id = Column(String, primary_key=True, default=settings.DEFAULT_TENANT)
+    id = Column(Integer, primary_key=True, autoincrement=False)
     name = Column(String, index=True)
     code = Column(String, index=True)
     price = Column(Float)
@@ -29,9 +183,15 @@ class Product(Base):
 
 class Prediction(Base):
     __tablename__ = "predictions"
+    __table_args__ = (
+        ForeignKeyConstraint(["tenant_id", "product_id"], ["products.tenant_id", "products.id"]),
+        # Consultas e substituições de previsões são sempre por (tenant, produto)
+        Index("ix_predictions_tenant_product_ds", "tenant_id", "product_id", "ds"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
-    product_id = Column(Integer, ForeignKey("products.id"))
+    tenant_id = Column(String, nullable=False, default=settings.DEFAULT_TENANT)
+    product_id = Column(Integer, nullable=False)
     ds = Column(DateTime, index=True)
     yhat = Column(Float)
     yhat_lower = Column(Float)
@@ -39,6 +199,140 @@ class Prediction(Base):
 
     product = relationship("Product", back_populates="predictions")
 
+class StockRisk(Base):
+    """
+    Risco de ruptura de estoque de um produto, recalculado a cada execução do pipeline
+    a partir do estoque atual e da previsão de demanda.
+    """
+    __tablename__ = "stock_risk"
+    __table_args__ = (
+        ForeignKeyConstraint(["tenant_id", "product_id"], ["products.tenant_id", "products.id"]),
+        # "Produtos em risco" ordena por dias de cobertura dentro do tenant
+        Index("ix_stock_risk_tenant_cover", "tenant_id", "days_of_cover"),
+    )
+
+    tenant_id = Column(String, primary_key=True, default=settings.DEFAULT_TENANT)
+    product_id = Column(Integer, primary_key=True, autoincrement=False)
+    stock = Column(Float)
+    days_of_cover = Column(Float, nullable=False)
+    stockout_date = Column(DateTime)
+    lead_time_days = Column(Integer)
+    service_level = Column(Float)
+    lead_time_demand = Column(Float)
+    safety_stock = Column(Float)
+    reorder_point = Column(Float)
+    reorder_quantity = Column(Float)
+    # Resumo da simulação Monte Carlo (apenas com FORECAST_KEEP_SAMPLES)
+    stockout_probability = Column(Float)
+    lead_time_stockout_probability = Column(Float)
+    expected_lost_sales = Column(Float)
+    computed_at = Column(DateTime)
+
+# Histórico de vendas (uma linha por venda, com a data do pedido). No PostgreSQL a tabela
+# é particionada por mês (ver app.core.sales_history.ensure_sales_partitions) e o índice
+# BRIN na data ocupa poucas páginas: as vendas são carregadas em ordem cronológica.
+sales_daily = Table(
+    "sales_daily",
+    Base.metadata,
+    Column("tenant_id", String, nullable=False),
+    Column("product_id", Integer, nullable=False),
+    Column("sale_date", Date, nullable=False),
+    Column("quantity", Float, nullable=False),
+    Column("unit_price", Float),
+    Column("total_value", Float),
+    Index("ix_sales_daily_sale_date", "sale_date", postgresql_using="brin"),
+    postgresql_partition_by="RANGE (sale_date)",
+)
+
+class SalesDailyProduct(Base):
+    """
+    Vendas agregadas por produto e dia (a série usada no treino do Prophet).
+    Mantida de forma incremental: cada carga recalcula apenas os dias que trouxe.
+    """
+    __tablename__ = "sales_daily_product"
+
+    tenant_id = Column(String, primary_key=True)
+    product_id = Column(Integer, primary_key=True, autoincrement=False)
+    day = Column(Date, primary_key=True)
+    quantity = Column(Float, nullable=False)
+    total_value = Column(Float)
+    orders = Column(Integer, nullable=False)
+
+class SalesLoad(Base):
+    """
+    Carga de um dataset de vendas processado no histórico do banco. Os workers só
+    leem as vendas do banco quando o dataset do lote já foi carregado.
+    """
+    __tablename__ = "sales_loads"
+
+    tenant = Column(String, primary_key=True)
+    source = Column(String, primary_key=True)
+    first_day = Column(Date)
+    last_day = Column(Date)
+    rows = Column(Integer)
+    loaded_at = Column(DateTime)
+
+class PipelineRun(Base):
+    """
+    Execução do pipeline de ML para um upload. A chave primária garante que
+    cada lote (tenant, timestamp) seja treinado uma única vez; completed_at
+    só é preenchido quando as previsões do lote foram publicadas.
+    """
+    __tablename__ = "pipeline_runs"
+
+    tenant = Column(String, primary_key=True)
+    batch_timestamp = Column(String, primary_key=True)
+    started_at = Column(DateTime)
+    completed_at = Column(DateTime)
+
+class ProcessedFile(Base):
+    """
+    Registro de processamento por conteúdo: o hash do arquivo bruto aponta para o
+    dataset processado gerado a partir dele, evitando processar o mesmo arquivo duas vezes.
+    O registro é por tenant: o mesmo arquivo enviado por outra empresa é processado de novo.
+    """
+    __tablename__ = "processing_ledger"
+
+    tenant = Column(String, primary_key=True, default=settings.DEFAULT_TENANT)
+    content_hash = Column(String, primary_key=True)
+    dataset = Column(String, primary_key=True)
+    processed_key = Column(String, nullable=False)
+    raw_key = Column(String)
+    created_at = Column(DateTime)
+
+class UploadSession(Base):
+    """
+    Sessão de upload direto ao S3: as chaves brutas reservadas para um lote e, nos
+    arquivos grandes, o ID do multipart upload. A API guarda apenas estes metadados;
+    os bytes vão do cliente direto para o bucket.
+    """
+    __tablename__ = "upload_sessions"
+
+    id = Column(String, primary_key=True)
+    tenant = Column(String, nullable=False, index=True)
+    batch_timestamp = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="pending")
+    # {dataset: {"key": ..., "size": ..., "upload_id": ... (multipart), "part_size": ...}}
+    files = Column(JSON, nullable=False)
+    created_at = Column(DateTime)
+    completed_at = Column(DateTime)
+
+class UploadPart(Base):
+    """
+    Ledger das partes recebidas em um upload em partes pela API (upload retomável): o
+    ETag devolvido pelo S3 e o SHA-256 de cada parte. Uma parte registrada sobrevive a
+    falhas do cliente; a retomada envia apenas as que faltam.
+    """
+    __tablename__ = "upload_parts"
+
+    session_id = Column(String, primary_key=True)
+    dataset = Column(String, primary_key=True)
+    part_number = Column(Integer, primary_key=True, autoincrement=False)
+    size = Column(Integer, nullable=False)
+    etag = Column(String, nullable=False)
+    checksum = Column(String, nullable=False)
+    uploaded_at = Column(DateTime)
+
 
 # --- Database Utility Functions ---
 
@@ -52,11 +346,21 @@ def get_db():
     finally:
         db.close()
 
+def get_read_db():
+    """
+    FastAPI dependency to get a read-only DB session (réplica de leitura, se configurada).
+    """
+    db = get_read_router().session()
+    try:
+        yield db
+    finally:
+        db.close()
+
 def create_tables():
     """
     Creates all database tables.
     """
     print("Criando tabelas no banco de dados...")
-    Base.metadata.create_all(bind=engine)
+    Base.metadata.create_all(bind=get_engine())
     print("Tabelas criadas com sucesso.")
 
@@ -0,0 +1,315 @@
+import datetime
+import re
+from typing import Iterable, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+from pyarrow import fs as pafs
+
+from app.core.config import settings
+from app.core.s3 import get_aws_credentials
+from app.core.parquet import to_arrow_table, file_write_options
+from app.utils.file_utils import COMPRESSION_EXTENSIONS
+
+# Layout do data lake:
+#   raw/{tenant}/{dataset}_{timestamp}.csv[.gz|.zst|.zip]   (uploads antigos: raw/{dataset}_{timestamp}.csv)
+#   processed/{tenant}/{dataset}/{timestamp}/year=YYYY/month=M/product_bucket=N/part-{i}.parquet
+#   processed/{tenant}/{dataset}/{timestamp}/_SUCCESS
+# O marcador _SUCCESS é gravado por último e sinaliza que o dataset está completo.
+# Um upload com o mesmo conteúdo de um dataset já processado grava apenas o
+# ponteiro _ALIAS (com a raiz do dataset original) seguido do _SUCCESS.
+SUCCESS_MARKER = "_SUCCESS"
+ALIAS_MARKER = "_ALIAS"
+
+DATASET_PARTITIONS = {
+    "sales": ["year", "month", "product_bucket"],
+    "products": ["product_bucket"],
+}
+
+PARTITION_TYPES = {
+    "year": pa.int16(),
+    "month": pa.int8(),
+    "product_bucket": pa.int16(),
+}
+
+def get_arrow_filesystem() -> pafs.FileSystem:
+    """
+    Cria o sistema de arquivos S3 do pyarrow com as mesmas credenciais do cliente boto3.
+    """
+    credentials = get_aws_credentials()
+    return pafs.S3FileSystem(
+        region=settings.AWS_REGION,
+        access_key=credentials.get("aws_access_key_id"),
+        secret_key=credentials.get("aws_secret_access_key"),
+        session_token=credentials.get("aws_session_token"),
+        endpoint_override=settings.S3_ENDPOINT_URL or None,
+    )
+
+def ensure_parent_dir(filesystem: pafs.FileSystem, path: str):
+    """
+    Cria o diretório pai de `path` quando necessário (no S3 não existem diretórios).
+    """
+    if not isinstance(filesystem, pafs.S3FileSystem):
+        filesystem.create_dir(path.rsplit("/", 1)[0], recursive=True)
+
+# Identificadores de tenant aceitos: fazem parte das chaves do S3 e das linhas do banco
+TENANT_PATTERN = re.compile(r"^[a-z0-9][a-z0-9_-]{0,62}$")
+
+def validate_tenant(tenant: Optional[str]) -> str:
+    """
+    Retorna o tenant informado (ou o padrão), garantindo que é seguro usá-lo em chaves.
+
+    Raises:
+        ValueError: Se o identificador tiver caracteres não permitidos.
+    """
+    tenant = tenant or settings.DEFAULT_TENANT
+    if not TENANT_PATTERN.match(tenant):
+        raise ValueError(f"Tenant inválido: {tenant!r}. Use letras minúsculas, números, '-' ou '_'.")
+    return tenant
+
+def raw_key(dataset: str, timestamp: str, tenant: Optional[str] = None, compression: Optional[str] = None) -> str:
+    """
+    Retorna a chave do CSV bruto de um upload. Arquivos comprimidos são guardados como
+    foram recebidos, com a extensão do formato (ex: sales_{ts}.csv.gz).
+    """
+    suffix = COMPRESSION_EXTENSIONS[compression] if compression else ""
+    return f"raw/{tenant or settings.DEFAULT_TENANT}/{dataset}_{timestamp}.csv{suffix}"
+
+def parse_raw_key(key: str) -> Tuple[str, Optional[str], str]:
+    """
+    Extrai (tenant, dataset, timestamp) da chave de um CSV bruto (comprimido ou não).
+
+    O dataset é None se o nome do arquivo não indicar produtos nem vendas.
+    """
+    parts = key.split("/")
+    tenant = parts[1] if len(parts) >= 3 and parts[0] == "raw" else settings.DEFAULT_TENANT
+    # Sem todas as extensões (.csv, .csv.gz, ...)
+    filename = parts[-1].split(".", 1)[0]
+    # O tipo vem do nome do arquivo, e não da chave inteira (o tenant pode conter "sales")
+    dataset = "products" if "products" in filename else "sales" if "sales" in filename else None
+    return tenant, dataset, filename.split("_")[-1]
+
+def dataset_root(dataset: str, timestamp: str, tenant: Optional[str] = None) -> str:
+    """
+    Retorna a chave (prefixo) raiz de um dataset processado.
+    """
+    return f"processed/{tenant or settings.DEFAULT_TENANT}/{dataset}/{timestamp}"
+
+def product_buckets(product_ids: Iterable, n_buckets: Optional[int] = None) -> List[int]:
+    """
+    Calcula os buckets de partição de uma lista de IDs de produto.
+    """
+    n_buckets = n_buckets or settings.DATALAKE_PRODUCT_BUCKETS
+    return sorted({int(pid) % n_buckets for pid in product_ids})
+
+def _partitioning(dataset: str) -> ds.Partitioning:
+    names = DATASET_PARTITIONS[dataset]
+    return ds.partitioning(pa.schema([(name, PARTITION_TYPES[name]) for name in names]), flavor="hive")
+
+def add_partition_columns(df: pd.DataFrame, dataset: str) -> pd.DataFrame:
+    """
+    Adiciona ao DataFrame as colunas de partição do dataset.
+    """
+    partitioned = df.copy()
+    partitioned["product_bucket"] = (
+        partitioned["produto_id"].astype("int64") % settings.DATALAKE_PRODUCT_BUCKETS
+    ).astype("int16")
+    if dataset == "sales":
+        dates = pd.to_datetime(partitioned["data_pedido"])
+        partitioned["year"] = dates.dt.year.astype("int16")
+        partitioned["month"] = dates.dt.month.astype("int8")
+    return partitioned
+
+def write_partitioned_dataset(
+    df: pd.DataFrame,
+    dataset: str,
+    timestamp: str,
+    tenant: Optional[str] = None,
+    bucket: Optional[str] = None,
+    filesystem: Optional[pafs.FileSystem] = None,
+) -> str:
+    """
+    Grava um DataFrame como dataset Parquet particionado (hive) no data lake.
+
+    Args:
+        df: O DataFrame limpo (produtos ou vendas).
+        dataset: "sales" ou "products".
+        timestamp: Identificador do upload que originou os dados.
+        tenant: Empresa dona dos dados (padrão: settings.DEFAULT_TENANT).
+        bucket: Bucket de destino (padrão: settings.S3_BUCKET_NAME).
+        filesystem: Sistema de arquivos pyarrow (padrão: S3).
+
+    Returns:
+        A chave raiz do dataset gravado.
+    """
+    filesystem = filesystem or get_arrow_filesystem()
+    bucket = bucket or settings.S3_BUCKET_NAME
+    root = dataset_root(dataset, timestamp, tenant)
+    base_dir = f"{bucket}/{root}"
+
+    table = to_arrow_table(add_partition_columns(df, dataset), dataset)
+    row_group_size = settings.PARQUET_ROW_GROUP_SIZE
+    ds.write_dataset(
+        table,
+        base_dir=base_dir,
+        format="parquet",
+        partitioning=_partitioning(dataset),
+        filesystem=filesystem,
+        basename_template="part-{i}.parquet",
+        file_options=file_write_options(),
+        max_rows_per_group=row_group_size,
+        min_rows_per_group=min(row_group_size, max(len(table), 1)),
+        existing_data_behavior="overwrite_or_ignore",
+        # No S3 não existem diretórios; evita objetos "pasta/" vazios
+        create_dir=not isinstance(filesystem, pafs.S3FileSystem),
+    )
+
+    _write_success_marker(filesystem, base_dir)
+    return root
+
+def _write_success_marker(filesystem: pafs.FileSystem, base_dir: str):
+    with filesystem.open_output_stream(f"{base_dir}/{SUCCESS_MARKER}") as marker:
+        marker.write(datetime.datetime.now(datetime.UTC).isoformat().encode("utf-8"))
+
+def write_dataset_alias(
+    target_root: str,
+    dataset: str,
+    timestamp: str,
+    tenant: Optional[str] = None,
+    bucket: Optional[str] = None,
+    filesystem: Optional[pafs.FileSystem] = None,
+) -> str:
+    """
+    Publica um dataset já processado sob um novo timestamp sem regravar os dados.
+    Não faz nada se o dataset do timestamp já estiver completo.
+
+    Args:
+        target_root: Raiz do dataset existente com o mesmo conteúdo.
+        dataset: "sales" ou "products".
+        timestamp: Identificador do novo upload.
+
+    Returns:
+        A chave raiz do novo dataset (que aponta para `target_root`).
+    """
+    filesystem = filesystem or get_arrow_filesystem()
+    bucket = bucket or settings.S3_BUCKET_NAME
+    root = dataset_root(dataset, timestamp, tenant)
+    base_dir = f"{bucket}/{root}"
+    if filesystem.get_file_info(f"{base_dir}/{SUCCESS_MARKER}").type != pafs.FileType.NotFound:
+        return root
+
+    ensure_parent_dir(filesystem, f"{base_dir}/{ALIAS_MARKER}")
+    with filesystem.open_output_stream(f"{base_dir}/{ALIAS_MARKER}") as alias:
+        alias.write(target_root.encode("utf-8"))
+    _write_success_marker(filesystem, base_dir)
+    return root
+
+def dataset_exists(root: str, bucket: Optional[str] = None, filesystem: Optional[pafs.FileSystem] = None) -> bool:
+    """
+    Indica se o dataset processado está completo no data lake (marcador _SUCCESS).
+    """
+    filesystem = filesystem or get_arrow_filesystem()
+    bucket = bucket or settings.S3_BUCKET_NAME
+    return filesystem.get_file_info(f"{bucket}/{root}/{SUCCESS_MARKER}").type != pafs.FileType.NotFound
+
+def resolve_dataset_root(root: str, bucket: Optional[str] = None, filesystem: Optional[pafs.FileSystem] = None) -> str:
+    """
+    Retorna a raiz onde os dados de um dataset realmente estão (seguindo o _ALIAS, se houver).
+    """
+    filesystem = filesystem or get_arrow_filesystem()
+    bucket = bucket or settings.S3_BUCKET_NAME
+    alias_path = f"{bucket}/{root}/{ALIAS_MARKER}"
+    if filesystem.get_file_info(alias_path).type == pafs.FileType.NotFound:
+        return root
+    with filesystem.open_input_stream(alias_path) as alias:
+        return alias.read().decode("utf-8")
+
+def product_filter(product_ids: Iterable) -> pc.Expression:
+    """
+    Filtro que seleciona apenas os produtos informados.
+    O filtro sobre product_bucket permite descartar partições inteiras sem lê-las.
+    """
+    ids = sorted({int(pid) for pid in product_ids})
+    return pc.field("product_bucket").isin(product_buckets(ids)) & pc.field("produto_id").isin(ids)
+
+def date_filter(start: datetime.date, end: Optional[datetime.date] = None) -> pc.Expression:
+    """
+    Filtro de vendas entre `start` e `end` (inclusive; sem `end`, a partir de `start`).
+    O filtro sobre year/month permite descartar partições fora do intervalo.
+    """
+    month_index = pc.field("year").cast(pa.int32()) * 12 + pc.field("month").cast(pa.int32())
+    expression = (
+        (month_index >= start.year * 12 + start.month)
+        & (pc.field("data_pedido") >= pa.scalar(pd.Timestamp(start), pa.timestamp("ns")))
+    )
+    if end is not None:
+        expression = (
+            expression & (month_index <= end.year * 12 + end.month)
+            & (pc.field("data_pedido") < pa.scalar(pd.Timestamp(end) + pd.Timedelta(days=1), pa.timestamp("ns")))
+        )
+    return expression
+
+def training_start(today: Optional[datetime.date] = None) -> Optional[datetime.date]:
+    """
+    Primeiro dia do histórico de vendas usado no treino (settings.TRAINING_HISTORY_DAYS),
+    ou None para usar todo o histórico.
+    """
+    if settings.TRAINING_HISTORY_DAYS <= 0:
+        return None
+    today = today or datetime.datetime.now(datetime.UTC).date()
+    return today - datetime.timedelta(days=settings.TRAINING_HISTORY_DAYS)
+
+def read_partitioned_dataset(
+    root: str,
+    dataset: str,
+    columns: Optional[List[str]] = None,
+    filter: Optional[pc.Expression] = None,
+    bucket: Optional[str] = None,
+    filesystem: Optional[pafs.FileSystem] = None,
+) -> pd.DataFrame:
+    """
+    Lê um dataset particionado do data lake, com projeção de colunas e filtros
+    aplicados na leitura (apenas as partições e colunas necessárias são baixadas).
+
+    Args:
+        root: Chave raiz do dataset (ver dataset_root).
+        dataset: "sales" ou "products".
+        columns: Colunas a carregar (padrão: todas as colunas de dados).
+        filter: Expressão pyarrow (ver product_filter e date_filter).
+        bucket: Bucket de origem (padrão: settings.S3_BUCKET_NAME).
+        filesystem: Sistema de arquivos pyarrow (padrão: S3).
+
+    Returns:
+        Um DataFrame com os dados selecionados.
+    """
+    return _scanner(root, dataset, columns, filter, bucket, filesystem).to_table().to_pandas()
+
+def scan_partitioned_dataset(
+    root: str,
+    dataset: str,
+    columns: Optional[List[str]] = None,
+    filter: Optional[pc.Expression] = None,
+    bucket: Optional[str] = None,
+    filesystem: Optional[pafs.FileSystem] = None,
+) -> pa.RecordBatchReader:
+    """
+    Como read_partitioned_dataset, mas retorna um leitor Arrow que baixa e entrega
+    os dados em lotes (ex: para o backend DuckDB agregar sem carregar tudo na memória).
+    """
+    return _scanner(root, dataset, columns, filter, bucket, filesystem).to_reader()
+
+def _scanner(root, dataset, columns, filter, bucket, filesystem) -> ds.Scanner:
+    filesystem = filesystem or get_arrow_filesystem()
+    bucket = bucket or settings.S3_BUCKET_NAME
+    arrow_dataset = ds.dataset(
+        f"{bucket}/{root}",
+        format="parquet",
+        partitioning=_partitioning(dataset),
+        filesystem=filesystem,
+    )
+    if columns is None:
+        partition_names = set(DATASET_PARTITIONS[dataset])
+        columns = [name for name in arrow_dataset.schema.names if name not in partition_names]
+    return arrow_dataset.scanner(columns=columns, filter=filter)
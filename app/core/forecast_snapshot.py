@@ -0,0 +1,311 @@
+import datetime
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pyarrow as pa
+from pyarrow import fs as pafs
+
+from app.core.config import settings
+from app.core.datalake import get_arrow_filesystem, ensure_parent_dir
+from app.core.parquet import PARQUET_SCHEMAS
+from app.utils.logger import get_logger
+
+logger = get_logger("core.forecast_snapshot")
+
+# Snapshot de previsões servido pela API (um por tenant, imutável):
+#   snapshots/{tenant}/forecast_{ts}.arrow        (Arrow IPC sem compressão, ordenado por produto e data)
+#   snapshots/{tenant}/forecast_{ts}.index.arrow  (product_id -> offset, length)
+#   snapshots/{tenant}/CURRENT                    ({"snapshot": "forecast_{ts}", ...})
+# Os dois arquivos são gravados antes do ponteiro CURRENT; trocar o ponteiro publica o snapshot.
+CURRENT_POINTER = "CURRENT"
+
+SNAPSHOT_SCHEMA = pa.schema([(name, PARQUET_SCHEMAS["forecast"][name]) for name in (
+    "product_id", "ds", "yhat", "yhat_lower", "yhat_upper",
+)])
+
+INDEX_SCHEMA = pa.schema([
+    ("product_id", pa.int32()),
+    ("offset", pa.int64()),
+    ("length", pa.int64()),
+])
+
+def snapshot_prefix(tenant: str) -> str:
+    return f"snapshots/{tenant}"
+
+def snapshot_name(timestamp: str) -> str:
+    return f"forecast_{timestamp}"
+
+# Formatos do timestamp no nome do snapshot, pelo tamanho: lotes (data ou data e hora)
+# e job_id da API (com microssegundos)
+_TIMESTAMP_FORMATS = {8: "%Y%m%d", 14: "%Y%m%d%H%M%S", 20: "%Y%m%d%H%M%S%f"}
+
+def snapshot_time(name: str) -> Optional[datetime.datetime]:
+    """
+    Momento (UTC) da execução que gerou o snapshot, lido do nome (forecast_{timestamp}).
+    Retorna None se o timestamp não estiver em um formato conhecido.
+    """
+    timestamp = name.rsplit("_", 1)[-1]
+    fmt = _TIMESTAMP_FORMATS.get(len(timestamp))
+    if fmt is None:
+        return None
+    try:
+        return datetime.datetime.strptime(timestamp, fmt).replace(tzinfo=datetime.UTC)
+    except ValueError:
+        return None
+
+def _is_newer(name: str, other: str) -> bool:
+    # Nomes com timestamps de tamanhos diferentes não se comparam como texto
+    name_time, other_time = snapshot_time(name), snapshot_time(other)
+    if name_time is not None and other_time is not None:
+        return name_time > other_time
+    return name > other
+
+def build_snapshot(table: pa.Table) -> Tuple[pa.Table, pa.Table]:
+    """
+    Prepara a tabela de previsões e o seu índice.
+
+    Returns:
+        (dados ordenados por product_id e ds, índice product_id -> (offset, length)).
+    """
+    table = table.select(SNAPSHOT_SCHEMA.names).cast(SNAPSHOT_SCHEMA, safe=False)
+    table = table.sort_by([("product_id", "ascending"), ("ds", "ascending")]).combine_chunks()
+
+    ids = table.column("product_id").to_numpy()
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]]) if len(ids) else np.array([], dtype=np.int64)
+    lengths = np.diff(np.r_[starts, len(ids)])
+    index = pa.Table.from_arrays(
+        [pa.array(ids[starts], pa.int32()), pa.array(starts, pa.int64()), pa.array(lengths, pa.int64())],
+        schema=INDEX_SCHEMA,
+    )
+    return table, index
+
+def _write_ipc(table: pa.Table, path: str, filesystem: pafs.FileSystem):
+    # Sem compressão: o leitor mapeia o arquivo e usa os buffers sem cópia
+    with filesystem.open_output_stream(path) as out, pa.ipc.new_file(out, table.schema) as writer:
+        writer.write_table(table)
+
+def read_current_pointer(tenant: str, bucket: str, filesystem: pafs.FileSystem) -> Optional[Dict]:
+    """
+    Lê o ponteiro do snapshot atual do tenant. Retorna None se não houver snapshot publicado.
+    """
+    path = f"{bucket}/{snapshot_prefix(tenant)}/{CURRENT_POINTER}"
+    if filesystem.get_file_info(path).type == pafs.FileType.NotFound:
+        return None
+    with filesystem.open_input_stream(path) as f:
+        return json.loads(f.read())
+
+def publish_forecast_snapshot(
+    table: pa.Table,
+    tenant: str,
+    timestamp: str,
+    bucket: Optional[str] = None,
+    filesystem: Optional[pafs.FileSystem] = None,
+) -> Optional[str]:
+    """
+    Grava o snapshot das previsões de uma execução e o publica como o atual do tenant.
+
+    Args:
+        table: Previsões de todos os produtos (colunas do esquema "forecast").
+        tenant: Empresa dona das previsões.
+        timestamp: Identificador da execução; snapshots mais antigos que o atual não são publicados.
+        bucket: Bucket de destino (padrão: settings.S3_BUCKET_NAME).
+        filesystem: Sistema de arquivos pyarrow (padrão: S3).
+
+    Returns:
+        O nome do snapshot publicado, ou None se não houver previsões ou já existir um mais novo.
+    """
+    if table.num_rows == 0:
+        return None
+    filesystem = filesystem or get_arrow_filesystem()
+    bucket = bucket or settings.S3_BUCKET_NAME
+    prefix = f"{bucket}/{snapshot_prefix(tenant)}"
+    name = snapshot_name(timestamp)
+
+    current = read_current_pointer(tenant, bucket, filesystem)
+    if current and _is_newer(current["snapshot"], name):
+        logger.info("Snapshot %s não publicado: %s é mais recente.", name, current["snapshot"])
+        return None
+
+    data, index = build_snapshot(table)
+    ensure_parent_dir(filesystem, f"{prefix}/{CURRENT_POINTER}")
+    _write_ipc(data, f"{prefix}/{name}.arrow", filesystem)
+    _write_ipc(index, f"{prefix}/{name}.index.arrow", filesystem)
+
+    pointer = json.dumps({"snapshot": name, "rows": data.num_rows, "products": index.num_rows}).encode("utf-8")
+    if isinstance(filesystem, pafs.S3FileSystem):
+        # PUT no S3 é atômico: leitores veem o ponteiro antigo ou o novo
+        with filesystem.open_output_stream(f"{prefix}/{CURRENT_POINTER}") as out:
+            out.write(pointer)
+    else:
+        tmp_path = f"{prefix}/{CURRENT_POINTER}.{os.getpid()}.tmp"
+        with filesystem.open_output_stream(tmp_path) as out:
+            out.write(pointer)
+        filesystem.move(tmp_path, f"{prefix}/{CURRENT_POINTER}")
+    logger.info("Snapshot %s publicado: %d previsões de %d produtos.", name, data.num_rows, index.num_rows)
+    return name
+
+class ForecastSnapshot:
+    """
+    Snapshot mapeado em memória. As colunas apontam direto para as páginas do
+    arquivo (compartilhadas entre os workers da máquina) e a busca de um produto
+    é uma busca binária no índice seguida de um slice sem cópia.
+    """
+    def __init__(self, name: str, data_path: str, index_path: str):
+        self.name = name
+        self.data = pa.ipc.open_file(pa.memory_map(data_path)).read_all()
+        index = pa.ipc.open_file(pa.memory_map(index_path)).read_all()
+        self._ids = index.column("product_id").to_numpy()
+        self._offsets = index.column("offset").to_numpy()
+        self._lengths = index.column("length").to_numpy()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def created_at(self) -> Optional[datetime.datetime]:
+        """
+        Momento (UTC) da execução que gerou o snapshot, lido do nome (forecast_{timestamp}).
+        """
+        return snapshot_time(self.name)
+
+    def lookup(self, product_id: int) -> Optional[pa.Table]:
+        """
+        Retorna as previsões do produto (slice sem cópia) ou None se ele não estiver no snapshot.
+        """
+        position = int(np.searchsorted(self._ids, product_id))
+        if position == len(self._ids) or self._ids[position] != product_id:
+            return None
+        return self.data.slice(int(self._offsets[position]), int(self._lengths[position]))
+
+class ForecastSnapshotStore:
+    """
+    Mantém o snapshot atual de cada tenant carregado no processo da API.
+
+    O ponteiro CURRENT é consultado no máximo a cada `refresh_seconds`; quando ele
+    muda, o novo snapshot é baixado para `cache_dir` (uma vez por máquina), mapeado
+    e trocado atomicamente. Requisições em andamento continuam com o snapshot anterior.
+    """
+    def __init__(
+        self,
+        bucket: Optional[str] = None,
+        filesystem: Optional[pafs.FileSystem] = None,
+        cache_dir: Optional[str] = None,
+        refresh_seconds: Optional[float] = None,
+    ):
+        self.bucket = bucket or settings.S3_BUCKET_NAME
+        self._filesystem = filesystem
+        self.cache_dir = cache_dir or settings.FORECAST_SNAPSHOT_DIR
+        self.refresh_seconds = settings.FORECAST_SNAPSHOT_REFRESH_SECONDS if refresh_seconds is None else refresh_seconds
+        self._lock = threading.Lock()
+        self._snapshots: Dict[str, Optional[ForecastSnapshot]] = {}
+        self._checked_at: Dict[str, float] = {}
+
+    @property
+    def filesystem(self) -> pafs.FileSystem:
+        if self._filesystem is None:
+            self._filesystem = get_arrow_filesystem()
+        return self._filesystem
+
+    def get(self, tenant: str) -> Optional[ForecastSnapshot]:
+        """
+        Retorna o snapshot atual do tenant, ou None se não houver um publicado.
+        """
+        now = time.monotonic()
+        if now - self._checked_at.get(tenant, float("-inf")) < self.refresh_seconds:
+            return self._snapshots.get(tenant)
+        with self._lock:
+            if now - self._checked_at.get(tenant, float("-inf")) >= self.refresh_seconds:
+                self._refresh(tenant)
+                self._checked_at[tenant] = time.monotonic()
+        return self._snapshots.get(tenant)
+
+    def invalidate(self, tenant: str):
+        """
+        Força a releitura do ponteiro na próxima consulta (ex: após publicar um snapshot).
+        """
+        self._checked_at.pop(tenant, None)
+
+    def _refresh(self, tenant: str):
+        current = self._snapshots.get(tenant)
+        try:
+            pointer = read_current_pointer(tenant, self.bucket, self.filesystem)
+            if pointer is None or (current is not None and current.name == pointer["snapshot"]):
+                self._snapshots.setdefault(tenant, None)
+                return
+            self._snapshots[tenant] = self._load(tenant, pointer["snapshot"])
+            self._prune(tenant, keep={pointer["snapshot"], current.name if current else None})
+            logger.info("Snapshot de previsões %s carregado para o tenant %s.", pointer["snapshot"], tenant)
+        except Exception as e:
+            # Sem snapshot novo, a API continua com o anterior (ou com o banco)
+            logger.warning("Não foi possível carregar o snapshot do tenant %s: %s", tenant, e)
+            self._snapshots.setdefault(tenant, None)
+
+    def _load(self, tenant: str, name: str) -> ForecastSnapshot:
+        paths = [f"{self.bucket}/{snapshot_prefix(tenant)}/{name}{suffix}" for suffix in (".arrow", ".index.arrow")]
+        if not isinstance(self.filesystem, pafs.LocalFileSystem):
+            paths = [self._download(path, tenant) for path in paths]
+        return ForecastSnapshot(name, *paths)
+
+    def _download(self, path: str, tenant: str) -> str:
+        # Snapshots são imutáveis: o arquivo já baixado por outro worker é reaproveitado
+        local_dir = os.path.join(self.cache_dir, tenant)
+        local_path = os.path.join(local_dir, path.rsplit("/", 1)[-1])
+        if os.path.exists(local_path):
+            return local_path
+        os.makedirs(local_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=local_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as out, self.filesystem.open_input_stream(path) as f:
+                while chunk := f.read(8 * 1024 * 1024):
+                    out.write(chunk)
+            os.replace(tmp_path, local_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return local_path
+
+    def _prune(self, tenant: str, keep: set):
+        # Remove do cache os snapshots antigos. Workers que ainda os mapeiam não são
+        # afetados: o mapeamento continua válido até ser liberado.
+        local_dir = os.path.join(self.cache_dir, tenant)
+        if isinstance(self.filesystem, pafs.LocalFileSystem) or not os.path.isdir(local_dir):
+            return
+        for filename in os.listdir(local_dir):
+            # Arquivos .tmp são downloads em andamento de outros workers
+            if filename.split(".", 1)[0] not in keep and not filename.endswith(".tmp"):
+                try:
+                    os.unlink(os.path.join(local_dir, filename))
+                except OSError:
+                    pass
+
+    def lookup(self, tenant: str, product_id: int) -> Tuple[bool, Optional[List[Dict]]]:
+        """
+        Busca as previsões do produto no snapshot do tenant.
+
+        Returns:
+            (há snapshot, linhas do produto ou None se ele não estiver no snapshot).
+        """
+        snapshot = self.get(tenant)
+        if snapshot is None:
+            return False, None
+        rows = snapshot.lookup(product_id)
+        return True, rows.to_pylist() if rows is not None else None
+
+_store: Optional[ForecastSnapshotStore] = None
+_store_lock = threading.Lock()
+
+def get_snapshot_store() -> ForecastSnapshotStore:
+    """
+    Retorna o store de snapshots do processo, criando-o no primeiro uso.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = ForecastSnapshotStore()
+    return _store
@@ -0,0 +1,103 @@
+import datetime
+import json
+from typing import Dict, List, Optional, Tuple
+
+from pyarrow import fs as pafs
+
+from app.core.config import settings
+from app.core.datalake import get_arrow_filesystem, dataset_root, ensure_parent_dir, SUCCESS_MARKER
+
+# Manifesto de lote: gravado pelo upload antes dos datasets processados, lista
+# todos os artefatos que o pipeline de ML precisa para aquele upload.
+#   manifests/{tenant}/{timestamp}.json
+#   {"tenant": ..., "timestamp": ..., "artifacts": {"products": "processed/...", "sales": "processed/..."}}
+BATCH_DATASETS = ("products", "sales")
+
+def manifest_key(tenant: str, timestamp: str) -> str:
+    return f"manifests/{tenant}/{timestamp}.json"
+
+def default_manifest(tenant: str, timestamp: str) -> Dict:
+    """
+    Manifesto implícito de um upload: um dataset de cada tipo com o mesmo timestamp.
+    """
+    return {
+        "tenant": tenant,
+        "timestamp": timestamp,
+        "artifacts": {dataset: dataset_root(dataset, timestamp, tenant) for dataset in BATCH_DATASETS},
+    }
+
+def write_batch_manifest(
+    timestamp: str,
+    tenant: Optional[str] = None,
+    bucket: Optional[str] = None,
+    filesystem: Optional[pafs.FileSystem] = None,
+) -> str:
+    """
+    Grava o manifesto de um upload e retorna a sua chave.
+    """
+    filesystem = filesystem or get_arrow_filesystem()
+    bucket = bucket or settings.S3_BUCKET_NAME
+    tenant = tenant or settings.DEFAULT_TENANT
+    manifest = default_manifest(tenant, timestamp)
+    manifest["created_at"] = datetime.datetime.now(datetime.UTC).isoformat()
+
+    key = manifest_key(tenant, timestamp)
+    ensure_parent_dir(filesystem, f"{bucket}/{key}")
+    with filesystem.open_output_stream(f"{bucket}/{key}") as out:
+        out.write(json.dumps(manifest).encode("utf-8"))
+    return key
+
+def read_batch_manifest(
+    tenant: str, timestamp: str, bucket: str, filesystem: Optional[pafs.FileSystem] = None
+) -> Optional[Dict]:
+    """
+    Lê o manifesto de um upload. Retorna None se ele não existir.
+    """
+    filesystem = filesystem or get_arrow_filesystem()
+    path = f"{bucket}/{manifest_key(tenant, timestamp)}"
+    if filesystem.get_file_info(path).type == pafs.FileType.NotFound:
+        return None
+    with filesystem.open_input_stream(path) as f:
+        return json.loads(f.read())
+
+def batch_from_key(key: str) -> Optional[Tuple[str, str]]:
+    """
+    Extrai (tenant, timestamp) da chave do marcador de um dataset processado:
+    processed/{tenant}/{dataset}/{timestamp}/_SUCCESS. Retorna None para outras chaves.
+    """
+    parts = key.split("/")
+    if len(parts) != 5 or parts[0] != "processed" or parts[2] not in BATCH_DATASETS or parts[4] != SUCCESS_MARKER:
+        return None
+    return parts[1], parts[3]
+
+def missing_artifacts(manifest: Dict, bucket: str, filesystem: Optional[pafs.FileSystem] = None) -> List[str]:
+    """
+    Retorna os artefatos do manifesto que ainda não têm o marcador _SUCCESS.
+    """
+    filesystem = filesystem or get_arrow_filesystem()
+    roots = list(manifest["artifacts"].values())
+    infos = filesystem.get_file_info([f"{bucket}/{root}/{SUCCESS_MARKER}" for root in roots])
+    return [root for root, info in zip(roots, infos) if info.type == pafs.FileType.NotFound]
+
+def newer_batches(tenant: str, timestamp: str, bucket: str, filesystem: Optional[pafs.FileSystem] = None) -> List[str]:
+    """
+    Lista os timestamps de manifestos do tenant mais recentes que `timestamp`.
+    """
+    filesystem = filesystem or get_arrow_filesystem()
+    selector = pafs.FileSelector(f"{bucket}/manifests/{tenant}", allow_not_found=True)
+    timestamps = [
+        info.base_name[:-len(".json")] for info in filesystem.get_file_info(selector)
+        if info.type == pafs.FileType.File and info.base_name.endswith(".json")
+    ]
+    return sorted(ts for ts in timestamps if ts > timestamp)
+
+def batch_run_id(artifacts: Dict[str, str]) -> str:
+    """
+    Identificador de execução de um lote a partir das raízes (já resolvidas) dos seus datasets.
+    É o timestamp quando todos os dados vêm do mesmo upload; caso contrário combina os
+    timestamps de cada dataset (ex: "products=20231120+sales=20231121").
+    """
+    timestamps = {dataset: root.rsplit("/", 1)[-1] for dataset, root in artifacts.items()}
+    if len(set(timestamps.values())) == 1:
+        return next(iter(timestamps.values()))
+    return "+".join(f"{dataset}={ts}" for dataset, ts in sorted(timestamps.items()))
@@ -0,0 +1,131 @@
+from typing import Dict, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from pyarrow import fs as pafs
+
+from app.core.config import settings
+
+# Tipo desejado de cada coluna por dataset. Inteiros, floats e timestamps só são
+# reduzidos quando a conversão não perde informação; caso contrário a coluna
+# mantém o tipo original. Colunas fora do esquema são gravadas como estão.
+_DICTIONARY = pa.dictionary(pa.int32(), pa.string())
+
+PARQUET_SCHEMAS: Dict[str, Dict[str, pa.DataType]] = {
+    "products": {
+        "produto_id": pa.int32(),
+        "produto_nome": pa.string(),
+        "produto_codigo": pa.string(),
+        "produto_preco": pa.float32(),
+        "produto_estoque_atual": pa.float32(),
+    },
+    "sales": {
+        "produto_id": pa.int32(),
+        # Poucos valores distintos repetidos em milhões de linhas
+        "produto_nome": _DICTIONARY,
+        "situacao": _DICTIONARY,
+        "valor_unitario": pa.float32(),
+        "valor_total_pedido": pa.float32(),
+        "quantidade": pa.int32(),
+        "data_pedido": pa.timestamp("s"),
+    },
+    "forecast": {
+        "product_id": pa.int32(),
+        "ds": pa.timestamp("s"),
+        "yhat": pa.float32(),
+        "yhat_lower": pa.float32(),
+        "yhat_upper": pa.float32(),
+    },
+}
+
+# Ordem das linhas dentro de cada arquivo. Linhas do mesmo produto juntas comprimem
+# muito melhor (nome, preço e id se repetem) e deixam as estatísticas min/max de
+# produto_id de cada row group seletivas para os filtros de leitura.
+SORT_KEYS: Dict[str, list] = {
+    "sales": ["produto_id", "data_pedido"],
+    "products": ["produto_id"],
+    "forecast": ["product_id", "ds"],
+}
+
+# Erro máximo aceito ao reduzir um float64 para float32 (meio centavo)
+FLOAT32_TOLERANCE = 0.005
+
+def _narrow(array: pa.Array, target: pa.DataType) -> pa.Array:
+    """
+    Converte a coluna para o tipo do esquema, se a conversão for segura.
+    """
+    if array.type == target:
+        return array
+    try:
+        if pa.types.is_dictionary(target):
+            if not pa.types.is_dictionary(array.type):
+                array = array.dictionary_encode()
+            return array.cast(target)
+        if pa.types.is_float32(target):
+            if not pa.types.is_floating(array.type):
+                return array
+            narrowed = array.cast(target)
+            error = pc.max(pc.abs(pc.subtract(narrowed.cast(array.type), array))).as_py()
+            if error is not None and error > FLOAT32_TOLERANCE:
+                return array
+            return narrowed
+        # Inteiros e timestamps: o cast seguro falha em overflow, frações ou truncamento
+        return array.cast(target, safe=True)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError, pa.ArrowTypeError):
+        return array
+
+def to_arrow_table(df: pd.DataFrame, dataset: str) -> pa.Table:
+    """
+    Converte um DataFrame em tabela Arrow com os tipos compactos do esquema do dataset.
+
+    Args:
+        df: O DataFrame a converter (o índice é descartado).
+        dataset: "sales", "products" ou "forecast".
+
+    Returns:
+        A tabela Arrow pronta para gravação.
+    """
+    schema = PARQUET_SCHEMAS.get(dataset, {})
+    arrays = []
+    for name in df.columns:
+        array = pa.Array.from_pandas(df[name])
+        arrays.append(_narrow(array, schema[name]) if name in schema else array)
+    table = pa.Table.from_arrays(arrays, names=[str(name) for name in df.columns])
+    sort_keys = [(key, "ascending") for key in SORT_KEYS.get(dataset, []) if key in table.column_names]
+    return table.sort_by(sort_keys) if sort_keys and table.num_rows else table
+
+def file_write_options() -> ds.FileWriteOptions:
+    """
+    Opções de gravação Parquet para pyarrow.dataset.write_dataset.
+    """
+    return ds.ParquetFileFormat().make_write_options(
+        compression=settings.PARQUET_COMPRESSION,
+        compression_level=settings.PARQUET_COMPRESSION_LEVEL,
+    )
+
+def write_parquet(
+    df: pd.DataFrame,
+    dataset: str,
+    where,
+    filesystem: Optional[pafs.FileSystem] = None,
+):
+    """
+    Grava um DataFrame como um único arquivo Parquet compacto.
+
+    Args:
+        df: O DataFrame a gravar.
+        dataset: Nome do esquema (ver PARQUET_SCHEMAS).
+        where: Caminho ou file-like object de destino.
+        filesystem: Sistema de arquivos pyarrow, quando `where` é um caminho.
+    """
+    pq.write_table(
+        to_arrow_table(df, dataset),
+        where,
+        filesystem=filesystem,
+        compression=settings.PARQUET_COMPRESSION,
+        compression_level=settings.PARQUET_COMPRESSION_LEVEL,
+        row_group_size=settings.PARQUET_ROW_GROUP_SIZE,
+    )
@@ -1,34 +1,82 @@
-import boto3
-from botocore.exceptions import NoCredentialsError, PartialCredentialsError
-from fastapi import UploadFile
+import threading
+
 from app.core.config import settings
 from app.utils.file_utils import NonCloseableFile
 
+# Cliente S3 criado no primeiro uso e reutilizado (clientes boto3 são thread-safe)
+_s3_client = None
+_s3_client_lock = threading.Lock()
+# Cliente para pré-assinar URLs com o endpoint público (S3_PUBLIC_ENDPOINT_URL)
+_presign_client = None
+
+def get_aws_credentials() -> dict:
+    """
+    Retorna as credenciais AWS explícitas configuradas, ou um dicionário vazio.
+
+    Apenas retorna credenciais se elas foram configuradas (diferente do default).
+    Isso permite que o boto3/pyarrow usem a IAM Role automaticamente no App Runner/Lambda.
+    """
+    if (settings.AWS_ACCESS_KEY_ID and
+        settings.AWS_ACCESS_KEY_ID != "YOUR_AWS_ACCESS_KEY_ID" and
+        settings.AWS_SECRET_ACCESS_KEY and
+        settings.AWS_SECRET_ACCESS_KEY != "YOUR_AWS_SECRET_ACCESS_KEY"):
+
+        credentials = {
+            "aws_access_key_id": settings.AWS_ACCESS_KEY_ID,
+            "aws_secret_access_key": settings.AWS_SECRET_ACCESS_KEY,
+        }
+        if settings.AWS_SESSION_TOKEN:
+            credentials["aws_session_token"] = settings.AWS_SESSION_TOKEN
+        return credentials
+    return {}
+
 def get_s3_client():
     """
-    Cria e retorna um cliente S3.
+    Retorna o cliente S3 do processo, criado na primeira chamada.
     Suporta credenciais explícitas (local) e IAM Roles (AWS).
     """
+    global _s3_client
+    if _s3_client is None:
+        with _s3_client_lock:
+            if _s3_client is None:
+                _s3_client = _create_s3_client()
+    return _s3_client
+
+def get_presign_client(s3_client=None):
+    """
+    Retorna o cliente usado para pré-assinar as URLs entregues aos clientes.
+
+    A assinatura inclui o host: com S3_PUBLIC_ENDPOINT_URL configurado, as URLs são
+    assinadas para esse endpoint. Sem ele, usa `s3_client` (ou o cliente do processo).
+    """
+    global _presign_client
+    if not settings.S3_PUBLIC_ENDPOINT_URL:
+        return s3_client or get_s3_client()
+    if _presign_client is None:
+        with _s3_client_lock:
+            if _presign_client is None:
+                _presign_client = _create_s3_client(settings.S3_PUBLIC_ENDPOINT_URL)
+    return _presign_client
+
+def _create_s3_client(endpoint_url=None):
+    # Importados sob demanda: o boto3 é pesado e nem todo módulo que usa app.core.s3 precisa dele
+    import boto3
+    from botocore.exceptions import NoCredentialsError, PartialCredentialsError
+
     try:
         client_args = {
             "service_name": "s3",
-            "region_name": settings.AWS_REGION
+            "region_name": settings.AWS_REGION,
+            **get_aws_credentials(),
         }
+        endpoint_url = endpoint_url or settings.S3_ENDPOINT_URL
+        if endpoint_url:
+            from botocore.config import Config
+            # S3 local (MinIO/LocalStack): endereçamento por caminho e assinatura v4 nas URLs pré-assinadas
+            client_args["endpoint_url"] = endpoint_url
+            client_args["config"] = Config(signature_version="s3v4", s3={"addressing_style": "path"})
 
-        # Apenas passar credenciais se elas foram configuradas (diferente do default)
-        # Isso permite que o boto3 use a IAM Role automaticamente no App Runner/Lambda
-        if (settings.AWS_ACCESS_KEY_ID and 
-            settings.AWS_ACCESS_KEY_ID != "YOUR_AWS_ACCESS_KEY_ID" and
-            settings.AWS_SECRET_ACCESS_KEY and 
-            settings.AWS_SECRET_ACCESS_KEY != "YOUR_AWS_SECRET_ACCESS_KEY"):
-            
-            client_args["aws_access_key_id"] = settings.AWS_ACCESS_KEY_ID
-            client_args["aws_secret_access_key"] = settings.AWS_SECRET_ACCESS_KEY
-            if settings.AWS_SESSION_TOKEN:
-                client_args["aws_session_token"] = settings.AWS_SESSION_TOKEN
-
-        s3_client = boto3.client(**client_args)
-        return s3_client
+        return boto3.client(**client_args)
     except (NoCredentialsError, PartialCredentialsError):
         print("AWS credentials not found. S3 functionality will be disabled.")
         return None
@@ -49,9 +97,6 @@ def upload_fileobj_to_s3(file_obj, bucket_name: str, object_name: str) -> bool:
     if not s3_client:
         return False
 
-    # TODO: Implementar a geração completa do caminho do S3:
-    # processed/{company-name}/{cnpj}/{ano}/{mes}/features_{date}.parquet
-
     try:
         # Envolver o arquivo para evitar que o boto3 o feche
         wrapped_file = NonCloseableFile(file_obj)
@@ -62,5 +107,3 @@ def upload_fileobj_to_s3(file_obj, bucket_name: str, object_name: str) -> bool:
         return False
     
     return True
-
-    return True
@@ -0,0 +1,238 @@
+import datetime
+import io
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import delete, func, insert, select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.core.database import sales_daily, SalesDailyProduct, SalesLoad
+from app.utils.tracing import span
+from app.utils.logger import get_logger
+
+logger = get_logger("core.sales_history")
+
+# Histórico de vendas no banco:
+#   sales_daily          vendas limpas (no PostgreSQL, uma partição por mês e índice BRIN na data)
+#   sales_daily_product  vendas por (tenant, produto, dia), recalculada só nos produtos e dias de cada carga
+#   sales_loads          datasets processados já carregados
+# O treino lê a série de cada produto com uma consulta pela chave primária de
+# sales_daily_product, em vez de reler e agregar o histórico inteiro no pandas.
+
+# Colunas do dataset de vendas processado -> colunas de sales_daily
+SALES_HISTORY_COLUMNS = {
+    "produto_id": "product_id",
+    "data_pedido": "sale_date",
+    "quantidade": "quantity",
+    "valor_unitario": "unit_price",
+    "valor_total_pedido": "total_value",
+}
+
+# Linhas enviadas por comando COPY (limita o buffer CSV em memória)
+COPY_CHUNK_ROWS = 500_000
+
+def _is_postgres(db: Session) -> bool:
+    return db.get_bind().dialect.name == "postgresql"
+
+def ensure_sales_partitions(db: Session, first_day: datetime.date, last_day: datetime.date):
+    """
+    Cria (se necessário) as partições mensais de sales_daily que cobrem o intervalo. Apenas PostgreSQL.
+    """
+    month = first_day.replace(day=1)
+    while month <= last_day:
+        next_month = (month + datetime.timedelta(days=32)).replace(day=1)
+        db.execute(text(
+            f"CREATE TABLE IF NOT EXISTS sales_daily_{month:%Y_%m} PARTITION OF sales_daily "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month.isoformat()}')"
+        ))
+        month = next_month
+
+def _copy_rows(db: Session, frame: pd.DataFrame, table: str = "sales_daily"):
+    # COPY ... FROM STDIN na conexão da sessão (mesma transação da remoção do intervalo)
+    columns = ", ".join(frame.columns)
+    cursor = db.connection().connection.cursor()
+    try:
+        for start in range(0, len(frame), COPY_CHUNK_ROWS):
+            buffer = io.StringIO()
+            frame.iloc[start:start + COPY_CHUNK_ROWS].to_csv(buffer, index=False, header=False, date_format="%Y-%m-%d")
+            buffer.seek(0)
+            cursor.copy_expert(f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+def _replace_rows_postgres(db: Session, tenant: str, frame: pd.DataFrame, first_day: datetime.date, last_day: datetime.date):
+    """
+    Substitui as vendas dos pares (produto, dia) da carga: COPY para uma tabela
+    temporária, DELETE ... USING pelos pares e INSERT ... SELECT.
+    """
+    ensure_sales_partitions(db, first_day, last_day)
+    db.execute(text("CREATE TEMP TABLE sales_daily_stage (LIKE sales_daily) ON COMMIT DROP"))
+    _copy_rows(db, frame, table="sales_daily_stage")
+    # O intervalo de datas restringe as partições visitadas
+    db.execute(text(
+        "DELETE FROM sales_daily d USING (SELECT DISTINCT product_id, sale_date FROM sales_daily_stage) s "
+        "WHERE d.tenant_id = :tenant AND d.sale_date BETWEEN :first_day AND :last_day "
+        "AND d.product_id = s.product_id AND d.sale_date = s.sale_date"
+    ), {"tenant": tenant, "first_day": first_day, "last_day": last_day})
+    db.execute(text("INSERT INTO sales_daily SELECT * FROM sales_daily_stage"))
+
+def _replace_rows(db: Session, tenant: str, frame: pd.DataFrame):
+    # Demais bancos (SQLite em desenvolvimento e testes): uma remoção por produto
+    for product_id, dates in frame.groupby("product_id")["sale_date"]:
+        days = sorted({day.date() for day in dates})
+        db.execute(delete(sales_daily).where(
+            sales_daily.c.tenant_id == tenant,
+            sales_daily.c.product_id == int(product_id),
+            sales_daily.c.sale_date.in_(days),
+        ))
+    records = frame.assign(sale_date=frame["sale_date"].dt.date)
+    records = records.astype(object).where(records.notna(), None).to_dict("records")
+    db.execute(insert(sales_daily), records)
+
+def refresh_daily_product_sales(
+    db: Session,
+    tenant: str,
+    first_day: datetime.date,
+    last_day: datetime.date,
+    product_ids: Optional[Iterable[int]] = None,
+):
+    """
+    Recalcula sales_daily_product para os dias do intervalo (sem commit), apenas dos
+    produtos informados (padrão: todos).
+    """
+    product_ids = None if product_ids is None else [int(pid) for pid in product_ids]
+    stale = delete(SalesDailyProduct).where(
+        SalesDailyProduct.tenant_id == tenant, SalesDailyProduct.day.between(first_day, last_day)
+    )
+    if product_ids is not None:
+        stale = stale.where(SalesDailyProduct.product_id.in_(product_ids))
+    db.execute(stale)
+    daily = select(
+        sales_daily.c.tenant_id,
+        sales_daily.c.product_id,
+        sales_daily.c.sale_date,
+        func.sum(sales_daily.c.quantity),
+        func.sum(sales_daily.c.total_value),
+        func.count(),
+    ).where(
+        sales_daily.c.tenant_id == tenant, sales_daily.c.sale_date.between(first_day, last_day)
+    )
+    if product_ids is not None:
+        daily = daily.where(sales_daily.c.product_id.in_(product_ids))
+    daily = daily.group_by(sales_daily.c.tenant_id, sales_daily.c.product_id, sales_daily.c.sale_date)
+    db.execute(insert(SalesDailyProduct).from_select(
+        ["tenant_id", "product_id", "day", "quantity", "total_value", "orders"], daily
+    ))
+
+def load_sales_history(
+    db: Session, sales_df: pd.DataFrame, tenant: Optional[str] = None, source: Optional[str] = None
+) -> int:
+    """
+    Carrega vendas limpas no histórico do banco e atualiza as vendas diárias por produto.
+
+    As vendas de cada produto nos dias em que ele aparece no DataFrame são substituídas
+    (recarregar o mesmo arquivo não duplica o histórico); os demais produtos e dias
+    ficam como estão. No PostgreSQL a carga usa COPY.
+
+    Args:
+        db: Sessão do banco.
+        sales_df: Vendas limpas (saída de clean_sales_data).
+        tenant: Empresa dona das vendas (padrão: settings.DEFAULT_TENANT).
+        source: Dataset processado de origem; um dataset já carregado não é carregado de novo.
+
+    Returns:
+        O número de vendas carregadas.
+    """
+    tenant = tenant or settings.DEFAULT_TENANT
+    if source and db.get(SalesLoad, (tenant, source)) is not None:
+        logger.info("Vendas de %s já carregadas no histórico.", source)
+        return 0
+
+    frame = sales_df.reindex(columns=list(SALES_HISTORY_COLUMNS)).rename(columns=SALES_HISTORY_COLUMNS)
+    frame = frame.dropna(subset=["product_id", "sale_date", "quantity"])
+    if frame.empty:
+        return 0
+    frame["sale_date"] = pd.to_datetime(frame["sale_date"]).dt.normalize()
+    frame["product_id"] = frame["product_id"].astype("int64")
+    # Ordem cronológica: mantém o BRIN compacto (páginas vizinhas com datas vizinhas)
+    frame = frame.sort_values(["sale_date", "product_id"], kind="stable")
+    frame.insert(0, "tenant_id", tenant)
+    first_day, last_day = frame["sale_date"].iloc[0].date(), frame["sale_date"].iloc[-1].date()
+
+    with span("load_sales_history") as s:
+        s.rows_in = len(frame)
+        if _is_postgres(db):
+            _replace_rows_postgres(db, tenant, frame, first_day, last_day)
+        else:
+            _replace_rows(db, tenant, frame)
+        refresh_daily_product_sales(db, tenant, first_day, last_day, frame["product_id"].unique())
+        if source:
+            db.add(SalesLoad(
+                tenant=tenant, source=source, first_day=first_day, last_day=last_day,
+                rows=len(frame), loaded_at=datetime.datetime.now(datetime.UTC),
+            ))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Outro processo carregou o mesmo dataset ao mesmo tempo
+            db.rollback()
+            return 0
+    logger.info("%d vendas de %s a %s carregadas no histórico.", len(frame), first_day, last_day)
+    return len(frame)
+
+def sales_history_loaded(db: Session, tenant: str, source: str) -> bool:
+    """
+    Indica se o dataset de vendas processado já foi carregado no histórico do banco.
+    """
+    return db.get(SalesLoad, (tenant, source)) is not None
+
+def get_sales_days(
+    db: Session, tenant: Optional[str] = None, start: Optional[datetime.date] = None
+) -> Dict[int, int]:
+    """
+    Retorna o número de dias com vendas de cada produto do tenant (a partir de `start`, se informado).
+    """
+    query = select(SalesDailyProduct.product_id, func.count()).where(
+        SalesDailyProduct.tenant_id == (tenant or settings.DEFAULT_TENANT)
+    )
+    if start is not None:
+        query = query.where(SalesDailyProduct.day >= start)
+    rows = db.execute(query.group_by(SalesDailyProduct.product_id)).all()
+    return {int(pid): int(days) for pid, days in rows}
+
+def get_daily_sales(
+    db: Session,
+    tenant: Optional[str] = None,
+    product_ids: Optional[Iterable[int]] = None,
+    start: Optional[datetime.date] = None,
+) -> Dict[int, pd.DataFrame]:
+    """
+    Lê as vendas diárias dos produtos do tenant, no mesmo formato de create_prophet_features.
+    Com `start`, apenas os dias a partir dele (ver training_start).
+
+    Returns:
+        Um dicionário com um DataFrame (ds, y) por ID de produto.
+    """
+    query = select(SalesDailyProduct.product_id, SalesDailyProduct.day, SalesDailyProduct.quantity).where(
+        SalesDailyProduct.tenant_id == (tenant or settings.DEFAULT_TENANT)
+    )
+    if product_ids is not None:
+        query = query.where(SalesDailyProduct.product_id.in_([int(pid) for pid in product_ids]))
+    if start is not None:
+        query = query.where(SalesDailyProduct.day >= start)
+    rows = db.execute(query.order_by(SalesDailyProduct.product_id, SalesDailyProduct.day)).all()
+    if not rows:
+        return {}
+
+    ids, days, quantities = zip(*rows)
+    ids = np.asarray(ids, dtype=np.int64)
+    daily = pd.DataFrame({
+        "ds": pd.to_datetime(pd.Series(days)).astype("datetime64[s]"),
+        "y": np.asarray(quantities, dtype=np.float64),
+    })
+    starts = np.flatnonzero(np.r_[True, ids[1:] != ids[:-1]])
+    ends = np.r_[starts[1:], len(ids)]
+    return {int(ids[start]): daily.iloc[start:end] for start, end in zip(starts, ends)}
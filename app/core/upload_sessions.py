@@ -0,0 +1,348 @@
+import base64
+import datetime
+import hashlib
+import math
+import uuid
+from typing import BinaryIO, Dict, List, Optional
+
+from app.core.config import settings
+from app.core.crud import create_upload_session, mark_upload_session_completed, record_upload_part, get_upload_parts
+from app.core.database import UploadSession
+from app.core.datalake import raw_key
+from app.core.manifest import BATCH_DATASETS, write_batch_manifest
+from app.utils.logger import get_logger
+
+logger = get_logger("core.upload_sessions")
+
+# Sessão de upload direto ao S3:
+#   1. start_upload_session reserva as chaves raw/{tenant}/{dataset}_{ts}.csv, grava o
+#      manifesto do lote e devolve URLs pré-assinadas (PUT simples ou uma URL por parte).
+#   2. O cliente envia os arquivos direto ao bucket.
+#   3. finish_upload_session conclui os multipart uploads e confere os objetos.
+# A notificação ObjectCreated de raw/ aciona a Lambda de processamento para cada
+# arquivo, como em um upload pela API. A API não recebe nenhum byte dos CSVs.
+#
+# Upload retomável (resumable=True), para clientes que não falam com o S3: os arquivos
+# são sempre multipart e o cliente envia cada parte à API (PUT com Content-Range e
+# SHA-256). Cada parte vai para o S3 (upload_part) e fica registrada no ledger
+# upload_parts; depois de uma falha, o cliente consulta o offset recebido e continua
+# dali. A conclusão usa os ETags do ledger e segue o mesmo caminho acima.
+
+# Limites do S3 para multipart upload
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_PARTS = 10_000
+
+def part_size_for(size: int, part_size: Optional[int] = None) -> int:
+    """
+    Tamanho de cada parte de um multipart upload, respeitando os limites do S3.
+    """
+    part_size = part_size or settings.UPLOAD_PART_SIZE
+    return max(part_size, MIN_PART_SIZE, math.ceil(size / MAX_PARTS))
+
+def _plan_file(
+    s3_client, bucket: str, key: str, size: int, expires: int, resumable: bool = False, presign_client=None
+):
+    """
+    Prepara o upload de um arquivo. Retorna (registro da sessão, instruções para o cliente).
+    As URLs são assinadas por `presign_client` (padrão: `s3_client`; ver get_presign_client).
+    """
+    presign_client = presign_client or s3_client
+    if resumable:
+        part_size = part_size_for(size, settings.UPLOAD_CHUNK_SIZE)
+        upload_id = s3_client.create_multipart_upload(Bucket=bucket, Key=key, ContentType="text/csv")["UploadId"]
+        record = {"key": key, "size": size, "upload_id": upload_id, "part_size": part_size}
+        return record, {"key": key, "method": "CHUNKED", "part_size": part_size, "parts": math.ceil(size / part_size)}
+
+    if size <= settings.UPLOAD_PART_SIZE:
+        url = presign_client.generate_presigned_url(
+            "put_object", Params={"Bucket": bucket, "Key": key}, ExpiresIn=expires
+        )
+        return {"key": key, "size": size}, {"key": key, "method": "PUT", "url": url}
+
+    part_size = part_size_for(size)
+    upload_id = s3_client.create_multipart_upload(Bucket=bucket, Key=key, ContentType="text/csv")["UploadId"]
+    parts = [
+        {
+            "part_number": number,
+            "url": presign_client.generate_presigned_url(
+                "upload_part",
+                Params={"Bucket": bucket, "Key": key, "UploadId": upload_id, "PartNumber": number},
+                ExpiresIn=expires,
+            ),
+        }
+        for number in range(1, math.ceil(size / part_size) + 1)
+    ]
+    record = {"key": key, "size": size, "upload_id": upload_id, "part_size": part_size}
+    return record, {"key": key, "method": "MULTIPART", "upload_id": upload_id, "part_size": part_size, "parts": parts}
+
+def start_upload_session(
+    db,
+    tenant: str,
+    sizes: Dict[str, int],
+    s3_client,
+    bucket: Optional[str] = None,
+    resumable: bool = False,
+    presign_client=None,
+) -> Dict:
+    """
+    Abre uma sessão de upload direto ao S3 para um lote (produtos e vendas).
+
+    Args:
+        db: Sessão do banco.
+        tenant: Empresa dona dos dados.
+        sizes: Tamanho em bytes de cada arquivo, por dataset ("products" e "sales").
+        s3_client: Cliente boto3 do S3 (inicia os multipart uploads e, sem `presign_client`, gera as URLs).
+        bucket: Bucket de destino (padrão: settings.S3_BUCKET_NAME).
+        resumable: Upload retomável: as partes são enviadas à API, em vez de URLs pré-assinadas.
+        presign_client: Cliente que assina as URLs com o endpoint visto pelo cliente (ver get_presign_client).
+
+    Returns:
+        O ID da sessão, o timestamp do lote, o manifesto e as instruções de upload de cada arquivo.
+    """
+    missing = [dataset for dataset in BATCH_DATASETS if dataset not in sizes]
+    if missing:
+        raise ValueError(f"Tamanho não informado para: {', '.join(missing)}")
+
+    bucket = bucket or settings.S3_BUCKET_NAME
+    expires = settings.UPLOAD_URL_EXPIRES_SECONDS
+    # Microssegundos: várias sessões do mesmo tenant no mesmo segundo não disputam as chaves
+    timestamp = datetime.datetime.now(datetime.UTC).strftime("%Y%m%d%H%M%S%f")
+
+    records, files = {}, {}
+    for dataset in BATCH_DATASETS:
+        records[dataset], files[dataset] = _plan_file(
+            s3_client, bucket, raw_key(dataset, timestamp, tenant), sizes[dataset], expires, resumable, presign_client
+        )
+
+    # O manifesto vem antes dos arquivos: o pipeline de ML espera todos os datasets do lote
+    manifest_path = write_batch_manifest(timestamp, tenant=tenant, bucket=bucket)
+    session_id = uuid.uuid4().hex
+    create_upload_session(db, session_id, tenant, timestamp, records)
+    logger.info("Sessão de upload %s aberta para %s/%s.", session_id, tenant, timestamp)
+
+    return {
+        "session_id": session_id,
+        "timestamp": timestamp,
+        "manifest": manifest_path,
+        "expires_in": expires,
+        "files": files,
+    }
+
+def finish_upload_session(
+    db,
+    session: UploadSession,
+    parts: Dict[str, List[Dict]],
+    s3_client,
+    bucket: Optional[str] = None,
+) -> List[str]:
+    """
+    Conclui uma sessão: finaliza os multipart uploads e confere que os arquivos estão no bucket,
+    com o tamanho declarado. A chamada pode ser repetida: arquivos já no bucket não são
+    concluídos de novo, e uma sessão já concluída apenas devolve as chaves.
+
+    Args:
+        db: Sessão do banco.
+        session: A sessão de upload.
+        parts: Partes enviadas de cada arquivo multipart ({dataset: [{"part_number", "etag"}]}).
+            Datasets sem partes informadas usam as partes registradas no ledger (upload retomável).
+        s3_client: Cliente boto3 do S3.
+        bucket: Bucket de destino (padrão: settings.S3_BUCKET_NAME).
+
+    Returns:
+        As chaves dos arquivos brutos.
+
+    Raises:
+        ValueError: Se faltarem partes ou algum arquivo não estiver no bucket com o tamanho declarado.
+    """
+    from botocore.exceptions import ClientError
+
+    bucket = bucket or settings.S3_BUCKET_NAME
+    keys = [session.files[dataset]["key"] for dataset in BATCH_DATASETS]
+    if session.status == "completed":
+        return keys
+
+    ledger = _ledger_parts(db, session)
+    for dataset in BATCH_DATASETS:
+        entry = session.files[dataset]
+        # Repetição depois de uma falha parcial: arquivos já concluídos não são concluídos de novo
+        size = _object_size(s3_client, bucket, entry["key"])
+        if size is None and "upload_id" in entry:
+            dataset_parts = parts.get(dataset)
+            if not dataset_parts:
+                missing = missing_parts(entry, ledger.get(dataset, {}))
+                if missing == list(range(1, part_count(entry) + 1)):
+                    raise ValueError(f"Partes do arquivo de {dataset} não informadas.")
+                if missing:
+                    raise ValueError(f"Faltam as partes {missing} do arquivo de {dataset}.")
+                dataset_parts = [
+                    {"part_number": number, "etag": part.etag} for number, part in ledger[dataset].items()
+                ]
+            try:
+                s3_client.complete_multipart_upload(
+                    Bucket=bucket,
+                    Key=entry["key"],
+                    UploadId=entry["upload_id"],
+                    MultipartUpload={"Parts": [
+                        {"PartNumber": int(p["part_number"]), "ETag": p["etag"]}
+                        for p in sorted(dataset_parts, key=lambda p: int(p["part_number"]))
+                    ]},
+                )
+            except ClientError as e:
+                raise ValueError(f"Não foi possível concluir o upload de {dataset}: {e}")
+            size = _object_size(s3_client, bucket, entry["key"])
+
+        if size is None:
+            raise ValueError(f"Arquivo de {dataset} não encontrado em {entry['key']}.")
+        if size != entry["size"]:
+            raise ValueError(f"Arquivo de {dataset} tem {size} bytes; esperados {entry['size']}.")
+
+    mark_upload_session_completed(db, session)
+    logger.info("Sessão de upload %s concluída.", session.id)
+    return keys
+
+def _object_size(s3_client, bucket: str, key: str) -> Optional[int]:
+    """
+    Tamanho do objeto no bucket, ou None se ele não existe.
+    """
+    from botocore.exceptions import ClientError
+
+    try:
+        return int(s3_client.head_object(Bucket=bucket, Key=key)["ContentLength"])
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+            return None
+        raise ValueError(f"Não foi possível consultar {key}: {e}")
+
+def part_count(entry: Dict) -> int:
+    return math.ceil(entry["size"] / entry["part_size"])
+
+def _part_range(entry: Dict, part_number: int):
+    # Intervalo [início, fim) de bytes da parte no arquivo
+    start = (part_number - 1) * entry["part_size"]
+    return start, min(start + entry["part_size"], entry["size"])
+
+def _ledger_parts(db, session: UploadSession) -> Dict[str, Dict]:
+    ledger: Dict[str, Dict] = {}
+    for part in get_upload_parts(db, session.id):
+        ledger.setdefault(part.dataset, {})[part.part_number] = part
+    return ledger
+
+def missing_parts(entry: Dict, received) -> List[int]:
+    """
+    Números das partes do arquivo ainda não recebidas.
+    """
+    return [number for number in range(1, part_count(entry) + 1) if number not in received]
+
+def received_offset(entry: Dict, received) -> int:
+    """
+    Bytes recebidos sem lacunas desde o início do arquivo: o ponto em que o envio continua.
+    """
+    number = 1
+    while number in received:
+        number += 1
+    return min((number - 1) * entry["part_size"], entry["size"])
+
+def upload_session_status(db, session: UploadSession) -> Dict:
+    """
+    Estado de uma sessão: o offset recebido e as partes que faltam de cada arquivo enviado em partes.
+    """
+    ledger = _ledger_parts(db, session)
+    files = {}
+    for dataset in BATCH_DATASETS:
+        entry = session.files[dataset]
+        status = {"key": entry["key"], "size": entry["size"]}
+        if "upload_id" in entry:
+            received = ledger.get(dataset, {})
+            status.update(
+                part_size=entry["part_size"],
+                offset=received_offset(entry, received),
+                received_parts=sorted(received),
+                missing_parts=missing_parts(entry, received),
+            )
+        files[dataset] = status
+    return {"session_id": session.id, "status": session.status, "files": files}
+
+def upload_chunk(
+    db,
+    session: UploadSession,
+    dataset: str,
+    start: int,
+    end: int,
+    total: int,
+    body: BinaryIO,
+    checksum: str,
+    s3_client,
+    bucket: Optional[str] = None,
+) -> Dict:
+    """
+    Recebe uma parte de um arquivo do upload retomável e a envia ao multipart upload no S3.
+
+    A parte deve cobrir exatamente um dos intervalos da sessão (múltiplos de part_size).
+    Reenviar uma parte já registrada com o mesmo conteúdo não a envia de novo ao S3.
+
+    Args:
+        db: Sessão do banco.
+        session: A sessão de upload.
+        dataset: Arquivo da parte ("products" ou "sales").
+        start: Primeiro byte da parte no arquivo (Content-Range).
+        end: Último byte da parte no arquivo, inclusive (Content-Range).
+        total: Tamanho total do arquivo (Content-Range).
+        body: Conteúdo da parte, posicionado no início.
+        checksum: SHA-256 (hexadecimal) da parte, calculado pelo cliente.
+        s3_client: Cliente boto3 do S3.
+        bucket: Bucket de destino (padrão: settings.S3_BUCKET_NAME).
+
+    Returns:
+        O número da parte e o offset recebido do arquivo depois dela.
+
+    Raises:
+        LookupError: Se o dataset não existe na sessão.
+        ValueError: Se a sessão já foi concluída, o intervalo não corresponde a uma parte
+            ou o checksum não confere.
+    """
+    from botocore.exceptions import ClientError
+
+    if dataset not in BATCH_DATASETS:
+        raise LookupError(f"Arquivo {dataset} não faz parte da sessão.")
+    if session.status == "completed":
+        raise ValueError("Sessão de upload já concluída.")
+    entry = session.files[dataset]
+    if "upload_id" not in entry:
+        raise ValueError(f"O arquivo de {dataset} não é enviado em partes.")
+    if total != entry["size"] or start % entry["part_size"] != 0:
+        raise ValueError(f"Intervalo {start}-{end}/{total} não corresponde a uma parte do arquivo de {dataset}.")
+    part_number = start // entry["part_size"] + 1
+    if part_number > part_count(entry) or _part_range(entry, part_number) != (start, end + 1):
+        raise ValueError(f"Intervalo {start}-{end}/{total} não corresponde a uma parte do arquivo de {dataset}.")
+
+    sha256, md5, size = hashlib.sha256(), hashlib.md5(), 0
+    for block in iter(lambda: body.read(1024 * 1024), b""):
+        sha256.update(block)
+        md5.update(block)
+        size += len(block)
+    if size != end + 1 - start:
+        raise ValueError(f"A parte {part_number} tem {size} bytes; esperados {end + 1 - start}.")
+    if sha256.hexdigest() != checksum.strip().lower():
+        raise ValueError(f"Checksum da parte {part_number} do arquivo de {dataset} não confere.")
+
+    ledger = _ledger_parts(db, session).get(dataset, {})
+    existing = ledger.get(part_number)
+    if existing is None or existing.checksum != sha256.hexdigest():
+        body.seek(0)
+        try:
+            # Content-MD5: o S3 também confere a parte recebida da API
+            response = s3_client.upload_part(
+                Bucket=bucket or settings.S3_BUCKET_NAME,
+                Key=entry["key"],
+                UploadId=entry["upload_id"],
+                PartNumber=part_number,
+                Body=body,
+                ContentLength=size,
+                ContentMD5=base64.b64encode(md5.digest()).decode("ascii"),
+            )
+        except ClientError as e:
+            raise ValueError(f"Não foi possível enviar a parte {part_number} do arquivo de {dataset}: {e}")
+        record_upload_part(db, session.id, dataset, part_number, size, response["ETag"], sha256.hexdigest())
+        ledger = {**ledger, part_number: True}
+
+    return {"dataset": dataset, "part_number": part_number, "offset": received_offset(entry, ledger)}
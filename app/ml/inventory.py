@@ -0,0 +1,120 @@
+from statistics import NormalDist
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.core.config import settings
+from app.ml.simulation import simulate_stock_risk
+from app.utils.tracing import traced
+from app.utils.logger import get_logger
+
+logger = get_logger("ml.inventory")
+
+# Largura do intervalo de previsão do Prophet (padrão do Prophet, não alterada no treino).
+# yhat_upper é o quantil (1 + largura) / 2 da demanda diária.
+PROPHET_INTERVAL_WIDTH = 0.8
+
+RISK_COLUMNS = [
+    "product_id", "stock", "days_of_cover", "stockout_date",
+    "lead_time_demand", "safety_stock", "reorder_point", "reorder_quantity",
+]
+
+@traced()
+def compute_stock_risk(
+    forecast: pd.DataFrame,
+    stock: pd.Series,
+    horizon_days: Optional[int] = None,
+    lead_time_days: Optional[int] = None,
+    service_level: Optional[float] = None,
+) -> pd.DataFrame:
+    """
+    Cruza a demanda prevista com o estoque atual de todos os produtos de uma vez.
+
+    A projeção usa os últimos `horizon_days` dias da previsão de cada produto (o período
+    futuro). O desvio padrão diário da demanda vem da distância entre yhat_upper e yhat;
+    o estoque de segurança cobre a variação da demanda no lead time com o nível de
+    serviço pedido (dias independentes).
+
+    Args:
+        forecast: Previsões com as colunas product_id, ds, yhat e yhat_upper.
+        stock: Estoque atual indexado pelo ID do produto (produtos ausentes contam como zero).
+        horizon_days: Número de dias futuros da previsão (padrão: settings.FORECAST_DAYS). Deve ser o
+            mesmo `days_to_predict` da previsão: as linhas anteriores são o histórico ajustado.
+        lead_time_days: Dias entre o pedido e a chegada da reposição (padrão: settings.INVENTORY_LEAD_TIME_DAYS).
+        service_level: Probabilidade desejada de não faltar estoque no lead time (padrão: settings.INVENTORY_SERVICE_LEVEL).
+
+    Returns:
+        Um DataFrame com uma linha por produto: dias de cobertura, data projetada de
+        ruptura (NaT se o estoque cobre todo o horizonte), demanda e estoque de
+        segurança no lead time, ponto de pedido e quantidade a repor.
+    """
+    horizon_days = settings.FORECAST_DAYS if horizon_days is None else horizon_days
+    lead_time_days = settings.INVENTORY_LEAD_TIME_DAYS if lead_time_days is None else lead_time_days
+    service_level = service_level or settings.INVENTORY_SERVICE_LEVEL
+    if forecast.empty:
+        return pd.DataFrame(columns=RISK_COLUMNS)
+
+    future = forecast.sort_values(["product_id", "ds"], kind="stable").groupby("product_id", sort=False).tail(horizon_days)
+    product_ids = future["product_id"].to_numpy()
+    dates = future["ds"].to_numpy()
+    demand = future["yhat"].to_numpy(dtype=np.float64).clip(min=0)
+    interval_z = NormalDist().inv_cdf((1 + PROPHET_INTERVAL_WIDTH) / 2)
+    sigma = (future["yhat_upper"].to_numpy(dtype=np.float64) - demand).clip(min=0) / interval_z
+
+    # Limites de cada produto nas linhas ordenadas
+    starts = np.flatnonzero(np.r_[True, product_ids[1:] != product_ids[:-1]])
+    counts = np.diff(np.r_[starts, len(product_ids)])
+    group = np.repeat(np.arange(len(starts)), counts)
+    day = np.arange(len(product_ids)) - starts[group]
+
+    # Demanda acumulada por produto (cumsum global menos o acumulado antes do produto)
+    cumulative = np.cumsum(demand)
+    cumulative -= np.repeat(cumulative[starts] - demand[starts], counts)
+
+    ids = product_ids[starts]
+    stock = stock[~stock.index.duplicated(keep="last")]
+    on_hand = stock.reindex(ids).fillna(0).to_numpy(dtype=np.float64).clip(min=0)
+
+    # A demanda acumulada não decresce: os dias cobertos são os primeiros de cada produto
+    covered = np.bincount(group, weights=cumulative <= on_hand[group], minlength=len(ids)).astype(np.int64)
+    runs_out = covered < counts
+    first_short = starts + np.minimum(covered, counts - 1)
+    before_short = cumulative[first_short] - demand[first_short]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fraction = np.where(runs_out, (on_hand - before_short) / demand[first_short], 0.0)
+    days_of_cover = covered + np.nan_to_num(fraction, nan=0.0, posinf=0.0)
+    stockout_date = np.where(runs_out, dates[first_short], np.datetime64("NaT"))
+
+    in_lead_time = day < lead_time_days
+    lead_time_demand = np.bincount(group, weights=demand * in_lead_time, minlength=len(ids))
+    lead_time_sigma = np.sqrt(np.bincount(group, weights=sigma ** 2 * in_lead_time, minlength=len(ids)))
+    safety_stock = NormalDist().inv_cdf(service_level) * lead_time_sigma
+    reorder_point = lead_time_demand + safety_stock
+
+    return pd.DataFrame({
+        "product_id": ids.astype(np.int64),
+        "stock": on_hand,
+        "days_of_cover": days_of_cover,
+        "stockout_date": pd.to_datetime(stockout_date),
+        "lead_time_demand": lead_time_demand,
+        "safety_stock": safety_stock,
+        "reorder_point": reorder_point,
+        "reorder_quantity": np.ceil((reorder_point - on_hand).clip(min=0)),
+    })
+
+def assess_stock_risk(
+    forecast: pd.DataFrame,
+    stock: pd.Series,
+    samples: Optional[Dict[int, np.ndarray]] = None,
+    horizon_days: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Calcula o risco de ruptura pela previsão e, se houver amostras da demanda,
+    acrescenta as estatísticas da simulação (probabilidade de ruptura e vendas perdidas).
+    `horizon_days` é o número de dias previstos (ver compute_stock_risk).
+    """
+    risk = compute_stock_risk(forecast, stock, horizon_days=horizon_days)
+    if samples:
+        risk = risk.merge(simulate_stock_risk(samples, stock), on="product_id", how="left")
+    return risk
@@ -1,10 +1,20 @@
+import numpy as np
 import pandas as pd
-from typing import Dict
+from typing import Dict, Optional
 from app.ml.prophet_model import ProphetModel
+from app.utils.tracing import traced, span
+from app.utils.logger import get_logger, bind_context
+from app.core.config import settings
 
+logger = get_logger("ml.predictor")
+# Mensagens por produto são amostradas para não pesar no loop de previsão
+product_logger = get_logger("ml.predictor.product", sample_rate=settings.LOG_PRODUCT_SAMPLE_RATE)
+
+@traced()
 def generate_predictions(
     trained_models: Dict[str, ProphetModel],
-    days_to_predict: int
+    days_to_predict: int,
+    samples: Optional[Dict[str, np.ndarray]] = None,
 ) -> Dict[str, pd.DataFrame]:
     """
     Gera previsões para cada modelo treinado.
@@ -12,6 +22,9 @@ def generate_predictions(
     Args:
         trained_models: Dicionário com os modelos Prophet treinados.
         days_to_predict: O número de dias a prever no futuro.
+        samples: Se informado, recebe, para cada produto, a matriz float32
+                 (dias x caminhos) de amostras da demanda futura, com até
+                 settings.SIMULATION_PATHS caminhos.
 
     Returns:
         Um dicionário onde as chaves são os IDs dos produtos e os valores
@@ -19,8 +32,15 @@ def generate_predictions(
     """
     predictions = {}
     for product_id, model in trained_models.items():
-        print(f"Gerando previsão para o produto {product_id}...")
-        forecast_df = model.predict(days=days_to_predict)
+        product_logger.info("Gerando previsão para o produto %s...", product_id)
+        with bind_context(product_id=str(product_id)), span("predict_product", product_id=str(product_id)) as s:
+            if samples is None:
+                forecast_df = model.predict(days=days_to_predict)
+            else:
+                forecast_df, product_samples = model.predict_with_samples(days_to_predict, settings.SIMULATION_PATHS)
+                if product_samples is not None:
+                    samples[product_id] = product_samples
+            s.rows_out = len(forecast_df)
 
         # Selecionar colunas relevantes e garantir que a previsão não seja negativa
         forecast_df = forecast_df[['ds', 'yhat', 'yhat_lower', 'yhat_upper']]
@@ -29,10 +49,21 @@ def generate_predictions(
         forecast_df['yhat_upper'] = forecast_df['yhat_upper'].clip(lower=0)
 
         predictions[product_id] = forecast_df
-        print(f"Previsão para o produto {product_id} gerada com sucesso.")
+        product_logger.info("Previsão para o produto %s gerada com sucesso.", product_id)
+
+    logger.info("%d previsões geradas.", len(predictions))
 
     # TODO: Em uma aplicação real, as previsões devem ser salvas em um
     # local persistente, como um banco de dados (PostgreSQL) ou S3 (Parquet).
     # Ex: save_predictions_to_db(product_id, forecast_df)
 
     return predictions
+
+def stack_predictions(predictions: Dict[str, pd.DataFrame]) -> pd.DataFrame:
+    """
+    Junta as previsões de todos os produtos em um único DataFrame com a coluna product_id.
+    """
+    frames = [df.assign(product_id=int(pid)) for pid, df in predictions.items()]
+    if not frames:
+        return pd.DataFrame(columns=["ds", "yhat", "yhat_lower", "yhat_upper", "product_id"])
+    return pd.concat(frames, ignore_index=True)
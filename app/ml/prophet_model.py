@@ -1,5 +1,72 @@
+import threading
+from typing import Optional, Tuple
+import numpy as np
 import pandas as pd
-from prophet import Prophet
+
+from app.utils.logger import get_logger
+
+logger = get_logger("ml.prophet_model")
+
+# O Prophet (e o cmdstanpy/matplotlib que ele carrega) leva mais de um segundo
+# para importar. A importação é adiada até o primeiro modelo ser criado, para que
+# módulos que apenas referenciam o ProphetModel (ex: Lambdas) iniciem rápido.
+_prophet_class = None
+_stan_model = None
+_lock = threading.Lock()
+
+def _get_prophet_class():
+    """
+    Importa o Prophet sob demanda e retorna uma subclasse que reutiliza o modelo
+    Stan pré-compilado, carregado uma única vez por processo.
+    """
+    global _prophet_class
+    if _prophet_class is None:
+        with _lock:
+            if _prophet_class is None:
+                from prophet import Prophet
+                try:
+                    from prophet.models import CmdStanPyBackend
+                except ImportError:
+                    CmdStanPyBackend = None
+                if CmdStanPyBackend is None or not hasattr(Prophet, "_load_stan_backend"):
+                    # O cache depende de uma API interna do Prophet (_load_stan_backend);
+                    # em versões sem ela, cada modelo carrega o seu modelo Stan
+                    logger.warning("Versão do Prophet sem _load_stan_backend: modelo Stan sem cache.")
+                    _prophet_class = Prophet
+                    return _prophet_class
+
+                class _CachedModelBackend(CmdStanPyBackend):
+                    # O backend guarda estado do ajuste (stan_fit), por isso cada modelo
+                    # tem o seu; apenas o executável Stan compilado é compartilhado.
+                    def load_model(self):
+                        return _get_stan_model(super().load_model)
+
+                class _Prophet(Prophet):
+                    def _load_stan_backend(self, stan_backend):
+                        if stan_backend not in (None, "CMDSTANPY"):
+                            return super()._load_stan_backend(stan_backend)
+                        self.stan_backend = _CachedModelBackend()
+
+                _prophet_class = _Prophet
+    return _prophet_class
+
+def _get_stan_model(loader):
+    global _stan_model
+    if _stan_model is None:
+        with _lock:
+            if _stan_model is None:
+                _stan_model = loader()
+    return _stan_model
+
+def warm_up():
+    """
+    Carrega o Prophet e o modelo Stan antecipadamente (ex: na inicialização da Lambda).
+    Uma falha não impede a inicialização: o carregamento volta a ser feito no primeiro treino.
+    """
+    try:
+        _get_prophet_class()()
+    except Exception as e:
+        logger.warning("Não foi possível pré-carregar o Prophet: %s", e)
 
 class ProphetModel:
     """
@@ -13,7 +80,7 @@ class ProphetModel:
             **kwargs: Argumentos para passar para o construtor do Prophet
                       (ex: seasonality_mode, daily_seasonality, etc.).
         """
-        self.model = Prophet(**kwargs)
+        self.model = _get_prophet_class()(**kwargs)
 
     def train(self, df: pd.DataFrame):
         """
@@ -40,3 +107,22 @@ class ProphetModel:
         future = self.model.make_future_dataframe(periods=days)
         forecast = self.model.predict(future)
         return forecast
+
+    def predict_with_samples(self, days: int, n_paths: int) -> Tuple[pd.DataFrame, Optional[np.ndarray]]:
+        """
+        Gera a previsão e amostras da distribuição preditiva dos dias futuros.
+
+        Args:
+            days: O número de dias a prever no futuro.
+            n_paths: Número máximo de caminhos (amostras) mantidos por dia.
+
+        Returns:
+            A previsão e uma matriz float32 (dias x caminhos) de demanda não negativa,
+            ou None se o modelo foi criado sem amostras de incerteza.
+        """
+        future = self.model.make_future_dataframe(periods=days)
+        forecast = self.model.predict(future)
+        if not self.model.uncertainty_samples:
+            return forecast, None
+        draws = self.model.predictive_samples(future.tail(days))["yhat"][:, :n_paths]
+        return forecast, np.clip(draws, 0, None).astype(np.float32)
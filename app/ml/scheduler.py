@@ -0,0 +1,125 @@
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Optional
+
+from app.core.config import settings
+from app.utils.logger import get_logger
+
+logger = get_logger("ml.scheduler")
+
+class FairShareScheduler:
+    """
+    Executa pipelines e shards de vários tenants em um pool de workers compartilhado.
+
+    Cada tenant tem a sua fila. Quando um worker fica livre, os tenants com jobs
+    pendentes são atendidos em rodízio, respeitando a cota de execuções simultâneas
+    de cada um: um tenant grande com dezenas de shards na fila ocupa no máximo a sua
+    cota, e o job de um tenant pequeno passa na frente dos shards restantes dele.
+
+    Os jobs não devem esperar por outros jobs do mesmo scheduler (o worker ficaria
+    ocupado e a fila poderia travar).
+    """
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        tenant_concurrency: Optional[int] = None,
+        tenant_quotas: Optional[Dict[str, int]] = None,
+    ):
+        self.max_workers = max_workers or settings.PIPELINE_MAX_WORKERS
+        self.tenant_concurrency = tenant_concurrency or settings.PIPELINE_TENANT_CONCURRENCY
+        self.tenant_quotas = dict(settings.PIPELINE_TENANT_QUOTAS if tenant_quotas is None else tenant_quotas)
+        self._lock = threading.Lock()
+        self._queues: Dict[str, Deque] = {}
+        # Tenants com jobs pendentes, na ordem em que serão atendidos
+        self._turns: Deque[str] = deque()
+        self._running: Dict[str, int] = {}
+        self._free = self.max_workers
+        self._pool = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="pipeline")
+
+    def quota(self, tenant: str) -> int:
+        return max(1, self.tenant_quotas.get(tenant, self.tenant_concurrency))
+
+    def submit(self, tenant: str, func: Callable, *args, **kwargs) -> Future:
+        """
+        Enfileira um job do tenant e retorna o Future do seu resultado.
+        """
+        future: Future = Future()
+        with self._lock:
+            queue = self._queues.setdefault(tenant, deque())
+            queue.append((future, func, args, kwargs))
+            if tenant not in self._turns:
+                self._turns.append(tenant)
+            pending = len(queue)
+        if pending > 1:
+            logger.info("Tenant %s com %d jobs na fila.", tenant, pending)
+        self._dispatch()
+        return future
+
+    def run(self, tenant: str, func: Callable, *args, **kwargs):
+        """
+        Enfileira um job e espera o seu resultado (propaga a exceção do job).
+        """
+        return self.submit(tenant, func, *args, **kwargs).result()
+
+    def _next_job(self):
+        # Rodízio: o primeiro tenant abaixo da cota é atendido e volta ao fim da fila
+        for _ in range(len(self._turns)):
+            tenant = self._turns.popleft()
+            if self._running.get(tenant, 0) >= self.quota(tenant):
+                self._turns.append(tenant)
+                continue
+            queue = self._queues[tenant]
+            job = queue.popleft()
+            if queue:
+                self._turns.append(tenant)
+            else:
+                del self._queues[tenant]
+            return tenant, job
+        return None
+
+    def _dispatch(self):
+        with self._lock:
+            while self._free > 0:
+                entry = self._next_job()
+                if entry is None:
+                    break
+                tenant, job = entry
+                self._free -= 1
+                self._running[tenant] = self._running.get(tenant, 0) + 1
+                self._pool.submit(self._execute, tenant, job)
+
+    def _execute(self, tenant: str, job):
+        future, func, args, kwargs = job
+        try:
+            if future.set_running_or_notify_cancel():
+                try:
+                    result = func(*args, **kwargs)
+                except BaseException as e:
+                    future.set_exception(e)
+                else:
+                    future.set_result(result)
+        finally:
+            with self._lock:
+                self._free += 1
+                self._running[tenant] -= 1
+                if not self._running[tenant]:
+                    del self._running[tenant]
+            self._dispatch()
+
+    def shutdown(self, wait: bool = True):
+        self._pool.shutdown(wait=wait)
+
+_scheduler: Optional[FairShareScheduler] = None
+_scheduler_lock = threading.Lock()
+
+def get_pipeline_scheduler() -> FairShareScheduler:
+    """
+    Retorna o scheduler compartilhado do processo, criando-o no primeiro uso.
+    """
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = FairShareScheduler()
+    return _scheduler
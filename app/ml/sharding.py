@@ -0,0 +1,360 @@
+import datetime
+import heapq
+import json
+import math
+import uuid
+from typing import Dict, List, Optional
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pyarrow import fs as pafs
+
+from app.core.config import settings
+from app.core.parquet import write_parquet
+from app.core.datalake import (
+    get_arrow_filesystem, read_partitioned_dataset, scan_partitioned_dataset, product_filter, date_filter,
+    training_start, ensure_parent_dir,
+)
+from app.core.forecast_snapshot import publish_forecast_snapshot
+from app.core.database import SessionLocal
+from app.core.crud import save_predictions_to_db, get_product_stock, save_stock_risk
+from app.core.sales_history import get_daily_sales
+from app.processing.feature_engineering import create_prophet_features
+from app.ml.trainer import train_models_for_products
+from app.ml.predictor import generate_predictions, stack_predictions
+from app.ml.inventory import assess_stock_risk
+from app.ml.scheduler import FairShareScheduler, get_pipeline_scheduler
+from app.utils.tracing import span
+from app.utils.logger import get_logger, bind_context
+
+logger = get_logger("ml.sharding")
+
+# Layout de uma execução particionada em shards:
+#   predictions/{tenant}/{ts}/shards/shard-0000.json            (manifesto de cada shard)
+#   predictions/{tenant}/{ts}/parts/{attempt}/part-0000.parquet  (previsões parciais de cada worker)
+#   predictions/{tenant}/{ts}/parts/{attempt}/part-0000.failed   (erro de um shard que falhou)
+#   predictions/{tenant}/forecast_{ts}.parquet         (resultado final, após o merge)
+SALES_FEATURE_COLUMNS = ["produto_id", "data_pedido", "quantidade"]
+
+def estimate_fit_cost(n_days: int) -> float:
+    """
+    Estima o custo relativo (em segundos aproximados) de treinar e prever um produto.
+    O ajuste do Prophet tem um custo fixo alto e cresce com o tamanho do histórico.
+    """
+    return 0.5 + n_days / 1000
+
+def plan_shards(days_per_product: Dict[int, int], max_shard_cost: Optional[float] = None) -> List[List[int]]:
+    """
+    Divide os produtos em shards de custo estimado semelhante.
+
+    O número de shards é o mínimo para que nenhum ultrapasse `max_shard_cost`
+    (em média); os produtos são distribuídos do mais caro para o mais barato,
+    sempre no shard menos carregado (LPT).
+
+    Args:
+        days_per_product: Número de dias de histórico por ID de produto.
+        max_shard_cost: Custo máximo estimado por shard (padrão: settings.PREDICT_SHARD_MAX_COST).
+
+    Returns:
+        A lista de shards, cada um uma lista de IDs de produto.
+    """
+    if not days_per_product:
+        return []
+    max_shard_cost = max_shard_cost or settings.PREDICT_SHARD_MAX_COST
+    costs = {pid: estimate_fit_cost(days) for pid, days in days_per_product.items()}
+    n_shards = max(1, math.ceil(sum(costs.values()) / max_shard_cost))
+
+    heap = [(0.0, i) for i in range(n_shards)]
+    shards: List[List[int]] = [[] for _ in range(n_shards)]
+    for pid in sorted(costs, key=lambda p: (-costs[p], p)):
+        load, index = heapq.heappop(heap)
+        shards[index].append(pid)
+        heapq.heappush(heap, (load + costs[pid], index))
+    return [sorted(shard) for shard in shards if shard]
+
+def run_prefix(tenant: str, timestamp: str) -> str:
+    return f"predictions/{tenant}/{timestamp}"
+
+def write_shard_manifests(
+    shards: List[List[int]],
+    sales_root: str,
+    tenant: str,
+    timestamp: str,
+    bucket: str,
+    filesystem: Optional[pafs.FileSystem] = None,
+    feature_source: str = "datalake",
+    run_id: Optional[str] = None,
+) -> List[str]:
+    """
+    Grava um manifesto JSON por shard e retorna as chaves gravadas.
+
+    `feature_source` indica de onde os workers leem as vendas: "datalake" (dataset
+    `sales_root`) ou "database" (vendas diárias do histórico, ver app.core.sales_history).
+    `run_id` identifica o lote no registro de execuções (padrão: o timestamp).
+
+    Cada chamada gera uma tentativa (`attempt`) própria: as partes são gravadas em um
+    diretório da tentativa, e partes de uma execução anterior do mesmo lote não contam
+    para o merge. O início da janela de treino (ver training_start) é fixado no manifesto,
+    para que todos os shards usem a mesma.
+    """
+    filesystem = filesystem or get_arrow_filesystem()
+    prefix = run_prefix(tenant, timestamp)
+    attempt = uuid.uuid4().hex
+    start = training_start()
+    keys = []
+    for index, product_ids in enumerate(shards):
+        manifest = {
+            "tenant": tenant,
+            "timestamp": timestamp,
+            "run_id": run_id or timestamp,
+            "attempt": attempt,
+            "days_to_predict": settings.FORECAST_DAYS,
+            "history_start": start.isoformat() if start else None,
+            "sales_root": sales_root,
+            "feature_source": feature_source,
+            "shard_index": index,
+            "shard_count": len(shards),
+            "product_ids": [int(pid) for pid in product_ids],
+        }
+        key = f"{prefix}/shards/shard-{index:04d}.json"
+        ensure_parent_dir(filesystem, f"{bucket}/{key}")
+        with filesystem.open_output_stream(f"{bucket}/{key}") as out:
+            out.write(json.dumps(manifest).encode("utf-8"))
+        keys.append(key)
+    return keys
+
+def read_manifest(key: str, bucket: str, filesystem: Optional[pafs.FileSystem] = None) -> Dict:
+    filesystem = filesystem or get_arrow_filesystem()
+    with filesystem.open_input_stream(f"{bucket}/{key}") as f:
+        return json.loads(f.read())
+
+def _read_shard_features(manifest: Dict, bucket: str, filesystem: pafs.FileSystem) -> Dict:
+    """
+    Lê as vendas diárias dos produtos do shard, do banco ou do data lake (conforme o manifesto).
+    """
+    start = manifest.get("history_start")
+    start = datetime.date.fromisoformat(start) if start else None
+    if manifest.get("feature_source") == "database":
+        # Uma consulta pela chave primária das vendas diárias por produto
+        db = SessionLocal()
+        try:
+            return get_daily_sales(db, manifest["tenant"], manifest["product_ids"], start=start)
+        finally:
+            db.close()
+
+    # Produtos e janela de treino filtrados na leitura: só as partições necessárias são baixadas
+    sales_filter = product_filter(manifest["product_ids"])
+    if start is not None:
+        sales_filter = sales_filter & date_filter(start)
+    sales_args = (manifest["sales_root"], "sales")
+    sales_kwargs = dict(
+        columns=SALES_FEATURE_COLUMNS,
+        filter=sales_filter,
+        bucket=bucket, filesystem=filesystem,
+    )
+    if settings.PROCESSING_BACKEND == "duckdb":
+        # O DuckDB agrega os lotes à medida que são baixados, sem montar o DataFrame de vendas
+        return create_prophet_features(scan_partitioned_dataset(*sales_args, **sales_kwargs))
+    return create_prophet_features(read_partitioned_dataset(*sales_args, **sales_kwargs))
+
+def run_shard(manifest_key: str, bucket: str, filesystem: Optional[pafs.FileSystem] = None) -> str:
+    """
+    Processa um shard: lê apenas as vendas dos seus produtos, treina, prevê,
+    salva as previsões no banco e grava o Parquet parcial.
+
+    Returns:
+        A chave do Parquet parcial gravado.
+    """
+    filesystem = filesystem or get_arrow_filesystem()
+    manifest = read_manifest(manifest_key, bucket, filesystem)
+    index = manifest["shard_index"]
+
+    with bind_context(shard=index), span("run_shard") as s:
+        feature_dfs = _read_shard_features(manifest, bucket, filesystem)
+        s.rows_in = sum(len(df) for df in feature_dfs.values())
+        trained_models = train_models_for_products(feature_dfs)
+        samples = {} if settings.FORECAST_KEEP_SAMPLES else None
+        days_to_predict = manifest.get("days_to_predict", settings.FORECAST_DAYS)
+        predictions = generate_predictions(trained_models, days_to_predict=days_to_predict, samples=samples)
+
+        part_df = stack_predictions(predictions)
+        db = SessionLocal()
+        try:
+            for product_id, forecast_df in predictions.items():
+                save_predictions_to_db(db, int(product_id), forecast_df, tenant=manifest["tenant"])
+            # Risco de ruptura dos produtos do shard (o estoque foi salvo pelo coordenador)
+            stock = get_product_stock(db, list(predictions), tenant=manifest["tenant"])
+            save_stock_risk(db, assess_stock_risk(part_df, stock, samples, horizon_days=days_to_predict), tenant=manifest["tenant"])
+        finally:
+            db.close()
+        s.rows_out = len(part_df)
+
+        part_key = f"{parts_prefix(manifest['tenant'], manifest['timestamp'], manifest.get('attempt'))}/part-{index:04d}.parquet"
+        ensure_parent_dir(filesystem, f"{bucket}/{part_key}")
+        write_parquet(part_df, "forecast", f"{bucket}/{part_key}", filesystem=filesystem)
+
+    logger.info("Shard %d/%d concluído: %d produtos.", index + 1, manifest["shard_count"], len(predictions))
+    return part_key
+
+def parts_prefix(tenant: str, timestamp: str, attempt: Optional[str] = None) -> str:
+    prefix = f"{run_prefix(tenant, timestamp)}/parts"
+    return f"{prefix}/{attempt}" if attempt else prefix
+
+def completed_parts(
+    tenant: str,
+    timestamp: str,
+    bucket: str,
+    filesystem: Optional[pafs.FileSystem] = None,
+    attempt: Optional[str] = None,
+) -> List[str]:
+    """
+    Lista as chaves dos Parquets parciais já gravados para a tentativa `attempt` da execução.
+    """
+    filesystem = filesystem or get_arrow_filesystem()
+    selector = pafs.FileSelector(f"{bucket}/{parts_prefix(tenant, timestamp, attempt)}", allow_not_found=True)
+    prefix_len = len(bucket) + 1
+    return sorted(
+        info.path[prefix_len:] for info in filesystem.get_file_info(selector)
+        if info.type == pafs.FileType.File and info.path.endswith(".parquet")
+    )
+
+def record_shard_failure(manifest_key: str, bucket: str, error: str, filesystem: Optional[pafs.FileSystem] = None) -> str:
+    """
+    Registra a falha de um shard ao lado das partes da tentativa, para que o último
+    worker saiba que o lote terminou sem todas as partes.
+
+    Returns:
+        A chave do registro gravado.
+    """
+    filesystem = filesystem or get_arrow_filesystem()
+    manifest = read_manifest(manifest_key, bucket, filesystem)
+    key = f"{parts_prefix(manifest['tenant'], manifest['timestamp'], manifest.get('attempt'))}/part-{manifest['shard_index']:04d}.failed"
+    ensure_parent_dir(filesystem, f"{bucket}/{key}")
+    with filesystem.open_output_stream(f"{bucket}/{key}") as out:
+        out.write(json.dumps({"manifest_key": manifest_key, "error": error}).encode("utf-8"))
+    return key
+
+def failed_shards(
+    tenant: str,
+    timestamp: str,
+    bucket: str,
+    filesystem: Optional[pafs.FileSystem] = None,
+    attempt: Optional[str] = None,
+) -> List[str]:
+    """
+    Lista as chaves das falhas de shards registradas para a tentativa `attempt` da execução.
+    """
+    filesystem = filesystem or get_arrow_filesystem()
+    selector = pafs.FileSelector(f"{bucket}/{parts_prefix(tenant, timestamp, attempt)}", allow_not_found=True)
+    prefix_len = len(bucket) + 1
+    return sorted(
+        info.path[prefix_len:] for info in filesystem.get_file_info(selector)
+        if info.type == pafs.FileType.File and info.path.endswith(".failed")
+    )
+
+def merge_forecast_parts(
+    tenant: str,
+    timestamp: str,
+    bucket: str,
+    filesystem: Optional[pafs.FileSystem] = None,
+    attempt: Optional[str] = None,
+) -> str:
+    """
+    Junta os Parquets parciais dos shards da tentativa `attempt` em
+    predictions/{tenant}/forecast_{ts}.parquet e publica o snapshot de previsões servido pela API.
+    A operação é idempotente: pode ser repetida se mais de um worker a disparar.
+
+    Returns:
+        A chave do arquivo final.
+    """
+    filesystem = filesystem or get_arrow_filesystem()
+    with span("merge_forecast_parts") as s:
+        tables = [pq.read_table(f"{bucket}/{key}", filesystem=filesystem) for key in completed_parts(tenant, timestamp, bucket, filesystem, attempt)]
+        s.rows_in = sum(t.num_rows for t in tables)
+        output_key = f"predictions/{tenant}/forecast_{timestamp}.parquet"
+        if tables:
+            ensure_parent_dir(filesystem, f"{bucket}/{output_key}")
+            # Partes com tipos diferentes (ex: float32 x float64) são unificadas
+            forecast = pa.concat_tables(tables, promote_options="permissive")
+            pq.write_table(
+                forecast,
+                f"{bucket}/{output_key}",
+                filesystem=filesystem,
+                compression=settings.PARQUET_COMPRESSION,
+                compression_level=settings.PARQUET_COMPRESSION_LEVEL,
+            )
+            publish_forecast_snapshot(forecast, tenant, timestamp, bucket=bucket, filesystem=filesystem)
+    return output_key
+
+class LocalShardExecutor:
+    """
+    Executa os shards no próprio processo (substitui a invocação de Lambdas
+    em desenvolvimento e testes) e faz o merge ao final.
+
+    Os shards passam pelo scheduler compartilhado, na fila do tenant: shards de
+    tenants diferentes se alternam nos workers.
+    """
+    def __init__(self, filesystem: Optional[pafs.FileSystem] = None, scheduler: Optional[FairShareScheduler] = None):
+        self.filesystem = filesystem
+        self.scheduler = scheduler
+
+    def submit(self, manifest_keys: List[str], bucket: str, tenant: str, timestamp: str) -> Optional[str]:
+        filesystem = self.filesystem or get_arrow_filesystem()
+        scheduler = self.scheduler or get_pipeline_scheduler()
+        futures = [scheduler.submit(tenant, run_shard, key, bucket, filesystem) for key in manifest_keys]
+        for future in futures:
+            future.result()
+        attempt = read_manifest(manifest_keys[0], bucket, filesystem).get("attempt") if manifest_keys else None
+        return merge_forecast_parts(tenant, timestamp, bucket, filesystem, attempt)
+
+class LambdaShardExecutor:
+    """
+    Dispara invocações assíncronas da Lambda de previsão (modo "worker"), uma por shard.
+    O último worker a terminar dispara o merge.
+
+    Cada tenant usa no máximo `workers_per_tenant` workers simultâneos: os shards são
+    divididos em cadeias, e cada worker, ao terminar, invoca o próximo shard da sua
+    cadeia. Assim um tenant grande não consome toda a concorrência da conta.
+    """
+    def __init__(self, function_name: str, lambda_client=None, workers_per_tenant: Optional[int] = None):
+        self.function_name = function_name
+        self.lambda_client = lambda_client
+        self.workers_per_tenant = workers_per_tenant or settings.PREDICT_WORKERS_PER_TENANT
+
+    def _client(self):
+        if self.lambda_client is None:
+            import boto3
+            self.lambda_client = boto3.client("lambda", region_name=settings.AWS_REGION)
+        return self.lambda_client
+
+    def _invoke_worker(self, bucket: str, chain: List[str]):
+        self._client().invoke(
+            FunctionName=self.function_name,
+            InvocationType="Event",
+            Payload=json.dumps({
+                "mode": "worker", "bucket": bucket, "manifest_key": chain[0], "next_keys": chain[1:],
+            }).encode("utf-8"),
+        )
+
+    def submit(self, manifest_keys: List[str], bucket: str, tenant: str, timestamp: str) -> Optional[str]:
+        n_chains = min(self.workers_per_tenant, len(manifest_keys))
+        for i in range(n_chains):
+            self._invoke_worker(bucket, manifest_keys[i::n_chains])
+        logger.info("%d shards enviados para a função %s (%d workers simultâneos).",
+                    len(manifest_keys), self.function_name, n_chains)
+        return None
+
+    def continue_chain(self, bucket: str, next_keys: List[str]):
+        """
+        Invoca o próximo shard da cadeia de um worker que terminou.
+        """
+        if next_keys:
+            self._invoke_worker(bucket, next_keys)
+
+def get_shard_executor(function_name: Optional[str] = None):
+    """
+    Retorna o executor configurado em settings.PREDICT_EXECUTOR ("local" ou "lambda").
+    """
+    if settings.PREDICT_EXECUTOR == "lambda":
+        return LambdaShardExecutor(settings.PREDICT_WORKER_FUNCTION_NAME or function_name)
+    return LocalShardExecutor()
@@ -0,0 +1,76 @@
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.core.config import settings
+from app.utils.tracing import span
+from app.utils.logger import get_logger
+
+logger = get_logger("ml.simulation")
+
+SIMULATION_COLUMNS = ["product_id", "stockout_probability", "lead_time_stockout_probability", "expected_lost_sales"]
+
+def simulate_stock_risk(
+    samples: Dict[int, np.ndarray],
+    stock: pd.Series,
+    lead_time_days: Optional[int] = None,
+    chunk_products: Optional[int] = None,
+) -> pd.DataFrame:
+    """
+    Simula o consumo do estoque atual em cada caminho de demanda amostrado (Monte Carlo).
+
+    Os produtos são processados em lotes de `chunk_products`: cada lote é empilhado em
+    um único array float32 (produtos x dias x caminhos), reaproveitado entre os lotes,
+    e as estatísticas são calculadas de uma vez para o lote. A memória fica limitada a
+    um lote, independente do número de produtos. Não há reposição no horizonte.
+
+    Args:
+        samples: Matrizes (dias x caminhos) de demanda de cada produto, todas com o mesmo formato.
+        stock: Estoque atual indexado pelo ID do produto (produtos ausentes contam como zero).
+        lead_time_days: Dias até a chegada de uma reposição (padrão: settings.INVENTORY_LEAD_TIME_DAYS).
+        chunk_products: Produtos por lote (padrão: settings.SIMULATION_CHUNK_PRODUCTS).
+
+    Returns:
+        Um DataFrame com uma linha por produto: probabilidade de ruptura no horizonte
+        e no lead time, e vendas perdidas esperadas no horizonte.
+    """
+    lead_time_days = settings.INVENTORY_LEAD_TIME_DAYS if lead_time_days is None else lead_time_days
+    chunk_products = chunk_products or settings.SIMULATION_CHUNK_PRODUCTS
+    if not samples:
+        return pd.DataFrame(columns=SIMULATION_COLUMNS)
+
+    ids = np.array([int(pid) for pid in samples], dtype=np.int64)
+    stock = stock[~stock.index.duplicated(keep="last")]
+    on_hand = stock.reindex(ids).fillna(0).to_numpy(dtype=np.float32).clip(min=0)
+    matrices = list(samples.values())
+    days, paths = matrices[0].shape
+    lead_day = min(max(lead_time_days, 1), days) - 1
+
+    stockout_probability = np.empty(len(ids))
+    lead_time_probability = np.empty(len(ids))
+    expected_lost_sales = np.empty(len(ids))
+    buffer = np.empty((min(chunk_products, len(ids)), days, paths), dtype=np.float32)
+
+    with span("simulate_stock_risk") as s:
+        s.rows_in = len(ids)
+        for start in range(0, len(ids), chunk_products):
+            end = min(start + chunk_products, len(ids))
+            cumulative = buffer[:end - start]
+            for i, matrix in enumerate(matrices[start:end]):
+                cumulative[i] = matrix
+            np.cumsum(cumulative, axis=1, out=cumulative)
+
+            level = on_hand[start:end, None]
+            total = cumulative[:, -1, :]
+            stockout_probability[start:end] = (total > level).mean(axis=1)
+            lead_time_probability[start:end] = (cumulative[:, lead_day, :] > level).mean(axis=1)
+            expected_lost_sales[start:end] = np.maximum(total - level, 0).mean(axis=1)
+        s.rows_out = len(ids)
+
+    return pd.DataFrame({
+        "product_id": ids,
+        "stockout_probability": stockout_probability,
+        "lead_time_stockout_probability": lead_time_probability,
+        "expected_lost_sales": expected_lost_sales,
+    })
@@ -1,7 +1,15 @@
 import pandas as pd
 from typing import Dict
 from app.ml.prophet_model import ProphetModel
+from app.utils.tracing import traced, span
+from app.utils.logger import get_logger, bind_context
+from app.core.config import settings
 
+logger = get_logger("ml.trainer")
+# Mensagens por produto são amostradas para não pesar no loop de treino
+product_logger = get_logger("ml.trainer.product", sample_rate=settings.LOG_PRODUCT_SAMPLE_RATE)
+
+@traced()
 def train_models_for_products(
     product_dfs: Dict[str, pd.DataFrame]
 ) -> Dict[str, ProphetModel]:
@@ -17,22 +25,29 @@ def train_models_for_products(
         são as instâncias dos modelos Prophet treinados.
     """
     trained_models = {}
+    skipped = 0
     for product_id, df in product_dfs.items():
         # Ignorar produtos com poucos dados para um treino estável
         if len(df) < 10:
-            print(f"Produto {product_id} tem dados insuficientes para o treino. Pulando.")
+            product_logger.info("Produto %s tem dados insuficientes para o treino. Pulando.", product_id)
+            skipped += 1
             continue
 
-        print(f"Treinando modelo para o produto {product_id}...")
-        model = ProphetModel(
-            seasonality_mode='multiplicative',
-            daily_seasonality=False,
-            weekly_seasonality=True,
-            yearly_seasonality=True
-        )
-        model.train(df)
-        trained_models[product_id] = model
-        print(f"Modelo para o produto {product_id} treinado com sucesso.")
+        with bind_context(product_id=str(product_id)):
+            product_logger.info("Treinando modelo para o produto %s...", product_id)
+            model = ProphetModel(
+                seasonality_mode='multiplicative',
+                daily_seasonality=False,
+                weekly_seasonality=True,
+                yearly_seasonality=True
+            )
+            with span("train_product", product_id=str(product_id)) as s:
+                s.rows_in = len(df)
+                model.train(df)
+            trained_models[product_id] = model
+            product_logger.info("Modelo para o produto %s treinado com sucesso.", product_id)
+
+    logger.info("%d modelos treinados, %d produtos ignorados por dados insuficientes.", len(trained_models), skipped)
 
     # TODO: Em uma aplicação real, os modelos treinados devem ser serializados
     # (ex: com pickle ou joblib) e salvos em um local persistente, como o S3.
@@ -1,36 +1,44 @@
 import pandas as pd
-from typing import BinaryIO
+from typing import BinaryIO, Union
+from app.utils.file_utils import IngestBuffer, ingest_cursor
+from app.utils.tracing import traced
+from app.processing.schemas import read_csv_with_schema, PRODUCTS_CSV_DTYPES, SALES_CSV_DTYPES
+from app.processing.dates import parse_dates
+from app.utils.logger import get_logger
+from app.core.config import settings
 
-import io
+logger = get_logger("processing.cleaner")
 
-def clean_products_data(file_obj: BinaryIO) -> pd.DataFrame:
+def _with_integer_ids(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Converte produto_id (lido como float) para int64, descartando ids fracionários.
+    """
+    df = df[df['produto_id'] % 1 == 0].copy()
+    df['produto_id'] = df['produto_id'].astype('int64')
+    return df
+
+@traced()
+def clean_products_data(file_obj: Union[BinaryIO, IngestBuffer]) -> pd.DataFrame:
     """
     Lê e limpa os dados de produtos de um arquivo CSV.
 
-    - Converte 'produto_preco' para tipo numérico.
+    - Lê apenas as colunas do esquema, já com os tipos numéricos (valores inválidos viram nulos).
     - Remove produtos com 'produto_id' duplicado, mantendo o primeiro.
     - Remove linhas onde 'produto_id' ou 'produto_nome' são nulos.
 
     Args:
-        file_obj: O objeto de arquivo CSV de produtos (file-like object).
+        file_obj: O objeto de arquivo CSV de produtos (IngestBuffer ou file-like object).
 
     Returns:
         Um DataFrame do Pandas com os dados limpos.
     """
-    # Ler conteúdo para memória
-    content = file_obj.read()
-    file_obj.seek(0)
-    buffer = io.BytesIO(content)
-    
-    df = pd.read_csv(buffer)
-
-    # Corrigir tipos de dados
-    df['produto_preco'] = pd.to_numeric(df['produto_preco'], errors='coerce')
-    df['produto_estoque_atual'] = pd.to_numeric(df['produto_estoque_atual'], errors='coerce')
+    with ingest_cursor(file_obj) as cursor:
+        df = read_csv_with_schema(cursor, PRODUCTS_CSV_DTYPES)
 
     # Remover nulos em colunas críticas
     # Remover nulos em colunas críticas
     df.dropna(subset=['produto_id', 'produto_nome', 'produto_preco'], inplace=True)
+    df = _with_integer_ids(df)
 
     # Remover duplicatas
     # Remover duplicatas
@@ -38,43 +46,43 @@ def clean_products_data(file_obj: BinaryIO) -> pd.DataFrame:
 
     return df
 
-def clean_sales_data(file_obj: BinaryIO) -> pd.DataFrame:
+@traced()
+def clean_sales_data(file_obj: Union[BinaryIO, IngestBuffer]) -> pd.DataFrame:
     """
     Lê e limpa os dados de vendas de um arquivo CSV.
 
-    - Converte 'data_pedido' para datetime.
-    - Converte colunas de valor e quantidade para tipos numéricos.
+    - Converte 'data_pedido' para datetime (formatos ISO e BR, ver app.processing.dates).
+    - Lê apenas as colunas do esquema, com valores e quantidade numéricos e
+      produto_nome/situacao como categorias.
     - Remove vendas com situação 'Cancelado'.
     - Remove linhas onde colunas críticas são nulas.
 
     Args:
-        file_obj: O objeto de arquivo CSV de vendas (file-like object).
+        file_obj: O objeto de arquivo CSV de vendas (IngestBuffer ou file-like object).
 
     Returns:
         Um DataFrame do Pandas com os dados limpos.
     """
-    # Ler conteúdo para memória
-    content = file_obj.read()
-    file_obj.seek(0)
-    buffer = io.BytesIO(content)
-
-    df = pd.read_csv(buffer)
-
-    # Corrigir tipos de dados
-    # Tentar formato ISO (YYYY-MM-DD) primeiro
-    iso_dates = pd.to_datetime(df['data_pedido'], format='%Y-%m-%d', errors='coerce')
-    # Tentar formato BR (DD/MM/YYYY) para os que falharam
-    br_dates = pd.to_datetime(df['data_pedido'], format='%d/%m/%Y', errors='coerce')
-    
-    df['data_pedido'] = iso_dates.fillna(br_dates)
-    numeric_cols = ['valor_unitario', 'valor_total_pedido', 'quantidade']
-    for col in numeric_cols:
-        df[col] = pd.to_numeric(df[col], errors='coerce')
+    if settings.PROCESSING_BACKEND == "duckdb":
+        # Importado sob demanda: o duckdb só é necessário com este backend
+        from app.processing.duckdb_engine import clean_sales
+        with ingest_cursor(file_obj) as cursor:
+            return clean_sales(cursor)
+
+    with ingest_cursor(file_obj) as cursor:
+        df = read_csv_with_schema(cursor, SALES_CSV_DTYPES)
+
+    # Converter datas (ISO ou BR) em uma única passada sobre os valores distintos
+    result = parse_dates(df['data_pedido'])
+    df['data_pedido'] = result.dates
+    if result.unparseable:
+        logger.warning("%d linhas de vendas com data_pedido inválida serão descartadas.", result.unparseable)
 
     # Remover vendas canceladas
     df = df[df['situacao'].str.lower() != 'cancelado']
 
     # Remover nulos em colunas críticas
     df.dropna(subset=['produto_id', 'data_pedido', 'quantidade'], inplace=True)
+    df = _with_integer_ids(df)
 
     return df
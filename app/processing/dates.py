@@ -0,0 +1,93 @@
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+# Formatos aceitos em data_pedido, na ordem de preferência em caso de empate
+DATE_FORMATS = ["%Y-%m-%d", "%d/%m/%Y"]
+
+# Número de valores distintos usados para detectar os formatos predominantes
+FORMAT_SAMPLE_SIZE = 500
+
+@dataclass
+class DateParseResult:
+    """
+    Resultado da conversão de uma coluna de datas.
+
+    Attributes:
+        dates: As datas convertidas (NaT onde não foi possível converter).
+        unparseable: Linhas com texto que não corresponde a nenhum formato.
+        missing: Linhas sem valor.
+        format_counts: Linhas convertidas por formato.
+    """
+    dates: pd.Series
+    unparseable: int = 0
+    missing: int = 0
+    format_counts: Dict[str, int] = field(default_factory=dict)
+
+def _factorize(values: pd.Series):
+    # Categorias já são a lista de valores distintos: não é preciso fatorar de novo
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        return values.cat.codes.to_numpy(), pd.Index(values.cat.categories)
+    codes, uniques = pd.factorize(values)
+    return codes, pd.Index(uniques)
+
+def rank_formats(uniques: pd.Index, formats: Sequence[str], sample_size: int = FORMAT_SAMPLE_SIZE) -> List[str]:
+    """
+    Ordena os formatos pelo número de acertos em uma amostra dos valores distintos.
+    """
+    sample = uniques[:sample_size]
+    hits = {fmt: int(pd.to_datetime(sample, format=fmt, errors="coerce").notna().sum()) for fmt in formats}
+    return sorted(formats, key=lambda fmt: -hits[fmt])
+
+def parse_dates(
+    values: pd.Series,
+    formats: Optional[Sequence[str]] = None,
+    sample_size: int = FORMAT_SAMPLE_SIZE,
+) -> DateParseResult:
+    """
+    Converte uma coluna de datas em texto, em uma única passada.
+
+    Cada valor distinto é convertido uma vez (um arquivo de vendas tem milhões de
+    linhas e poucas datas distintas) e depois espalhado para as linhas. Os formatos
+    são tentados na ordem detectada em uma amostra; cada formato só recebe os
+    valores que os anteriores não converteram.
+
+    Args:
+        values: A coluna de datas (texto ou categoria).
+        formats: Formatos aceitos (padrão: DATE_FORMATS).
+        sample_size: Valores distintos usados na detecção dos formatos.
+
+    Returns:
+        Um DateParseResult com as datas e as contagens de linhas por resultado.
+    """
+    formats = list(formats or DATE_FORMATS)
+    codes, uniques = _factorize(values)
+    uniques = uniques.astype(str)
+
+    parsed = np.full(len(uniques), np.datetime64("NaT"), dtype="datetime64[s]")
+    pending = np.ones(len(uniques), dtype=bool)
+    rows_per_unique = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    format_counts: Dict[str, int] = {}
+
+    for fmt in rank_formats(uniques, formats, sample_size):
+        if not pending.any():
+            break
+        positions = np.flatnonzero(pending)
+        attempt = pd.to_datetime(uniques[positions], format=fmt, errors="coerce")
+        ok = np.asarray(attempt.notna())
+        if ok.any():
+            parsed[positions[ok]] = attempt[ok].to_numpy().astype("datetime64[s]")
+            pending[positions[ok]] = False
+            format_counts[fmt] = int(rows_per_unique[positions[ok]].sum())
+
+    dates = np.full(len(codes), np.datetime64("NaT"), dtype="datetime64[s]")
+    present = codes >= 0
+    dates[present] = parsed[codes[present]]
+    return DateParseResult(
+        dates=pd.Series(dates, index=values.index, name=values.name),
+        unparseable=int(rows_per_unique[pending].sum()),
+        missing=int((codes < 0).sum()),
+        format_counts=format_counts,
+    )
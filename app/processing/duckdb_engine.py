@@ -0,0 +1,177 @@
+import os
+from typing import Dict, Union
+
+import duckdb
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+
+from app.core.config import settings
+from app.processing.schemas import SALES_CSV_DTYPES
+from app.utils.tracing import traced
+from app.utils.logger import get_logger
+
+logger = get_logger("processing.duckdb_engine")
+
+# Backend de processamento alternativo ao pandas (PROCESSING_BACKEND=duckdb).
+# As mesmas regras de limpeza e a agregação diária rodam como SQL no DuckDB embarcado:
+# leitura em streaming, execução em todos os núcleos e derramamento em disco
+# (DUCKDB_TEMP_DIR) quando os dados não cabem em DUCKDB_MEMORY_LIMIT.
+
+# Mesmas conversões do backend pandas: valores numéricos inválidos viram nulos e
+# data_pedido aceita os formatos de app.processing.dates.DATE_FORMATS
+_NUMERIC_COLUMNS = [name for name, dtype in SALES_CSV_DTYPES.items() if dtype == "float64"]
+
+_STAGE_SALES_SQL = "CREATE TEMP TABLE sales_staged AS SELECT {columns} FROM sales_raw"
+_COERCED_COLUMNS = ", ".join(
+    f"TRY_CAST({name} AS DOUBLE) AS {name}" if name in _NUMERIC_COLUMNS else name for name in SALES_CSV_DTYPES
+)
+
+# Cada data distinta é convertida uma vez (como em app.processing.dates.parse_dates)
+_PARSE_DATES_SQL = """
+CREATE TEMP TABLE sales_dates AS
+SELECT raw, COALESCE(TRY_STRPTIME(raw, '%Y-%m-%d'), TRY_STRPTIME(raw, '%d/%m/%Y')) AS parsed
+FROM (SELECT DISTINCT data_pedido AS raw FROM sales_staged WHERE data_pedido IS NOT NULL)
+"""
+
+_UNPARSEABLE_SQL = """
+SELECT count(*) FROM sales_staged s JOIN sales_dates d ON d.raw = s.data_pedido WHERE d.parsed IS NULL
+"""
+
+_CLEAN_SALES_SQL = """
+SELECT
+    CAST(s.produto_id AS BIGINT) AS produto_id,
+    s.produto_nome, s.valor_unitario, s.valor_total_pedido, s.quantidade, s.situacao,
+    d.parsed AS data_pedido
+FROM sales_staged s JOIN sales_dates d ON d.raw = s.data_pedido
+WHERE (s.situacao IS NULL OR lower(s.situacao) <> 'cancelado')
+  AND s.produto_id IS NOT NULL AND d.parsed IS NOT NULL AND s.quantidade IS NOT NULL
+  AND s.produto_id = floor(s.produto_id)
+ORDER BY s.rowid
+"""
+
+_DAILY_SALES_SQL = """
+SELECT CAST(produto_id AS BIGINT) AS produto_id, date_trunc('day', data_pedido) AS ds, sum(quantidade) AS y
+FROM sales
+GROUP BY ALL
+ORDER BY produto_id, ds
+"""
+
+SalesSource = Union[str, pd.DataFrame, pa.Table, pa.RecordBatchReader]
+
+def connect() -> "duckdb.DuckDBPyConnection":
+    """
+    Abre uma conexão DuckDB em memória com os limites de threads, memória e spill configurados.
+    """
+    con = duckdb.connect()
+    con.execute(f"SET threads TO {settings.DUCKDB_THREADS or os.cpu_count() or 1}")
+    if settings.DUCKDB_MEMORY_LIMIT:
+        con.execute(f"SET memory_limit = '{settings.DUCKDB_MEMORY_LIMIT}'")
+    os.makedirs(settings.DUCKDB_TEMP_DIR, exist_ok=True)
+    con.execute(f"SET temp_directory = '{settings.DUCKDB_TEMP_DIR}'")
+    return con
+
+def _stage_raw_sales(con, source):
+    """
+    Carrega o CSV bruto na tabela temporária sales_staged, com as colunas numéricas já convertidas.
+    """
+    if isinstance(source, str):
+        # Arquivo em disco: leitura paralela pelo próprio DuckDB
+        con.register("sales_raw", con.read_csv(source, all_varchar=True, header=True))
+        con.execute(_STAGE_SALES_SQL.format(columns=_COERCED_COLUMNS))
+        return
+
+    # Arquivo em memória (ex: cursor do IngestBuffer): lido em lotes pelo CSV do pyarrow,
+    # já com os tipos numéricos; se houver valores inválidos, relido como texto com coerção
+    start = source.tell()
+    try:
+        con.register("sales_raw", con.from_arrow(_open_csv(source, typed=True)))
+        con.execute(_STAGE_SALES_SQL.format(columns=", ".join(SALES_CSV_DTYPES)))
+        return
+    except (pa.ArrowInvalid, duckdb.Error):
+        con.execute("DROP TABLE IF EXISTS sales_staged")
+        source.seek(start)
+    con.register("sales_raw", con.from_arrow(_open_csv(source, typed=False)))
+    con.execute(_STAGE_SALES_SQL.format(columns=_COERCED_COLUMNS))
+
+def _open_csv(source, typed: bool) -> pa.RecordBatchReader:
+    column_types = {
+        name: pa.float64() if typed and name in _NUMERIC_COLUMNS else pa.string() for name in SALES_CSV_DTYPES
+    }
+    return pacsv.open_csv(source, convert_options=pacsv.ConvertOptions(
+        column_types=column_types,
+        include_columns=list(SALES_CSV_DTYPES),
+        strings_can_be_null=True,
+    ))
+
+def _sales_relation(con, source: SalesSource):
+    if isinstance(source, str):
+        if source.endswith(".csv"):
+            return con.read_csv(source, header=True)
+        return con.read_parquet(source, hive_partitioning=True)
+    if isinstance(source, pd.DataFrame):
+        return con.from_df(source)
+    return con.from_arrow(source)
+
+@traced()
+def clean_sales(source) -> pd.DataFrame:
+    """
+    Lê e limpa um CSV de vendas com as mesmas regras de clean_sales_data.
+
+    Args:
+        source: Caminho do CSV ou arquivo (file-like object) posicionado no início.
+
+    Returns:
+        O DataFrame limpo, com os mesmos tipos do backend pandas.
+    """
+    con = connect()
+    try:
+        # Tabelas temporárias: o DuckDB as mantém em disco se passarem do limite de memória
+        _stage_raw_sales(con, source)
+        con.execute(_PARSE_DATES_SQL)
+        unparseable = con.execute(_UNPARSEABLE_SQL).fetchone()[0]
+        if unparseable:
+            logger.warning("%d linhas de vendas com data_pedido inválida serão descartadas.", unparseable)
+        table = con.execute(_CLEAN_SALES_SQL).arrow()
+    finally:
+        con.close()
+
+    if isinstance(table, pa.RecordBatchReader):
+        table = table.read_all()
+    # Colunas de texto viram categorias já no Arrow (bem mais rápido que converter no pandas)
+    for name, dtype in SALES_CSV_DTYPES.items():
+        if dtype == "category" and name != "data_pedido":
+            index = table.schema.get_field_index(name)
+            table = table.set_column(index, name, pc.dictionary_encode(table.column(name)))
+    df = table.to_pandas()
+    df["data_pedido"] = df["data_pedido"].astype("datetime64[s]")
+    return df
+
+@traced()
+def daily_product_sales(source: SalesSource) -> Dict[int, pd.DataFrame]:
+    """
+    Agrega as vendas limpas por produto e dia, com o mesmo resultado de create_prophet_features.
+
+    Args:
+        source: Vendas limpas: DataFrame, tabela ou leitor Arrow (em streaming), ou
+                caminho/glob de arquivos Parquet (ex: um dataset processado local).
+
+    Returns:
+        Um dicionário com um DataFrame (ds, y) por ID de produto.
+    """
+    con = connect()
+    try:
+        con.register("sales", _sales_relation(con, source).select("produto_id, data_pedido, quantidade"))
+        daily = con.execute(_DAILY_SALES_SQL).df()
+    finally:
+        con.close()
+
+    product_ids = daily["produto_id"].to_numpy()
+    if not len(product_ids):
+        return {}
+    daily = daily[["ds", "y"]].astype({"ds": "datetime64[s]"})
+    starts = np.flatnonzero(np.r_[True, product_ids[1:] != product_ids[:-1]])
+    ends = np.r_[starts[1:], len(product_ids)]
+    return {int(product_ids[start]): daily.iloc[start:end] for start, end in zip(starts, ends)}
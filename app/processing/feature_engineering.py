@@ -1,6 +1,9 @@
 import pandas as pd
 from typing import Dict
+from app.core.config import settings
+from app.utils.tracing import traced
 
+@traced()
 def create_prophet_features(sales_df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
     """
     Transforma o DataFrame de vendas em um formato adequado para o Prophet.
@@ -9,6 +12,9 @@ def create_prophet_features(sales_df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
     - Renomeia as colunas para 'ds' (data) and 'y' (quantidade).
     - Retorna um dicionário de DataFrames, um para cada produto.
 
+    Com PROCESSING_BACKEND=duckdb a agregação roda no DuckDB, que também aceita as
+    vendas como leitor Arrow (em streaming) ou caminho de arquivos Parquet.
+
     Args:
         sales_df: O DataFrame de vendas limpo.
 
@@ -16,6 +22,10 @@ def create_prophet_features(sales_df: pd.DataFrame) -> Dict[str, pd.DataFrame]:
         Um dicionário onde as chaves são os IDs dos produtos e os valores
         são os DataFrames formatados para o Prophet.
     """
+    if settings.PROCESSING_BACKEND == "duckdb":
+        from app.processing.duckdb_engine import daily_product_sales
+        return daily_product_sales(sales_df)
+
     # Garantir que a coluna de data está no formato correto
     sales_df['data_pedido'] = pd.to_datetime(sales_df['data_pedido'])
 
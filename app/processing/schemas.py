@@ -0,0 +1,62 @@
+from typing import BinaryIO, Dict, Optional
+
+import pandas as pd
+
+from app.core.config import settings
+
+# Esquemas de leitura dos CSVs: apenas estas colunas são carregadas, já no tipo final.
+# Strings com poucos valores distintos (nome do produto nas vendas, situação) viram
+# categorias. Os ids são lidos como float64, que aceita nulos e é bem mais rápido
+# que o Int64 no engine C; a limpeza os converte para int64 após remover os nulos.
+PRODUCTS_CSV_DTYPES: Dict[str, str] = {
+    "produto_id": "float64",
+    "produto_nome": "str",
+    "produto_codigo": "str",
+    "produto_preco": "float64",
+    "produto_estoque_atual": "float64",
+}
+
+SALES_CSV_DTYPES: Dict[str, str] = {
+    "produto_id": "float64",
+    "produto_nome": "category",
+    "valor_unitario": "float64",
+    "valor_total_pedido": "float64",
+    "quantidade": "float64",
+    "situacao": "category",
+    # Poucas datas distintas: a categoria permite converter cada uma só uma vez
+    "data_pedido": "category",
+}
+
+_NUMERIC_DTYPES = {"float64"}
+
+def read_csv_with_schema(file_obj: BinaryIO, dtypes: Dict[str, str], engine: Optional[str] = None) -> pd.DataFrame:
+    """
+    Lê um CSV carregando apenas as colunas do esquema, já com os tipos declarados.
+
+    Se alguma coluna numérica tiver valores inválidos (ex: "invalid"), o arquivo é
+    relido com essas colunas como texto e elas são convertidas com pd.to_numeric,
+    transformando os valores inválidos em nulos. A releitura usa o engine "c",
+    mais tolerante a linhas malformadas.
+
+    Args:
+        file_obj: O arquivo CSV (file-like object), posicionado no início.
+        dtypes: O esquema (coluna -> tipo), ex: SALES_CSV_DTYPES.
+        engine: Engine do pandas ("c" ou "pyarrow"; padrão: settings.CSV_ENGINE).
+
+    Returns:
+        Um DataFrame com as colunas do esquema.
+    """
+    engine = engine or settings.CSV_ENGINE
+    start = file_obj.tell()
+    try:
+        return pd.read_csv(file_obj, usecols=list(dtypes), dtype=dtypes, engine=engine)
+    except (ValueError, TypeError, OverflowError):
+        # Dados sujos: ler as colunas numéricas como texto e converter com coerção
+        file_obj.seek(start)
+
+    text_dtypes = {col: ("str" if dtype in _NUMERIC_DTYPES else dtype) for col, dtype in dtypes.items()}
+    df = pd.read_csv(file_obj, usecols=list(dtypes), dtype=text_dtypes, engine="c")
+    for col, dtype in dtypes.items():
+        if dtype in _NUMERIC_DTYPES:
+            df[col] = pd.to_numeric(df[col], errors="coerce").astype(dtype)
+    return df
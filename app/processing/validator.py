@@ -1,13 +1,15 @@
 import pandas as pd
-import io
-from typing import List, Tuple, BinaryIO
+from typing import List, Tuple, BinaryIO, Union
+from app.utils.file_utils import IngestBuffer, ingest_cursor
+from app.utils.tracing import traced
 
-def validate_csv(file_obj: BinaryIO, expected_columns: List[str]) -> Tuple[bool, str]:
+@traced()
+def validate_csv(file_obj: Union[BinaryIO, IngestBuffer], expected_columns: List[str]) -> Tuple[bool, str]:
     """
     Valida um arquivo CSV com base nas colunas esperadas.
 
     Args:
-        file_obj: O arquivo CSV enviado (file-like object).
+        file_obj: O arquivo CSV enviado (IngestBuffer ou file-like object).
         expected_columns: Uma lista de nomes de colunas que o CSV deve conter.
 
     Returns:
@@ -16,14 +18,9 @@ def validate_csv(file_obj: BinaryIO, expected_columns: List[str]) -> Tuple[bool,
         - str: Uma mensagem de erro ou sucesso.
     """
     try:
-        # Ler o conteúdo para memória para evitar que o pandas feche o arquivo original
-        content = file_obj.read()
-        file_obj.seek(0) # Resetar o ponteiro do arquivo original
-        
-        # Criar um BytesIO com o conteúdo
-        buffer = io.BytesIO(content)
-        
-        df = pd.read_csv(buffer)
+        # Apenas o cabeçalho é lido: os valores são tratados na limpeza
+        with ingest_cursor(file_obj) as cursor:
+            df = pd.read_csv(cursor, nrows=0)
 
         if not all(col in df.columns for col in expected_columns):
             missing_cols = [col for col in expected_columns if col not in df.columns]
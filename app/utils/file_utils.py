@@ -1,4 +1,22 @@
-from typing import BinaryIO
+import gzip
+import hashlib
+import io
+import mmap
+import os
+import shutil
+import tempfile
+import zipfile
+from contextlib import contextmanager
+from typing import BinaryIO, Callable, Iterator, Optional
+
+# Formatos de compressão aceitos nos CSVs enviados, identificados pelos primeiros bytes
+# (o nome do arquivo não é confiável). O valor é a extensão usada na chave bruta do S3.
+COMPRESSION_MAGIC = {
+    "gzip": b"\x1f\x8b",
+    "zstd": b"\x28\xb5\x2f\xfd",
+    "zip": b"PK\x03\x04",
+}
+COMPRESSION_EXTENSIONS = {"gzip": ".gz", "zstd": ".zst", "zip": ".zip"}
 
 class NonCloseableFile:
     """
@@ -15,3 +33,271 @@ class NonCloseableFile:
     def close(self):
         # Não faz nada
         pass
+
+class BufferCursor(io.RawIOBase):
+    """
+    Leitor (file-like object) sobre um memoryview, sem copiar o conteúdo.
+
+    Cada estágio (validação, hash, limpeza, upload) abre o seu próprio cursor sobre
+    o mesmo IngestBuffer. Fechar o cursor não afeta o buffer nem os outros cursores.
+    """
+    def __init__(self, view: memoryview):
+        super().__init__()
+        self._view = view
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        if self.closed:
+            raise ValueError("I/O operation on closed cursor.")
+        n = min(len(b), len(self._view) - self._pos)
+        if n <= 0:
+            return 0
+        b[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_SET:
+            pos = offset
+        elif whence == io.SEEK_CUR:
+            pos = self._pos + offset
+        elif whence == io.SEEK_END:
+            pos = len(self._view) + offset
+        else:
+            raise ValueError(f"whence inválido: {whence}")
+        if pos < 0:
+            raise ValueError(f"Posição negativa: {pos}")
+        self._pos = pos
+        return pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def close(self):
+        # Solta apenas a referência; o memoryview pertence ao IngestBuffer
+        self._view = memoryview(b"")
+        super().close()
+
+class DecompressingReader(io.RawIOBase):
+    """
+    Leitor que descomprime o conteúdo à medida que é lido, sem materializar o arquivo
+    descomprimido. Voltar a uma posição anterior (ex: releitura do CSV com outro
+    esquema) reabre a descompressão desde o início.
+    """
+    def __init__(self, open_stream: Callable[[], BinaryIO]):
+        super().__init__()
+        self._open_stream = open_stream
+        self._stream = open_stream()
+        self._pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, b) -> int:
+        if self.closed:
+            raise ValueError("I/O operation on closed reader.")
+        n = self._stream.readinto(b)
+        self._pos += n
+        return n
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence != io.SEEK_SET:
+            raise io.UnsupportedOperation("Conteúdo comprimido: o tamanho final não é conhecido.")
+        if offset < 0:
+            raise ValueError(f"Posição negativa: {offset}")
+        if offset < self._pos:
+            self._stream.close()
+            self._stream = self._open_stream()
+            self._pos = 0
+        while self._pos < offset:
+            skipped = len(self._stream.read(min(offset - self._pos, 1024 * 1024)))
+            if not skipped:
+                break
+            self._pos += skipped
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def close(self):
+        if not self.closed:
+            self._stream.close()
+        super().close()
+
+def _open_zip_member(cursor: "BufferCursor") -> BinaryIO:
+    # Exportações zipadas trazem um único CSV (outros arquivos, como leia-me, são ignorados)
+    archive = zipfile.ZipFile(cursor)
+    members = [info for info in archive.infolist() if not info.is_dir()]
+    csv_members = [info for info in members if info.filename.lower().endswith(".csv")] or members
+    if not csv_members:
+        raise ValueError("Arquivo zip sem arquivos.")
+    return archive.open(csv_members[0])
+
+def _open_zstd(cursor: "BufferCursor") -> BinaryIO:
+    try:
+        import zstandard
+    except ImportError:  # zstandard é opcional
+        raise ValueError("Arquivos zstd exigem o pacote zstandard.")
+    return zstandard.ZstdDecompressor().stream_reader(cursor, closefd=True)
+
+_DECOMPRESSORS = {
+    "gzip": lambda cursor: gzip.GzipFile(fileobj=cursor, mode="rb"),
+    "zstd": _open_zstd,
+    "zip": _open_zip_member,
+}
+
+class IngestBuffer:
+    """
+    Conteúdo de um arquivo recebido, compartilhado por todos os estágios da ingestão.
+
+    Expõe os bytes como um memoryview sobre a memória que já contém o arquivo:
+    o buffer do BytesIO (UploadFile pequeno, ainda em memória), um mmap do arquivo
+    temporário (UploadFile grande, já em disco) ou de um arquivo local. Assim a
+    validação, o hash, a limpeza e o upload leem os mesmos bytes, sem read() +
+    BytesIO em cada etapa.
+
+    Deve ser fechado (ou usado como context manager) antes de fechar o arquivo de origem.
+    """
+    def __init__(self, view: memoryview, mapped: Optional[mmap.mmap] = None, spool: Optional[BinaryIO] = None):
+        self._view = view
+        self._mmap = mapped
+        self._spool = spool
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "IngestBuffer":
+        return cls(memoryview(data))
+
+    @classmethod
+    def from_file(cls, file_obj: BinaryIO) -> "IngestBuffer":
+        """
+        Cria o buffer sobre um arquivo já recebido (UploadFile.file, arquivo local, BytesIO).
+
+        O conteúdo inteiro é exposto, independente da posição atual do arquivo.
+        """
+        # SpooledTemporaryFile (UploadFile) ainda em memória: usar o BytesIO interno,
+        # já que fileno() forçaria a gravação em disco
+        if getattr(file_obj, "_rolled", True) is False:
+            file_obj = file_obj._file
+        if isinstance(file_obj, io.BytesIO):
+            return cls(file_obj.getbuffer())
+
+        try:
+            fileno = file_obj.fileno()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            # Sem descritor (ex: corpo de resposta em streaming): copiar uma única vez
+            file_obj.seek(0)
+            return cls.from_bytes(file_obj.read())
+        file_obj.flush()
+        return cls._map(fileno)
+
+    @classmethod
+    def from_stream(cls, stream: BinaryIO, spool_dir: Optional[str] = None, chunk_size: int = 1024 * 1024) -> "IngestBuffer":
+        """
+        Copia um stream (ex: Body do S3) para um arquivo temporário e o mapeia em memória.
+
+        O conteúdo fica no cache de páginas do sistema, e não na memória do processo.
+
+        Args:
+            stream: O stream de origem, lido até o fim.
+            spool_dir: Diretório do arquivo temporário (padrão: o do sistema, /tmp na Lambda).
+            chunk_size: Tamanho de cada bloco copiado.
+        """
+        spool = tempfile.TemporaryFile(dir=spool_dir)
+        try:
+            shutil.copyfileobj(stream, spool, chunk_size)
+            spool.flush()
+            buffer = cls._map(spool.fileno())
+        except Exception:
+            spool.close()
+            raise
+        buffer._spool = spool
+        return buffer
+
+    @classmethod
+    def _map(cls, fileno: int) -> "IngestBuffer":
+        if os.fstat(fileno).st_size == 0:
+            # mmap não aceita arquivos vazios
+            return cls(memoryview(b""))
+        mapped = mmap.mmap(fileno, 0, access=mmap.ACCESS_READ)
+        return cls(memoryview(mapped), mapped=mapped)
+
+    @property
+    def view(self) -> memoryview:
+        return self._view
+
+    @property
+    def size(self) -> int:
+        return len(self._view)
+
+    @property
+    def compression(self) -> Optional[str]:
+        """
+        Formato de compressão do conteúdo ("gzip", "zstd" ou "zip"), ou None se não comprimido.
+        """
+        head = bytes(self._view[:4])
+        return next((name for name, magic in COMPRESSION_MAGIC.items() if head.startswith(magic)), None)
+
+    def cursor(self) -> BufferCursor:
+        """
+        Abre um novo leitor posicionado no início do conteúdo (bytes como recebidos).
+        """
+        return BufferCursor(self._view)
+
+    def reader(self) -> BinaryIO:
+        """
+        Abre um leitor do CSV: o próprio conteúdo ou, se comprimido, o conteúdo
+        descomprimido em streaming.
+        """
+        compression = self.compression
+        if compression is None:
+            return self.cursor()
+        decompress = _DECOMPRESSORS[compression]
+        return DecompressingReader(lambda: decompress(self.cursor()))
+
+    def sha256(self) -> str:
+        """
+        Calcula o SHA-256 do conteúdo diretamente sobre o buffer.
+        """
+        return hashlib.sha256(self._view).hexdigest()
+
+    def close(self):
+        self._view.release()
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        if self._spool is not None:
+            self._spool.close()
+            self._spool = None
+
+    def __enter__(self) -> "IngestBuffer":
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+@contextmanager
+def ingest_cursor(source) -> Iterator[BinaryIO]:
+    """
+    Abre um leitor do CSV em `source` (IngestBuffer ou file-like object), descomprimindo
+    em streaming os arquivos gzip, zstd ou zip.
+
+    Quando `source` é um arquivo, o IngestBuffer criado para ele é liberado ao sair;
+    o arquivo de origem nunca é fechado.
+    """
+    if isinstance(source, IngestBuffer):
+        with source.reader() as cursor:
+            yield cursor
+        return
+    with IngestBuffer.from_file(source) as buffer, buffer.reader() as cursor:
+        yield cursor
@@ -1,15 +1,66 @@
+import atexit
+import itertools
 import logging
-import json
+import logging.handlers
+import queue
 import sys
-from datetime import datetime
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from types import MappingProxyType
+from typing import Mapping
+
+try:
+    import orjson
+
+    def _dumps(obj) -> str:
+        return orjson.dumps(obj, default=str).decode("utf-8")
+except ImportError:  # orjson é opcional; cai para o json da biblioteca padrão
+    import json
+
+    def _dumps(obj) -> str:
+        return json.dumps(obj, default=str, separators=(",", ":"))
+
+# Campos de contexto (job_id, product_id, ...) ligados ao fluxo de execução atual.
+# O mapeamento é imutável: bind_context cria um novo uma vez por bloco, e cada
+# registro de log apenas guarda a referência, sem copiar o dicionário.
+_log_context: ContextVar[Mapping] = ContextVar("log_context", default=MappingProxyType({}))
+
+@contextmanager
+def bind_context(**fields):
+    """
+    Liga campos de contexto a todos os logs emitidos dentro do bloco.
+
+    Exemplo:
+        with bind_context(job_id="20231120", product_id=101):
+            logger.info("Treinando modelo...")
+    """
+    token = _log_context.set(MappingProxyType({**_log_context.get(), **fields}))
+    try:
+        yield
+    finally:
+        _log_context.reset(token)
 
 class JSONFormatter(logging.Formatter):
     """
     Formatador de logs que gera saída em JSON.
     """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cached_second = None
+        self._cached_prefix = ""
+
+    def _format_timestamp(self, created: float) -> str:
+        # strftime é caro: reaproveita o prefixo enquanto estivermos no mesmo segundo
+        second = int(created)
+        if second != self._cached_second:
+            self._cached_prefix = time.strftime("%Y-%m-%dT%H:%M:%S", time.gmtime(second))
+            self._cached_second = second
+        return f"{self._cached_prefix}.{int((created - second) * 1_000_000):06d}Z"
+
     def format(self, record):
         log_record = {
-            "timestamp": datetime.utcfromtimestamp(record.created).isoformat() + "Z",
+            "timestamp": self._format_timestamp(record.created),
             "level": record.levelname,
             "message": record.getMessage(),
             "logger": record.name,
@@ -18,6 +69,13 @@ class JSONFormatter(logging.Formatter):
             "line": record.lineno
         }
 
+        # Adicionar campos de contexto (capturados na thread de origem)
+        context = getattr(record, "log_context", None)
+        if context is None:
+            context = _log_context.get()
+        if context:
+            log_record.update(context)
+
         # Adicionar campos extras se existirem
         if hasattr(record, "extra_fields"):
             log_record.update(record.extra_fields)
@@ -26,22 +84,87 @@ class JSONFormatter(logging.Formatter):
         if record.exc_info:
             log_record["exception"] = self.formatException(record.exc_info)
 
-        return json.dumps(log_record)
+        return _dumps(log_record)
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler que apenas enfileira o registro: a formatação e a escrita
+    acontecem na thread do QueueListener.
+
+    Diferente do QueueHandler padrão, não formata a mensagem na thread de
+    origem (a fila é em memória, não precisa de registros serializáveis);
+    apenas captura a referência ao contexto atual.
+    """
+    def prepare(self, record):
+        record.log_context = _log_context.get()
+        return record
+
+class SamplingFilter(logging.Filter):
+    """
+    Deixa passar 1 a cada N registros abaixo de WARNING.
+    Avisos e erros nunca são descartados.
+    """
+    def __init__(self, rate: float):
+        super().__init__()
+        self.every = max(1, round(1 / rate)) if rate > 0 else 0
+        self._counter = itertools.count()
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        if self.every == 0:
+            return False
+        return next(self._counter) % self.every == 0
+
+_log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(-1)
+_listener = None
+
+def _start_listener():
+    global _listener
+    if _listener is None:
+        stream_handler = logging.StreamHandler(sys.stdout)
+        stream_handler.setFormatter(JSONFormatter())
+        _listener = logging.handlers.QueueListener(_log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        atexit.register(_listener.stop)
+
+def flush_logs():
+    """
+    Bloqueia até que todos os logs enfileirados tenham sido escritos.
+    Deve ser chamado ao fim de cada invocação Lambda, antes do processo congelar.
+    """
+    _log_queue.join()
 
 def configure_logger(name: str = "smart-stock", level: str = "INFO"):
     """
-    Configura o logger raiz para usar o formato JSON.
+    Configura o logger para usar o formato JSON com escrita assíncrona
+    (QueueHandler na thread de origem, QueueListener em segundo plano).
     """
     logger = logging.getLogger(name)
     logger.setLevel(level)
 
     # Evitar duplicidade de handlers
     if not logger.handlers:
-        handler = logging.StreamHandler(sys.stdout)
-        handler.setFormatter(JSONFormatter())
-        logger.addHandler(handler)
+        _start_listener()
+        logger.addHandler(NonBlockingQueueHandler(_log_queue))
+        # Evita que o mesmo registro seja escrito também pelo handler raiz (ex: runtime da Lambda)
+        logger.propagate = False
 
     return logger
 
+def get_logger(name: str, sample_rate: float = 1.0) -> logging.Logger:
+    """
+    Retorna um logger filho de "smart-stock" (herda o handler assíncrono).
+
+    Args:
+        name: Nome do logger, relativo a "smart-stock" (ex: "ml.trainer").
+        sample_rate: Fração dos registros abaixo de WARNING que serão mantidos.
+                     Útil para mensagens de alta frequência, como as emitidas por produto.
+    """
+    child = logging.getLogger(f"{logger.name}.{name}")
+    if sample_rate < 1.0 and not any(isinstance(f, SamplingFilter) for f in child.filters):
+        child.addFilter(SamplingFilter(sample_rate))
+    return child
+
 # Instância padrão
 logger = configure_logger()
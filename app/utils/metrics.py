@@ -1,54 +1,250 @@
+import atexit
 import json
 import sys
+import threading
 import datetime
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Tuple, Union
 
-def log_metric(
-    name: str,
-    value: float,
-    unit: str = "Count",
+from app.core.config import settings
+
+DEFAULT_NAMESPACE = "Smart Stock"
+
+# Limites do CloudWatch Embedded Metric Format
+MAX_METRICS_PER_DOCUMENT = 100
+MAX_VALUES_PER_METRIC = 100
+
+def build_emf_document(
+    metrics: Dict[str, Tuple[Union[float, List[float]], str]],
     dimensions: Optional[Dict[str, str]] = None,
-    namespace: str = "Smart Stock"
-):
+    namespace: str = DEFAULT_NAMESPACE,
+    properties: Optional[Dict[str, Any]] = None,
+) -> Dict[str, Any]:
     """
-    Loga uma métrica no formato JSON.
-    Pode ser usado com CloudWatch Logs Metric Filters ou EMF (Embedded Metric Format).
-    
+    Monta um documento no CloudWatch Embedded Metric Format (EMF).
+
     Args:
-        name: Nome da métrica.
-        value: Valor da métrica.
-        unit: Unidade (Count, Seconds, Milliseconds, Bytes, etc.).
-        dimensions: Dicionário de dimensões (ex: {"Service": "API"}).
+        metrics: Dicionário nome -> (valor, unidade). O valor pode ser uma lista
+                 de até 100 observações.
+        dimensions: Dimensões da métrica (ex: {"Service": "API"}).
         namespace: Namespace da métrica.
+        properties: Campos extras gravados no log, mas que não são dimensões.
+
+    Returns:
+        O documento EMF pronto para ser serializado em uma linha de log.
     """
-    metric_data = {
+    dimensions = dimensions or {}
+    document: Dict[str, Any] = {
         "_aws": {
             "Timestamp": int(datetime.datetime.now().timestamp() * 1000),
             "CloudWatchMetrics": [
                 {
                     "Namespace": namespace,
-                    "Dimensions": [list(dimensions.keys())] if dimensions else [],
-                    "Metrics": [{"Name": name, "Unit": unit}]
+                    "Dimensions": [list(dimensions.keys())],
+                    "Metrics": [{"Name": name, "Unit": unit} for name, (_, unit) in metrics.items()]
                 }
             ]
-        },
-        name: value
+        }
     }
+    if properties:
+        document.update(properties)
+    document.update(dimensions)
+    for name, (value, _) in metrics.items():
+        document[name] = value
+    return document
 
-    if dimensions:
-        metric_data.update(dimensions)
-
-    # Para simplificar no MVP, vamos apenas imprimir um JSON estruturado
-    # que pode ser ingerido por ferramentas de log.
-    # Se quiséssemos EMF real, precisaríamos garantir o formato exato da AWS.
-    
-    simple_metric = {
-        "metric_name": name,
-        "metric_value": value,
-        "metric_unit": unit,
-        "dimensions": dimensions or {},
-        "namespace": namespace,
-        "type": "metric"
-    }
-    
-    print(json.dumps(simple_metric))
+class MetricsClient:
+    """
+    Cliente de métricas com buffer em memória.
+
+    Contadores são somados e histogramas acumulam observações até o flush,
+    que grava documentos EMF em lote (até 100 métricas por documento) com uma
+    única escrita no stream. O flush acontece em uma thread em segundo plano a
+    cada `flush_interval` segundos, quando o buffer atinge `max_buffered`
+    registros, ou explicitamente (fim da invocação Lambda / saída do processo).
+
+    Registros com propriedades (campos que não são dimensões, ex: product_id) são
+    agrupados por propriedades: cada combinação vai em documentos próprios.
+    """
+    def __init__(
+        self,
+        namespace: str = DEFAULT_NAMESPACE,
+        flush_interval: float = 10.0,
+        max_buffered: int = 1000,
+        stream=None,
+        background: bool = True,
+    ):
+        self.namespace = namespace
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.stream = stream
+        self.background = background
+        self._lock = threading.Lock()
+        # (namespace, dimensões, propriedades) -> (nome, unidade) -> soma (contador) ou lista (histograma)
+        self._buffer: Dict[tuple, Dict[Tuple[str, str], Union[float, List[float]]]] = {}
+        self._pending = 0
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def increment(
+        self,
+        name: str,
+        value: float = 1,
+        unit: str = "Count",
+        dimensions: Optional[Dict[str, str]] = None,
+        namespace: Optional[str] = None,
+        properties: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Soma `value` ao contador `name`.
+        """
+        self._record(name, value, unit, dimensions, namespace, properties, counter=True)
+
+    def observe(
+        self,
+        name: str,
+        value: float,
+        unit: str = "Milliseconds",
+        dimensions: Optional[Dict[str, str]] = None,
+        namespace: Optional[str] = None,
+        properties: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Registra uma observação no histograma `name`.
+        """
+        self._record(name, value, unit, dimensions, namespace, properties, counter=False)
+
+    def _record(self, name, value, unit, dimensions, namespace, properties, counter):
+        # Propriedades serializadas na chave: valores podem não ser hasheáveis
+        properties_key = json.dumps(properties, sort_keys=True, default=str) if properties else ""
+        key = (namespace or self.namespace, tuple(sorted((dimensions or {}).items())), properties_key)
+        with self._lock:
+            metrics = self._buffer.setdefault(key, {})
+            current = metrics.get((name, unit))
+            if counter and not isinstance(current, list):
+                metrics[(name, unit)] = (current or 0) + value
+            elif isinstance(current, list):
+                current.append(value)
+            else:
+                metrics[(name, unit)] = [value] if current is None else [current, value]
+            self._pending += 1
+            pending = self._pending
+
+        if pending >= self.max_buffered:
+            if self.background:
+                self._wakeup.set()
+            else:
+                self.flush()
+        self._ensure_thread()
+
+    def _ensure_thread(self):
+        if not self.background or self._thread is not None or self._stopped.is_set():
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="metrics-flusher", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def _drain(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            buffer, self._buffer = self._buffer, {}
+            self._pending = 0
+
+        documents = []
+        for (namespace, dims_key, properties_key), metrics in buffer.items():
+            properties = json.loads(properties_key) if properties_key else None
+            # Quebra histogramas com mais de 100 valores em vários itens
+            items = []
+            for (name, unit), value in metrics.items():
+                if isinstance(value, list):
+                    for i in range(0, len(value), MAX_VALUES_PER_METRIC):
+                        chunk = value[i:i + MAX_VALUES_PER_METRIC]
+                        items.append((name, unit, chunk if len(chunk) > 1 else chunk[0]))
+                else:
+                    items.append((name, unit, value))
+
+            # Distribui os itens em documentos com até 100 métricas e nomes únicos
+            batches: List[Dict[str, tuple]] = []
+            for name, unit, value in items:
+                for batch in batches:
+                    if name not in batch and len(batch) < MAX_METRICS_PER_DOCUMENT:
+                        batch[name] = (value, unit)
+                        break
+                else:
+                    batches.append({name: (value, unit)})
+
+            for batch in batches:
+                documents.append(build_emf_document(batch, dict(dims_key), namespace, properties))
+        return documents
+
+    def flush(self):
+        """
+        Grava todas as métricas do buffer como documentos EMF.
+        """
+        documents = self._drain()
+        if not documents:
+            return
+        stream = self.stream or sys.stdout
+        payload = "".join(json.dumps(doc, default=str) + "\n" for doc in documents)
+        try:
+            stream.write(payload)
+            stream.flush()
+        except ValueError:
+            # Stream já fechado (ex: saída do interpretador)
+            pass
+
+    def close(self):
+        """
+        Para a thread de flush e grava o que restar no buffer.
+        """
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout=self.flush_interval)
+        self.flush()
+
+# Instância padrão
+metrics_client = MetricsClient(
+    flush_interval=settings.METRICS_FLUSH_INTERVAL_SECONDS,
+    max_buffered=settings.METRICS_MAX_BUFFERED,
+)
+atexit.register(metrics_client.close)
+
+def log_metrics(
+    metrics: Dict[str, Tuple[float, str]],
+    dimensions: Optional[Dict[str, str]] = None,
+    namespace: str = DEFAULT_NAMESPACE,
+    properties: Optional[Dict[str, Any]] = None,
+):
+    """
+    Registra várias observações que compartilham as mesmas dimensões no cliente padrão.
+    As propriedades (ex: IDs de alta cardinalidade) vão no documento EMF, sem virar dimensões.
+    """
+    for name, (value, unit) in metrics.items():
+        metrics_client.observe(name, value, unit=unit, dimensions=dimensions, namespace=namespace, properties=properties)
+
+def log_metric(
+    name: str,
+    value: float,
+    unit: str = "Count",
+    dimensions: Optional[Dict[str, str]] = None,
+    namespace: str = DEFAULT_NAMESPACE
+):
+    """
+    Registra uma métrica para emissão em CloudWatch Embedded Metric Format (EMF).
+    A métrica é agregada em memória e gravada em lote no próximo flush.
+
+    Args:
+        name: Nome da métrica.
+        value: Valor da métrica.
+        unit: Unidade (Count, Seconds, Milliseconds, Bytes, etc.).
+        dimensions: Dicionário de dimensões (ex: {"Service": "API"}).
+        namespace: Namespace da métrica.
+    """
+    metrics_client.observe(name, value, unit=unit, dimensions=dimensions, namespace=namespace)
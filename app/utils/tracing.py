@@ -0,0 +1,208 @@
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Dict, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from app.utils.metrics import log_metrics
+
+def get_peak_rss_bytes() -> Optional[int]:
+    """
+    Retorna o pico de memória residente (RSS) do processo desde o seu início, em bytes.
+    Retorna None em plataformas sem o módulo `resource`.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss é em KB no Linux e em bytes no macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def get_rss_bytes() -> Optional[int]:
+    """
+    Retorna a memória residente (RSS) atual do processo, em bytes.
+    Retorna None fora do Linux (sem /proc/self/statm).
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+def get_cpu_seconds() -> float:
+    """
+    Tempo de CPU do processo: todas as threads (ex: threads do pyarrow) e os subprocessos
+    já concluídos (ex: o cmdstan de cada ajuste do Prophet).
+    """
+    cpu = time.process_time()
+    if resource is not None:
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        cpu += children.ru_utime + children.ru_stime
+    return cpu
+
+def count_rows(obj: Any) -> Optional[int]:
+    """
+    Conta as linhas de um DataFrame, ou o total de linhas de um dicionário de DataFrames.
+    Retorna None para objetos que não representam linhas.
+    """
+    if isinstance(obj, dict):
+        return sum(len(v) for v in obj.values() if hasattr(v, "__len__"))
+    if hasattr(obj, "shape") and hasattr(obj, "__len__"):
+        return len(obj)
+    return None
+
+class Span:
+    """
+    Medição de uma etapa do pipeline: tempo de parede, tempo de CPU, variação
+    do RSS, pico de RSS do processo e linhas de entrada/saída.
+
+    O tempo de CPU e o RSS são do processo: etapas executadas ao mesmo tempo em
+    outras threads entram na medição umas das outras.
+    """
+    def __init__(self, name: str, dimensions: Optional[Dict[str, str]] = None, properties: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.dimensions = dimensions or {}
+        self.properties = properties or {}
+        self.rows_in: Optional[int] = None
+        self.rows_out: Optional[int] = None
+        self.wall_seconds: float = 0.0
+        self.cpu_seconds: float = 0.0
+        self.rss_delta_bytes: Optional[int] = None
+        # Pico do processo até o fim da etapa (não é o pico da etapa)
+        self.process_peak_rss_bytes: Optional[int] = None
+        self.error: bool = False
+
+    def metrics(self) -> Dict[str, tuple]:
+        metrics = {
+            "StageWallTime": (self.wall_seconds * 1000, "Milliseconds"),
+            "StageCpuTime": (self.cpu_seconds * 1000, "Milliseconds"),
+        }
+        if self.rss_delta_bytes is not None:
+            metrics["StageRSSDelta"] = (self.rss_delta_bytes, "Bytes")
+        if self.process_peak_rss_bytes is not None:
+            metrics["ProcessPeakRSS"] = (self.process_peak_rss_bytes, "Bytes")
+        if self.rows_in is not None:
+            metrics["RowsIn"] = (self.rows_in, "Count")
+        if self.rows_out is not None:
+            metrics["RowsOut"] = (self.rows_out, "Count")
+        return metrics
+
+class SpanAggregator:
+    """
+    Agrega as medições de spans em memória, por nome de etapa.
+    Exposto pelo endpoint /metrics da API.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, Any]] = {}
+
+    def record(self, span: Span):
+        with self._lock:
+            stats = self._stats.get(span.name)
+            if stats is None:
+                stats = self._stats[span.name] = {
+                    "count": 0,
+                    "errors": 0,
+                    "wall_seconds_total": 0.0,
+                    "wall_seconds_min": None,
+                    "wall_seconds_max": 0.0,
+                    "cpu_seconds_total": 0.0,
+                    "rss_delta_bytes_max": None,
+                    "process_peak_rss_bytes": None,
+                    "rows_in_total": 0,
+                    "rows_out_total": 0,
+                }
+            stats["count"] += 1
+            stats["errors"] += int(span.error)
+            stats["wall_seconds_total"] += span.wall_seconds
+            if stats["wall_seconds_min"] is None or span.wall_seconds < stats["wall_seconds_min"]:
+                stats["wall_seconds_min"] = span.wall_seconds
+            stats["wall_seconds_max"] = max(stats["wall_seconds_max"], span.wall_seconds)
+            stats["cpu_seconds_total"] += span.cpu_seconds
+            if span.rss_delta_bytes is not None:
+                previous = stats["rss_delta_bytes_max"]
+                stats["rss_delta_bytes_max"] = span.rss_delta_bytes if previous is None else max(previous, span.rss_delta_bytes)
+            if span.process_peak_rss_bytes is not None:
+                stats["process_peak_rss_bytes"] = max(stats["process_peak_rss_bytes"] or 0, span.process_peak_rss_bytes)
+            stats["rows_in_total"] += span.rows_in or 0
+            stats["rows_out_total"] += span.rows_out or 0
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            result = {}
+            for name, stats in self._stats.items():
+                result[name] = dict(stats, wall_seconds_avg=stats["wall_seconds_total"] / stats["count"])
+            return result
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+# Instância padrão
+aggregator = SpanAggregator()
+
+@contextmanager
+def span(name: str, dimensions: Optional[Dict[str, str]] = None, emit: bool = True, **properties):
+    """
+    Mede o bloco de código como uma etapa do pipeline.
+
+    A medição é registrada no agregador em memória e, se `emit` for True,
+    enviada ao cliente de métricas (EMF em lote) com a dimensão "Stage".
+
+    Args:
+        name: Nome da etapa.
+        dimensions: Dimensões adicionais das métricas (baixa cardinalidade).
+        emit: Se False, apenas agrega em memória.
+        **properties: Campos extras no log EMF que não viram dimensões (ex: product_id).
+
+    Exemplo:
+        with span("clean_sales_data") as s:
+            s.rows_in = len(raw_df)
+            ...
+    """
+    current = Span(name, dimensions=dict(dimensions or {}, Stage=name), properties=properties)
+    wall_start = time.perf_counter()
+    cpu_start = get_cpu_seconds()
+    rss_start = get_rss_bytes()
+    try:
+        yield current
+    except BaseException:
+        current.error = True
+        raise
+    finally:
+        current.wall_seconds = time.perf_counter() - wall_start
+        current.cpu_seconds = get_cpu_seconds() - cpu_start
+        rss_end = get_rss_bytes()
+        if rss_start is not None and rss_end is not None:
+            current.rss_delta_bytes = rss_end - rss_start
+        current.process_peak_rss_bytes = get_peak_rss_bytes()
+        aggregator.record(current)
+        if emit:
+            log_metrics(current.metrics(), dimensions=current.dimensions, properties=current.properties)
+
+def traced(name: Optional[str] = None, emit: bool = True):
+    """
+    Decorator que mede a função como uma etapa do pipeline.
+
+    As linhas de entrada são contadas a partir do primeiro argumento e as de
+    saída a partir do retorno, quando forem DataFrames (ou dicionários de DataFrames).
+    """
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(stage_name, emit=emit) as current:
+                if args:
+                    current.rows_in = count_rows(args[0])
+                result = func(*args, **kwargs)
+                current.rows_out = count_rows(result)
+                return result
+        return wrapper
+    return decorator
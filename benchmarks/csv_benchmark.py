@@ -0,0 +1,133 @@
+"""
+Benchmark da leitura dos CSVs de vendas: leitura sem esquema (todas as colunas
+inferidas, números convertidos depois com pd.to_numeric) contra a leitura com o
+esquema declarado de app.processing.schemas, nos engines "c" e "pyarrow".
+
+Mede o tempo de leitura e a memória do DataFrame resultante por milhão de linhas,
+e o tempo de conversão de data_pedido (duas passadas com fillna contra
+app.processing.dates.parse_dates).
+
+Uso:
+    python -m benchmarks.csv_benchmark --skus 500 --days 365 --orders-per-day 3000
+"""
+import argparse
+import io
+import json
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+from app.processing.dates import parse_dates
+from app.processing.schemas import read_csv_with_schema, SALES_CSV_DTYPES
+from benchmarks.synthetic_data import generate_sales_df, to_csv_bytes
+
+DEFAULT_CONFIG = {
+    "skus": 200,
+    "days": 365,
+    "orders_per_day": 1000,
+    "repeat": 3,
+    "seed": 42,
+}
+
+def _read_untyped(buffer: io.BytesIO) -> pd.DataFrame:
+    # Comportamento anterior da limpeza
+    df = pd.read_csv(buffer)
+    for col in ['valor_unitario', 'valor_total_pedido', 'quantidade']:
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    return df
+
+READERS: Dict[str, Callable[[io.BytesIO], pd.DataFrame]] = {
+    "untyped": _read_untyped,
+    "schema_c": lambda buffer: read_csv_with_schema(buffer, SALES_CSV_DTYPES, engine="c"),
+    "schema_pyarrow": lambda buffer: read_csv_with_schema(buffer, SALES_CSV_DTYPES, engine="pyarrow"),
+}
+
+def _parse_dates_twice(values: pd.Series) -> pd.Series:
+    # Comportamento anterior da limpeza: a coluna inteira é convertida em cada formato
+    iso_dates = pd.to_datetime(values, format='%Y-%m-%d', errors='coerce')
+    br_dates = pd.to_datetime(values, format='%d/%m/%Y', errors='coerce')
+    return iso_dates.fillna(br_dates)
+
+DATE_PARSERS: Dict[str, Callable[[pd.Series], object]] = {
+    "two_pass": _parse_dates_twice,
+    "parse_dates": parse_dates,
+    "parse_dates_category": lambda values: parse_dates(values.astype("category")),
+}
+
+def measure_date_parser(name: str, values: pd.Series, repeat: int = 1) -> Dict:
+    """
+    Mede o tempo (melhor de `repeat`) de conversão de uma coluna de datas em texto.
+    """
+    parser = DATE_PARSERS[name]
+    timings = []
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        parser(values)
+        timings.append(time.perf_counter() - start)
+    return {"parser": name, "rows": len(values), "seconds": min(timings)}
+
+def measure_reader(name: str, payload: bytes, repeat: int = 1) -> Dict:
+    """
+    Mede o tempo (melhor de `repeat`) e a memória do DataFrame lido por um reader.
+    """
+    reader = READERS[name]
+    timings = []
+    df = None
+    for _ in range(max(repeat, 1)):
+        buffer = io.BytesIO(payload)
+        start = time.perf_counter()
+        df = reader(buffer)
+        timings.append(time.perf_counter() - start)
+    frame_bytes = int(df.memory_usage(deep=True).sum())
+    return {
+        "reader": name,
+        "rows": len(df),
+        "seconds": min(timings),
+        "frame_bytes": frame_bytes,
+        "bytes_per_million_rows": frame_bytes * 1_000_000 // max(len(df), 1),
+    }
+
+def run_csv_benchmark(config: Dict) -> Dict:
+    payload = to_csv_bytes(generate_sales_df(
+        config["skus"], n_days=config["days"], orders_per_day=config["orders_per_day"], seed=config["seed"]
+    ))
+    dates = pd.read_csv(io.BytesIO(payload), usecols=["data_pedido"], dtype={"data_pedido": "str"})["data_pedido"]
+    return {
+        "config": config,
+        "csv_bytes": len(payload),
+        "results": [measure_reader(name, payload, config["repeat"]) for name in READERS],
+        "date_results": [measure_date_parser(name, dates, config["repeat"]) for name in DATE_PARSERS],
+    }
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark da leitura de CSVs de vendas.")
+    parser.add_argument("--skus", type=int, default=DEFAULT_CONFIG["skus"])
+    parser.add_argument("--days", type=int, default=DEFAULT_CONFIG["days"])
+    parser.add_argument("--orders-per-day", type=int, default=DEFAULT_CONFIG["orders_per_day"])
+    parser.add_argument("--repeat", type=int, default=DEFAULT_CONFIG["repeat"])
+    parser.add_argument("--seed", type=int, default=DEFAULT_CONFIG["seed"])
+    parser.add_argument("--output", help="Arquivo JSON de saída.")
+    args = parser.parse_args(argv)
+
+    config = dict(DEFAULT_CONFIG, skus=args.skus, days=args.days, orders_per_day=args.orders_per_day,
+                  repeat=args.repeat, seed=args.seed)
+    results = run_csv_benchmark(config)
+
+    base = results["results"][0]
+    for r in results["results"]:
+        print(f"{r['reader']:<16} {r['seconds'] * 1000:>8.1f} ms ({base['seconds'] / r['seconds']:.1f}x)  "
+              f"{r['bytes_per_million_rows'] / 1024 ** 2:>7.1f} MiB/milhão de linhas "
+              f"({base['frame_bytes'] / r['frame_bytes']:.1f}x)")
+    base = results["date_results"][0]
+    for r in results["date_results"]:
+        print(f"{r['parser']:<22} {r['seconds'] * 1000:>8.1f} ms ({base['seconds'] / r['seconds']:.1f}x)")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
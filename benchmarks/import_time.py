@@ -0,0 +1,87 @@
+"""
+Benchmark do tempo de inicialização (cold start) dos handlers Lambda e da API.
+
+Cada módulo é importado em um interpretador novo, como acontece em um cold start,
+e o tempo de importação é comparado com o orçamento definido em STARTUP_BUDGETS.
+
+Uso:
+    python -m benchmarks.import_time --repeat 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List, Optional
+
+# Orçamento de tempo de importação (segundos) por módulo
+STARTUP_BUDGETS = {
+    "lambdas.process_handler.main": 3.0,
+    "lambdas.predict_handler.main": 3.0,
+    "app.api.main": 4.0,
+}
+
+# Módulos pesados que não devem ser carregados na inicialização: são importados
+# apenas quando realmente usados (treino do Prophet, conexão com o banco, boto3).
+DEFERRED_MODULES = ["prophet", "cmdstanpy", "matplotlib", "psycopg", "psycopg2", "boto3"]
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"seconds": elapsed, "loaded": [m for m in {deferred!r} if m in sys.modules]}}))
+"""
+
+def measure_import(module: str, repeat: int = 1) -> Dict:
+    """
+    Mede o tempo de importação de um módulo em interpretadores novos.
+
+    Returns:
+        Um dicionário com a mediana e o mínimo dos tempos e os módulos pesados
+        que foram carregados durante a importação.
+    """
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [root, os.environ.get("PYTHONPATH")])))
+    timings: List[float] = []
+    loaded: List[str] = []
+    for _ in range(max(repeat, 1)):
+        output = subprocess.run(
+            [sys.executable, "-c", _PROBE.format(module=module, deferred=DEFERRED_MODULES)],
+            capture_output=True, text=True, check=True, cwd=root, env=env,
+        ).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        timings.append(result["seconds"])
+        loaded = result["loaded"]
+    return {
+        "module": module,
+        "median_seconds": statistics.median(timings),
+        "min_seconds": min(timings),
+        "budget_seconds": STARTUP_BUDGETS.get(module),
+        "deferred_modules_loaded": loaded,
+    }
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de tempo de inicialização.")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Arquivo JSON de saída.")
+    args = parser.parse_args(argv)
+
+    results = [measure_import(module, args.repeat) for module in STARTUP_BUDGETS]
+    failed = False
+    for r in results:
+        over_budget = r["median_seconds"] > r["budget_seconds"]
+        failed = failed or over_budget or bool(r["deferred_modules_loaded"])
+        print(f"{r['module']:<32} {r['median_seconds'] * 1000:>8.0f} ms (orçamento {r['budget_seconds'] * 1000:.0f} ms)"
+              f"{'  ACIMA DO ORÇAMENTO' if over_budget else ''}"
+              f"{'  carregou: ' + ', '.join(r['deferred_modules_loaded']) if r['deferred_modules_loaded'] else ''}")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,127 @@
+"""
+Benchmark da serialização Parquet: gravação padrão do pandas (snappy, tipos de
+64 bits, strings sem dicionário) contra o módulo app.core.parquet (esquema por
+dataset, dicionário, tipos reduzidos e zstd).
+
+Mede o tamanho do arquivo (bytes enviados/baixados do S3) e o tempo de gravação e leitura.
+
+Uso:
+    python -m benchmarks.parquet_benchmark --skus 500 --days 365 --orders-per-day 3000
+"""
+import argparse
+import io
+import json
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+import pyarrow.parquet as pq
+
+from app.core.parquet import write_parquet
+from app.processing.cleaner import clean_products_data, clean_sales_data
+from benchmarks.synthetic_data import generate_products_df, generate_sales_df, to_csv_bytes
+
+DEFAULT_CONFIG = {
+    "skus": 200,
+    "days": 365,
+    "orders_per_day": 500,
+    "repeat": 3,
+    "seed": 42,
+}
+
+WRITERS: Dict[str, Callable[[pd.DataFrame, str, io.BytesIO], None]] = {
+    "pandas_default": lambda df, dataset, buffer: df.to_parquet(buffer, index=False),
+    "tuned": lambda df, dataset, buffer: write_parquet(df, dataset, buffer),
+}
+
+def _best_of(func: Callable[[], object], repeat: int) -> float:
+    timings = []
+    for _ in range(max(repeat, 1)):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+def measure_writer(name: str, df: pd.DataFrame, dataset: str, repeat: int = 1) -> Dict:
+    """
+    Mede tamanho, tempo de gravação e tempo de leitura de um DataFrame com um writer.
+
+    Returns:
+        Um dicionário com bytes, write_seconds e read_seconds.
+    """
+    writer = WRITERS[name]
+
+    def write() -> bytes:
+        buffer = io.BytesIO()
+        writer(df, dataset, buffer)
+        return buffer.getvalue()
+
+    payload = write()
+    return {
+        "dataset": dataset,
+        "writer": name,
+        "rows": len(df),
+        "bytes": len(payload),
+        "write_seconds": _best_of(write, repeat),
+        "read_seconds": _best_of(lambda: pq.read_table(io.BytesIO(payload)).to_pandas(), repeat),
+    }
+
+def run_parquet_benchmark(config: Dict) -> Dict:
+    """
+    Executa o benchmark sobre dados sintéticos limpos (como gravados pelo pipeline).
+    """
+    products_df = clean_products_data(io.BytesIO(to_csv_bytes(generate_products_df(config["skus"], seed=config["seed"]))))
+    sales_df = clean_sales_data(io.BytesIO(to_csv_bytes(generate_sales_df(
+        config["skus"], n_days=config["days"], orders_per_day=config["orders_per_day"], seed=config["seed"]
+    ))))
+
+    results: List[Dict] = []
+    for dataset, df in (("products", products_df), ("sales", sales_df)):
+        for writer in WRITERS:
+            results.append(measure_writer(writer, df, dataset, config["repeat"]))
+    return {"config": config, "results": results}
+
+def summarize(results: Dict) -> List[Dict]:
+    """
+    Calcula, por dataset, a razão entre o writer padrão e o ajustado.
+    """
+    by_key = {(r["dataset"], r["writer"]): r for r in results["results"]}
+    summary = []
+    for dataset in sorted({r["dataset"] for r in results["results"]}):
+        default, tuned = by_key[(dataset, "pandas_default")], by_key[(dataset, "tuned")]
+        summary.append({
+            "dataset": dataset,
+            "size_ratio": default["bytes"] / max(tuned["bytes"], 1),
+            "write_ratio": default["write_seconds"] / max(tuned["write_seconds"], 1e-9),
+            "read_ratio": default["read_seconds"] / max(tuned["read_seconds"], 1e-9),
+        })
+    return summary
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark da serialização Parquet.")
+    parser.add_argument("--skus", type=int, default=DEFAULT_CONFIG["skus"])
+    parser.add_argument("--days", type=int, default=DEFAULT_CONFIG["days"])
+    parser.add_argument("--orders-per-day", type=int, default=DEFAULT_CONFIG["orders_per_day"])
+    parser.add_argument("--repeat", type=int, default=DEFAULT_CONFIG["repeat"])
+    parser.add_argument("--seed", type=int, default=DEFAULT_CONFIG["seed"])
+    parser.add_argument("--output", help="Arquivo JSON de saída.")
+    args = parser.parse_args(argv)
+
+    config = dict(DEFAULT_CONFIG, skus=args.skus, days=args.days, orders_per_day=args.orders_per_day,
+                  repeat=args.repeat, seed=args.seed)
+    results = run_parquet_benchmark(config)
+
+    for r in results["results"]:
+        print(f"{r['dataset']:<9} {r['writer']:<15} {r['bytes'] / 1024:>10.1f} KiB "
+              f"gravação {r['write_seconds'] * 1000:>8.1f} ms  leitura {r['read_seconds'] * 1000:>8.1f} ms")
+    for s in summarize(results):
+        print(f"{s['dataset']:<9} tamanho {s['size_ratio']:.1f}x menor, gravação {s['write_ratio']:.1f}x, leitura {s['read_ratio']:.1f}x")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(dict(results, summary=summarize(results)), f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
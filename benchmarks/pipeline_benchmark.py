@@ -0,0 +1,290 @@
+"""
+Benchmark de ponta a ponta do pipeline (validação -> limpeza -> features ->
+treino -> previsão -> gravação no banco) sobre dados sintéticos.
+
+Uso:
+    python -m benchmarks.pipeline_benchmark --skus 50 --days 365 --orders-per-day 200 \\
+        --output bench_output.json --baseline benchmarks/baseline.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Os writers de CRUD são medidos contra um SQLite em memória; evita que a importação
+# do módulo de banco tente conectar no PostgreSQL configurado.
+os.environ.setdefault("DATABASE_URL", "sqlite:///:memory:")
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.processing.validator import validate_csv, PRODUCT_COLUMNS, SALES_COLUMNS
+from app.processing.cleaner import clean_products_data, clean_sales_data
+from app.processing.feature_engineering import create_prophet_features
+from app.ml.trainer import train_models_for_products
+from app.ml.predictor import generate_predictions
+from app.core.database import Base
+from app.core.crud import save_products_to_db, save_predictions_to_db
+from benchmarks.synthetic_data import generate_products_df, generate_sales_df, to_csv_bytes
+
+DEFAULT_CONFIG = {
+    "skus": 20,
+    "days": 180,
+    "orders_per_day": 100,
+    "cancellation_rate": 0.05,
+    "train_products": 3,
+    "days_to_predict": 90,
+    "repeat": 3,
+    "seed": 42,
+}
+
+# Diferenças absolutas abaixo destes valores são ruído de medição e não contam
+# como regressão, mesmo que a razão relativa seja grande.
+MIN_ABSOLUTE_DELTA = {
+    "wall_seconds": 0.005,
+    "peak_memory_bytes": 1024 * 1024,
+}
+
+
+def measure_stage(
+    name: str,
+    setup: Callable[[], Tuple],
+    func: Callable,
+    repeat: int = 1,
+    rows_in: Optional[int] = None,
+) -> Tuple[Any, Dict[str, Any]]:
+    """
+    Mede uma etapa do pipeline.
+
+    O tempo é o melhor de `repeat` execuções sem rastreamento de memória;
+    o pico de memória é medido em uma execução extra com o tracemalloc ativo,
+    para que o overhead do rastreamento não contamine o tempo.
+
+    Args:
+        name: Nome da etapa.
+        setup: Função que devolve os argumentos da etapa (chamada antes de cada
+               execução, fora da medição, pois algumas etapas alteram a entrada).
+        func: A etapa a ser medida.
+        repeat: Número de execuções cronometradas.
+        rows_in: Número de linhas de entrada, apenas informativo.
+
+    Returns:
+        O resultado da última execução e o registro da medição.
+    """
+    timings = []
+    result = None
+    for _ in range(max(repeat, 1)):
+        args = setup()
+        start = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - start)
+
+    args = setup()
+    tracemalloc.start()
+    try:
+        func(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    record = {
+        "stage": name,
+        "wall_seconds": min(timings),
+        "peak_memory_bytes": peak,
+        "rows_in": rows_in,
+        "rows_out": _count_rows(result),
+    }
+    return result, record
+
+
+def _count_rows(result: Any) -> Optional[int]:
+    if hasattr(result, "__len__") and not isinstance(result, (str, bytes, tuple)):
+        if isinstance(result, dict):
+            return sum(len(v) for v in result.values() if hasattr(v, "__len__"))
+        return len(result)
+    return None
+
+
+def run_pipeline_benchmark(config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Executa todas as etapas do pipeline sobre dados sintéticos e mede cada uma.
+
+    Args:
+        config: Parâmetros de escala (ver DEFAULT_CONFIG). Chaves ausentes usam o padrão.
+
+    Returns:
+        Um dicionário com a configuração usada, informações do ambiente e a lista
+        de medições por etapa.
+    """
+    cfg = {**DEFAULT_CONFIG, **(config or {})}
+    repeat = cfg["repeat"]
+
+    products_csv = to_csv_bytes(generate_products_df(cfg["skus"], seed=cfg["seed"]))
+    sales_csv = to_csv_bytes(generate_sales_df(
+        cfg["skus"], cfg["days"], cfg["orders_per_day"],
+        cancellation_rate=cfg["cancellation_rate"], seed=cfg["seed"],
+    ))
+    n_sales_rows = cfg["days"] * cfg["orders_per_day"]
+
+    stages: List[Dict[str, Any]] = []
+
+    def run(name, setup, func, rows_in=None, times=repeat):
+        result, record = measure_stage(name, setup, func, repeat=times, rows_in=rows_in)
+        stages.append(record)
+        return result
+
+    run("validate_products", lambda: (io.BytesIO(products_csv), PRODUCT_COLUMNS), validate_csv, cfg["skus"])
+    run("validate_sales", lambda: (io.BytesIO(sales_csv), SALES_COLUMNS), validate_csv, n_sales_rows)
+    products_df = run("clean_products_data", lambda: (io.BytesIO(products_csv),), clean_products_data, cfg["skus"])
+    sales_df = run("clean_sales_data", lambda: (io.BytesIO(sales_csv),), clean_sales_data, n_sales_rows)
+
+    feature_dfs = run(
+        "create_prophet_features", lambda: (sales_df.copy(),), create_prophet_features, len(sales_df)
+    )
+
+    # O treino é a etapa mais cara: limitamos o número de produtos e executamos uma vez.
+    train_ids = sorted(feature_dfs)[: cfg["train_products"]]
+    train_input = {pid: feature_dfs[pid] for pid in train_ids}
+    trained_models = run(
+        "train_models_for_products", lambda: (train_input,), train_models_for_products,
+        sum(len(df) for df in train_input.values()), times=1,
+    )
+    predictions = run(
+        "generate_predictions", lambda: (trained_models, cfg["days_to_predict"]), generate_predictions,
+        len(trained_models), times=1,
+    )
+
+    engine = create_engine("sqlite:///:memory:")
+    Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def fresh_session():
+        Base.metadata.drop_all(bind=engine)
+        Base.metadata.create_all(bind=engine)
+        return Session()
+
+    def save_all_predictions(db, preds):
+        try:
+            save_products_to_db(db, products_df)
+            for product_id, forecast_df in preds.items():
+                save_predictions_to_db(db, int(product_id), forecast_df)
+        finally:
+            db.close()
+
+    def save_products(db, df):
+        try:
+            save_products_to_db(db, df)
+        finally:
+            db.close()
+
+    run("save_products_to_db", lambda: (fresh_session(), products_df), save_products, len(products_df))
+    run(
+        "save_predictions_to_db", lambda: (fresh_session(), predictions), save_all_predictions,
+        sum(len(df) for df in predictions.values()),
+    )
+
+    return {
+        "config": cfg,
+        "environment": {
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+        },
+        "stages": stages,
+    }
+
+
+def compare_with_baseline(
+    results: Dict[str, Any],
+    baseline: Dict[str, Any],
+    tolerance: float = 0.25,
+) -> List[Dict[str, Any]]:
+    """
+    Compara um resultado com o baseline armazenado.
+
+    Uma etapa é considerada regressão quando o tempo ou o pico de memória
+    excede o valor do baseline em mais de `tolerance` (fração) e a diferença
+    absoluta supera MIN_ABSOLUTE_DELTA.
+
+    Returns:
+        A lista de regressões encontradas (vazia se não houver nenhuma).
+    """
+    baseline_stages = {s["stage"]: s for s in baseline.get("stages", [])}
+    regressions = []
+    for stage in results.get("stages", []):
+        reference = baseline_stages.get(stage["stage"])
+        if not reference:
+            continue
+        for metric in ("wall_seconds", "peak_memory_bytes"):
+            old, new = reference.get(metric), stage.get(metric)
+            if not old or new is None:
+                continue
+            ratio = new / old
+            if ratio > 1 + tolerance and new - old > MIN_ABSOLUTE_DELTA[metric]:
+                regressions.append({
+                    "stage": stage["stage"],
+                    "metric": metric,
+                    "baseline": old,
+                    "current": new,
+                    "ratio": round(ratio, 3),
+                })
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark do pipeline Smart Stock.")
+    parser.add_argument("--skus", type=int, default=DEFAULT_CONFIG["skus"])
+    parser.add_argument("--days", type=int, default=DEFAULT_CONFIG["days"])
+    parser.add_argument("--orders-per-day", type=int, default=DEFAULT_CONFIG["orders_per_day"])
+    parser.add_argument("--cancellation-rate", type=float, default=DEFAULT_CONFIG["cancellation_rate"])
+    parser.add_argument("--train-products", type=int, default=DEFAULT_CONFIG["train_products"])
+    parser.add_argument("--repeat", type=int, default=DEFAULT_CONFIG["repeat"])
+    parser.add_argument("--seed", type=int, default=DEFAULT_CONFIG["seed"])
+    parser.add_argument("--output", default="bench_output.json", help="Arquivo JSON de saída.")
+    parser.add_argument("--baseline", help="Baseline JSON para comparação.")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--update-baseline", action="store_true",
+                        help="Grava o resultado como novo baseline em --baseline.")
+    args = parser.parse_args(argv)
+
+    results = run_pipeline_benchmark({
+        "skus": args.skus,
+        "days": args.days,
+        "orders_per_day": args.orders_per_day,
+        "cancellation_rate": args.cancellation_rate,
+        "train_products": args.train_products,
+        "repeat": args.repeat,
+        "seed": args.seed,
+    })
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+
+    for stage in results["stages"]:
+        print(f"{stage['stage']:<28} {stage['wall_seconds'] * 1000:>10.1f} ms "
+              f"{stage['peak_memory_bytes'] / 1024 / 1024:>8.1f} MiB")
+
+    if args.baseline and args.update_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline atualizado em {args.baseline}")
+        return 0
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != results["config"]:
+            print("Aviso: a configuração difere da do baseline; a comparação pode não ser significativa.")
+        regressions = compare_with_baseline(results, baseline, tolerance=args.tolerance)
+        for r in regressions:
+            print(f"REGRESSÃO {r['stage']} {r['metric']}: {r['baseline']} -> {r['current']} (x{r['ratio']})")
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,82 @@
+import numpy as np
+import pandas as pd
+
+SITUACOES = ["Entregue", "Enviado", "Faturado"]
+
+
+def generate_products_df(n_skus: int, seed: int = 42) -> pd.DataFrame:
+    """
+    Gera um DataFrame sintético de produtos no mesmo formato do CSV de produtos.
+
+    Args:
+        n_skus: Número de produtos (SKUs) a gerar.
+        seed: Semente do gerador aleatório, para resultados reprodutíveis.
+
+    Returns:
+        Um DataFrame com as colunas esperadas pelo validador de produtos.
+    """
+    rng = np.random.default_rng(seed)
+    ids = np.arange(1, n_skus + 1)
+    return pd.DataFrame({
+        "produto_id": ids,
+        "produto_nome": [f"Produto {i}" for i in ids],
+        "produto_codigo": [f"PRD{i}" for i in ids],
+        "produto_preco": rng.uniform(1.0, 500.0, n_skus).round(2),
+        "produto_estoque_atual": rng.integers(0, 1000, n_skus).astype(float),
+    })
+
+
+def generate_sales_df(
+    n_skus: int,
+    n_days: int,
+    orders_per_day: int,
+    cancellation_rate: float = 0.05,
+    date_format: str = "%d/%m/%Y",
+    start_date: str = "2023-01-01",
+    seed: int = 42,
+) -> pd.DataFrame:
+    """
+    Gera um DataFrame sintético de vendas no mesmo formato do CSV de vendas.
+
+    Args:
+        n_skus: Número de produtos distintos vendidos.
+        n_days: Número de dias de histórico.
+        orders_per_day: Número de linhas de pedido por dia.
+        cancellation_rate: Fração dos pedidos com situação 'Cancelado'.
+        date_format: Formato de 'data_pedido' (ISO '%Y-%m-%d' ou BR '%d/%m/%Y').
+        start_date: Primeiro dia do histórico.
+        seed: Semente do gerador aleatório, para resultados reprodutíveis.
+
+    Returns:
+        Um DataFrame com as colunas esperadas pelo validador de vendas.
+    """
+    rng = np.random.default_rng(seed)
+    n_rows = n_days * orders_per_day
+
+    days = pd.date_range(start=start_date, periods=n_days, freq="D")
+    day_labels = days.strftime(date_format).to_numpy()
+    order_days = np.repeat(np.arange(n_days), orders_per_day)
+
+    product_ids = rng.integers(1, n_skus + 1, n_rows)
+    unit_prices = (product_ids % 97 + 1).astype(float) * 1.5
+    quantities = rng.poisson(3, n_rows) + 1
+
+    situacao = rng.choice(SITUACOES, n_rows).astype(object)
+    situacao[rng.random(n_rows) < cancellation_rate] = "Cancelado"
+
+    return pd.DataFrame({
+        "produto_id": product_ids,
+        "produto_nome": [f"Produto {i}" for i in product_ids],
+        "valor_unitario": unit_prices,
+        "valor_total_pedido": (unit_prices * quantities).round(2),
+        "quantidade": quantities,
+        "situacao": situacao,
+        "data_pedido": day_labels[order_days],
+    })
+
+
+def to_csv_bytes(df: pd.DataFrame) -> bytes:
+    """
+    Serializa um DataFrame como CSV em bytes (UTF-8), como seria enviado no upload.
+    """
+    return df.to_csv(index=False).encode("utf-8")
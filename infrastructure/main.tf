@@ -12,6 +12,38 @@ resource "aws_s3_bucket_acl" "data_lake_acl" {
   acl    = "private"
 }
 
+# Upload direto do navegador/cliente com URLs pré-assinadas (POST /upload/sessions).
+# O ETag precisa ser exposto para o cliente concluir os multipart uploads.
+resource "aws_s3_bucket_cors_configuration" "data_lake_cors" {
+  bucket = aws_s3_bucket.data_lake.id
+
+  cors_rule {
+    allowed_methods = ["PUT"]
+    allowed_origins = ["*"]
+    allowed_headers = ["*"]
+    expose_headers  = ["ETag"]
+    max_age_seconds = 3600
+  }
+}
+
+# Sessões abandonadas: partes de multipart uploads não concluídos são descartadas
+resource "aws_s3_bucket_lifecycle_configuration" "data_lake_lifecycle" {
+  bucket = aws_s3_bucket.data_lake.id
+
+  rule {
+    id     = "abort-incomplete-uploads"
+    status = "Enabled"
+
+    filter {
+      prefix = "raw/"
+    }
+
+    abort_incomplete_multipart_upload {
+      days_after_initiation = 1
+    }
+  }
+}
+
 # --- ECR Repository (Docker Images) ---
 resource "aws_ecr_repository" "api" {
   name = "${var.project_name}-api"
@@ -96,6 +128,8 @@ resource "aws_lambda_function" "process_handler" {
   environment {
     variables = {
       S3_BUCKET_NAME = aws_s3_bucket.data_lake.id
+      # Ledger de arquivos processados (hash do conteúdo -> dataset processado)
+      DATABASE_URL   = "postgresql://${var.db_username}:${var.db_password}@${aws_db_instance.default.endpoint}/${var.project_name}"
     }
   }
 }
@@ -114,10 +148,28 @@ resource "aws_lambda_function" "predict_handler" {
     variables = {
       S3_BUCKET_NAME = aws_s3_bucket.data_lake.id
       DATABASE_URL   = "postgresql://${var.db_username}:${var.db_password}@${aws_db_instance.default.endpoint}/${var.project_name}"
+      # Coordenador invoca a própria função em modo worker, um shard por invocação
+      PREDICT_EXECUTOR = "lambda"
     }
   }
   }
 
+resource "aws_iam_role_policy" "predict_fan_out" {
+  name = "predict_fan_out"
+  role = aws_iam_role.lambda_role.id
+
+  policy = jsonencode({
+    Version = "2012-10-17"
+    Statement = [
+      {
+        Action   = ["lambda:InvokeFunction"]
+        Effect   = "Allow"
+        Resource = "arn:aws:lambda:*:*:function:${var.project_name}-predict-handler"
+      }
+    ]
+  })
+}
+
 
 # --- S3 Triggers ---
 resource "aws_s3_bucket_notification" "bucket_notification" {
@@ -129,10 +181,13 @@ resource "aws_s3_bucket_notification" "bucket_notification" {
     filter_prefix       = "raw/"
   }
 
+  # Cada dataset completo (_SUCCESS) notifica o pipeline de ML, que só treina
+  # quando todos os artefatos do manifesto do upload estiverem prontos
   lambda_function {
     lambda_function_arn = aws_lambda_function.predict_handler.arn
     events              = ["s3:ObjectCreated:*"]
     filter_prefix       = "processed/"
+    filter_suffix       = "_SUCCESS"
   }
 
   depends_on = [aws_lambda_permission.allow_bucket, aws_lambda_permission.allow_bucket_predict]
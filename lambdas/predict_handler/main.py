@@ -1,107 +1,261 @@
-import boto3
-import io
-import urllib.parse
 import os
-import logging
-import pandas as pd
-from app.processing.feature_engineering import create_prophet_features
-from app.ml.trainer import train_models_for_products
-from app.ml.predictor import generate_predictions
+import urllib.parse
 from app.core.database import SessionLocal
-from app.core.crud import save_products_to_db, save_predictions_to_db
+from app.core.crud import save_products_to_db, claim_pipeline_run, release_pipeline_run, complete_pipeline_run
+from app.core.datalake import read_partitioned_dataset, resolve_dataset_root, date_filter, training_start
+from app.core.sales_history import sales_history_loaded, get_sales_days
+from app.core.manifest import (
+    batch_from_key, batch_run_id, read_batch_manifest, default_manifest, missing_artifacts, newer_batches,
+)
+from app.ml.sharding import (
+    plan_shards, write_shard_manifests, read_manifest, run_shard, record_shard_failure,
+    completed_parts, failed_shards, merge_forecast_parts, get_shard_executor, LambdaShardExecutor,
+)
+from app.core.config import settings
+from app.ml.prophet_model import warm_up
+from app.utils.tracing import span
+from app.utils.metrics import metrics_client
+from app.utils.logger import get_logger, bind_context, flush_logs
 
 # Configurar logger
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
+logger = get_logger("lambdas.predict_handler")
 
-s3_client = boto3.client('s3')
+# Na Lambda, o Prophet e o modelo Stan são carregados na fase de inicialização, antes da
+# primeira invocação. Fora dela (testes, benchmarks de importação) o carregamento é adiado
+if settings.PROPHET_WARM_UP and os.environ.get("AWS_LAMBDA_FUNCTION_NAME"):
+    warm_up()
 
 def handler(event, context):
     """
     Lambda handler para executar o pipeline de ML.
-    Acionado por evento S3 Object Created (processed/sales_...).
+
+    Modos:
+        - Coordenador: acionado por evento S3 Object Created (processed/{tenant}/{dataset}/{ts}/_SUCCESS).
+          Processa todos os registros do evento; cada lote completo (ver app.core.manifest)
+          tem os produtos divididos em shards, enviados ao executor.
+        - Worker: {"mode": "worker", "bucket": ..., "manifest_key": ..., "next_keys": [...]}.
+          Processa um shard e invoca o próximo da sua cadeia (ver LambdaShardExecutor).
+        - Merge: {"mode": "merge", "bucket": ..., "tenant": ..., "timestamp": ...,
+          "attempt": ... e "run_id": ... (opcionais)}.
     """
-    bucket = event['Records'][0]['s3']['bucket']['name']
-    key = urllib.parse.unquote_plus(event['Records'][0]['s3']['object']['key'], encoding='utf-8')
+    request_id = getattr(context, "aws_request_id", None)
+    with bind_context(job_id=request_id):
+        try:
+            mode = event.get("mode")
+            if mode == "worker":
+                return _handle_worker(event, context)
+            if mode == "merge":
+                return _handle_merge(event)
+            return _handle(event, context)
+        finally:
+            # A Lambda congela o processo entre invocações: grava métricas e logs do buffer agora
+            metrics_client.flush()
+            flush_logs()
+
+def _handle(event, context):
+    # Agrupar os marcadores _SUCCESS do evento por (bucket, tenant)
+    batches = {}
+    for record in event.get('Records', []):
+        bucket = record['s3']['bucket']['name']
+        key = urllib.parse.unquote_plus(record['s3']['object']['key'], encoding='utf-8')
+        logger.info(f"Evento recebido para: s3://{bucket}/{key}")
 
-    logger.info(f"Evento recebido para: s3://{bucket}/{key}")
+        # processed/{tenant}/{sales|products}/{ts}/_SUCCESS
+        batch = batch_from_key(key)
+        if batch is None:
+            logger.info(f"{key} não é o marcador de um dataset processado. Ignorando.")
+            continue
+        tenant, timestamp = batch
+        batches.setdefault((bucket, tenant), set()).add(timestamp)
+
+    # Uploads em sequência do mesmo tenant são agrupados: apenas o mais recente é treinado.
+    # A falha de um tenant não interrompe os lotes dos demais
+    results, failed = [], []
+    for (bucket, tenant), timestamps in batches.items():
+        try:
+            result = _run_batch(bucket, tenant, max(timestamps), context)
+        except Exception as e:
+            logger.exception(f"Pipeline de ML do tenant {tenant} falhou: {e}")
+            metrics_client.increment("PipelineFailures", dimensions={"Stage": "predict_batch"}, properties={"tenant": tenant})
+            failed.append(tenant)
+            continue
+        if result is not None:
+            results.append(result)
 
-    # Verificar se é um arquivo de vendas
-    if "sales" not in key:
-        logger.info("Não é um arquivo de vendas. Ignorando.")
+    if failed:
+        # Os lotes que falharam foram liberados (release_pipeline_run): a nova tentativa
+        # da Lambda executa apenas eles, pois os concluídos já estão registrados
+        raise RuntimeError(f"Pipeline de ML falhou para: {', '.join(failed)}")
+    if not results:
         return
 
-    try:
-        # Derivar chave do arquivo de produtos (assumindo mesmo timestamp)
-        # processed/sales_{ts}.parquet -> processed/products_{ts}.parquet
-        products_key = key.replace("sales", "products")
-        
-        logger.info(f"Baixando arquivos: {key} e {products_key}")
+    return {
+        'statusCode': 200,
+        'body': "Pipeline de ML executado com sucesso: " + "; ".join(results)
+    }
+
+def _run_batch(bucket, tenant, timestamp, context):
+    """
+    Executa o pipeline de ML para um lote, se ele estiver completo, não tiver sido
+    substituído por um upload mais recente e não estiver em execução por outra invocação.
+    """
+    with bind_context(tenant=tenant, batch=timestamp):
+        manifest = _load_manifest(bucket, tenant, timestamp)
+        missing = missing_artifacts(manifest, bucket)
+        if missing:
+            # Um evento posterior (o marcador que falta) dispara o lote completo
+            logger.info(f"Lote {tenant}/{timestamp} incompleto, aguardando: {', '.join(missing)}")
+            return None
 
-        # Download Sales
-        sales_obj = s3_client.get_object(Bucket=bucket, Key=key)
-        sales_df = pd.read_parquet(io.BytesIO(sales_obj['Body'].read()))
+        newer = [ts for ts in newer_batches(tenant, timestamp, bucket)
+                 if not missing_artifacts(_load_manifest(bucket, tenant, ts), bucket)]
+        if newer:
+            logger.info(f"Lote {tenant}/{timestamp} substituído pelo upload {newer[-1]}. Ignorando.")
+            return None
 
-        # Download Products
-        products_obj = s3_client.get_object(Bucket=bucket, Key=products_key)
-        products_df = pd.read_parquet(io.BytesIO(products_obj['Body'].read()))
+        # Datasets reenviados sem alteração apontam (_ALIAS) para os originais; o lote é
+        # identificado pelos dados que realmente usa, e um reenvio idêntico não é retreinado
+        artifacts = {dataset: resolve_dataset_root(root, bucket) for dataset, root in manifest["artifacts"].items()}
+        run_id = batch_run_id(artifacts)
 
-        # Iniciar sessão do banco
         db = SessionLocal()
         try:
-            # 1. Salvar produtos no banco
-            save_products_to_db(db, products_df)
-
-            # 2. Feature Engineering
-            logger.info("Criando features para o Prophet...")
-            feature_dfs = create_prophet_features(sales_df)
-
-            # 3. Treinamento
-            logger.info("Treinando modelos...")
-            trained_models = train_models_for_products(feature_dfs)
-
-            # 4. Previsão
-            logger.info("Gerando previsões...")
-            predictions = generate_predictions(trained_models, days_to_predict=90)
-
-            # 5. Salvar previsões no banco
-            logger.info("Salvando previsões no banco...")
-            for product_id, forecast_df in predictions.items():
-                save_predictions_to_db(db, int(product_id), forecast_df)
-
-            # 6. Salvar previsões no S3 (Data Lake)
-            logger.info("Salvando previsões no S3...")
-            timestamp = key.split('_')[-1].replace('.parquet', '') # Extrair timestamp do nome do arquivo
-            
-            for product_id, forecast_df in predictions.items():
-                # Estrutura: predictions/forecast_{ts}_{product_id}.parquet
-                # Ou melhor: predictions/{ts}/forecast.parquet (com todos)
-                pass
-            
-            # Vamos salvar um arquivo único com todas as previsões
-            all_predictions = []
-            for pid, df in predictions.items():
-                df['product_id'] = pid
-                all_predictions.append(df)
-            
-            if all_predictions:
-                final_df = pd.concat(all_predictions)
-                parquet_buffer = io.BytesIO()
-                final_df.to_parquet(parquet_buffer, index=False)
-                parquet_buffer.seek(0)
-                
-                output_key = f"predictions/forecast_{timestamp}.parquet"
-                s3_client.upload_fileobj(parquet_buffer, bucket, output_key)
-                logger.info(f"Previsões salvas em: s3://{bucket}/{output_key}")
-
+            if not claim_pipeline_run(db, tenant, run_id):
+                logger.info(f"Lote {tenant}/{run_id} já foi executado. Ignorando.")
+                return None
         finally:
             db.close()
 
-        return {
-            'statusCode': 200,
-            'body': "Pipeline de ML executado com sucesso."
-        }
+        try:
+            return _run_pipeline(bucket, tenant, timestamp, artifacts, context, run_id)
+        except Exception as e:
+            logger.error(f"Erro no pipeline de ML: {e}")
+            # Libera o lote para que a nova tentativa da Lambda possa executá-lo
+            db = SessionLocal()
+            try:
+                release_pipeline_run(db, tenant, run_id)
+            finally:
+                db.close()
+            raise e
+
+def _load_manifest(bucket, tenant, timestamp):
+    # Uploads sem manifesto (ex: arquivos enviados direto ao S3) usam o manifesto implícito
+    return read_batch_manifest(tenant, timestamp, bucket) or default_manifest(tenant, timestamp)
+
+def _run_pipeline(bucket, tenant, timestamp, artifacts, context, run_id=None):
+    sales_root = artifacts["sales"]
+    products_root = artifacts["products"]
+    logger.info(f"Lendo datasets: {sales_root} e {products_root}")
 
-    except Exception as e:
-        logger.error(f"Erro no pipeline de ML: {e}")
-        raise e
+    with span("read_datasets") as s:
+        products_df = read_partitioned_dataset(products_root, "products", bucket=bucket)
+        s.rows_out = len(products_df)
+
+    # 1. Salvar produtos no banco
+    db = SessionLocal()
+    try:
+        save_products_to_db(db, products_df, tenant=tenant)
+        # Vendas já carregadas no histórico do banco: os dias de cada produto vêm das
+        # vendas diárias agregadas e os workers leem a série de treino do banco
+        from_history = settings.SALES_HISTORY_ENABLED and sales_history_loaded(db, tenant, sales_root)
+        if from_history:
+            days_per_product = get_sales_days(db, tenant, start=training_start())
+    finally:
+        db.close()
+
+    # 2. Planejar shards pelo custo estimado (dias de histórico de cada produto)
+    product_ids = set(products_df['produto_id'])
+    if from_history:
+        days_per_product = {pid: days for pid, days in days_per_product.items() if pid in product_ids}
+    else:
+        # O coordenador só precisa das chaves para estimar o custo de cada produto
+        with span("read_sales_keys") as s:
+            start = training_start()
+            sales_keys = read_partitioned_dataset(
+                sales_root, "sales", columns=["produto_id", "data_pedido"],
+                filter=date_filter(start) if start else None, bucket=bucket,
+            )
+            s.rows_out = len(sales_keys)
+        sales_keys = sales_keys[sales_keys['produto_id'].isin(product_ids)]
+        days_per_product = sales_keys.groupby('produto_id')['data_pedido'].nunique().to_dict()
+    shards = plan_shards(days_per_product)
+    if not shards:
+        # Nenhum produto com vendas (ex: fora da janela TRAINING_HISTORY_DAYS): não há o que
+        # treinar, e nenhum worker concluiria o lote. Ele é concluído aqui, sem previsões
+        logger.warning(f"Lote {tenant}/{run_id or timestamp} sem vendas dos produtos para treinar.")
+        _complete_run(tenant, run_id or timestamp)
+        return f"{tenant}/{timestamp} (0 shards)"
+    manifest_keys = write_shard_manifests(
+        shards, sales_root, tenant, timestamp, bucket,
+        feature_source="database" if from_history else "datalake", run_id=run_id,
+    )
+    logger.info(f"{len(days_per_product)} produtos divididos em {len(shards)} shards.")
+
+    # 3. Executar os shards (no próprio processo ou em Lambdas workers)
+    executor = get_shard_executor(getattr(context, "function_name", None))
+    output_key = executor.submit(manifest_keys, bucket, tenant, timestamp)
+    if output_key:
+        # Executor local: o merge já foi feito. Com workers Lambda, o lote é concluído no merge
+        _complete_run(tenant, run_id or timestamp)
+        logger.info(f"Previsões salvas em: s3://{bucket}/{output_key}")
+
+    return f"{tenant}/{timestamp} ({len(shards)} shards)"
+
+def _handle_worker(event, context):
+    bucket = event["bucket"]
+    manifest = read_manifest(event["manifest_key"], bucket)
+    tenant, timestamp, attempt = manifest["tenant"], manifest["timestamp"], manifest.get("attempt")
+    failed = False
+    with bind_context(tenant=tenant):
+        try:
+            run_shard(event["manifest_key"], bucket)
+        except Exception as e:
+            # A falha fica registrada e a cadeia segue: os shards restantes do lote
+            # ainda gravam as suas previsões no banco
+            logger.exception(f"Shard {manifest['shard_index']} do tenant {tenant} falhou: {e}")
+            metrics_client.increment("PipelineFailures", dimensions={"Stage": "predict_shard"},
+                                     properties={"tenant": tenant, "shard": manifest["shard_index"]})
+            record_shard_failure(event["manifest_key"], bucket, str(e))
+            failed = True
+
+    # Libera a vaga do tenant para o próximo shard da cadeia
+    function_name = settings.PREDICT_WORKER_FUNCTION_NAME or getattr(context, "function_name", None)
+    LambdaShardExecutor(function_name).continue_chain(bucket, event.get("next_keys", []))
+
+    # O último worker a terminar monta o arquivo final. Só contam as partes desta
+    # tentativa: partes de uma execução anterior do mesmo lote ficam em outro diretório
+    run_id = manifest.get("run_id", timestamp)
+    parts = completed_parts(tenant, timestamp, bucket, attempt=attempt)
+    if len(parts) >= manifest["shard_count"]:
+        output_key = merge_forecast_parts(tenant, timestamp, bucket, attempt=attempt)
+        _complete_run(tenant, run_id)
+        logger.info(f"Previsões salvas em: s3://{bucket}/{output_key}")
+    elif len(parts) + len(failed_shards(tenant, timestamp, bucket, attempt=attempt)) >= manifest["shard_count"]:
+        # Todos os shards terminaram, alguns com falha: sem merge, e o lote pode ser executado de novo
+        logger.error(f"Lote {run_id} do tenant {tenant} terminou com shards com falha; o merge não foi feito.")
+        _release_run(tenant, run_id)
+
+    # Sem exceção: uma nova tentativa da invocação assíncrona repetiria a cadeia
+    if failed:
+        return {'statusCode': 500, 'body': f"Shard {manifest['shard_index']} falhou."}
+    return {'statusCode': 200, 'body': f"Shard {manifest['shard_index']} processado."}
+
+def _handle_merge(event):
+    output_key = merge_forecast_parts(event["tenant"], event["timestamp"], event["bucket"], attempt=event.get("attempt"))
+    _complete_run(event["tenant"], event.get("run_id", event["timestamp"]))
+    return {'statusCode': 200, 'body': output_key}
+
+def _release_run(tenant, run_id):
+    db = SessionLocal()
+    try:
+        release_pipeline_run(db, tenant, run_id)
+    finally:
+        db.close()
+
+def _complete_run(tenant, run_id):
+    # Lote concluído: um reenvio idêntico não é treinado de novo (ver claim_pipeline_run)
+    db = SessionLocal()
+    try:
+        complete_pipeline_run(db, tenant, run_id)
+    finally:
+        db.close()
@@ -1,71 +1,99 @@
-import boto3
-import io
 import urllib.parse
-import os
-import logging
 from app.processing.validator import validate_csv, PRODUCT_COLUMNS, SALES_COLUMNS
 from app.processing.cleaner import clean_products_data, clean_sales_data
 from app.core.config import settings
+from app.core.database import SessionLocal
+from app.core.crud import get_processed_key, record_processed_file, forget_processed_file
+from app.core.datalake import write_partitioned_dataset, write_dataset_alias, parse_raw_key, dataset_root, dataset_exists
+from app.core.sales_history import load_sales_history
+from app.core.s3 import get_s3_client
+from app.utils.file_utils import IngestBuffer
+from app.utils.tracing import span
+from app.utils.metrics import metrics_client
+from app.utils.logger import get_logger, bind_context, flush_logs
 
 # Configurar logger
-logger = logging.getLogger()
-logger.setLevel(logging.INFO)
-
-s3_client = boto3.client('s3')
+logger = get_logger("lambdas.process_handler")
 
 def handler(event, context):
     """
     Lambda handler para processar arquivos CSV enviados para o S3.
     Acionado por evento S3 Object Created.
     """
+    request_id = getattr(context, "aws_request_id", None)
+    with bind_context(job_id=request_id):
+        return _handle(event, context)
+
+def _handle(event, context):
     bucket = event['Records'][0]['s3']['bucket']['name']
     key = urllib.parse.unquote_plus(event['Records'][0]['s3']['object']['key'], encoding='utf-8')
 
     logger.info(f"Iniciando processamento do arquivo: s3://{bucket}/{key}")
 
     try:
-        # Identificar tipo de arquivo
-        if "products" in key:
-            file_type = "products"
+        # Identificar tenant, tipo de arquivo e caminho de saída (dataset particionado no data lake)
+        # Ex: raw/{tenant}/products_2023...csv -> processed/{tenant}/products/2023.../year=.../part-0.parquet
+        tenant, file_type, timestamp = parse_raw_key(key)
+        if file_type == "products":
             columns = PRODUCT_COLUMNS
             cleaner_func = clean_products_data
-        elif "sales" in key:
-            file_type = "sales"
+        elif file_type == "sales":
             columns = SALES_COLUMNS
             cleaner_func = clean_sales_data
         else:
             logger.warning(f"Tipo de arquivo desconhecido: {key}. Ignorando.")
             return
 
-        # Download do arquivo
-        response = s3_client.get_object(Bucket=bucket, Key=key)
-        file_content = response['Body'].read()
-        file_obj = io.BytesIO(file_content)
+        # Download do arquivo para /tmp, mapeado em memória e compartilhado por hash, validação e limpeza
+        with span("s3_download", dimensions={"FileType": file_type}):
+            response = get_s3_client().get_object(Bucket=bucket, Key=key)
+            file_obj = IngestBuffer.from_stream(response['Body'])
 
-        # Validar
-        is_valid, message = validate_csv(file_obj, columns)
-        if not is_valid:
-            logger.error(f"Arquivo inválido: {message}")
-            # Opcional: Mover para bucket de erro ou notificar
-            return
+        db = SessionLocal()
+        try:
+            # Conteúdo já processado (reenvio, retentativa do S3 ou upload feito pela API):
+            # apenas publica o dataset existente sob este timestamp
+            content_hash = file_obj.sha256()
+            existing_key = get_processed_key(db, content_hash, file_type, tenant=tenant)
+            if existing_key and not dataset_exists(existing_key, bucket=bucket):
+                # Dataset removido do data lake desde o registro: o conteúdo é processado de novo
+                logger.info(f"Dataset s3://{bucket}/{existing_key} não existe mais. Reprocessando.")
+                forget_processed_file(db, content_hash, file_type, tenant=tenant)
+                existing_key = None
+            if existing_key:
+                # O _SUCCESS do alias aciona a Lambda de previsão, que só pula o treino se o
+                # pipeline desses dados já foi concluído (ver claim_pipeline_run)
+                output_key = write_dataset_alias(existing_key, file_type, timestamp, tenant=tenant, bucket=bucket)
+                logger.info(f"Conteúdo já processado em s3://{bucket}/{existing_key} (publicado em {output_key}). Processamento ignorado.")
+                return {
+                    'statusCode': 200,
+                    'body': f"Arquivo {key} já processado: {existing_key}"
+                }
+
+            # Validar
+            is_valid, message = validate_csv(file_obj, columns)
+            if not is_valid:
+                logger.error(f"Arquivo inválido: {message}")
+                # Opcional: Mover para bucket de erro ou notificar
+                return
 
-        # Limpar
-        df = cleaner_func(file_obj)
-        
-        # Converter para Parquet
-        parquet_buffer = io.BytesIO()
-        df.to_parquet(parquet_buffer, index=False)
-        parquet_buffer.seek(0)
+            # Limpar
+            df = cleaner_func(file_obj)
 
-        # Definir caminho de saída
-        # Ex: raw/products_2023...csv -> processed/products_2023...parquet
-        filename = os.path.basename(key)
-        filename_no_ext = os.path.splitext(filename)[0]
-        output_key = f"processed/{filename_no_ext}.parquet"
+            # Carregar as vendas no histórico do banco antes do _SUCCESS: quando a Lambda de
+            # previsão for acionada, os workers já podem ler a série de treino do banco
+            if file_type == "sales" and settings.SALES_HISTORY_ENABLED:
+                load_sales_history(db, df, tenant=tenant, source=dataset_root(file_type, timestamp, tenant))
 
-        # Upload
-        s3_client.upload_fileobj(parquet_buffer, bucket, output_key)
-        logger.info(f"Arquivo processado salvo em: s3://{bucket}/{output_key}")
+            # Converter para Parquet e gravar no S3
+            with span("write_processed_dataset", dimensions={"FileType": file_type}) as s:
+                s.rows_in = len(df)
+                output_key = write_partitioned_dataset(df, file_type, timestamp, tenant=tenant, bucket=bucket)
+            record_processed_file(db, content_hash, file_type, output_key, raw_key=key, tenant=tenant)
+            logger.info(f"Arquivo processado salvo em: s3://{bucket}/{output_key}")
+        finally:
+            db.close()
+            file_obj.close()
 
         return {
             'statusCode': 200,
@@ -75,3 +103,7 @@ def handler(event, context):
     except Exception as e:
         logger.error(f"Erro ao processar arquivo {key}: {e}")
         raise e
+    finally:
+        # A Lambda congela o processo entre invocações: grava métricas e logs do buffer agora
+        metrics_client.flush()
+        flush_logs()
@@ -1,6 +1,10 @@
+import gzip
 import io
+import json
 import os
 from unittest.mock import patch
+import pytest
+from pyarrow.fs import LocalFileSystem
 
 # --- Configuração do Ambiente de Teste ---
 # Usa um banco de dados SQLite em memória compartilhado entre threads
@@ -8,6 +12,10 @@ os.environ['DATABASE_URL'] = "sqlite:///file:memdb1?mode=memory&cache=shared&uri
 
 from fastapi.testclient import TestClient
 from app.api.main import app
+from app.api.routes.upload import wait_for_pipeline_jobs
+from app.api.pagination import encode_cursor
+from app.core.config import settings
+from app.core.forecast_snapshot import ForecastSnapshotStore
 
 # --- Dados de Exemplo ---
 PRODUCTS_CSV = "produto_id,produto_nome,produto_codigo,produto_preco,produto_estoque_atual\n101,Caneta,PRD101,1.50,100.0"
@@ -16,10 +24,22 @@ SALES_CSV = (
     + "\n".join([f"101,Caneta,1.50,15.00,{10 + i},Entregue,{i:02d}/10/2023" for i in range(1, 21)])
 )
 
-def test_full_pipeline_and_get_prediction():
+@pytest.fixture(autouse=True)
+def snapshot_store(tmp_path):
+    # Snapshots de previsões em disco local, em vez do S3
+    store = ForecastSnapshotStore(bucket=str(tmp_path), filesystem=LocalFileSystem())
+    with patch.object(settings, 'S3_BUCKET_NAME', str(tmp_path)), \
+         patch('app.core.forecast_snapshot.get_arrow_filesystem', return_value=LocalFileSystem()), \
+         patch('app.api.routes.upload.get_snapshot_store', return_value=store), \
+         patch('app.api.routes.predictions.get_snapshot_store', return_value=store):
+        yield store
+
+def test_full_pipeline_and_get_prediction(snapshot_store):
     with TestClient(app) as client:
         # 1. Fazer o upload para acionar o pipeline
-        with patch('app.api.routes.upload.upload_fileobj_to_s3', return_value=True):
+        with patch('app.api.routes.upload.upload_fileobj_to_s3', return_value=True), \
+             patch('app.api.routes.upload.write_batch_manifest', side_effect=lambda ts, tenant: f"manifests/{tenant}/{ts}.json"), \
+             patch('app.api.routes.upload.write_partitioned_dataset', side_effect=lambda df, dataset, ts, tenant: f"processed/{tenant}/{dataset}/{ts}"):
             response_upload = client.post(
                 "/upload",
                 files={
@@ -29,14 +49,182 @@ def test_full_pipeline_and_get_prediction():
             )
             assert response_upload.status_code == 200
             assert "processamento foi iniciado" in response_upload.json()["message"]
+            assert response_upload.json()["manifest"].startswith("manifests/default/")
+            # O upload responde sem esperar o pipeline, que roda no scheduler compartilhado
+            assert wait_for_pipeline_jobs(timeout=300)
 
-        # 2. Buscar a previsão gerada no banco de dados
+        # 2. Buscar a previsão gerada (servida pelo snapshot publicado pelo pipeline)
         response_get = client.get("/predictions/101")
         assert response_get.status_code == 200
         prediction_data = response_get.json()
         assert isinstance(prediction_data, list)
         assert len(prediction_data) > 90
         assert "yhat" in prediction_data[0]
+        assert snapshot_store.get("default") is not None
+        assert prediction_data[0]["id"] is None
+
+        # Respostas acima do limite vão comprimidas, com a versão do snapshot na ETag
+        response_gzip = client.get("/predictions/101", headers={"Accept-Encoding": "gzip"})
+        assert response_gzip.headers["content-encoding"] == "gzip"
+        assert response_gzip.json() == prediction_data
+        etag = response_gzip.headers["etag"]
+        assert etag.startswith('W/"default-forecast_')
+        # Previsões de uma empresa não podem ser guardadas por caches compartilhados
+        assert response_gzip.headers["cache-control"].startswith("private, max-age=")
+        assert "X-Tenant-ID" in response_gzip.headers["vary"]
+
+        # Revalidação: a mesma versão responde 304 sem corpo
+        response_cached = client.get("/predictions/101", headers={"If-None-Match": etag})
+        assert response_cached.status_code == 304
+        assert response_cached.content == b""
+        response_since = client.get("/predictions/101", headers={"If-Modified-Since": response_gzip.headers["last-modified"]})
+        assert response_since.status_code == 304
+
+        # O risco de ruptura é calculado junto com as previsões
+        response_risk = client.get("/inventory/at-risk", params={"limit": 5})
+        assert response_risk.status_code == 200
+        assert [r["product_id"] for r in response_risk.json()] == [101]
+
+        # 3. As previsões são da empresa padrão: outra empresa não as enxerga
+        response_other = client.get("/predictions/101", headers={"X-Tenant-ID": "outra-loja"})
+        assert response_other.status_code == 404
+
+def _upload_twice(client, tenant, product_id, name, run_completes):
+    def pipeline(products_df, sales_df, tenant, sales_root, run_id):
+        if run_completes:
+            from app.core.crud import complete_pipeline_run
+            from app.core.database import SessionLocal
+            db = SessionLocal()
+            try:
+                complete_pipeline_run(db, tenant, run_id)
+            finally:
+                db.close()
+
+    with patch('app.api.routes.upload.upload_fileobj_to_s3', return_value=True), \
+         patch('app.api.routes.upload.write_batch_manifest', side_effect=lambda ts, tenant: f"manifests/{tenant}/{ts}.json"), \
+         patch('app.api.routes.upload.write_dataset_alias', side_effect=lambda key, dataset, ts, tenant: key), \
+         patch('app.api.routes.upload.dataset_exists', return_value=True), \
+         patch('app.api.routes.upload.write_partitioned_dataset', side_effect=lambda df, dataset, ts, tenant: f"processed/{tenant}/{dataset}/dup{ts}") as mock_write, \
+         patch('app.api.routes.upload.run_ml_pipeline_task', side_effect=pipeline) as mock_pipeline:
+        files = lambda: {
+            "products_file": ("products.csv", io.BytesIO(f"produto_id,produto_nome,produto_codigo,produto_preco,produto_estoque_atual\n{product_id},{name},PRD{product_id},1.0,5".encode('utf-8')), "text/csv"),
+            "sales_file": ("sales.csv", io.BytesIO(SALES_CSV.replace("101,Caneta", f"{product_id},{name}").encode('utf-8')), "text/csv"),
+        }
+        first = client.post("/upload", headers={"X-Tenant-ID": tenant}, files=files())
+        assert wait_for_pipeline_jobs(timeout=30)
+        second = client.post("/upload", headers={"X-Tenant-ID": tenant}, files=files())
+        assert wait_for_pipeline_jobs(timeout=30)
+    return first, second, mock_write, mock_pipeline
+
+def test_upload_duplicate_content_is_not_reprocessed():
+    with TestClient(app) as client:
+        first, second, mock_write, mock_pipeline = _upload_twice(client, "loja-dup", 7, "Borracha", run_completes=True)
+
+        assert first.status_code == 200 and second.status_code == 200
+        assert mock_write.call_count == 2
+        assert mock_pipeline.call_count == 1
+        assert second.json()["processed_files"] == first.json()["processed_files"]
+
+def test_upload_duplicate_content_retrains_after_failed_run():
+    with TestClient(app) as client:
+        # O primeiro pipeline não concluiu: o reenvio do mesmo conteúdo treina de novo
+        first, second, mock_write, mock_pipeline = _upload_twice(client, "loja-retreino", 9, "Apontador", run_completes=False)
+
+        assert first.status_code == 200 and second.status_code == 200
+        assert mock_write.call_count == 2
+        assert mock_pipeline.call_count == 2
+        assert mock_pipeline.call_args.args[4] == mock_pipeline.call_args_list[0].args[4]
+
+def test_upload_uses_tenant_prefixed_keys():
+    with TestClient(app) as client:
+        with patch('app.api.routes.upload.upload_fileobj_to_s3', return_value=True) as mock_upload, \
+             patch('app.api.routes.upload.write_batch_manifest', side_effect=lambda ts, tenant: f"manifests/{tenant}/{ts}.json"), \
+             patch('app.api.routes.upload.write_partitioned_dataset', side_effect=lambda df, dataset, ts, tenant: f"processed/{tenant}/{dataset}/{ts}"), \
+             patch('app.api.routes.upload.run_ml_pipeline_task') as mock_pipeline:
+            response = client.post(
+                "/upload",
+                headers={"X-Tenant-ID": "loja-a"},
+                files={
+                    "products_file": ("products.csv", io.BytesIO(b"produto_id,produto_nome,produto_codigo,produto_preco,produto_estoque_atual\n8,Regua,PRD8,2.0,5"), "text/csv"),
+                    "sales_file": ("sales.csv", io.BytesIO(SALES_CSV.replace("101,Caneta", "8,Regua").encode('utf-8')), "text/csv"),
+                }
+            )
+            assert wait_for_pipeline_jobs(timeout=30)
+
+        assert response.status_code == 200
+        assert all(key.startswith("raw/loja-a/") for key in response.json()["raw_files"])
+        assert all(key.startswith("processed/loja-a/") for key in response.json()["processed_files"])
+        assert mock_upload.call_args.args[2].startswith("raw/loja-a/sales_")
+        assert mock_pipeline.call_args.args[2] == "loja-a"
+
+        invalid = client.get("/predictions/8", headers={"X-Tenant-ID": "../loja"})
+        assert invalid.status_code == 400
+
+def test_upload_accepts_gzipped_csv():
+    with TestClient(app) as client:
+        uploaded = {}
+        def upload(file_obj, bucket, key):
+            uploaded[key] = file_obj.read()
+            return True
+        with patch('app.api.routes.upload.upload_fileobj_to_s3', side_effect=upload), \
+             patch('app.api.routes.upload.write_batch_manifest', side_effect=lambda ts, tenant: f"manifests/{tenant}/{ts}.json"), \
+             patch('app.api.routes.upload.write_partitioned_dataset', side_effect=lambda df, dataset, ts, tenant: f"processed/{tenant}/{dataset}/{ts}") as mock_write, \
+             patch('app.api.routes.upload.run_ml_pipeline_task'):
+            sales_gz = gzip.compress(SALES_CSV.replace("101,Caneta", "9,Lixa").encode('utf-8'))
+            response = client.post(
+                "/upload",
+                headers={"X-Tenant-ID": "loja-gz"},
+                files={
+                    "products_file": ("products.csv", io.BytesIO(b"produto_id,produto_nome,produto_codigo,produto_preco,produto_estoque_atual\n9,Lixa,PRD9,2.0,5"), "text/csv"),
+                    "sales_file": ("sales.csv.gz", io.BytesIO(sales_gz), "application/gzip"),
+                }
+            )
+            assert wait_for_pipeline_jobs(timeout=30)
+
+        assert response.status_code == 200
+        # O arquivo bruto vai para o S3 comprimido, como foi recebido
+        raw_sales = response.json()["raw_files"][1]
+        assert raw_sales.endswith(".csv.gz")
+        assert uploaded[raw_sales] == sales_gz
+        sales_df = next(call.args[0] for call in mock_write.call_args_list if call.args[1] == "sales")
+        assert len(sales_df) == 20
+
+def test_prediction_from_database_supports_conditional_requests():
+    with TestClient(app) as client:
+        seed_catalog("sem-snapshot")
+        headers = {"X-Tenant-ID": "sem-snapshot"}
+        response = client.get("/predictions/1", headers=headers)
+        assert response.status_code == 200
+        # Sem snapshot, a ETag vem do conteúdo e a resposta é sempre revalidada
+        assert response.headers["cache-control"] == "no-cache"
+        assert "X-Tenant-ID" in response.headers["vary"]
+        cached = client.get("/predictions/1", headers={**headers, "If-None-Match": response.headers["etag"]})
+        assert cached.status_code == 304
+
+        # A ETag de uma empresa não valida a cópia de outra
+        seed_catalog("sem-snapshot-b")
+        other = client.get("/predictions/1", headers={"X-Tenant-ID": "sem-snapshot-b", "If-None-Match": response.headers["etag"]})
+        assert other.status_code == 200
+
+def test_prediction_missing_from_snapshot_falls_back_to_database(snapshot_store, tmp_path):
+    from app.core.forecast_snapshot import publish_forecast_snapshot
+    from app.core.parquet import to_arrow_table
+    import pandas as pd
+    seed_catalog("snapshot-parcial")
+    forecast = pd.DataFrame({
+        "ds": pd.date_range("2024-01-01", periods=2, freq="D"), "yhat": [2.0, 2.0],
+        "yhat_lower": [1.0, 1.0], "yhat_upper": [3.0, 3.0], "product_id": [1, 1],
+    })
+    publish_forecast_snapshot(to_arrow_table(forecast, "forecast"), "snapshot-parcial", "20240101",
+                              bucket=str(tmp_path), filesystem=LocalFileSystem())
+    with TestClient(app) as client:
+        headers = {"X-Tenant-ID": "snapshot-parcial"}
+        assert client.get("/predictions/1", headers=headers).json()[0]["yhat"] == 2.0
+        # O produto 2 não está no snapshot: as previsões vêm do banco
+        response = client.get("/predictions/2", headers=headers)
+        assert response.status_code == 200
+        assert len(response.json()) == 3
+        assert response.headers["cache-control"] == "no-cache"
 
 def test_get_prediction_not_found():
     with TestClient(app) as client:
@@ -65,3 +253,76 @@ def test_upload_s3_failure():
                 }
             )
             assert response.status_code == 500
+
+def test_metrics_endpoint_exposes_pipeline_stages():
+    with TestClient(app) as client:
+        client.post(
+            "/upload",
+            files={
+                "products_file": ("products.csv", io.BytesIO(b"produto_id,produto_nome\n1,Caneta"), "text/csv"),
+                "sales_file": ("sales.csv", io.BytesIO(SALES_CSV.encode('utf-8')), "text/csv"),
+            }
+        )
+        response = client.get("/metrics")
+        assert response.status_code == 200
+        stages = response.json()["stages"]
+        assert "validate_csv" in stages
+        assert stages["validate_csv"]["count"] >= 1
+
+def seed_catalog(tenant):
+    from app.core.database import SessionLocal, Product, Prediction
+    from datetime import datetime, timedelta
+    db = SessionLocal()
+    try:
+        for pid in range(1, 6):
+            db.add(Product(tenant_id=tenant, id=pid, name=f"Item {pid}", code=f"{'A' if pid % 2 else 'B'}-{pid}", price=1.0, stock=10.0))
+            for day in range(3):
+                db.add(Prediction(tenant_id=tenant, product_id=pid, ds=datetime(2024, 1, 1) + timedelta(days=day), yhat=1.0, yhat_lower=0.5, yhat_upper=1.5))
+        db.commit()
+    finally:
+        db.close()
+
+def test_list_products_with_cursor_and_prefix():
+    with TestClient(app) as client:
+        seed_catalog("catalogo")
+        headers = {"X-Tenant-ID": "catalogo"}
+
+        first = client.get("/products", params={"limit": 2}, headers=headers).json()
+        assert [p["id"] for p in first["items"]] == [1, 2]
+        second = client.get("/products", params={"limit": 2, "cursor": first["next_cursor"]}, headers=headers).json()
+        assert [p["id"] for p in second["items"]] == [3, 4]
+
+        filtered = client.get("/products", params={"code_prefix": "B-"}, headers=headers).json()
+        assert [p["id"] for p in filtered["items"]] == [2, 4]
+        assert filtered["next_cursor"] is None
+
+        assert client.get("/products", params={"cursor": "nao-e-um-cursor"}, headers=headers).status_code == 400
+        # JSON válido com uma chave que não é um ID de produto
+        for values in (["x"], [None]):
+            invalid = client.get("/products", params={"cursor": encode_cursor(*values)}, headers=headers)
+            assert invalid.status_code == 400
+            assert invalid.json()["detail"] == "Cursor de paginação inválido."
+
+def test_list_predictions_pages_and_streams():
+    with TestClient(app) as client:
+        seed_catalog("previsoes")
+        headers = {"X-Tenant-ID": "previsoes"}
+
+        # Janela de datas: 2 previsões por produto; páginas de 3 atravessam os produtos
+        params = {"limit": 3, "start": "2024-01-02T00:00:00"}
+        keys, cursor = [], None
+        while True:
+            page = client.get("/predictions", params={**params, **({"cursor": cursor} if cursor else {})}, headers=headers).json()
+            keys += [(p["product_id"], p["ds"][:10]) for p in page["items"]]
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+        assert keys == [(pid, day) for pid in range(1, 6) for day in ("2024-01-02", "2024-01-03")]
+
+        # NDJSON: as mesmas linhas, em uma única resposta transmitida
+        response = client.get("/predictions", params={**params, "format": "ndjson"}, headers={**headers, "Accept-Encoding": "zstd"})
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        # A transmissão é comprimida pedaço a pedaço
+        assert response.headers["content-encoding"] == "zstd"
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert [(p["product_id"], p["ds"][:10]) for p in lines] == keys
@@ -0,0 +1,66 @@
+import io
+from app.processing.validator import validate_csv, SALES_COLUMNS, PRODUCT_COLUMNS
+from app.processing.cleaner import clean_sales_data
+from benchmarks.synthetic_data import generate_products_df, generate_sales_df, to_csv_bytes
+from benchmarks.pipeline_benchmark import compare_with_baseline, measure_stage
+from benchmarks.parquet_benchmark import run_parquet_benchmark, summarize
+from benchmarks.csv_benchmark import run_csv_benchmark
+
+def test_synthetic_data_matches_expected_columns():
+    products_csv = to_csv_bytes(generate_products_df(5))
+    sales_csv = to_csv_bytes(generate_sales_df(5, n_days=10, orders_per_day=20))
+
+    assert validate_csv(io.BytesIO(products_csv), PRODUCT_COLUMNS)[0] is True
+    assert validate_csv(io.BytesIO(sales_csv), SALES_COLUMNS)[0] is True
+
+def test_synthetic_sales_scale_and_cancellations():
+    sales_df = generate_sales_df(10, n_days=30, orders_per_day=100, cancellation_rate=0.2, seed=1)
+
+    assert len(sales_df) == 3000
+    assert sales_df['produto_id'].between(1, 10).all()
+    cancelled = (sales_df['situacao'] == 'Cancelado').mean()
+    assert 0.15 < cancelled < 0.25
+
+    cleaned_df = clean_sales_data(io.BytesIO(to_csv_bytes(sales_df)))
+    assert len(cleaned_df) == (sales_df['situacao'] != 'Cancelado').sum()
+
+def test_measure_stage_records_time_and_memory():
+    result, record = measure_stage("soma", lambda: (list(range(1000)),), sum, repeat=2, rows_in=1000)
+
+    assert result == sum(range(1000))
+    assert record["stage"] == "soma"
+    assert record["wall_seconds"] >= 0
+    assert record["peak_memory_bytes"] >= 0
+
+def test_compare_with_baseline_flags_regressions():
+    baseline = {"stages": [
+        {"stage": "clean_sales_data", "wall_seconds": 1.0, "peak_memory_bytes": 100 * 1024 * 1024},
+        {"stage": "validate_sales", "wall_seconds": 0.001, "peak_memory_bytes": 1000},
+    ]}
+    results = {"stages": [
+        {"stage": "clean_sales_data", "wall_seconds": 2.0, "peak_memory_bytes": 100 * 1024 * 1024},
+        # Razão alta, mas diferença absoluta desprezível: não é regressão
+        {"stage": "validate_sales", "wall_seconds": 0.002, "peak_memory_bytes": 3000},
+    ]}
+
+    regressions = compare_with_baseline(results, baseline, tolerance=0.25)
+
+    assert len(regressions) == 1
+    assert regressions[0]["stage"] == "clean_sales_data"
+    assert regressions[0]["metric"] == "wall_seconds"
+
+def test_parquet_benchmark_tuned_writer_is_smaller():
+    results = run_parquet_benchmark({"skus": 10, "days": 60, "orders_per_day": 100, "repeat": 1, "seed": 1})
+
+    assert len(results["results"]) == 4
+    sales = next(s for s in summarize(results) if s["dataset"] == "sales")
+    assert sales["size_ratio"] > 1.5
+
+def test_csv_benchmark_schema_readers_use_less_memory():
+    results = run_csv_benchmark({"skus": 10, "days": 30, "orders_per_day": 100, "repeat": 1, "seed": 1})
+
+    by_reader = {r["reader"]: r for r in results["results"]}
+    assert by_reader["untyped"]["rows"] == by_reader["schema_pyarrow"]["rows"] == 3000
+    assert by_reader["schema_c"]["frame_bytes"] < by_reader["untyped"]["frame_bytes"]
+    assert by_reader["schema_pyarrow"]["frame_bytes"] < by_reader["untyped"]["frame_bytes"]
+    assert [r["rows"] for r in results["date_results"]] == [3000] * 3
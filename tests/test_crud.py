@@ -3,7 +3,12 @@ import pandas as pd
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from app.core.database import Base, Product, Prediction
-from app.core.crud import save_products_to_db, save_predictions_to_db
+from app.core.crud import (
+    save_products_to_db, save_predictions_to_db, claim_pipeline_run, release_pipeline_run,
+    complete_pipeline_run, pipeline_run_completed,
+    get_product_stock, save_stock_risk, get_stock_at_risk,
+)
+from app.ml.inventory import compute_stock_risk
 
 # --- Configuração do Banco de Dados de Teste ---
 SQLALCHEMY_DATABASE_URL = "sqlite:///:memory:"
@@ -48,3 +53,73 @@ def test_save_predictions_to_db(db_session):
     db_predictions = db_session.query(Prediction).filter(Prediction.product_id == 101).all()
     assert len(db_predictions) == 2
     assert db_predictions[0].yhat == 10.5
+
+def test_claim_pipeline_run_only_once(db_session):
+    assert claim_pipeline_run(db_session, "default", "20231120") is True
+    assert claim_pipeline_run(db_session, "default", "20231120") is False
+    # Outro lote do mesmo tenant pode ser executado
+    assert claim_pipeline_run(db_session, "default", "20231121") is True
+
+    release_pipeline_run(db_session, "default", "20231120")
+    assert claim_pipeline_run(db_session, "default", "20231120") is True
+
+def test_claim_pipeline_run_takes_over_stale_runs(db_session):
+    from app.core.config import settings
+    from app.core.database import PipelineRun
+    assert claim_pipeline_run(db_session, "default", "20231120") is True
+    assert pipeline_run_completed(db_session, "default", "20231120") is False
+
+    # Execução que passou do timeout sem concluir (ex.: Lambda interrompida) pode ser retomada
+    run = db_session.query(PipelineRun).filter_by(tenant="default", batch_timestamp="20231120").one()
+    run.started_at = run.started_at - pd.Timedelta(seconds=settings.PIPELINE_RUN_TIMEOUT_SECONDS + 1)
+    db_session.commit()
+    assert claim_pipeline_run(db_session, "default", "20231120") is True
+
+    complete_pipeline_run(db_session, "default", "20231120")
+    assert pipeline_run_completed(db_session, "default", "20231120") is True
+    assert claim_pipeline_run(db_session, "default", "20231120") is False
+
+def test_products_and_predictions_are_isolated_by_tenant(db_session):
+    products_df = pd.DataFrame({
+        'produto_id': [1], 'produto_nome': ['Caneta'], 'produto_codigo': ['PRD1'],
+        'produto_preco': [10.0], 'produto_estoque_atual': [100.0],
+    })
+    forecast_df = pd.DataFrame({
+        'ds': pd.to_datetime(['2023-01-01']), 'yhat': [1.0], 'yhat_lower': [0.5], 'yhat_upper': [1.5],
+    })
+    # O mesmo ID de produto em duas empresas
+    for tenant in ("loja-a", "loja-b"):
+        save_products_to_db(db_session, products_df, tenant=tenant)
+        save_predictions_to_db(db_session, 1, forecast_df, tenant=tenant)
+
+    # Regravar as previsões de uma empresa não apaga as da outra
+    save_predictions_to_db(db_session, 1, forecast_df.assign(yhat=[2.0]), tenant="loja-a")
+
+    assert db_session.query(Product).count() == 2
+    by_tenant = {p.tenant_id: p.yhat for p in db_session.query(Prediction).all()}
+    assert by_tenant == {"loja-a": 2.0, "loja-b": 1.0}
+
+def test_stock_risk_is_replaced_and_ranked(db_session):
+    products_df = pd.DataFrame({
+        'produto_id': [1, 2, 3], 'produto_nome': ['A', 'B', 'C'], 'produto_codigo': ['P1', 'P2', 'P3'],
+        'produto_preco': [1.0, 1.0, 1.0], 'produto_estoque_atual': [5.0, 50.0, 20.0],
+    })
+    save_products_to_db(db_session, products_df, tenant="loja")
+    # Um novo upload atualiza o estoque dos produtos existentes
+    save_products_to_db(db_session, products_df.assign(produto_estoque_atual=[5.0, 50.0, 2.0]), tenant="loja")
+    stock = get_product_stock(db_session, [1, 2, 3], tenant="loja")
+    assert stock.to_dict() == {1: 5.0, 2: 50.0, 3: 2.0}
+
+    forecast = pd.DataFrame({
+        'product_id': [pid for pid in (1, 2, 3) for _ in range(10)],
+        'ds': list(pd.date_range('2024-01-01', periods=10)) * 3,
+        'yhat': [1.0] * 30, 'yhat_upper': [1.5] * 30,
+    })
+    save_stock_risk(db_session, compute_stock_risk(forecast, stock, horizon_days=10), tenant="loja")
+    save_stock_risk(db_session, compute_stock_risk(forecast, stock, horizon_days=10), tenant="loja")
+
+    at_risk = get_stock_at_risk(db_session, "loja", limit=2)
+    assert [(r.product_id, r.days_of_cover) for r in at_risk] == [(3, 2.0), (1, 5.0)]
+    assert at_risk[0].stockout_date is not None
+    assert [r.product_id for r in get_stock_at_risk(db_session, "loja", max_days_of_cover=3)] == [3]
+    assert get_stock_at_risk(db_session, "outra-loja") == []
@@ -0,0 +1,99 @@
+import datetime
+import os
+import pandas as pd
+import pytest
+from pyarrow.fs import LocalFileSystem
+from app.core.datalake import (
+    write_partitioned_dataset, read_partitioned_dataset, product_filter, date_filter,
+    write_dataset_alias, resolve_dataset_root, SUCCESS_MARKER,
+    raw_key, parse_raw_key, validate_tenant,
+)
+
+@pytest.fixture
+def sales_df():
+    return pd.DataFrame({
+        'produto_id': [1, 2, 17, 1, 2],
+        'produto_nome': ['Caneta', 'Lapis', 'Borracha', 'Caneta', 'Lapis'],
+        'valor_unitario': [1.5, 0.8, 2.0, 1.5, 0.8],
+        'valor_total_pedido': [15.0, 4.0, 4.0, 3.0, 1.6],
+        'quantidade': [10, 5, 2, 2, 2],
+        'situacao': ['Entregue'] * 5,
+        'data_pedido': pd.to_datetime(['2023-09-30', '2023-10-01', '2023-10-02', '2023-11-15', '2024-01-03']),
+    })
+
+def test_write_partitioned_dataset_layout(tmp_path, sales_df):
+    root = write_partitioned_dataset(
+        sales_df, "sales", "20231120", tenant="loja-a", bucket=str(tmp_path), filesystem=LocalFileSystem()
+    )
+
+    assert root == "processed/loja-a/sales/20231120"
+    base = tmp_path / root
+    assert (base / SUCCESS_MARKER).exists()
+    # produto 1 e 17 caem no mesmo bucket (17 % 16 == 1)
+    assert (base / "year=2023" / "month=10" / "product_bucket=1").is_dir()
+    assert (base / "year=2024" / "month=1" / "product_bucket=2").is_dir()
+    files = [f for _, _, fs in os.walk(base) for f in fs if f.endswith(".parquet")]
+    assert len(files) == 5
+
+def test_read_partitioned_dataset_with_pushdown(tmp_path, sales_df):
+    fs = LocalFileSystem()
+    root = write_partitioned_dataset(sales_df, "sales", "20231120", bucket=str(tmp_path), filesystem=fs)
+
+    df = read_partitioned_dataset(
+        root, "sales",
+        columns=['produto_id', 'data_pedido', 'quantidade'],
+        filter=product_filter([1]) & date_filter(datetime.date(2023, 10, 1), datetime.date(2023, 12, 31)),
+        bucket=str(tmp_path), filesystem=fs,
+    )
+
+    assert list(df.columns) == ['produto_id', 'data_pedido', 'quantidade']
+    assert df['produto_id'].tolist() == [1]
+    assert df['quantidade'].tolist() == [2]
+
+    # Sem data final: janela de treino a partir de `start`
+    recent = read_partitioned_dataset(root, "sales", filter=date_filter(datetime.date(2023, 12, 1)),
+                                      bucket=str(tmp_path), filesystem=fs)
+    assert (recent['data_pedido'] >= pd.Timestamp("2023-12-01")).all()
+    assert len(recent) == (sales_df['data_pedido'] >= pd.Timestamp("2023-12-01")).sum()
+
+def test_read_partitioned_dataset_drops_partition_columns(tmp_path, sales_df):
+    fs = LocalFileSystem()
+    root = write_partitioned_dataset(sales_df, "sales", "20231120", bucket=str(tmp_path), filesystem=fs)
+
+    df = read_partitioned_dataset(root, "sales", bucket=str(tmp_path), filesystem=fs)
+
+    assert len(df) == len(sales_df)
+    assert not {'year', 'month', 'product_bucket'} & set(df.columns)
+    assert sorted(df['produto_id'].tolist()) == sorted(sales_df['produto_id'].tolist())
+
+def test_dataset_alias_points_to_existing_data(tmp_path, sales_df):
+    fs = LocalFileSystem()
+    root = write_partitioned_dataset(sales_df, "sales", "20231120", bucket=str(tmp_path), filesystem=fs)
+
+    alias_root = write_dataset_alias(root, "sales", "20231121", bucket=str(tmp_path), filesystem=fs)
+
+    assert alias_root == "processed/default/sales/20231121"
+    assert (tmp_path / alias_root / SUCCESS_MARKER).exists()
+    assert not [f for f in os.listdir(tmp_path / alias_root) if f.endswith(".parquet")]
+    assert resolve_dataset_root(alias_root, bucket=str(tmp_path), filesystem=fs) == root
+    assert resolve_dataset_root(root, bucket=str(tmp_path), filesystem=fs) == root
+    # Um dataset já completo não é substituído pelo alias
+    assert write_dataset_alias("processed/default/sales/x", "sales", "20231120", bucket=str(tmp_path), filesystem=fs) == root
+    assert resolve_dataset_root(root, bucket=str(tmp_path), filesystem=fs) == root
+
+def test_raw_keys_are_tenant_prefixed():
+    key = raw_key("sales", "20231120", "loja-sales")
+    assert key == "raw/loja-sales/sales_20231120.csv"
+    # O tipo vem do nome do arquivo, mesmo com "sales" no nome do tenant
+    assert parse_raw_key(raw_key("products", "20231120", "loja-sales")) == ("loja-sales", "products", "20231120")
+    assert parse_raw_key(key) == ("loja-sales", "sales", "20231120")
+    # Chaves antigas, sem tenant
+    assert parse_raw_key("raw/products_20231120.csv") == ("default", "products", "20231120")
+    # Arquivos comprimidos mantêm a extensão do formato
+    gz_key = raw_key("sales", "20231120", "loja-a", compression="gzip")
+    assert gz_key == "raw/loja-a/sales_20231120.csv.gz"
+    assert parse_raw_key(gz_key) == ("loja-a", "sales", "20231120")
+
+    assert validate_tenant(None) == "default"
+    with pytest.raises(ValueError):
+        validate_tenant("../outra")
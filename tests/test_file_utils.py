@@ -0,0 +1,90 @@
+import gzip
+import io
+import tempfile
+import zipfile
+import pandas as pd
+import pytest
+from app.utils.file_utils import IngestBuffer
+from app.processing.validator import validate_csv, PRODUCT_COLUMNS
+from app.processing.cleaner import clean_products_data
+
+def zipped(content: bytes) -> bytes:
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("LEIAME.txt", "exportação do ERP")
+        zf.writestr("produtos.csv", content)
+    return archive.getvalue()
+
+CSV_CONTENT = (
+    "produto_id,produto_nome,produto_codigo,produto_preco,produto_estoque_atual\n"
+    "1,Caneta,PRD1,1.50,100.0\n"
+    "2,Lapis,PRD2,0.80,50.0\n"
+).encode("utf-8")
+
+def test_ingest_buffer_shares_upload_memory_and_cursors_are_independent():
+    """
+    Testa que o buffer expõe o BytesIO sem cópia e que cada estágio lê do início.
+    """
+    spooled = tempfile.SpooledTemporaryFile(max_size=1024 * 1024)
+    spooled.write(CSV_CONTENT)
+    spooled.seek(10)
+
+    with IngestBuffer.from_file(spooled) as buffer:
+        # Ainda em memória: nada foi gravado em disco e o buffer é o próprio BytesIO
+        assert spooled._rolled is False
+        with pytest.raises(BufferError):
+            spooled._file.truncate(0)
+
+        first = buffer.cursor()
+        first.read(5)
+        first.close()
+        assert validate_csv(buffer, PRODUCT_COLUMNS)[0] is True
+        assert buffer.cursor().read() == CSV_CONTENT
+        assert len(clean_products_data(buffer)) == 2
+
+    # O arquivo de origem continua aberto e utilizável
+    spooled.seek(0)
+    assert spooled.read() == CSV_CONTENT
+
+def test_ingest_buffer_maps_files_on_disk():
+    """
+    Testa o mapeamento em memória de arquivos em disco e de streams copiados para /tmp.
+    """
+    with tempfile.TemporaryFile() as f:
+        f.write(CSV_CONTENT)
+        with IngestBuffer.from_file(f) as buffer:
+            assert buffer.size == len(CSV_CONTENT)
+            assert pd.read_csv(buffer.cursor())['produto_id'].tolist() == [1, 2]
+
+    with IngestBuffer.from_stream(io.BytesIO(CSV_CONTENT), chunk_size=16) as buffer:
+        assert bytes(buffer.view) == CSV_CONTENT
+        assert len(buffer.sha256()) == 64
+
+    with IngestBuffer.from_stream(io.BytesIO(b"")) as buffer:
+        assert buffer.size == 0
+        assert buffer.cursor().read() == b""
+
+@pytest.mark.parametrize("compression,compress", [
+    ("gzip", gzip.compress),
+    ("zip", zipped),
+    ("zstd", lambda content: pytest.importorskip("zstandard").ZstdCompressor().compress(content)),
+])
+def test_compressed_csv_is_decompressed_while_parsing(compression, compress):
+    """
+    Testa que validação e limpeza leem CSVs comprimidos, e que os bytes brutos continuam comprimidos.
+    """
+    data = compress(CSV_CONTENT)
+    with IngestBuffer.from_bytes(data) as buffer:
+        assert buffer.compression == compression
+        assert buffer.cursor().read() == data
+        assert validate_csv(buffer, PRODUCT_COLUMNS)[0] is True
+        assert clean_products_data(buffer)["produto_id"].tolist() == [1, 2]
+
+        # Voltar ao início reabre a descompressão
+        with buffer.reader() as reader:
+            reader.read(10)
+            reader.seek(0)
+            assert reader.read() == CSV_CONTENT
+
+    with IngestBuffer.from_bytes(CSV_CONTENT) as buffer:
+        assert buffer.compression is None
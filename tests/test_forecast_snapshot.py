@@ -0,0 +1,67 @@
+import pandas as pd
+from pyarrow.fs import LocalFileSystem, SubTreeFileSystem
+from app.core.parquet import to_arrow_table
+from app.core.forecast_snapshot import publish_forecast_snapshot, read_current_pointer, ForecastSnapshotStore
+
+def _forecast(product_ids, start="2024-01-01", days=3):
+    return to_arrow_table(pd.DataFrame({
+        "ds": list(pd.date_range(start, periods=days, freq="D")) * len(product_ids),
+        "yhat": [1.5] * days * len(product_ids),
+        "yhat_lower": [1.0] * days * len(product_ids),
+        "yhat_upper": [2.0] * days * len(product_ids),
+        "product_id": [pid for pid in product_ids for _ in range(days)],
+    }), "forecast")
+
+def test_snapshot_lookup_and_hot_swap(tmp_path):
+    fs = LocalFileSystem()
+    bucket = str(tmp_path)
+    store = ForecastSnapshotStore(bucket=bucket, filesystem=fs, refresh_seconds=3600)
+
+    # Sem snapshot publicado a API consulta o banco
+    assert store.lookup("loja", 1) == (False, None)
+
+    # Produtos fora de ordem: o snapshot é ordenado e indexado por produto
+    assert publish_forecast_snapshot(_forecast([30, 2, 7]), "loja", "20240101", bucket, fs) == "forecast_20240101"
+    store.invalidate("loja")
+    snapshot = store.get("loja")
+    assert len(snapshot) == 3
+    found, rows = store.lookup("loja", 7)
+    assert found and [r["product_id"] for r in rows] == [7, 7, 7]
+    assert rows[0]["ds"] == pd.Timestamp("2024-01-01") and rows[0]["yhat"] == 1.5
+    assert store.lookup("loja", 5) == (True, None)
+
+    # Um novo snapshot substitui o anterior; um mais antigo não é publicado
+    publish_forecast_snapshot(_forecast([5], start="2024-02-01"), "loja", "20240201", bucket, fs)
+    assert publish_forecast_snapshot(_forecast([9]), "loja", "20231231", bucket, fs) is None
+    assert read_current_pointer("loja", bucket, fs)["snapshot"] == "forecast_20240201"
+
+    # Dentro do intervalo de refresh o snapshot carregado continua em uso
+    assert store.get("loja") is snapshot
+    store.invalidate("loja")
+    assert store.lookup("loja", 7) == (True, None)
+    assert store.lookup("loja", 5)[1][0]["ds"] == pd.Timestamp("2024-02-01")
+    # O snapshot anterior continua válido para quem ainda o usa
+    assert snapshot.lookup(30).num_rows == 3
+
+def test_snapshots_are_ordered_by_timestamp_across_formats(tmp_path):
+    fs = LocalFileSystem()
+    bucket = str(tmp_path)
+    # job_id da API (com microssegundos) seguido de um lote da Lambda, mais novo
+    publish_forecast_snapshot(_forecast([1]), "loja", "20240101120000123456", bucket, fs)
+    assert publish_forecast_snapshot(_forecast([1]), "loja", "20240101130000", bucket, fs) == "forecast_20240101130000"
+    # Um lote mais antigo que o job_id publicado não é publicado
+    assert publish_forecast_snapshot(_forecast([1]), "loja", "20240101110000", bucket, fs) is None
+    assert publish_forecast_snapshot(_forecast([1]), "loja", "20240101130000000001", bucket, fs) == "forecast_20240101130000000001"
+    assert read_current_pointer("loja", bucket, fs)["snapshot"] == "forecast_20240101130000000001"
+
+def test_snapshot_is_downloaded_to_local_cache(tmp_path):
+    # Fora do LocalFileSystem (ex: S3) o store baixa o snapshot antes de mapeá-lo
+    fs = SubTreeFileSystem(str(tmp_path), LocalFileSystem())
+    cache_dir = tmp_path / "cache"
+    publish_forecast_snapshot(_forecast([1, 2]), "loja", "20240101", "bucket", fs)
+    store = ForecastSnapshotStore(bucket="bucket", filesystem=fs, cache_dir=str(cache_dir))
+
+    assert store.lookup("loja", 2)[1][0]["product_id"] == 2
+    assert sorted(p.name for p in (cache_dir / "loja").iterdir()) == [
+        "forecast_20240101.arrow", "forecast_20240101.index.arrow",
+    ]
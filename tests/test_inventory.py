@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+import pytest
+from app.ml.inventory import compute_stock_risk, assess_stock_risk
+
+def _forecast(product_id, daily, days=10, upper_margin=0.0, history_days=0):
+    dates = pd.date_range("2024-01-01", periods=history_days + days, freq="D")
+    return pd.DataFrame({
+        "product_id": product_id,
+        "ds": dates,
+        "yhat": [daily] * len(dates),
+        "yhat_lower": [daily] * len(dates),
+        "yhat_upper": [daily + upper_margin] * len(dates),
+    })
+
+def test_stock_risk_days_of_cover_and_stockout_date():
+    # Histórico (5 dias) antes do horizonte de 10 dias; produtos fora de ordem
+    forecast = pd.concat([_forecast(2, 4.0, history_days=5), _forecast(1, 10.0, history_days=5)])
+    stock = pd.Series({1: 25.0, 2: 1000.0})
+
+    risk = compute_stock_risk(forecast, stock, horizon_days=10, lead_time_days=3).set_index("product_id")
+
+    # 25 unidades a 10 por dia: 2 dias completos e metade do terceiro
+    assert risk.loc[1, "days_of_cover"] == pytest.approx(2.5)
+    assert risk.loc[1, "stockout_date"] == pd.Timestamp("2024-01-08")
+    assert risk.loc[1, "lead_time_demand"] == pytest.approx(30.0)
+    # Sem incerteza, o ponto de pedido é a demanda do lead time
+    assert risk.loc[1, "reorder_quantity"] == 5.0
+    # O estoque cobre todo o horizonte
+    assert risk.loc[2, "days_of_cover"] == 10
+    assert pd.isna(risk.loc[2, "stockout_date"])
+    assert risk.loc[2, "reorder_quantity"] == 0.0
+
+def test_stock_risk_safety_stock_grows_with_service_level():
+    forecast = _forecast(1, 10.0, upper_margin=5.0)
+    stock = pd.Series({1: 0.0})
+
+    low = compute_stock_risk(forecast, stock, horizon_days=10, lead_time_days=4, service_level=0.8).iloc[0]
+    high = compute_stock_risk(forecast, stock, horizon_days=10, lead_time_days=4, service_level=0.99).iloc[0]
+
+    assert 0 < low["safety_stock"] < high["safety_stock"]
+    assert high["reorder_point"] == pytest.approx(40.0 + high["safety_stock"])
+    # Produto sem estoque informado: ruptura no primeiro dia
+    assert compute_stock_risk(forecast, pd.Series(dtype=float)).iloc[0]["days_of_cover"] == 0
+
+def test_assess_stock_risk_adds_simulation_summary():
+    forecast = pd.concat([_forecast(1, 10.0), _forecast(2, 1.0)])
+    stock = pd.Series({1: 25.0, 2: 100.0})
+
+    assert "stockout_probability" not in assess_stock_risk(forecast, stock).columns
+
+    # Amostras apenas do produto 1: o produto 2 fica sem resumo da simulação
+    risk = assess_stock_risk(forecast, stock, {1: np.full((10, 50), 10.0, np.float32)}).set_index("product_id")
+    assert risk.loc[1, "stockout_probability"] == 1.0
+    assert risk.loc[1, "expected_lost_sales"] == pytest.approx(75.0)
+    assert pd.isna(risk.loc[2, "stockout_probability"])
+
+def test_assess_stock_risk_uses_the_forecast_horizon():
+    # Horizonte de 14 dias após 30 dias de histórico: a projeção não inclui datas passadas
+    forecast = pd.concat([_forecast(1, 0.0, days=30), _forecast(1, 10.0, days=14)])
+    forecast["ds"] = pd.date_range("2024-01-01", periods=44, freq="D")
+    stock = pd.Series({1: 1000.0})
+
+    risk = assess_stock_risk(forecast, stock, horizon_days=14).iloc[0]
+
+    assert risk["days_of_cover"] == 14
+    assert risk["lead_time_demand"] == pytest.approx(70.0)
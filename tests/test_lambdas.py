@@ -3,8 +3,24 @@ from unittest.mock import MagicMock, patch
 import pandas as pd
 import io
 import json
+from contextlib import ExitStack
 from lambdas.process_handler.main import handler as process_handler
 from lambdas.predict_handler.main import handler as predict_handler
+from app.core.datalake import write_partitioned_dataset
+from app.core.manifest import write_batch_manifest
+from pyarrow.fs import LocalFileSystem
+
+def local_lake(filesystem):
+    """
+    Substitui o S3 do data lake por um sistema de arquivos local.
+    """
+    stack = ExitStack()
+    for module in ("app.core.datalake", "app.core.manifest", "app.ml.sharding"):
+        stack.enter_context(patch(f"{module}.get_arrow_filesystem", return_value=filesystem))
+    return stack
+
+def success_event(bucket, *keys):
+    return {"Records": [{"s3": {"bucket": {"name": bucket}, "object": {"key": key}}} for key in keys]}
 
 @pytest.fixture
 def mock_s3_event():
@@ -19,9 +35,14 @@ def mock_s3_event():
         ]
     }
 
-@patch("lambdas.process_handler.main.s3_client")
-def test_process_handler_products(mock_s3, mock_s3_event):
+@patch("lambdas.process_handler.main.SessionLocal")
+@patch("lambdas.process_handler.main.record_processed_file")
+@patch("lambdas.process_handler.main.get_processed_key", return_value=None)
+@patch("lambdas.process_handler.main.write_partitioned_dataset")
+@patch("lambdas.process_handler.main.get_s3_client")
+def test_process_handler_products(mock_get_s3, mock_write_dataset, mock_get_key, mock_record, mock_db, mock_s3_event):
     # Mock S3 get_object
+    mock_s3 = mock_get_s3.return_value
     csv_content = "produto_id,produto_nome,produto_codigo,produto_preco,produto_estoque_atual\n1,Produto A,PRD1,10.0,100.0"
     mock_s3.get_object.return_value = {
         "Body": io.BytesIO(csv_content.encode("utf-8"))
@@ -32,34 +53,45 @@ def test_process_handler_products(mock_s3, mock_s3_event):
 
     # Assertions
     assert response["statusCode"] == 200
-    mock_s3.upload_fileobj.assert_called_once()
-    args, _ = mock_s3.upload_fileobj.call_args
-    bucket, key = args[1], args[2]
-    assert bucket == "smart-stock-bucket"
-    assert key == "processed/products_20231120.parquet"
+    mock_write_dataset.assert_called_once()
+    args, kwargs = mock_write_dataset.call_args
+    df, dataset, timestamp = args
+    assert len(df) == 1
+    assert dataset == "products"
+    assert timestamp == "20231120"
+    assert kwargs["bucket"] == "smart-stock-bucket"
+    # Chaves antigas, sem o tenant, pertencem ao tenant padrão
+    assert kwargs["tenant"] == "default"
+    # O conteúdo processado fica registrado no ledger
+    mock_record.assert_called_once()
+    assert mock_record.call_args.args[2:] == ("products", mock_write_dataset.return_value)
+
+@patch("lambdas.process_handler.main.SessionLocal")
+@patch("lambdas.process_handler.main.dataset_exists", return_value=True)
+@patch("lambdas.process_handler.main.get_processed_key", return_value="processed/default/products/20231119")
+@patch("lambdas.process_handler.main.write_dataset_alias", return_value="processed/default/products/20231120")
+@patch("lambdas.process_handler.main.write_partitioned_dataset")
+@patch("lambdas.process_handler.main.get_s3_client")
+def test_process_handler_skips_duplicate_content(mock_get_s3, mock_write_dataset, mock_alias, mock_get_key, mock_exists, mock_db, mock_s3_event):
+    mock_get_s3.return_value.get_object.return_value = {"Body": io.BytesIO(b"produto_id,produto_nome\n1,Produto A")}
+
+    response = process_handler(mock_s3_event, None)
+
+    assert response["statusCode"] == 200
+    assert "processed/default/products/20231119" in response["body"]
+    mock_write_dataset.assert_not_called()
+    mock_alias.assert_called_once_with("processed/default/products/20231119", "products", "20231120", tenant="default", bucket="smart-stock-bucket")
 
-@patch("lambdas.predict_handler.main.s3_client")
+@patch("app.ml.sharding.SessionLocal")
 @patch("lambdas.predict_handler.main.SessionLocal")
+@patch("lambdas.predict_handler.main.sales_history_loaded", return_value=False)
 @patch("lambdas.predict_handler.main.save_products_to_db")
-@patch("lambdas.predict_handler.main.save_predictions_to_db")
-def test_predict_handler(mock_save_preds, mock_save_prods, mock_db, mock_s3):
-    # Event for sales file
-    event = {
-        "Records": [
-            {
-                "s3": {
-                    "bucket": {"name": "smart-stock-bucket"},
-                    "object": {"key": "processed/sales_20231120.parquet"}
-                }
-            }
-        ]
-    }
-
-    # Mock S3 downloads (Sales and Products)
-    # Create dummy dataframes
+@patch("app.ml.sharding.save_predictions_to_db")
+def test_predict_handler(mock_save_preds, mock_save_prods, mock_loaded, mock_db, mock_shard_db, tmp_path):
+    # Datasets particionados gravados em um "bucket" local
     sales_df = pd.DataFrame({
         "produto_id": [1] * 10,
-        "data_pedido": pd.date_range(start="2023-01-01", periods=10, freq="D").astype(str),
+        "data_pedido": pd.date_range(start="2023-01-01", periods=10, freq="D"),
         "quantidade": [10] * 10,
         "valor_unitario": [10] * 10,
         "valor_total_pedido": [100] * 10,
@@ -72,26 +104,198 @@ def test_predict_handler(mock_save_preds, mock_save_prods, mock_db, mock_s3):
         "produto_preco": [10.0],
         "produto_estoque_atual": [100.0]
     })
+    bucket = str(tmp_path)
+    local_fs = LocalFileSystem()
+    write_partitioned_dataset(sales_df, "sales", "20231120", bucket=bucket, filesystem=local_fs)
+    write_partitioned_dataset(products_df, "products", "20231120", bucket=bucket, filesystem=local_fs)
 
-    sales_buffer = io.BytesIO()
-    sales_df.to_parquet(sales_buffer)
-    sales_buffer.seek(0)
-
-    products_buffer = io.BytesIO()
-    products_df.to_parquet(products_buffer)
-    products_buffer.seek(0)
-
-    # Mock get_object side effects (first call sales, second call products)
-    mock_s3.get_object.side_effect = [
-        {"Body": sales_buffer},
-        {"Body": products_buffer}
-    ]
+    # Event for sales dataset marker
+    event = {
+        "Records": [
+            {
+                "s3": {
+                    "bucket": {"name": bucket},
+                    "object": {"key": "processed/default/sales/20231120/_SUCCESS"}
+                }
+            }
+        ]
+    }
 
     # Run handler
-    response = predict_handler(event, None)
+    with local_lake(local_fs):
+        response = predict_handler(event, None)
 
     # Assertions
     assert response["statusCode"] == 200
     assert mock_save_prods.called
     assert mock_save_preds.called
-    assert mock_s3.upload_fileobj.called # Should upload forecast
+    assert (tmp_path / "predictions/default/20231120/shards/shard-0000.json").exists()
+    forecast = pd.read_parquet(tmp_path / "predictions/default/forecast_20231120.parquet")
+    assert set(forecast["product_id"]) == {1}
+
+@patch("lambdas.predict_handler.main.get_shard_executor")
+@patch("lambdas.predict_handler.main.claim_pipeline_run", return_value=True)
+@patch("lambdas.predict_handler.main._complete_run")
+@patch("lambdas.predict_handler.main.SessionLocal")
+@patch("lambdas.predict_handler.main.sales_history_loaded", return_value=False)
+@patch("lambdas.predict_handler.main.save_products_to_db")
+def test_predict_handler_completes_runs_without_shards(
+    mock_save_prods, mock_loaded, mock_db, mock_complete, mock_claim, mock_executor, tmp_path
+):
+    # Vendas só de um produto que não está no cadastro: nenhum shard é planejado
+    sales_df = pd.DataFrame({
+        "produto_id": [2] * 3, "data_pedido": pd.date_range(start="2023-01-01", periods=3, freq="D"),
+        "quantidade": [1] * 3, "valor_unitario": [1.0] * 3, "valor_total_pedido": [1.0] * 3, "situacao": ["Concluido"] * 3,
+    })
+    products_df = pd.DataFrame({
+        "produto_id": [1], "produto_nome": ["Produto A"], "produto_codigo": ["PRD1"],
+        "produto_preco": [10.0], "produto_estoque_atual": [100.0],
+    })
+    bucket = str(tmp_path)
+    fs = LocalFileSystem()
+    with local_lake(fs):
+        write_partitioned_dataset(sales_df, "sales", "20231120", bucket=bucket, filesystem=fs)
+        write_partitioned_dataset(products_df, "products", "20231120", bucket=bucket, filesystem=fs)
+        response = predict_handler(success_event(bucket, "processed/default/sales/20231120/_SUCCESS"), None)
+
+    assert response["statusCode"] == 200
+    mock_executor.assert_not_called()
+    # O lote é concluído na hora, em vez de ficar reivindicado até PIPELINE_RUN_TIMEOUT_SECONDS
+    mock_complete.assert_called_once_with("default", "20231120")
+
+@patch("lambdas.predict_handler.main.read_partitioned_dataset")
+def test_predict_handler_ignores_partial_files(mock_read):
+    event = {
+        "Records": [
+            {
+                "s3": {
+                    "bucket": {"name": "smart-stock-bucket"},
+                    "object": {"key": "processed/default/sales/20231120/year=2023/month=1/product_bucket=1/part-0.parquet"}
+                }
+            }
+        ]
+    }
+    assert predict_handler(event, None) is None
+    mock_read.assert_not_called()
+
+@pytest.fixture
+def small_batch():
+    sales_df = pd.DataFrame({
+        "produto_id": [1, 1],
+        "data_pedido": pd.to_datetime(["2023-01-01", "2023-01-02"]),
+        "quantidade": [1, 2],
+    })
+    products_df = pd.DataFrame({
+        "produto_id": [1], "produto_nome": ["Produto A"], "produto_codigo": ["PRD1"],
+        "produto_preco": [10.0], "produto_estoque_atual": [100.0],
+    })
+    return sales_df, products_df
+
+@patch("lambdas.predict_handler.main.SessionLocal")
+@patch("lambdas.predict_handler.main.claim_pipeline_run", return_value=True)
+@patch("lambdas.predict_handler.main._run_pipeline", return_value="default/20231120 (1 shards)")
+def test_predict_handler_processes_all_records_once(mock_run, mock_claim, mock_db, tmp_path, small_batch):
+    sales_df, products_df = small_batch
+    bucket, fs = str(tmp_path), LocalFileSystem()
+    write_batch_manifest("20231120", bucket=bucket, filesystem=fs)
+    write_partitioned_dataset(sales_df, "sales", "20231120", bucket=bucket, filesystem=fs)
+    write_partitioned_dataset(products_df, "products", "20231120", bucket=bucket, filesystem=fs)
+
+    # Os dois marcadores chegam no mesmo evento: um único treino
+    event = success_event(bucket, "processed/default/products/20231120/_SUCCESS", "processed/default/sales/20231120/_SUCCESS")
+    with local_lake(fs):
+        response = predict_handler(event, None)
+
+    assert response["statusCode"] == 200
+    mock_run.assert_called_once()
+    args = mock_run.call_args.args
+    assert args[:3] == (bucket, "default", "20231120")
+    assert args[3]["products"] == "processed/default/products/20231120"
+
+@patch("lambdas.predict_handler.main.claim_pipeline_run", return_value=True)
+@patch("lambdas.predict_handler.main._run_pipeline")
+def test_predict_handler_waits_for_incomplete_batch(mock_run, mock_claim, tmp_path, small_batch):
+    sales_df, _ = small_batch
+    bucket, fs = str(tmp_path), LocalFileSystem()
+    write_batch_manifest("20231120", bucket=bucket, filesystem=fs)
+    # As vendas ficam prontas antes dos produtos
+    write_partitioned_dataset(sales_df, "sales", "20231120", bucket=bucket, filesystem=fs)
+
+    with local_lake(fs):
+        assert predict_handler(success_event(bucket, "processed/default/sales/20231120/_SUCCESS"), None) is None
+
+    mock_run.assert_not_called()
+    mock_claim.assert_not_called()
+
+@patch("lambdas.predict_handler.main.SessionLocal")
+@patch("lambdas.predict_handler.main.claim_pipeline_run", return_value=True)
+@patch("lambdas.predict_handler.main._run_pipeline", return_value="default/20231121 (1 shards)")
+def test_predict_handler_coalesces_uploads(mock_run, mock_claim, mock_db, tmp_path, small_batch):
+    sales_df, products_df = small_batch
+    bucket, fs = str(tmp_path), LocalFileSystem()
+    for ts in ("20231120", "20231121"):
+        write_batch_manifest(ts, bucket=bucket, filesystem=fs)
+        write_partitioned_dataset(sales_df, "sales", ts, bucket=bucket, filesystem=fs)
+        write_partitioned_dataset(products_df, "products", ts, bucket=bucket, filesystem=fs)
+
+    with local_lake(fs):
+        # O lote antigo foi substituído pelo upload mais recente
+        assert predict_handler(success_event(bucket, "processed/default/sales/20231120/_SUCCESS"), None) is None
+        predict_handler(success_event(bucket, "processed/default/sales/20231121/_SUCCESS"), None)
+
+    mock_run.assert_called_once()
+    assert mock_run.call_args.args[2] == "20231121"
+
+@patch("lambdas.predict_handler.main.SessionLocal")
+@patch("lambdas.predict_handler.main.claim_pipeline_run", return_value=True)
+@patch("lambdas.predict_handler.main.release_pipeline_run")
+@patch("lambdas.predict_handler.main._run_pipeline")
+def test_predict_handler_isolates_tenant_failures(mock_run, mock_release, mock_claim, mock_db, tmp_path, small_batch):
+    sales_df, products_df = small_batch
+    bucket, fs = str(tmp_path), LocalFileSystem()
+    for tenant in ("loja-a", "loja-b"):
+        write_batch_manifest("20231120", tenant=tenant, bucket=bucket, filesystem=fs)
+        write_partitioned_dataset(sales_df, "sales", "20231120", tenant=tenant, bucket=bucket, filesystem=fs)
+        write_partitioned_dataset(products_df, "products", "20231120", tenant=tenant, bucket=bucket, filesystem=fs)
+
+    def run_pipeline(bucket, tenant, timestamp, artifacts, context, run_id=None):
+        if tenant == "loja-a":
+            raise ValueError("dados corrompidos")
+        return f"{tenant}/{timestamp} (1 shards)"
+    mock_run.side_effect = run_pipeline
+
+    event = success_event(
+        bucket, "processed/loja-a/sales/20231120/_SUCCESS", "processed/loja-b/sales/20231120/_SUCCESS"
+    )
+    with local_lake(fs), pytest.raises(RuntimeError, match="loja-a"):
+        predict_handler(event, None)
+
+    # O tenant com erro não impede o treino do outro; apenas o lote que falhou é liberado
+    assert [c.args[1] for c in mock_run.call_args_list] == ["loja-a", "loja-b"]
+    assert mock_release.call_args.args[1] == "loja-a"
+
+@patch("lambdas.predict_handler.main._release_run")
+@patch("lambdas.predict_handler.main._complete_run")
+@patch("lambdas.predict_handler.main.LambdaShardExecutor")
+@patch("lambdas.predict_handler.main.run_shard")
+def test_predict_worker_records_failure_and_continues_chain(mock_run_shard, mock_executor, mock_complete, mock_release, tmp_path):
+    from app.ml.sharding import write_shard_manifests, failed_shards
+    bucket = str(tmp_path)
+    fs = LocalFileSystem()
+    with local_lake(fs):
+        keys = write_shard_manifests([[1], [2]], "processed/default/sales/1", "default", "20231120", bucket)
+        mock_run_shard.side_effect = ValueError("série vazia")
+
+        response = predict_handler({"mode": "worker", "bucket": bucket, "manifest_key": keys[0], "next_keys": keys[1:]}, None)
+
+        assert response["statusCode"] == 500
+        # O próximo shard da cadeia é invocado mesmo com a falha
+        mock_executor.return_value.continue_chain.assert_called_once_with(bucket, keys[1:])
+        attempt = json.loads((tmp_path / keys[0]).read_text())["attempt"]
+        assert len(failed_shards("default", "20231120", bucket, attempt=attempt)) == 1
+        mock_release.assert_not_called()
+
+        # O último shard falha também: o lote termina sem merge e é liberado para uma nova execução
+        predict_handler({"mode": "worker", "bucket": bucket, "manifest_key": keys[1], "next_keys": []}, None)
+        mock_complete.assert_not_called()
+        mock_release.assert_called_once_with("default", "20231120")
@@ -1,17 +1,185 @@
-from app.utils.logger import logger
-from app.utils.metrics import log_metric
+from app.utils.logger import (
+    logger, bind_context, flush_logs, get_logger, JSONFormatter, NonBlockingQueueHandler, SamplingFilter
+)
+from app.utils.metrics import log_metric, build_emf_document, metrics_client, MetricsClient
+from app.utils.tracing import span, traced, Span, SpanAggregator, aggregator
+import numpy as np
+import pandas as pd
+import pytest
+import io
 import json
+import logging
+import queue
+import subprocess
+import sys
 
 def test_logger():
     print("\n--- Testing Logger ---")
     logger.info("Teste de log de info", extra={"extra_fields": {"user_id": "123"}})
     logger.error("Teste de log de erro", exc_info=True)
 
+def test_bind_context_fields_are_captured_on_calling_thread():
+    log_queue = queue.Queue()
+    log = logging.getLogger("teste.contexto")
+    log.addHandler(NonBlockingQueueHandler(log_queue))
+    log.propagate = False
+    log.setLevel(logging.INFO)
+
+    with bind_context(job_id="job-1"):
+        with bind_context(product_id="101"):
+            log.info("Treinando modelo para o produto %s...", 101)
+    log.info("Fora do contexto")
+
+    inside = json.loads(JSONFormatter().format(log_queue.get()))
+    outside = json.loads(JSONFormatter().format(log_queue.get()))
+    assert inside["message"] == "Treinando modelo para o produto 101..."
+    assert inside["job_id"] == "job-1"
+    assert inside["product_id"] == "101"
+    assert "job_id" not in outside
+
+def test_sampling_filter_keeps_warnings():
+    sampling = SamplingFilter(0.1)
+    info = logging.LogRecord("x", logging.INFO, __file__, 1, "info", None, None)
+    warning = logging.LogRecord("x", logging.WARNING, __file__, 1, "aviso", None, None)
+
+    assert sum(sampling.filter(info) for _ in range(100)) == 10
+    assert all(sampling.filter(warning) for _ in range(10))
+
+def test_get_logger_is_async_child():
+    child = get_logger("teste.amostrado", sample_rate=0.5)
+    assert child.name == "smart-stock.teste.amostrado"
+    assert any(isinstance(f, SamplingFilter) for f in child.filters)
+    child.info("mensagem")
+    flush_logs()
+
 def test_metrics():
     print("\n--- Testing Metrics ---")
     log_metric("ProcessedFiles", 1, unit="Count", dimensions={"FileType": "CSV"})
     log_metric("ProcessingTime", 150.5, unit="Milliseconds")
 
+def test_emf_document_format():
+    doc = build_emf_document(
+        {"StageWallTime": (12.5, "Milliseconds"), "RowsIn": (10, "Count")},
+        dimensions={"Stage": "clean_sales_data"},
+        properties={"product_id": "101"},
+    )
+    directive = doc["_aws"]["CloudWatchMetrics"][0]
+    assert directive["Dimensions"] == [["Stage"]]
+    assert {m["Name"] for m in directive["Metrics"]} == {"StageWallTime", "RowsIn"}
+    assert doc["Stage"] == "clean_sales_data"
+    assert doc["StageWallTime"] == 12.5
+    assert doc["product_id"] == "101"
+
+def test_span_records_and_emits(capsys):
+    aggregator.reset()
+    with span("etapa_teste", product_id="7") as s:
+        s.rows_in = 3
+        s.rows_out = 2
+
+    stats = aggregator.snapshot()["etapa_teste"]
+    assert stats["count"] == 1
+    assert stats["rows_in_total"] == 3
+    assert stats["rows_out_total"] == 2
+    assert stats["wall_seconds_total"] >= 0
+
+    metrics_client.flush()
+    emitted = [json.loads(line) for line in capsys.readouterr().out.strip().splitlines()]
+    doc = next(d for d in emitted if d.get("Stage") == "etapa_teste")
+    assert "StageWallTime" in doc
+    assert doc["RowsIn"] == 3
+    # Propriedades do span vão no documento, sem virar dimensões
+    assert doc["product_id"] == "7"
+    assert doc["_aws"]["CloudWatchMetrics"][0]["Dimensions"] == [["Stage"]]
+
+def test_span_measures_stage_memory_and_process_cpu():
+    with span("alocar", emit=False) as s:
+        buffer = np.ones(32 * 1024 * 1024 // 8)
+        # CPU de um subprocesso concluído entra no tempo de CPU da etapa
+        subprocess.run([sys.executable, "-c", "sum(range(3_000_000))"], check=True)
+
+    assert s.rss_delta_bytes is None or s.rss_delta_bytes >= 16 * 1024 * 1024
+    assert s.cpu_seconds >= 0.05
+    assert s.metrics()["ProcessPeakRSS"][0] >= (s.rss_delta_bytes or 0)
+    del buffer
+
+def test_span_counts_errors():
+    aggregator.reset()
+    with pytest.raises(ValueError):
+        with span("etapa_com_erro", emit=False):
+            raise ValueError("falha")
+    assert aggregator.snapshot()["etapa_com_erro"]["errors"] == 1
+
+def test_traced_counts_dataframe_rows():
+    @traced("dobrar", emit=False)
+    def dobrar(df):
+        return pd.concat([df, df])
+
+    result = dobrar(pd.DataFrame({"a": [1, 2]}))
+
+    assert len(result) == 4
+    stats = aggregator.snapshot()["dobrar"]
+    assert stats["rows_out_total"] >= 4
+
+def test_span_aggregator_min_max():
+    agg = SpanAggregator()
+    for wall in (0.5, 0.1, 0.3):
+        s = Span("x")
+        s.wall_seconds = wall
+        agg.record(s)
+    stats = agg.snapshot()["x"]
+    assert stats["wall_seconds_min"] == 0.1
+    assert stats["wall_seconds_max"] == 0.5
+    assert stats["wall_seconds_avg"] == pytest.approx(0.3)
+
+def test_metrics_client_batches_documents():
+    stream = io.StringIO()
+    client = MetricsClient(stream=stream, background=False, max_buffered=10_000)
+    for i in range(150):
+        client.increment(f"Metric{i}", dimensions={"Service": "Teste"})
+    client.increment("Metric0", 2, dimensions={"Service": "Teste"})
+    for v in range(250):
+        client.observe("Latency", v, dimensions={"Service": "Teste"})
+
+    assert stream.getvalue() == ""  # nada é escrito antes do flush
+    client.flush()
+
+    docs = [json.loads(line) for line in stream.getvalue().splitlines()]
+    for doc in docs:
+        assert len(doc["_aws"]["CloudWatchMetrics"][0]["Metrics"]) <= 100
+        if isinstance(doc.get("Latency"), list):
+            assert len(doc["Latency"]) <= 100
+    assert sum(1 for d in docs if "Metric149" in d) == 1
+    assert next(d for d in docs if "Metric0" in d)["Metric0"] == 3
+    latencies = [v for d in docs if "Latency" in d for v in d["Latency"]]
+    assert sorted(latencies) == list(range(250))
+
+    # O buffer é esvaziado após o flush
+    stream.truncate(0)
+    client.flush()
+    assert stream.getvalue() == ""
+
+def test_metrics_client_keeps_properties_and_namespace():
+    stream = io.StringIO()
+    client = MetricsClient(stream=stream, background=False)
+    for product_id in ("1", "2"):
+        client.observe("FitTime", 5.0, dimensions={"Stage": "fit"}, properties={"product_id": product_id})
+    client.increment("Uploads", namespace="Outro")
+    client.flush()
+
+    docs = [json.loads(line) for line in stream.getvalue().splitlines()]
+    fits = sorted((d for d in docs if "FitTime" in d), key=lambda d: d["product_id"])
+    assert [(d["product_id"], d["FitTime"]) for d in fits] == [("1", 5.0), ("2", 5.0)]
+    uploads = next(d for d in docs if "Uploads" in d)
+    assert uploads["_aws"]["CloudWatchMetrics"][0]["Namespace"] == "Outro"
+    assert "product_id" not in uploads
+
+def test_metrics_client_flushes_on_size_threshold():
+    stream = io.StringIO()
+    client = MetricsClient(stream=stream, background=False, max_buffered=5)
+    for _ in range(5):
+        client.observe("Latency", 1.0)
+    assert '"Latency"' in stream.getvalue()
+
 if __name__ == "__main__":
     test_logger()
     test_metrics()
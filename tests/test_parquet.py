@@ -0,0 +1,56 @@
+import io
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from app.core.parquet import to_arrow_table, write_parquet
+
+def test_to_arrow_table_narrows_types_when_safe():
+    df = pd.DataFrame({
+        'produto_id': [2, 1],
+        'produto_nome': ['Lapis', 'Caneta'],
+        'valor_unitario': [0.8, 1.5],
+        'valor_total_pedido': [4.0, 15.0],
+        'quantidade': [5, 10],
+        'situacao': ['Entregue', 'Entregue'],
+        'data_pedido': pd.to_datetime(['2023-10-01', '2023-09-30']),
+        'extra': [1, 2],
+    })
+
+    table = to_arrow_table(df, "sales")
+
+    assert table.schema.field('produto_id').type == pa.int32()
+    assert table.schema.field('quantidade').type == pa.int32()
+    assert table.schema.field('valor_unitario').type == pa.float32()
+    assert pa.types.is_dictionary(table.schema.field('situacao').type)
+    # Colunas fora do esquema não são alteradas
+    assert table.schema.field('extra').type == pa.int64()
+    # Linhas ordenadas por produto
+    assert table.column('produto_id').to_pylist() == [1, 2]
+
+def test_to_arrow_table_keeps_wide_types_when_lossy():
+    df = pd.DataFrame({
+        'produto_id': [1, 3_000_000_000],
+        'valor_total_pedido': [12_345_678.91, 1.0],
+        'quantidade': [1.5, 2.0],
+    })
+
+    table = to_arrow_table(df, "sales")
+
+    assert table.schema.field('produto_id').type == pa.int64()
+    assert table.schema.field('valor_total_pedido').type == pa.float64()
+    assert table.schema.field('quantidade').type == pa.float64()
+
+def test_write_parquet_roundtrip_uses_zstd():
+    df = pd.DataFrame({'product_id': [1, 1], 'ds': pd.to_datetime(['2024-01-01', '2024-01-02']),
+                       'yhat': [1.25, 2.5], 'yhat_lower': [1.0, 2.0], 'yhat_upper': [1.5, 3.0]})
+    buffer = io.BytesIO()
+
+    write_parquet(df, "forecast", buffer)
+
+    buffer.seek(0)
+    metadata = pq.ParquetFile(buffer).metadata
+    assert metadata.row_group(0).column(0).compression == "ZSTD"
+    buffer.seek(0)
+    result = pd.read_parquet(buffer)
+    assert result['yhat'].tolist() == [1.25, 2.5]
+    assert result['product_id'].tolist() == [1, 1]
@@ -65,3 +65,110 @@ def test_run_ml_pipeline_task_filters_missing_products(
     # This assertion will FAIL before the fix, and PASS after the fix
     assert 2 not in passed_sales_df['produto_id'].values, "Product 2 should have been filtered out"
     assert 1 in passed_sales_df['produto_id'].values
+
+@patch('app.api.routes.upload.SessionLocal')
+@patch('app.api.routes.upload.save_products_to_db')
+@patch('app.api.routes.upload.load_sales_history')
+@patch('app.api.routes.upload.sales_history_loaded', return_value=True)
+@patch('app.api.routes.upload.get_daily_sales')
+@patch('app.api.routes.upload.create_prophet_features')
+@patch('app.api.routes.upload.train_models_for_products', return_value={})
+@patch('app.api.routes.upload.generate_predictions', return_value={})
+def test_run_ml_pipeline_task_trains_on_loaded_history(
+    mock_generate_predictions, mock_train_models, mock_create_features, mock_daily_sales,
+    mock_loaded, mock_load_history, mock_save_products, mock_session_local,
+):
+    # Com o dataset carregado no histórico, o treino usa a mesma série dos workers da Lambda
+    products_df = pd.DataFrame({'produto_id': [1], 'produto_estoque_atual': [10]})
+    sales_df = pd.DataFrame({'produto_id': [1, 2], 'data_pedido': pd.to_datetime(['2023-01-01'] * 2), 'quantidade': [1, 1]})
+    mock_daily_sales.return_value = {1: pd.DataFrame({'ds': pd.to_datetime(['2022-12-31', '2023-01-01']), 'y': [3.0, 1.0]})}
+
+    with patch('app.api.routes.upload.save_stock_risk'), patch('app.api.routes.upload._publish_snapshot'):
+        run_ml_pipeline_task(products_df, sales_df, "loja-a", "processed/loja-a/sales/1")
+
+    mock_create_features.assert_not_called()
+    assert mock_daily_sales.call_args.args[1:] == ("loja-a", {1})
+    assert mock_train_models.call_args.args[0] is mock_daily_sales.return_value
+
+@patch('app.api.routes.upload.SessionLocal')
+@patch('app.api.routes.upload.release_pipeline_run')
+@patch('app.api.routes.upload.claim_pipeline_run')
+@patch('app.api.routes.upload.save_products_to_db')
+@patch('app.api.routes.upload.train_models_for_products')
+def test_run_ml_pipeline_task_skips_claimed_runs(
+    mock_train_models, mock_save_products, mock_claim, mock_release, mock_session_local,
+):
+    products_df = pd.DataFrame({'produto_id': [1], 'produto_estoque_atual': [10]})
+    sales_df = pd.DataFrame({'produto_id': [1], 'data_pedido': pd.to_datetime(['2023-01-01']), 'quantidade': [1]})
+
+    # Lote já reivindicado pela Lambda de previsão (acionada pelo _SUCCESS): a API não treina de novo
+    mock_claim.return_value = False
+    run_ml_pipeline_task(products_df, sales_df, "loja-a", "processed/loja-a/sales/1", "20231120")
+    assert mock_claim.call_args.args[1:] == ("loja-a", "20231120")
+    mock_save_products.assert_not_called()
+    mock_train_models.assert_not_called()
+
+    # Falha no pipeline: o lote é liberado para uma nova execução
+    mock_claim.return_value = True
+    mock_save_products.side_effect = RuntimeError("banco indisponível")
+    run_ml_pipeline_task(products_df, sales_df, "loja-a", "processed/loja-a/sales/1", "20231120")
+    assert mock_release.call_args.args[1:] == ("loja-a", "20231120")
+
+# --- Equivalência entre os backends de processamento (pandas x DuckDB) ---
+
+DIRTY_SALES_CSV = (
+    "produto_id,produto_nome,valor_unitario,valor_total_pedido,quantidade,situacao,data_pedido\n"
+    "1,Caneta,1.50,15.00,10,Entregue,01/10/2023\n"
+    "1,Caneta,1.50,3.00,2,Entregue,2023-10-01\n"
+    "2,Lapis,invalid,5.00,5,Cancelado,02/10/2023\n"
+    "2,Lapis,1.00,4.00,4,CANCELADO,02/10/2023\n"
+    "2,Lapis,1.00,4.00,,Entregue,02/10/2023\n"
+    ",Borracha,1.00,4.00,4,Entregue,02/10/2023\n"
+    "3.5,Borracha,1.00,4.00,4,Entregue,02/10/2023\n"
+    "3,Borracha,1.00,4.00,4,,data ruim\n"
+    "3,Borracha,1.00,7.00,7,,03/10/2023\n"
+    "3,Borracha,1.00,1.00,1,Entregue,2023-10-05\n"
+)
+
+def _clean_with(backend, tmp_path):
+    import io
+    from app.core.config import settings
+    from app.processing.cleaner import clean_sales_data
+    with patch.object(settings, "PROCESSING_BACKEND", backend), patch.object(settings, "DUCKDB_TEMP_DIR", str(tmp_path)):
+        return clean_sales_data(io.BytesIO(DIRTY_SALES_CSV.encode("utf-8")))
+
+def _features_with(backend, sales_df, tmp_path):
+    from app.core.config import settings
+    from app.processing.feature_engineering import create_prophet_features
+    with patch.object(settings, "PROCESSING_BACKEND", backend), patch.object(settings, "DUCKDB_TEMP_DIR", str(tmp_path)):
+        return create_prophet_features(sales_df.copy())
+
+def test_duckdb_backend_cleans_sales_like_pandas(tmp_path):
+    pytest.importorskip("duckdb")
+
+    expected = _clean_with("pandas", tmp_path).reset_index(drop=True)
+    result = _clean_with("duckdb", tmp_path)
+
+    assert sorted(result["produto_id"].unique()) == [1, 3]
+    pd.testing.assert_frame_equal(result, expected, check_like=True, check_categorical=False)
+
+def test_duckdb_backend_aggregates_daily_sales_like_pandas(tmp_path):
+    duckdb_engine = pytest.importorskip("app.processing.duckdb_engine")
+    from app.core.datalake import write_partitioned_dataset, scan_partitioned_dataset
+    from pyarrow.fs import LocalFileSystem
+    sales_df = _clean_with("pandas", tmp_path)
+
+    expected = _features_with("pandas", sales_df, tmp_path)
+    result = _features_with("duckdb", sales_df, tmp_path)
+
+    assert sorted(result) == sorted(expected) == [1, 3]
+    for product_id in expected:
+        pd.testing.assert_frame_equal(result[product_id].reset_index(drop=True), expected[product_id].reset_index(drop=True))
+
+    # Também a partir do dataset Parquet particionado, lido em streaming
+    root = write_partitioned_dataset(sales_df, "sales", "20231001", bucket=str(tmp_path), filesystem=LocalFileSystem())
+    reader = scan_partitioned_dataset(root, "sales", columns=["produto_id", "data_pedido", "quantidade"],
+                                      bucket=str(tmp_path), filesystem=LocalFileSystem())
+    streamed = duckdb_engine.daily_product_sales(reader)
+    for product_id in expected:
+        pd.testing.assert_frame_equal(streamed[product_id].reset_index(drop=True), expected[product_id].reset_index(drop=True))
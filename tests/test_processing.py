@@ -3,6 +3,8 @@ from fastapi import UploadFile
 import pandas as pd
 from app.processing.validator import validate_csv, PRODUCT_COLUMNS
 from app.processing.cleaner import clean_products_data, clean_sales_data
+from app.processing.schemas import read_csv_with_schema, SALES_CSV_DTYPES
+from app.processing.dates import parse_dates
 from app.processing.feature_engineering import create_prophet_features
 
 def test_validate_csv_valid():
@@ -109,3 +111,60 @@ def test_create_prophet_features():
     # Verifica se agrupou corretamente as vendas do dia 01/10/2023
     assert df_101[df_101['ds'] == '2023-10-01']['y'].iloc[0] == 15
     assert df_101[df_101['ds'] == '2023-10-03']['y'].iloc[0] == 3
+
+def test_read_csv_with_schema_loads_declared_columns_and_types():
+    """
+    Testa a leitura com esquema: colunas extras ignoradas, categorias e números já tipados.
+    """
+    csv_content = (
+        "produto_id,produto_nome,valor_unitario,valor_total_pedido,quantidade,situacao,data_pedido,observacao\n"
+        "101,Caneta,1.50,15.00,10,Entregue,01/10/2023,texto livre\n"
+        "102,Caderno,12.00,24.00,2,Entregue,02/10/2023,\n"
+    )
+    for engine in ("c", "pyarrow"):
+        df = read_csv_with_schema(io.BytesIO(csv_content.encode('utf-8')), SALES_CSV_DTYPES, engine=engine)
+
+        assert list(df.columns) == list(SALES_CSV_DTYPES)
+        assert isinstance(df['situacao'].dtype, pd.CategoricalDtype)
+        assert df['quantidade'].dtype == 'float64'
+        assert df['valor_total_pedido'].tolist() == [15.0, 24.0]
+
+def test_read_csv_with_schema_coerces_dirty_numbers():
+    """
+    Testa que valores numéricos inválidos viram nulos em vez de falhar a leitura.
+    """
+    csv_content = (
+        "produto_id,produto_nome,valor_unitario,valor_total_pedido,quantidade,situacao,data_pedido\n"
+        "101,Caneta,1.50,15.00,dez,Entregue,01/10/2023\n"
+        "abc,Lapis,0.80,4.00,5,Entregue,03/10/2023\n"
+    )
+    df = read_csv_with_schema(io.BytesIO(csv_content.encode('utf-8')), SALES_CSV_DTYPES, engine="pyarrow")
+
+    assert df['quantidade'].isna().tolist() == [True, False]
+    assert df['produto_id'].isna().tolist() == [False, True]
+    assert isinstance(df['produto_nome'].dtype, pd.CategoricalDtype)
+
+def test_parse_dates_mixed_formats_and_counts():
+    """
+    Testa a conversão de datas em ISO e no formato brasileiro, com contagens por resultado.
+    """
+    values = pd.Series(["2023-10-01", "01/10/2023", "2023-10-01", "invalid", None, "02/10/2023"])
+
+    for series in (values, values.astype("category")):
+        result = parse_dates(series)
+
+        assert result.dates.dt.strftime('%Y-%m-%d').tolist()[:3] == ["2023-10-01"] * 3
+        assert result.dates.iloc[5] == pd.Timestamp("2023-10-02")
+        assert result.dates.iloc[3:5].isna().all()
+        assert result.unparseable == 1
+        assert result.missing == 1
+        assert result.format_counts == {"%Y-%m-%d": 2, "%d/%m/%Y": 2}
+
+def test_parse_dates_empty_series():
+    """
+    Testa que uma coluna vazia não gera erro.
+    """
+    result = parse_dates(pd.Series([], dtype="str"))
+
+    assert len(result.dates) == 0
+    assert result.unparseable == 0 and result.missing == 0
@@ -0,0 +1,52 @@
+from unittest.mock import MagicMock, patch
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.core.database import Base, Product, ReadRouter, replica_lag_seconds
+
+def database_file(path, name):
+    # Cada "banco" é um arquivo SQLite com um produto que identifica a sua origem
+    engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(bind=engine)
+    with factory() as db:
+        db.add(Product(tenant_id="default", id=1, name=name))
+        db.commit()
+    return factory
+
+def served_by(router):
+    with router.session() as db:
+        return db.get(Product, ("default", 1)).name
+
+def test_reads_go_to_fresh_replica(tmp_path):
+    primary = database_file(tmp_path / "primary.db", "primario")
+    database_file(tmp_path / "replica.db", "replica")
+
+    router = ReadRouter(replica_url=f"sqlite:///{tmp_path / 'replica.db'}", primary_factory=primary)
+    assert served_by(router) == "replica"
+
+    # Sem réplica configurada, as leituras ficam no primário
+    assert served_by(ReadRouter(replica_url="", primary_factory=primary)) == "primario"
+
+def test_stale_or_unreachable_replica_falls_back_to_primary(tmp_path):
+    primary = database_file(tmp_path / "primary.db", "primario")
+    database_file(tmp_path / "replica.db", "replica")
+    replica_url = f"sqlite:///{tmp_path / 'replica.db'}"
+
+    router = ReadRouter(replica_url=replica_url, max_lag_seconds=30, check_interval_seconds=0, primary_factory=primary)
+    with patch("app.core.database.replica_lag_seconds", return_value=120.0):
+        assert served_by(router) == "primario"
+    # A réplica volta a ser usada quando alcança o primário
+    assert served_by(router) == "replica"
+
+    unreachable = ReadRouter(replica_url=f"sqlite:///{tmp_path / 'inexistente' / 'replica.db'}", primary_factory=primary)
+    assert served_by(unreachable) == "primario"
+
+def test_disconnected_replica_has_unknown_lag():
+    connection = MagicMock()
+    connection.dialect.name = "postgresql"
+    # Sem WAL receiver ativo a consulta retorna NULL: a réplica não é considerada atualizada
+    connection.execute.return_value.scalar.return_value = None
+    assert replica_lag_seconds(connection) == float("inf")
+    connection.execute.return_value.scalar.return_value = 0
+    assert replica_lag_seconds(connection) == 0.0
+    assert "pg_stat_wal_receiver" in str(connection.execute.call_args.args[0])
@@ -0,0 +1,162 @@
+import datetime
+import os
+from unittest.mock import MagicMock
+
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import sessionmaker
+from app.core.database import Base, sales_daily, SalesDailyProduct
+from app.core.sales_history import (
+    load_sales_history, sales_history_loaded, get_sales_days, get_daily_sales,
+    _replace_rows_postgres,
+)
+from app.processing.feature_engineering import create_prophet_features
+
+engine = create_engine("sqlite:///:memory:", connect_args={"check_same_thread": False})
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+POSTGRES_URL = os.environ.get("TEST_POSTGRES_URL")
+
+@pytest.fixture(scope="function")
+def db_session():
+    Base.metadata.create_all(bind=engine)
+    db = TestingSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=engine)
+
+def sales(product_ids, dates, quantities):
+    return pd.DataFrame({
+        "produto_id": product_ids,
+        "produto_nome": ["Produto"] * len(product_ids),
+        "valor_unitario": [2.0] * len(product_ids),
+        "valor_total_pedido": [2.0 * q for q in quantities],
+        "quantidade": [float(q) for q in quantities],
+        "situacao": ["Entregue"] * len(product_ids),
+        "data_pedido": pd.to_datetime(dates),
+    })
+
+def test_daily_sales_match_prophet_features(db_session):
+    sales_df = sales(
+        [1, 1, 2, 1, 2],
+        ["2023-10-01", "2023-10-01", "2023-10-01", "2023-10-03", "2023-11-02"],
+        [10, 2, 5, 1, 4],
+    )
+
+    assert load_sales_history(db_session, sales_df, tenant="loja-a") == 5
+
+    from_db = get_daily_sales(db_session, "loja-a")
+    expected = create_prophet_features(sales_df.copy())
+    assert sorted(from_db) == [1, 2]
+    for pid, df in expected.items():
+        pd.testing.assert_frame_equal(
+            from_db[pid].reset_index(drop=True),
+            df.astype({"y": "float64"}).reset_index(drop=True),
+            check_dtype=False,
+        )
+    assert get_sales_days(db_session, "loja-a") == {1: 2, 2: 2}
+    assert list(get_daily_sales(db_session, "loja-a", product_ids=[2])) == [2]
+    # Outra empresa não enxerga o histórico
+    assert get_daily_sales(db_session, "loja-b") == {}
+
+def test_reload_replaces_only_the_days_it_covers(db_session):
+    load_sales_history(db_session, sales(
+        [1, 1, 1], ["2023-10-01", "2023-10-02", "2023-10-03"], [1, 1, 1],
+    ), source="processed/default/sales/1")
+    # Nova carga cobrindo 02 e 03/10: substitui esses dias e mantém 01/10
+    load_sales_history(db_session, sales(
+        [1, 1, 1], ["2023-10-02", "2023-10-03", "2023-10-03"], [5, 2, 3],
+    ), source="processed/default/sales/2")
+
+    daily = get_daily_sales(db_session)[1]
+    assert daily["y"].tolist() == [1.0, 5.0, 5.0]
+    assert db_session.execute(select(func.count()).select_from(sales_daily)).scalar() == 4
+    orders = db_session.execute(select(SalesDailyProduct.orders).order_by(SalesDailyProduct.day)).scalars().all()
+    assert orders == [1, 1, 2]
+
+    # Um dataset já carregado não é carregado de novo
+    assert sales_history_loaded(db_session, "default", "processed/default/sales/2")
+    assert load_sales_history(db_session, sales([1], ["2023-10-02"], [99]), source="processed/default/sales/2") == 0
+    assert get_daily_sales(db_session)[1]["y"].tolist() == [1.0, 5.0, 5.0]
+
+def test_load_keeps_products_and_days_missing_from_the_file(db_session):
+    load_sales_history(db_session, sales(
+        [1, 1, 1], ["2023-10-01", "2023-10-02", "2023-10-03"], [1, 2, 3],
+    ), source="processed/default/sales/1")
+    # Arquivo de outro produto no mesmo intervalo, e um parcial do produto 1 (só 02/10)
+    load_sales_history(db_session, sales(
+        [2, 2], ["2023-10-01", "2023-10-03"], [7, 8],
+    ), source="processed/default/sales/2")
+    load_sales_history(db_session, sales([1], ["2023-10-02"], [9]), source="processed/default/sales/3")
+
+    daily = get_daily_sales(db_session)
+    assert daily[1]["y"].tolist() == [1.0, 9.0, 3.0]
+    assert daily[2]["y"].tolist() == [7.0, 8.0]
+    assert get_sales_days(db_session) == {1: 3, 2: 2}
+
+def test_postgres_load_stages_copies_and_replaces_pairs():
+    db = MagicMock()
+    cursor = db.connection.return_value.connection.cursor.return_value
+    copied = []
+    cursor.copy_expert.side_effect = lambda sql, buffer: copied.append((sql, buffer.read()))
+    frame = pd.DataFrame({
+        "tenant_id": ["loja-a", "loja-a"],
+        "product_id": [1, 2],
+        "sale_date": pd.to_datetime(["2023-10-31", "2023-11-01"]),
+        "quantity": [3.0, 4.0],
+        "unit_price": [2.0, 2.0],
+        "total_value": [6.0, 8.0],
+    })
+
+    _replace_rows_postgres(db, "loja-a", frame, datetime.date(2023, 10, 31), datetime.date(2023, 11, 1))
+
+    statements = [" ".join(str(c.args[0]).split()) for c in db.execute.call_args_list]
+    assert statements[0] == (
+        "CREATE TABLE IF NOT EXISTS sales_daily_2023_10 PARTITION OF sales_daily "
+        "FOR VALUES FROM ('2023-10-01') TO ('2023-11-01')"
+    )
+    assert statements[1] == (
+        "CREATE TABLE IF NOT EXISTS sales_daily_2023_11 PARTITION OF sales_daily "
+        "FOR VALUES FROM ('2023-11-01') TO ('2023-12-01')"
+    )
+    assert statements[2] == "CREATE TEMP TABLE sales_daily_stage (LIKE sales_daily) ON COMMIT DROP"
+    assert statements[3].startswith("DELETE FROM sales_daily d USING (SELECT DISTINCT product_id, sale_date FROM sales_daily_stage) s")
+    assert "d.product_id = s.product_id AND d.sale_date = s.sale_date" in statements[3]
+    assert db.execute.call_args_list[3].args[1] == {
+        "tenant": "loja-a", "first_day": datetime.date(2023, 10, 31), "last_day": datetime.date(2023, 11, 1),
+    }
+    assert statements[4] == "INSERT INTO sales_daily SELECT * FROM sales_daily_stage"
+    assert len(statements) == 5
+
+    # O COPY vai para a tabela temporária, antes da remoção dos pares
+    assert copied == [(
+        "COPY sales_daily_stage (tenant_id, product_id, sale_date, quantity, unit_price, total_value) "
+        "FROM STDIN WITH (FORMAT csv)",
+        "loja-a,1,2023-10-31,3.0,2.0,6.0\nloja-a,2,2023-11-01,4.0,2.0,8.0\n",
+    )]
+    cursor.close.assert_called_once()
+
+@pytest.mark.skipif(not POSTGRES_URL, reason="TEST_POSTGRES_URL não configurada")
+def test_postgres_load_keeps_products_missing_from_the_file():
+    pg_engine = create_engine(POSTGRES_URL)
+    Base.metadata.drop_all(bind=pg_engine)
+    Base.metadata.create_all(bind=pg_engine)
+    db = sessionmaker(bind=pg_engine)()
+    try:
+        load_sales_history(db, sales(
+            [1, 1, 1], ["2023-10-30", "2023-10-31", "2023-11-01"], [1, 2, 3],
+        ), source="processed/default/sales/1")
+        load_sales_history(db, sales([2, 2], ["2023-10-31", "2023-11-01"], [7, 8]), source="processed/default/sales/2")
+        load_sales_history(db, sales([1], ["2023-10-31"], [9]), source="processed/default/sales/3")
+
+        daily = get_daily_sales(db)
+        assert daily[1]["y"].tolist() == [1.0, 9.0, 3.0]
+        assert daily[2]["y"].tolist() == [7.0, 8.0]
+        assert db.execute(select(func.count()).select_from(sales_daily)).scalar() == 5
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=pg_engine)
+        pg_engine.dispose()
@@ -0,0 +1,48 @@
+import threading
+import pytest
+from app.ml.scheduler import FairShareScheduler
+
+def test_small_tenant_is_not_starved_by_large_tenant():
+    scheduler = FairShareScheduler(max_workers=2, tenant_concurrency=1)
+    release = threading.Event()
+    started = []
+
+    def large_job(name):
+        started.append(name)
+        release.wait(timeout=5)
+        return name
+
+    # Tenant grande enfileira vários shards antes do pequeno
+    large = [scheduler.submit("grande", large_job, f"grande-{i}") for i in range(4)]
+    small = scheduler.submit("pequena", lambda: "pequena-0")
+
+    # Cota de 1 por tenant: o segundo worker atende o tenant pequeno enquanto o grande está ocupado
+    assert small.result(timeout=5) == "pequena-0"
+    assert len(started) <= 1
+
+    release.set()
+    assert [f.result(timeout=5) for f in large] == [f"grande-{i}" for i in range(4)]
+    scheduler.shutdown()
+
+def test_tenant_quota_overrides_and_errors():
+    scheduler = FairShareScheduler(max_workers=3, tenant_concurrency=1, tenant_quotas={"grande": 2})
+    running, peak = [0], [0]
+    lock = threading.Lock()
+    barrier = threading.Event()
+
+    def job():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        barrier.wait(timeout=0.2)
+        with lock:
+            running[0] -= 1
+
+    futures = [scheduler.submit("grande", job) for _ in range(6)]
+    for f in futures:
+        f.result(timeout=5)
+    assert peak[0] == 2
+
+    with pytest.raises(ValueError):
+        scheduler.run("grande", lambda: (_ for _ in ()).throw(ValueError("falhou")))
+    scheduler.shutdown()
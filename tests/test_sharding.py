@@ -0,0 +1,148 @@
+import datetime
+import json
+import pandas as pd
+from unittest.mock import MagicMock, patch
+from pyarrow.fs import LocalFileSystem
+from app.core.datalake import write_partitioned_dataset
+from app.ml.sharding import (
+    plan_shards, write_shard_manifests, completed_parts, run_shard, LocalShardExecutor, LambdaShardExecutor
+)
+from app.ml.scheduler import FairShareScheduler
+from app.core.config import settings
+from app.core.forecast_snapshot import read_current_pointer
+
+def test_plan_shards_balances_by_cost():
+    # Um produto com histórico longo e vários produtos pequenos
+    days = {1: 3000, 2: 100, 3: 100, 4: 100, 5: 100}
+
+    shards = plan_shards(days, max_shard_cost=3.0)
+
+    assert sorted(pid for shard in shards for pid in shard) == [1, 2, 3, 4, 5]
+    assert len(shards) == 2
+    # O produto caro fica sozinho no seu shard
+    assert [1] in shards
+
+def test_plan_shards_single_shard_for_small_tenants():
+    assert plan_shards({1: 10, 2: 10}) == [[1, 2]]
+    assert plan_shards({}) == []
+
+@patch("app.ml.sharding.SessionLocal")
+@patch("app.ml.sharding.save_predictions_to_db")
+def test_local_executor_runs_shards_and_merges(mock_save_preds, mock_db, tmp_path):
+    sales_df = pd.DataFrame({
+        "produto_id": [1] * 10 + [2] * 10,
+        "data_pedido": list(pd.date_range(start="2023-01-01", periods=10, freq="D")) * 2,
+        "quantidade": [10] * 10 + [3] * 10,
+    })
+    bucket = str(tmp_path)
+    fs = LocalFileSystem()
+    sales_root = write_partitioned_dataset(sales_df, "sales", "20231120", bucket=bucket, filesystem=fs)
+
+    keys = write_shard_manifests([[1], [2]], sales_root, "default", "20231120", bucket, filesystem=fs)
+    output_key = LocalShardExecutor(filesystem=fs, scheduler=FairShareScheduler(max_workers=2, tenant_concurrency=2)).submit(keys, bucket, "default", "20231120")
+
+    attempt = json.loads((tmp_path / keys[0]).read_text())["attempt"]
+    assert len(completed_parts("default", "20231120", bucket, fs, attempt)) == 2
+    assert mock_save_preds.call_count == 2
+    forecast = pd.read_parquet(tmp_path / output_key)
+    assert output_key == "predictions/default/forecast_20231120.parquet"
+    assert set(forecast["product_id"]) == {1, 2}
+    # O merge publica o snapshot servido pela API
+    assert read_current_pointer("default", bucket, fs)["snapshot"] == "forecast_20231120"
+
+@patch("app.ml.sharding.SessionLocal")
+@patch("app.ml.sharding.save_predictions_to_db")
+@patch("app.ml.sharding.get_daily_sales")
+def test_run_shard_reads_features_from_sales_history(mock_daily_sales, mock_save_preds, mock_db, tmp_path):
+    mock_daily_sales.return_value = {
+        3: pd.DataFrame({"ds": pd.date_range(start="2023-01-01", periods=10, freq="D"), "y": [4.0] * 10}),
+    }
+    bucket = str(tmp_path)
+    fs = LocalFileSystem()
+    # O dataset de vendas não existe no data lake: a série vem do banco
+    keys = write_shard_manifests([[3]], "processed/default/sales/ausente", "default", "20231120", bucket,
+                                 filesystem=fs, feature_source="database")
+
+    part_key = run_shard(keys[0], bucket, filesystem=fs)
+
+    assert mock_daily_sales.call_args.args[1:] == ("default", [3])
+    assert set(pd.read_parquet(tmp_path / part_key)["product_id"]) == {3}
+
+@patch("app.ml.sharding.SessionLocal")
+@patch("app.ml.sharding.save_predictions_to_db")
+@patch("app.ml.sharding.get_daily_sales")
+def test_completed_parts_ignores_parts_from_previous_attempts(mock_daily_sales, mock_save_preds, mock_db, tmp_path):
+    mock_daily_sales.side_effect = lambda db, tenant, product_ids, start=None: {
+        pid: pd.DataFrame({"ds": pd.date_range(start="2023-01-01", periods=10, freq="D"), "y": [4.0] * 10})
+        for pid in product_ids
+    }
+    bucket = str(tmp_path)
+    fs = LocalFileSystem()
+    args = ([[1], [2]], "processed/default/sales/ausente", "default", "20231120", bucket)
+
+    # Uma execução anterior do mesmo lote deixou a parte do shard 1
+    stale = write_shard_manifests(*args, filesystem=fs, feature_source="database")
+    run_shard(stale[1], bucket, filesystem=fs)
+
+    with patch.object(settings, "FORECAST_DAYS", 14):
+        keys = write_shard_manifests(*args, filesystem=fs, feature_source="database")
+    part_key = run_shard(keys[0], bucket, filesystem=fs)
+
+    attempt = json.loads((tmp_path / keys[0]).read_text())["attempt"]
+    assert completed_parts("default", "20231120", bucket, fs, attempt) == [part_key]
+    # O horizonte vem do manifesto do shard
+    assert len(pd.read_parquet(tmp_path / part_key)) == 10 + 14
+
+def test_lambda_executor_invokes_one_worker_per_shard():
+    client = MagicMock()
+
+    result = LambdaShardExecutor("predict-fn", lambda_client=client).submit(
+        ["s/shard-0000.json", "s/shard-0001.json"], "bucket", "default", "20231120"
+    )
+
+    assert result is None
+    assert client.invoke.call_count == 2
+    kwargs = client.invoke.call_args.kwargs
+    assert kwargs["InvocationType"] == "Event"
+    assert json.loads(kwargs["Payload"]) == {
+        "mode": "worker", "bucket": "bucket", "manifest_key": "s/shard-0001.json", "next_keys": [],
+    }
+
+def test_lambda_executor_limits_workers_per_tenant():
+    client = MagicMock()
+    keys = [f"s/shard-{i:04d}.json" for i in range(5)]
+    executor = LambdaShardExecutor("predict-fn", lambda_client=client, workers_per_tenant=2)
+
+    executor.submit(keys, "bucket", "loja-grande", "20231120")
+
+    # Duas cadeias: cada worker invoca o próximo shard da sua cadeia ao terminar
+    payloads = [json.loads(c.kwargs["Payload"]) for c in client.invoke.call_args_list]
+    assert [(p["manifest_key"], p["next_keys"]) for p in payloads] == [
+        (keys[0], [keys[2], keys[4]]),
+        (keys[1], [keys[3]]),
+    ]
+
+    executor.continue_chain("bucket", [keys[2], keys[4]])
+    assert json.loads(client.invoke.call_args.kwargs["Payload"])["next_keys"] == [keys[4]]
+
+@patch("app.ml.sharding.SessionLocal")
+@patch("app.ml.sharding.save_predictions_to_db")
+def test_run_shard_trains_on_the_history_window(mock_save_preds, mock_db, tmp_path):
+    sales_df = pd.DataFrame({
+        "produto_id": [1] * 40,
+        "data_pedido": pd.date_range(start="2023-01-01", periods=40, freq="D"),
+        "quantidade": [10] * 40,
+    })
+    bucket = str(tmp_path)
+    fs = LocalFileSystem()
+    sales_root = write_partitioned_dataset(sales_df, "sales", "20231120", bucket=bucket, filesystem=fs)
+
+    # A janela de treino é fixada no manifesto pelo coordenador
+    with patch("app.ml.sharding.training_start", return_value=datetime.date(2023, 2, 1)):
+        keys = write_shard_manifests([[1]], sales_root, "default", "20231120", bucket, filesystem=fs)
+    with patch("app.ml.sharding.train_models_for_products", return_value={}) as mock_train:
+        run_shard(keys[0], bucket, filesystem=fs)
+
+    history = mock_train.call_args.args[0][1]
+    assert history["ds"].min() == pd.Timestamp("2023-02-01")
+    assert len(history) == 9
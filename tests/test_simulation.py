@@ -0,0 +1,38 @@
+import numpy as np
+import pandas as pd
+import pytest
+from app.ml.simulation import simulate_stock_risk
+from app.ml.trainer import train_models_for_products
+from app.ml.predictor import generate_predictions
+
+def test_simulation_statistics_and_chunking():
+    rng = np.random.default_rng(0)
+    samples = {pid: rng.gamma(2.0, 5.0, size=(30, 400)).astype(np.float32) for pid in range(1, 8)}
+    # Caminhos conhecidos: metade com demanda 1/dia, metade com 3/dia
+    samples[100] = np.concatenate([np.ones((30, 2), np.float32), np.full((30, 2), 3.0, np.float32)], axis=1)[:, :4]
+    stock = pd.Series({pid: 250.0 for pid in range(1, 8)} | {100: 60.0})
+
+    known = simulate_stock_risk({100: samples.pop(100)}, stock, lead_time_days=25).iloc[0]
+    # Total no horizonte: 30 ou 90; ruptura só nos caminhos de 3/dia (a partir do dia 21)
+    assert known["stockout_probability"] == 0.5
+    assert known["lead_time_stockout_probability"] == 0.5
+    assert known["expected_lost_sales"] == pytest.approx(15.0)
+
+    # Lotes pequenos produzem o mesmo resultado que um único lote
+    chunked = simulate_stock_risk(samples, stock, chunk_products=3)
+    single = simulate_stock_risk(samples, stock, chunk_products=100)
+    pd.testing.assert_frame_equal(chunked, single)
+    assert chunked["stockout_probability"].between(0, 1).all()
+    assert simulate_stock_risk({}, stock).empty
+
+def test_generate_predictions_keeps_float32_samples():
+    dates = pd.date_range("2023-01-01", periods=30, freq="D")
+    feature_dfs = {7: pd.DataFrame({"ds": dates, "y": np.arange(30) % 5 + 10.0})}
+    samples = {}
+
+    predictions = generate_predictions(train_models_for_products(feature_dfs), days_to_predict=14, samples=samples)
+
+    assert len(predictions[7]) == 44
+    assert samples[7].dtype == np.float32
+    assert samples[7].shape[0] == 14 and 0 < samples[7].shape[1] <= 200
+    assert (samples[7] >= 0).all()
@@ -0,0 +1,36 @@
+import pytest
+from benchmarks.import_time import measure_import, STARTUP_BUDGETS
+from app.ml.prophet_model import ProphetModel
+
+@pytest.mark.parametrize("module", ["lambdas.process_handler.main", "lambdas.predict_handler.main"])
+def test_lambda_startup_within_budget(module):
+    result = measure_import(module)
+
+    # Prophet, driver do banco e boto3 só devem ser carregados no primeiro uso
+    assert result["deferred_modules_loaded"] == []
+    assert result["median_seconds"] < STARTUP_BUDGETS[module]
+
+def test_prophet_models_share_compiled_stan_model():
+    first = ProphetModel()
+    second = ProphetModel()
+
+    # Cada modelo tem o seu backend (estado do ajuste), mas o executável Stan é carregado uma vez
+    assert first.model.stan_backend is not second.model.stan_backend
+    assert first.model.stan_backend.model is second.model.stan_backend.model
+
+def test_s3_client_is_created_once():
+    from unittest.mock import patch
+    import app.core.s3 as s3
+
+    with patch.object(s3, "_s3_client", None), patch("boto3.client") as client:
+        assert s3.get_s3_client() is s3.get_s3_client()
+    client.assert_called_once()
+
+def test_api_startup_warms_up_prophet():
+    from unittest.mock import patch
+    from fastapi.testclient import TestClient
+    from app.api.main import app
+
+    with patch("app.api.main.create_tables"), patch("app.api.main.warm_up") as warm_up, TestClient(app):
+        pass
+    warm_up.assert_called_once()
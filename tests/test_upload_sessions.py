@@ -0,0 +1,222 @@
+import hashlib
+import os
+from unittest.mock import MagicMock, patch
+from urllib.parse import urlparse, parse_qs
+
+import boto3
+from botocore.exceptions import ClientError
+
+os.environ['DATABASE_URL'] = "sqlite:///file:memdb1?mode=memory&cache=shared&uri=true"
+
+from fastapi.testclient import TestClient
+from app.api.main import app
+
+def fake_s3():
+    """
+    S3 local de teste: as URLs são pré-assinadas por um cliente boto3 real apontando
+    para um endpoint local (não há rede); as chamadas de API são simuladas.
+    `client.objects` guarda o tamanho dos objetos no bucket e `client.part_sizes`
+    o das partes enviadas (pela API ou direto pelo cliente).
+    """
+    signer = boto3.client(
+        "s3", region_name="us-east-1", endpoint_url="http://localhost:9000",
+        aws_access_key_id="test", aws_secret_access_key="test",
+    )
+    client = MagicMock()
+    client.objects, client.part_sizes = {}, {}
+    client.generate_presigned_url.side_effect = signer.generate_presigned_url
+    client.create_multipart_upload.return_value = {"UploadId": "upload-1"}
+
+    def upload_part(Key, PartNumber, ContentLength, **kwargs):
+        client.part_sizes[(Key, PartNumber)] = ContentLength
+        return {"ETag": f'"etag-{PartNumber}"'}
+    client.upload_part.side_effect = upload_part
+
+    def complete_multipart_upload(Key, MultipartUpload, **kwargs):
+        client.objects[Key] = sum(client.part_sizes.get((Key, p["PartNumber"]), 0) for p in MultipartUpload["Parts"])
+    client.complete_multipart_upload.side_effect = complete_multipart_upload
+
+    def head_object(Bucket, Key):
+        if Key not in client.objects:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+        return {"ContentLength": client.objects[Key]}
+    client.head_object.side_effect = head_object
+    return client
+
+def test_upload_session_issues_presigned_urls_and_completes_multipart():
+    client_s3 = fake_s3()
+    with TestClient(app) as client, \
+         patch('app.api.routes.upload_sessions.get_s3_client', return_value=client_s3), \
+         patch('app.core.upload_sessions.write_batch_manifest', side_effect=lambda ts, tenant, bucket: f"manifests/{tenant}/{ts}.json"), \
+         patch('app.core.config.settings.UPLOAD_PART_SIZE', 8 * 1024 * 1024):
+        response = client.post(
+            "/upload/sessions",
+            headers={"X-Tenant-ID": "loja-a"},
+            json={"products_size": 1024, "sales_size": 20 * 1024 * 1024},
+        )
+        assert response.status_code == 200
+        session = response.json()
+        products, sales = session["files"]["products"], session["files"]["sales"]
+
+        # Arquivo pequeno: um PUT direto ao bucket, na chave bruta do tenant
+        assert products["method"] == "PUT"
+        assert products["key"] == f"raw/loja-a/products_{session['timestamp']}.csv"
+        assert urlparse(products["url"]).path.endswith(products["key"])
+        # Arquivo grande: uma URL por parte de 8 MiB
+        assert sales["method"] == "MULTIPART"
+        assert [p["part_number"] for p in sales["parts"]] == [1, 2, 3]
+        assert parse_qs(urlparse(sales["parts"][1]["url"]).query)["partNumber"] == ["2"]
+
+        # Outra empresa não conclui a sessão
+        other = client.post(f"/upload/sessions/{session['session_id']}/complete", json={})
+        assert other.status_code == 404
+
+        # Sem as partes do multipart a sessão não pode ser concluída
+        incomplete = client.post(f"/upload/sessions/{session['session_id']}/complete",
+                                 headers={"X-Tenant-ID": "loja-a"}, json={})
+        assert incomplete.status_code == 409
+
+        # O cliente envia os arquivos direto ao bucket
+        client_s3.objects[products["key"]] = 1024
+        client_s3.part_sizes.update({(sales["key"], n): size for n, size in ((1, 8 << 20), (2, 8 << 20), (3, 4 << 20))})
+        parts = {"sales": [{"part_number": n, "etag": f"etag-{n}"} for n in (3, 1, 2)]}
+        done = client.post(f"/upload/sessions/{session['session_id']}/complete",
+                           headers={"X-Tenant-ID": "loja-a"}, json={"parts": parts})
+
+    assert done.status_code == 200
+    assert done.json()["status"] == "completed"
+    assert done.json()["raw_files"] == [products["key"], sales["key"]]
+    kwargs = client_s3.complete_multipart_upload.call_args.kwargs
+    assert kwargs["UploadId"] == "upload-1"
+    assert [p["PartNumber"] for p in kwargs["MultipartUpload"]["Parts"]] == [1, 2, 3]
+
+def test_upload_session_complete_requires_uploaded_objects():
+    client_s3 = fake_s3()
+    with TestClient(app) as client, \
+         patch('app.api.routes.upload_sessions.get_s3_client', return_value=client_s3), \
+         patch('app.core.upload_sessions.write_batch_manifest', side_effect=lambda ts, tenant, bucket: f"manifests/{tenant}/{ts}.json"):
+        session = client.post("/upload/sessions", json={"products_size": 10, "sales_size": 10}).json()
+        complete = f"/upload/sessions/{session['session_id']}/complete"
+        # O arquivo de vendas ainda não chegou ao bucket
+        client_s3.objects[session["files"]["products"]["key"]] = 10
+        missing = client.post(complete, json={})
+        # Chegou, mas truncado
+        client_s3.objects[session["files"]["sales"]["key"]] = 7
+        truncated = client.post(complete, json={})
+
+    assert missing.status_code == 409
+    assert "sales" in missing.json()["detail"]
+    assert truncated.status_code == 409
+    assert "7 bytes" in truncated.json()["detail"]
+    client_s3.create_multipart_upload.assert_not_called()
+
+def test_upload_session_complete_can_be_retried_after_partial_failure():
+    client_s3 = fake_s3()
+    complete_part = client_s3.complete_multipart_upload.side_effect
+
+    def flaky_complete(Key, **kwargs):
+        # A conclusão das vendas falha na primeira tentativa; a de produtos já foi feita
+        if "/sales_" in Key and client_s3.complete_multipart_upload.call_count == 2:
+            raise ClientError({"Error": {"Code": "InternalError"}}, "CompleteMultipartUpload")
+        return complete_part(Key=Key, **kwargs)
+    client_s3.complete_multipart_upload.side_effect = flaky_complete
+
+    with TestClient(app) as client, \
+         patch('app.api.routes.upload_sessions.get_s3_client', return_value=client_s3), \
+         patch('app.core.upload_sessions.write_batch_manifest', side_effect=lambda ts, tenant, bucket: f"manifests/{tenant}/{ts}.json"), \
+         patch('app.core.upload_sessions.MIN_PART_SIZE', 4), \
+         patch('app.core.config.settings.UPLOAD_PART_SIZE', 4):
+        session = client.post("/upload/sessions", json={"products_size": 6, "sales_size": 6}).json()
+        for dataset in ("products", "sales"):
+            key = session["files"][dataset]["key"]
+            client_s3.part_sizes.update({(key, 1): 4, (key, 2): 2})
+        parts = {dataset: [{"part_number": n, "etag": f"etag-{n}"} for n in (1, 2)] for dataset in ("products", "sales")}
+        complete = f"/upload/sessions/{session['session_id']}/complete"
+        failed = client.post(complete, json={"parts": parts})
+        retried = client.post(complete, json={"parts": parts})
+
+    assert failed.status_code == 409
+    assert retried.status_code == 200
+    completed_keys = [c.kwargs["Key"] for c in client_s3.complete_multipart_upload.call_args_list]
+    assert sum("/products_" in key for key in completed_keys) == 1
+    assert sum("/sales_" in key for key in completed_keys) == 2
+
+def test_resumable_upload_survives_interrupted_chunks():
+    client_s3 = fake_s3()
+    sales_csv = b"0123456789"
+
+    def put(client, session_id, dataset, start, data, checksum=None):
+        end = start + len(data) - 1
+        total = len(sales_csv) if dataset == "sales" else 3
+        return client.put(
+            f"/upload/sessions/{session_id}/files/{dataset}",
+            headers={
+                "X-Tenant-ID": "loja-a",
+                "Content-Range": f"bytes {start}-{end}/{total}",
+                "X-Checksum-SHA256": checksum or hashlib.sha256(data).hexdigest(),
+            },
+            content=data,
+        )
+
+    with TestClient(app) as client, \
+         patch('app.api.routes.upload_sessions.get_s3_client', return_value=client_s3), \
+         patch('app.core.upload_sessions.write_batch_manifest', side_effect=lambda ts, tenant, bucket: f"manifests/{tenant}/{ts}.json"), \
+         patch('app.core.upload_sessions.MIN_PART_SIZE', 4), \
+         patch('app.core.config.settings.UPLOAD_CHUNK_SIZE', 4):
+        session = client.post(
+            "/upload/sessions/resumable",
+            headers={"X-Tenant-ID": "loja-a"},
+            json={"products_size": 3, "sales_size": len(sales_csv)},
+        ).json()
+        session_id = session["session_id"]
+        assert session["files"]["sales"] == {
+            "key": f"raw/loja-a/sales_{session['timestamp']}.csv", "method": "CHUNKED", "part_size": 4, "parts": 3,
+        }
+
+        assert put(client, session_id, "products", 0, b"abc").status_code == 200
+        assert put(client, session_id, "sales", 0, sales_csv[:4]).json() == {"dataset": "sales", "part_number": 1, "offset": 4}
+        # A conexão caiu na segunda parte; a terceira chegou
+        assert put(client, session_id, "sales", 8, sales_csv[8:]).json()["offset"] == 4
+        # Parte corrompida ou fora dos limites das partes
+        assert put(client, session_id, "sales", 4, sales_csv[4:8], checksum="0" * 64).status_code == 400
+        assert put(client, session_id, "sales", 2, sales_csv[2:6]).status_code == 400
+
+        status = client.get(f"/upload/sessions/{session_id}", headers={"X-Tenant-ID": "loja-a"}).json()
+        assert status["files"]["sales"]["offset"] == 4
+        assert status["files"]["sales"]["missing_parts"] == [2]
+        incomplete = client.post(f"/upload/sessions/{session_id}/complete", headers={"X-Tenant-ID": "loja-a"}, json={})
+        assert incomplete.status_code == 409
+
+        # Retomada: reenviar uma parte já registrada não a envia de novo ao S3
+        assert put(client, session_id, "sales", 0, sales_csv[:4]).status_code == 200
+        assert put(client, session_id, "sales", 4, sales_csv[4:8]).json()["offset"] == 10
+        done = client.post(f"/upload/sessions/{session_id}/complete", headers={"X-Tenant-ID": "loja-a"}, json={})
+
+    assert done.status_code == 200
+    assert done.json()["status"] == "completed"
+    assert [c.kwargs["PartNumber"] for c in client_s3.upload_part.call_args_list] == [1, 1, 3, 2]
+    sales_complete = client_s3.complete_multipart_upload.call_args_list[-1].kwargs
+    assert sales_complete["Key"].endswith(".csv") and "/sales_" in sales_complete["Key"]
+    assert sales_complete["MultipartUpload"]["Parts"] == [
+        {"PartNumber": n, "ETag": f'"etag-{n}"'} for n in (1, 2, 3)
+    ]
+
+def test_presigned_urls_use_the_public_endpoint():
+    import app.core.s3 as s3
+    from app.core.config import settings
+    # Na rede do Docker a API fala com http://minio:9000; o cliente no host recebe localhost
+    client_s3 = fake_s3()
+    with TestClient(app) as client, \
+         patch('app.api.routes.upload_sessions.get_s3_client', return_value=client_s3), \
+         patch('app.core.upload_sessions.write_batch_manifest', side_effect=lambda ts, tenant, bucket: f"manifests/{tenant}/{ts}.json"), \
+         patch.object(s3, "_presign_client", None), \
+         patch.object(settings, "S3_ENDPOINT_URL", "http://minio:9000"), \
+         patch.object(settings, "S3_PUBLIC_ENDPOINT_URL", "http://localhost:9001"), \
+         patch.object(settings, "AWS_ACCESS_KEY_ID", "minioadmin"), \
+         patch.object(settings, "AWS_SECRET_ACCESS_KEY", "minioadmin"):
+        session = client.post("/upload/sessions", json={"products_size": 10, "sales_size": 10}).json()
+
+    url = urlparse(session["files"]["products"]["url"])
+    assert url.netloc == "localhost:9001"
+    assert "minioadmin" in parse_qs(url.query)["X-Amz-Credential"][0]
+    client_s3.generate_presigned_url.assert_not_called()